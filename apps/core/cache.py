@@ -118,6 +118,32 @@ class FaultTolerantCache:
             self._handle_redis_error('delete', key, exc)
             return False
     
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> Optional[bool]:
+        """
+        Set value only if key does not exist (SET NX). Returns None if Redis is down.
+        
+        Args:
+            key: Cache key
+            value: Value to cache
+            timeout: Cache timeout in seconds
+            
+        Returns:
+            True if stored, False if the key already exists, None if Redis is down
+        """
+        try:
+            result = self.cache.add(key, value, timeout)
+            
+            # Reset availability flag on successful operation
+            if not self._redis_available:
+                logger.info("Redis cache is back online")
+                self._redis_available = True
+                
+            return bool(result)
+            
+        except Exception as exc:
+            self._handle_redis_error('add', key, exc)
+            return None
+    
     def get_many(self, keys: list) -> dict:
         """
         Get multiple values from cache. Returns empty dict if Redis is down.
@@ -0,0 +1,129 @@
+"""
+Event loop de fondo para ejecutar corrutinas desde código síncrono.
+
+Un único loop por proceso corre en un hilo daemon y se crea recién en el
+primer uso. `run_sync()` le entrega la corrutina con
+`asyncio.run_coroutine_threadsafe` y espera el resultado, evitando crear y
+destruir un loop por llamada como hace `asyncio.run()`.
+
+Es fork-safe: el hijo de un fork (workers prefork de gunicorn/Celery) no
+hereda el hilo del padre, así que al forkear se descarta el loop heredado y
+el hijo crea el suyo en el primer uso. Los callbacks registrados con
+`on_fork()` permiten descartar también el estado atado al loop del padre.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from typing import Any, Callable, Coroutine, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundEventLoop:
+    """Loop asyncio de larga vida en un hilo daemon, uno por proceso."""
+
+    def __init__(self, name: str = "event-loop"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def _run(self, loop: asyncio.AbstractEventLoop, started: threading.Event) -> None:
+        asyncio.set_event_loop(loop)
+        loop.call_soon(started.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def _is_running(self) -> bool:
+        return (
+            self._loop is not None
+            and self._pid == os.getpid()
+            and self._thread is not None
+            and self._thread.is_alive()
+        )
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """Devuelve el loop del proceso, arrancándolo si hace falta."""
+        if self._is_running():
+            return self._loop
+        with self._lock:
+            if not self._is_running():
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+                thread = threading.Thread(target=self._run, args=(loop, started), name=self.name, daemon=True)
+                thread.start()
+                started.wait()
+                self._loop, self._thread, self._pid = loop, thread, os.getpid()
+                logger.debug("Background event loop started", extra={'pid': self._pid})
+        return self._loop
+
+    def in_loop_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def run_sync(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """
+        Ejecuta `coro` en el loop de fondo y espera su resultado.
+
+        Raises:
+            RuntimeError: Si se llama desde el propio hilo del loop (se bloquearía)
+            TimeoutError: Si no termina en `timeout` segundos (la corrutina se cancela)
+        """
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("run_sync() no puede llamarse desde el hilo del event loop")
+        future = asyncio.run_coroutine_threadsafe(coro, self.get_loop())
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Detiene el loop del proceso actual (no-op si no está corriendo)."""
+        with self._lock:
+            if not self._is_running():
+                return
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = self._pid = None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+    def _forget(self) -> None:
+        """Descarta el loop heredado en el hijo de un fork (su hilo no existe acá)."""
+        self._lock = threading.Lock()
+        self._loop = self._thread = self._pid = None
+
+
+background_loop = BackgroundEventLoop()
+
+_fork_callbacks: List[Callable[[], None]] = []
+
+
+def on_fork(callback: Callable[[], None]) -> None:
+    """Registra un callback a ejecutar en el proceso hijo después de un fork."""
+    _fork_callbacks.append(callback)
+
+
+def _after_fork_in_child() -> None:
+    background_loop._forget()
+    for callback in _fork_callbacks:
+        try:
+            callback()
+        except Exception:
+            logger.exception("Event loop fork callback failed")
+
+
+def run_sync(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """Ejecuta `coro` en el event loop de fondo del proceso (ver BackgroundEventLoop.run_sync)."""
+    return background_loop.run_sync(coro, timeout)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+atexit.register(background_loop.stop)
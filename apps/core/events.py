@@ -4,9 +4,10 @@ Este módulo actúa como la interfaz principal para toda la comunicación event-
 """
 
 import asyncio
+import dataclasses
 import logging
 from typing import Any, Dict, List, Optional, Type
-from uuid import UUID
+from uuid import UUID, uuid4
 
 # Importar toda la infraestructura de eventos
 from apps.events import (
@@ -41,13 +42,27 @@ from apps.events import (
     
     # Monitoring
     EventMetrics,
-    HealthChecker
+    HealthChecker,
+    
+    # Request/reply
+    EventReplied,
+    PendingReplies,
+    ReplyHandler
 )
+from apps.events.rpc import reply_key
+
+from django.conf import settings
+
+from apps.core.event_loop import on_fork, run_sync
 
 logger = logging.getLogger(__name__)
 
 # Global event system instance
 _event_system: Optional[EventSystemManager] = None
+# Serializa la inicialización perezosa dentro del loop de fondo
+_init_lock: Optional[asyncio.Lock] = None
+# Solicitudes esperando respuesta, por correlation_id
+_pending_replies = PendingReplies()
 
 
 class EventBus:
@@ -67,6 +82,11 @@ class EventBus:
             
         try:
             _event_system = await initialize_event_system(config)
+            event_bus = _event_system.get_event_bus()
+            await event_bus.subscribe(ReplyHandler(_pending_replies))
+            # Handler de stock para las solicitudes del POS (import diferido: usa modelos)
+            from apps.stock.event_handlers import POSStockRequestHandler
+            await event_bus.subscribe(POSStockRequestHandler())
             logger.info("Event system initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize event system: {e}")
@@ -101,6 +121,82 @@ class EventBus:
             logger.error(f"Failed to publish event {event.event_type}: {e}")
             raise
     
+    @staticmethod
+    async def publish_batch(events: List[DomainEvent]) -> None:
+        """Publicar un lote de eventos de dominio en una sola llamada al bus"""
+        if _event_system is None:
+            raise RuntimeError("Event system not initialized. Call EventBus.initialize() first")
+        
+        if not events:
+            return
+        
+        try:
+            await _event_system.publish_events(events)
+            logger.debug(f"Published batch of {len(events)} events")
+        except Exception as e:
+            logger.error(f"Failed to publish batch of {len(events)} events: {e}")
+            raise
+    
+    @staticmethod
+    async def request(event: DomainEvent, timeout: float) -> Dict[str, Any]:
+        """
+        Publicar una solicitud y esperar la respuesta correlacionada por correlation_id.
+        Si el evento no trae correlation_id se le asigna uno nuevo.
+        
+        Raises:
+            TimeoutError: Si nadie responde en `timeout` segundos
+            ValueError: Si ya hay una solicitud en curso con el mismo correlation_id
+        """
+        replies = await EventBus.request_many([event], timeout)
+        return replies[0]
+    
+    @staticmethod
+    async def request_many(events: List[DomainEvent], timeout: float) -> List[Dict[str, Any]]:
+        """
+        Publicar varias solicitudes en un solo lote y esperarlas concurrentemente.
+        Cada solicitud necesita su propio correlation_id; las respuestas vuelven en el
+        mismo orden que `events`. El timeout aplica al lote completo.
+        """
+        if not events:
+            return []
+        
+        events = [
+            event if event.correlation_id is not None else dataclasses.replace(event, correlation_id=uuid4())
+            for event in events
+        ]
+        keys: List[str] = []
+        futures: List[asyncio.Future] = []
+        try:
+            for event in events:
+                key = reply_key(event)
+                futures.append(_pending_replies.register(key))
+                keys.append(key)
+            
+            if len(events) == 1:
+                await EventBus.publish(events[0])
+            else:
+                await EventBus.publish_batch(events)
+            return list(await asyncio.wait_for(asyncio.gather(*futures), timeout))
+        finally:
+            _pending_replies.discard(keys)
+    
+    @staticmethod
+    async def reply(request: DomainEvent, payload: Dict[str, Any]) -> None:
+        """
+        Responder a una solicitud. Si quien espera está en este proceso se resuelve
+        su future directamente; si no, se publica un EventReplied por el bus.
+        """
+        if _pending_replies.resolve(reply_key(request), payload):
+            return
+        
+        await EventBus.publish(EventReplied(
+            aggregate_id=str(request.aggregate_id),
+            aggregate_type=request.aggregate_type,
+            causation_id=request.event_id,
+            correlation_id=request.correlation_id,
+            payload=payload
+        ))
+    
     @staticmethod
     async def publish_domain_event(
         event_type: str,
@@ -162,28 +258,111 @@ async def publish_stock_event(
     )
 
 
-def publish_pos_event(event: DomainEvent) -> str:
+async def _ensure_event_system() -> None:
+    """Inicializa el sistema de eventos en el loop de fondo si todavía no lo está."""
+    global _init_lock
+    if EventBus.is_initialized():
+        return
+    if _init_lock is None:
+        _init_lock = asyncio.Lock()
+    async with _init_lock:
+        if not EventBus.is_initialized():
+            try:
+                await EventBus.initialize(get_development_config())
+            except Exception as e:
+                logger.error(f"Failed to initialize event system for sync publish: {e}")
+                # Si no se inicializa, el publish levantará error
+
+
+async def _request_on_loop(events: List[DomainEvent], timeout: float) -> List[Dict[str, Any]]:
+    await _ensure_event_system()
+    return await EventBus.request_many(events, timeout)
+
+
+async def _publish_on_loop(events: List[DomainEvent]) -> None:
+    await _ensure_event_system()
+    if len(events) == 1:
+        await EventBus.publish(events[0])
+    else:
+        await EventBus.publish_batch(events)
+
+
+def _forget_event_system() -> None:
+    """En el hijo de un fork, el sistema del padre queda atado a un loop que no existe."""
+    global _event_system, _init_lock
+    _event_system = None
+    _init_lock = None
+    _pending_replies.clear()
+
+
+on_fork(_forget_event_system)
+
+
+def publish_sync(event: DomainEvent, timeout: Optional[float] = None) -> str:
     """
-    Publicar un evento del dominio POS desde un contexto síncrono.
-    Acepta una instancia de DomainEvent y retorna el ID del evento publicado como str.
+    Publicar un evento desde un contexto síncrono (vistas, servicios, tareas Celery).
+    Usa el event loop de fondo del proceso y espera la publicación.
+    Retorna el ID del evento publicado como str.
     """
-    # Asegurar inicialización del sistema de eventos
-    if not EventBus.is_initialized():
-        try:
-            asyncio.run(EventBus.initialize(get_development_config()))
-        except Exception as e:
-            logger.error(f"Failed to initialize event system for POS publish: {e}")
-            # Si no se inicializa, el publish más abajo levantará error
-    
-    # Publicar el evento de manera síncrona
     try:
-        asyncio.run(EventBus.publish(event))
+        run_sync(_publish_on_loop([event]), timeout or settings.EVENT_PUBLISH_TIMEOUT_SECONDS)
         return str(event.event_id)
     except Exception as e:
-        logger.error(f"Failed to publish POS event {event.event_type}: {e}")
+        logger.error(f"Failed to publish event {event.event_type}: {e}")
         raise
 
 
+def publish_many_sync(events: List[DomainEvent], timeout: Optional[float] = None) -> int:
+    """
+    Publicar un lote de eventos desde un contexto síncrono en una sola llamada al bus.
+    Retorna la cantidad de eventos publicados.
+    """
+    if not events:
+        return 0
+    
+    try:
+        run_sync(_publish_on_loop(list(events)), timeout or settings.EVENT_PUBLISH_TIMEOUT_SECONDS)
+        return len(events)
+    except Exception as e:
+        logger.error(f"Failed to publish batch of {len(events)} events: {e}")
+        raise
+
+
+def request_sync(event: DomainEvent, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Enviar una solicitud desde un contexto síncrono y esperar su respuesta.
+    Retorna el payload de la respuesta.
+    """
+    return request_many_sync([event], timeout)[0]
+
+
+def request_many_sync(events: List[DomainEvent], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Enviar varias solicitudes desde un contexto síncrono y esperarlas concurrentemente.
+    Retorna los payloads de las respuestas en el orden de `events`.
+    """
+    if not events:
+        return []
+    
+    timeout = timeout or settings.EVENT_REQUEST_TIMEOUT_SECONDS
+    try:
+        # El timeout del lote lo aplica el loop; el margen cubre la inicialización perezosa
+        return run_sync(_request_on_loop(list(events), timeout), timeout + settings.EVENT_PUBLISH_TIMEOUT_SECONDS)
+    except Exception as e:
+        logger.error(f"Request of {len(events)} events failed: {e!r}")
+        raise
+
+
+def publish_pos_event(event: DomainEvent) -> str:
+    """Compatibilidad: usar `publish_sync`."""
+    return publish_sync(event)
+
+
+def publish_event_batch(events: List[DomainEvent]) -> int:
+    """Compatibilidad: usar `publish_many_sync`."""
+    return publish_many_sync(events)
+
+
 async def publish_order_event(
     event_type: str,
     order_id: str,
@@ -220,9 +399,19 @@ __all__ = [
     'get_development_config',
     'get_production_config',
     
+    # Sync publishers (background event loop)
+    'publish_sync',
+    'publish_many_sync',
+    
+    # Request/reply
+    'EventReplied',
+    'request_sync',
+    'request_many_sync',
+    
     # Domain-specific publishers
     'publish_stock_event',
     'publish_pos_event',
+    'publish_event_batch',
     'publish_order_event',
     
     # Compatibility aliases
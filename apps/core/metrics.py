@@ -43,6 +43,27 @@ pricing_calculation_duration_seconds = Histogram(
     buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
 )
 
+# Métricas de contención de stock
+stock_exit_conflicts_total = Counter(
+    'stock_exit_conflicts_total',
+    'Total number of stock exit attempts that lost a concurrent update',
+    ['mode', 'outcome']
+)
+
+stock_exit_attempts = Histogram(
+    'stock_exit_attempts',
+    'Attempts needed to complete a stock exit',
+    ['mode'],
+    buckets=[1, 2, 3, 4, 5, 8]
+)
+
+stock_allocation_movements_per_line = Histogram(
+    'stock_allocation_movements_per_line',
+    'Lot movements generated per allocated line',
+    ['strategy'],
+    buckets=[1, 2, 3, 4, 6, 8, 12, 20]
+)
+
 # Métricas generales del sistema
 system_counters = {}
 system_gauges = {}
@@ -157,7 +178,7 @@ def update_near_expiry_lots(product_category='unknown', days_range='0-7', count=
     
     Args:
         product_category (str): Categoría del producto
-        days_range (str): Rango de días hasta vencimiento ('0-7', '8-15', '16-30')
+        days_range (str): Rango de días hasta vencimiento ('0-7', '8-30', '31-90')
         count (int): Número de lotes en este rango
     """
     try:
@@ -273,6 +294,78 @@ def observe_pricing_duration(duration_seconds, segment='unknown', calculation_ty
             calculation_type=calculation_type
         )
 
+def increment_stock_exit_conflict(mode='optimistic', outcome='retried'):
+    """
+    Incrementa el contador de conflictos en salidas de stock.
+    
+    Args:
+        mode (str): Modo de salida ('optimistic', 'locking')
+        outcome (str): 'retried' si se reintentó, 'exhausted' si se agotaron los reintentos
+    """
+    try:
+        stock_exit_conflicts_total.labels(mode=mode, outcome=outcome).inc()
+        
+        logger.info(
+            "stock_exit_conflict_incremented",
+            mode=mode,
+            outcome=outcome
+        )
+    except Exception as e:
+        logger.error(
+            "error_incrementing_stock_exit_conflict",
+            error=str(e),
+            mode=mode,
+            outcome=outcome
+        )
+
+def observe_stock_exit_attempts(attempts, mode='optimistic'):
+    """
+    Registra la cantidad de intentos de una salida de stock.
+    
+    Args:
+        attempts (int): Intentos usados (1 = sin conflictos)
+        mode (str): Modo de salida ('optimistic', 'locking')
+    """
+    try:
+        stock_exit_attempts.labels(mode=mode).observe(attempts)
+        
+        logger.info(
+            "stock_exit_attempts_observed",
+            attempts=attempts,
+            mode=mode
+        )
+    except Exception as e:
+        logger.error(
+            "error_observing_stock_exit_attempts",
+            error=str(e),
+            attempts=attempts,
+            mode=mode
+        )
+
+def observe_allocation_movements(movements, strategy='fefo'):
+    """
+    Registra cuántos movimientos de lote generó una línea asignada.
+    
+    Args:
+        movements (int): Movimientos (lotes) usados por la línea
+        strategy (str): Estrategia de asignación ('fefo', 'min_splits', ...)
+    """
+    try:
+        stock_allocation_movements_per_line.labels(strategy=strategy).observe(movements)
+        
+        logger.info(
+            "stock_allocation_movements_observed",
+            movements=movements,
+            strategy=strategy
+        )
+    except Exception as e:
+        logger.error(
+            "error_observing_stock_allocation_movements",
+            error=str(e),
+            movements=movements,
+            strategy=strategy
+        )
+
 def get_metrics_summary():
     """
     Retorna un resumen de las métricas actuales para debugging.
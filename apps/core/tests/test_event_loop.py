@@ -0,0 +1,88 @@
+"""Tests para el event loop de fondo y la publicación síncrona de eventos."""
+
+import asyncio
+import os
+import threading
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from django.test import SimpleTestCase
+
+from apps.core import event_loop, events
+from apps.core.event_loop import background_loop, run_sync
+from apps.stock.events import StockUpdated
+
+
+async def _current_thread():
+    return threading.current_thread()
+
+
+class BackgroundEventLoopTests(SimpleTestCase):
+    """Un único loop de larga vida por proceso."""
+
+    def test_reuses_one_loop_thread(self):
+        first = run_sync(_current_thread())
+        second = run_sync(_current_thread())
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, threading.current_thread())
+        self.assertTrue(first.daemon)
+
+    def test_rejects_calls_from_the_loop_thread(self):
+        async def nested():
+            run_sync(_current_thread())
+
+        with self.assertRaises(RuntimeError):
+            run_sync(nested())
+
+    def test_timeout_cancels_the_coroutine(self):
+        with self.assertRaises(TimeoutError):
+            run_sync(asyncio.sleep(5), timeout=0.05)
+
+    def test_fork_callbacks_drop_the_inherited_loop(self):
+        parent = run_sync(_current_thread())
+        with patch.object(events, '_event_system', object()):
+            event_loop._after_fork_in_child()
+            self.assertIsNone(events._event_system)
+
+        self.assertIsNot(run_sync(_current_thread()), parent)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requiere fork')
+    def test_forked_child_starts_its_own_loop(self):
+        run_sync(_current_thread())
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover - corre en el hijo
+            code = 1
+            try:
+                thread = run_sync(_current_thread(), timeout=5)
+                code = 0 if thread.is_alive() and background_loop._pid == os.getpid() else 2
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+
+
+@patch.object(events.EventBus, 'is_initialized', return_value=True)
+class PublishSyncTests(SimpleTestCase):
+    """publish_sync / publish_many_sync esperan la publicación en el loop de fondo."""
+
+    def _event(self, product_id):
+        return StockUpdated(aggregate_id=str(product_id), product_id=str(product_id))
+
+    def test_publish_sync_awaits_the_bus(self, initialized):
+        event = self._event(1)
+        with patch.object(events.EventBus, 'publish', new_callable=AsyncMock) as publish:
+            self.assertEqual(events.publish_sync(event), str(event.event_id))
+        publish.assert_awaited_once_with(event)
+
+    def test_publish_many_sync_sends_one_batch(self, initialized):
+        batch = [self._event(1), self._event(2)]
+        with patch.object(events.EventBus, 'publish_batch', new_callable=AsyncMock) as publish_batch:
+            self.assertEqual(events.publish_many_sync(batch), 2)
+            self.assertEqual(events.publish_many_sync([]), 0)
+        publish_batch.assert_awaited_once_with(batch)
+
+    def test_errors_reach_the_caller(self, initialized):
+        with patch.object(events.EventBus, 'publish', new_callable=AsyncMock, side_effect=RuntimeError('bus down')):
+            with self.assertRaises(RuntimeError):
+                events.publish_sync(self._event(1))
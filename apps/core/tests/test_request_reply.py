@@ -0,0 +1,93 @@
+"""Tests para request/reply sobre el event bus."""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from django.test import SimpleTestCase
+
+from apps.core import events
+from apps.core.event_loop import run_sync
+from apps.events.rpc import EventReplied
+from apps.stock.events import StockUpdated
+
+
+def _event(product_id, correlation_id=None):
+    return StockUpdated(aggregate_id=str(product_id), product_id=str(product_id), correlation_id=correlation_id)
+
+
+def _answering(payload_for):
+    """Publish simulado: un handler responde cada solicitud por el camino corto."""
+    async def answer(*published):
+        batch = published[0] if isinstance(published[0], list) else list(published)
+        for request in batch:
+            await events.EventBus.reply(request, payload_for(request))
+    return answer
+
+
+@patch.object(events.EventBus, 'is_initialized', return_value=True)
+class RequestReplyTests(SimpleTestCase):
+    """request() resuelve el future con la respuesta correlacionada."""
+
+    def tearDown(self):
+        self.assertEqual(len(events._pending_replies), 0)
+
+    def test_request_sync_returns_the_reply_payload(self, initialized):
+        answer = _answering(lambda request: {'product_id': request.product_id})
+        with patch.object(events.EventBus, 'publish', new=AsyncMock(side_effect=answer)) as publish:
+            reply = events.request_sync(_event(1), timeout=1)
+
+        self.assertEqual(reply, {'product_id': '1'})
+        self.assertIsNotNone(publish.await_args.args[0].correlation_id)
+
+    def test_request_many_publishes_one_batch_and_keeps_order(self, initialized):
+        answer = _answering(lambda request: {'product_id': request.product_id})
+        batch = [_event(i, correlation_id=f'c-{i}') for i in range(3)]
+        with patch.object(events.EventBus, 'publish_batch', new=AsyncMock(side_effect=answer)) as publish_batch:
+            replies = events.request_many_sync(batch, timeout=1)
+
+        publish_batch.assert_awaited_once()
+        self.assertEqual([r['product_id'] for r in replies], ['0', '1', '2'])
+
+    def test_timeout_releases_the_pending_request(self, initialized):
+        with patch.object(events.EventBus, 'publish', new_callable=AsyncMock):
+            with self.assertRaises(TimeoutError):
+                events.request_sync(_event(1, correlation_id='late'), timeout=0.05)
+
+        self.assertNotIn('late', events._pending_replies)
+
+    def test_duplicate_correlation_in_flight_is_rejected(self, initialized):
+        batch = [_event(1, correlation_id='dup'), _event(2, correlation_id='dup')]
+        with patch.object(events.EventBus, 'publish_batch', new_callable=AsyncMock) as publish_batch:
+            with self.assertRaises(ValueError):
+                events.request_many_sync(batch, timeout=1)
+
+        publish_batch.assert_not_awaited()
+
+    def test_reply_without_local_waiter_goes_through_the_bus(self, initialized):
+        request = _event(1, correlation_id='remote')
+        with patch.object(events.EventBus, 'publish', new_callable=AsyncMock) as publish:
+            run_sync(events.EventBus.reply(request, {'ok': True}))
+
+        reply = publish.await_args.args[0]
+        self.assertIsInstance(reply, EventReplied)
+        self.assertEqual(str(reply.correlation_id), 'remote')
+        self.assertEqual(reply.causation_id, request.event_id)
+        self.assertEqual(reply.payload, {'ok': True})
+
+    def test_reply_event_from_the_bus_resolves_the_request(self, initialized):
+        handler = events.ReplyHandler(events._pending_replies)
+
+        async def answer(request):
+            asyncio.get_running_loop().call_soon(
+                asyncio.ensure_future,
+                handler.handle(EventReplied(
+                    aggregate_id=request.aggregate_id,
+                    correlation_id=request.correlation_id,
+                    payload={'via': 'bus'}
+                ))
+            )
+
+        with patch.object(events.EventBus, 'publish', new=AsyncMock(side_effect=answer)):
+            reply = events.request_sync(_event(1, correlation_id='bus'), timeout=1)
+
+        self.assertEqual(reply, {'via': 'bus'})
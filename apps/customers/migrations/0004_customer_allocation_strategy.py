@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customers", "0003_customer_min_shelf_life_days"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customer",
+            name="allocation_strategy",
+            field=models.CharField(
+                blank=True,
+                help_text="Estrategia de asignación de lotes (vacío = settings.STOCK_ALLOCATION_STRATEGY)",
+                max_length=16,
+            ),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 
 
@@ -16,6 +17,11 @@ class Customer(models.Model):
         default=0, 
         help_text="Días mínimos de vida útil requeridos para este cliente"
     )
+    allocation_strategy = models.CharField(
+        max_length=16,
+        blank=True,
+        help_text="Estrategia de asignación de lotes (vacío = settings.STOCK_ALLOCATION_STRATEGY)"
+    )
 
     class Meta:
         indexes = [
@@ -23,5 +29,18 @@ class Customer(models.Model):
             models.Index(fields=['tax_id'], name='idx_customer_tax_id'),
         ]
 
+    def clean(self):
+        """allocation_strategy debe ser una estrategia registrada (o vacío)."""
+        super().clean()
+        # Import diferido: las estrategias viven en stock, que depende de customers
+        from apps.stock.allocation_strategies import allocation_strategy_names
+
+        names = allocation_strategy_names()
+        if self.allocation_strategy and self.allocation_strategy not in names:
+            raise ValidationError({
+                'allocation_strategy': f"Estrategia desconocida: {self.allocation_strategy} "
+                                       f"(disponibles: {', '.join(names)})"
+            })
+
     def __str__(self) -> str:  # pragma: no cover
         return self.name
@@ -1,6 +1,8 @@
 """Minimal unit tests for customers models - creación básica + defaults + __str__."""
 
 import pytest
+from django.core.exceptions import ValidationError
+
 from apps.customers.models import Customer
 
 
@@ -38,4 +40,14 @@ class TestCustomerMinimal:
             name="Test Customer 3",
             segment=Customer.Segment.RETAIL
         )
-        assert str(customer) == "Test Customer 3"
\ No newline at end of file
+        assert str(customer) == "Test Customer 3"
+
+    def test_allocation_strategy_must_be_registered(self):
+        """Test allocation_strategy is validated against the registered strategies."""
+        customer = Customer(name="Test Customer 4", segment=Customer.Segment.RETAIL, allocation_strategy="min_splits")
+        customer.full_clean()
+
+        customer.allocation_strategy = "fifo"
+        with pytest.raises(ValidationError) as exc_info:
+            customer.full_clean()
+        assert 'allocation_strategy' in exc_info.value.message_dict
@@ -75,6 +75,12 @@ from .monitoring import (
     MonitoringDashboard
 )
 
+from .rpc import (
+    EventReplied,
+    PendingReplies,
+    ReplyHandler
+)
+
 from .config import (
     EventSystemConfig,
     get_development_config,
@@ -185,6 +191,11 @@ __all__ = [
     'AlertManager',
     'MonitoringDashboard',
     
+    # Request/reply
+    'EventReplied',
+    'PendingReplies',
+    'ReplyHandler',
+    
     # Configuration
     'EventSystemConfig',
     'get_development_config',
@@ -153,12 +153,12 @@ class EventSystemManager:
         
         # Initialize event bus
         self._event_bus = InMemoryEventBus(
-            max_concurrent_handlers=self.config.event_bus.max_concurrent_handlers,
-            default_timeout_seconds=self.config.event_bus.default_timeout_seconds
+            max_queue_size=self.config.event_bus.max_queue_size,
+            processing_batch_size=self.config.event_bus.batch_size
         )
         
         # Set global event bus
-        EventBusManager.set_instance(self._event_bus)
+        EventBusManager.get_instance().initialize(self._event_bus)
         logger.debug("Event bus initialized")
     
     async def _initialize_monitoring_components(self) -> None:
@@ -341,6 +341,17 @@ class EventSystemManager:
         # Publish through event bus
         await self._event_bus.publish(event)
     
+    async def publish_events(self, events: List[DomainEvent]) -> None:
+        """Publish a batch of events through the system in a single bus call"""
+        if not self._is_running:
+            raise RuntimeError("Event system not running")
+        
+        if self.config.enable_event_sourcing:
+            for event in events:
+                await self._event_store.append_event(event)
+        
+        await self._event_bus.publish_batch(events)
+    
     async def register_handler(self, 
                               event_type: str, 
                               handler: IEventHandler,
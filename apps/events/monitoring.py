@@ -235,7 +235,7 @@ class EventMetrics(IEventMetrics):
             )
     
     def record_event_processed(self, event_type: str, handler_name: str, 
-                              processing_time_ms: float, success: bool):
+                              success: bool, processing_time_ms: float):
         """Record event processing"""
         status = "success" if success else "failure"
         
@@ -299,6 +299,18 @@ class EventMetrics(IEventMetrics):
             size,
             tags={"queue": queue_name}
         )
+    
+    def get_metrics_summary(self) -> Dict[str, Any]:
+        """Get metrics summary"""
+        # Counters are cumulative: the last point of each (name, tags) holds its value
+        latest: Dict[tuple, float] = {}
+        for point in self.collector.get_metrics():
+            if point.metric_type == MetricType.COUNTER and point.name.startswith("events."):
+                latest[(point.name, tuple(sorted(point.tags.items())))] = point.value
+        counters: Dict[str, float] = defaultdict(float)
+        for (name, _), value in latest.items():
+            counters[name] += value
+        return {'counters': dict(counters)}
 
 
 class HealthChecker:
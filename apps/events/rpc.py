@@ -0,0 +1,102 @@
+"""
+Request/reply on top of the event bus
+Correlates reply events with pending requests through correlation_id
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .base import DomainEvent, HandlerResult, IEventHandler
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, kw_only=True)
+class EventReplied(DomainEvent):
+    """Reply to a request event; correlation_id matches the request's"""
+
+    payload: Dict[str, Any] = field(default_factory=dict)
+
+
+def reply_key(event: DomainEvent) -> str:
+    """Key used to correlate a request with its reply"""
+    if event.correlation_id is None:
+        raise ValueError(f"Event {event.event_type} has no correlation_id to reply to")
+    return str(event.correlation_id)
+
+
+class PendingReplies:
+    """
+    Futures awaiting a reply, keyed by correlation_id
+    Futures belong to the loop that created them; resolve() is thread-safe
+    """
+
+    def __init__(self):
+        self._futures: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._futures)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._futures
+
+    def register(self, key: str) -> asyncio.Future:
+        """Create the future for a request; a correlation_id can only be in flight once"""
+        if key in self._futures:
+            raise ValueError(f"A request with correlation_id {key} is already awaiting a reply")
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        return future
+
+    def discard(self, keys: List[str]) -> None:
+        """Forget requests that were answered, timed out or cancelled"""
+        for key in keys:
+            self._futures.pop(key, None)
+
+    def resolve(self, key: str, payload: Dict[str, Any]) -> bool:
+        """Hand the payload to the waiting request; False if nobody is waiting"""
+        future = self._futures.get(key)
+        if future is None:
+            return False
+
+        def _set_result() -> None:
+            if not future.done():
+                future.set_result(payload)
+
+        loop = future.get_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            _set_result()
+        else:
+            loop.call_soon_threadsafe(_set_result)
+        return True
+
+    def clear(self) -> None:
+        """Drop every pending future (e.g. in a forked child, where their loop is gone)"""
+        self._futures.clear()
+
+
+class ReplyHandler(IEventHandler):
+    """Resolves pending requests from EventReplied events that travelled through the bus"""
+
+    def __init__(self, pending: PendingReplies):
+        self.pending = pending
+
+    @property
+    def handler_name(self) -> str:
+        return "event_reply_handler"
+
+    @property
+    def handled_events(self) -> List[str]:
+        return ["EventReplied"]
+
+    async def handle(self, event: DomainEvent) -> HandlerResult:
+        if not self.pending.resolve(reply_key(event), event.payload):
+            logger.debug(f"Dropping reply {event.correlation_id}: no request is waiting for it")
+        return HandlerResult.success_no_events()
@@ -142,13 +142,11 @@ class InMemoryEventStore(IEventStore):
                 aggregate_type=event.aggregate_type,
                 event_data=event.to_dict(),
                 metadata={
-                    'source': event.source,
-                    'user_id': str(event.user_id) if event.user_id else None,
-                    'tenant_id': str(event.tenant_id) if event.tenant_id else None,
+                    **event.metadata,
                     'correlation_id': str(event.correlation_id) if event.correlation_id else None,
                     'causation_id': str(event.causation_id) if event.causation_id else None
                 },
-                timestamp=event.timestamp,
+                timestamp=event.occurred_at,
                 sequence_number=sequence_number,
                 correlation_id=event.correlation_id,
                 causation_id=event.causation_id
@@ -165,6 +163,22 @@ class InMemoryEventStore(IEventStore):
             logger.debug(f"Appended event {event.event_type} with sequence {sequence_number}")
             return event_record
     
+    async def save_event(self, event: DomainEvent) -> None:
+        """Save a single event"""
+        await self.append_event(event)
+    
+    async def save_events(self, events: List[DomainEvent]) -> None:
+        """Save multiple events in order"""
+        for event in events:
+            await self.append_event(event)
+    
+    async def get_events_by_type(self, 
+                                event_type: str, 
+                                limit: int = 100) -> List[EventRecord]:
+        """Get events of a specific type"""
+        stream = await self.get_events(EventQuery(event_types=[event_type], limit=limit))
+        return stream.events
+    
     async def get_events(self, query: EventQuery) -> EventStream:
         """Get events matching query"""
         async with self._lock:
@@ -10,7 +10,8 @@ from django.utils import timezone
 from django.db import transaction
 
 from apps.notifications.models import Notification
-from apps.stock.models import StockLot
+from apps.stock.expiry_bucket_service import near_expiry_lots
+from apps.stock.low_stock_service import detect_low_stock
 
 _notifications: List[Dict[str, Any]] = []
 
@@ -63,32 +64,24 @@ def _should_skip_rate_limited(event: str, product_id: int = None, batch_id: int
 
 
 def generate_low_stock_alerts() -> GenerateResult:
-    """Generate alerts for products with low stock."""
-    default_threshold = int(os.getenv("LOW_STOCK_THRESHOLD_DEFAULT", "5"))
+    """Generate alerts for products whose total stock is at or below their threshold."""
     created = 0
     skipped = 0
     
     with transaction.atomic():
-        # Get products with low stock
-        low_stock_items = StockLot.objects.select_related("product").filter(
-            qty_on_hand__lte=default_threshold,
-            qty_on_hand__gt=0  # Don't alert on completely out of stock
-        )
-        
-        for stock in low_stock_items:
+        # Products with low stock (one grouped query; out of stock is not alerted here)
+        for item in detect_low_stock(include_out_of_stock=False):
             # Check rate limiting
-            if _should_skip_rate_limited("low_stock", product_id=stock.product.id):
+            if _should_skip_rate_limited("low_stock", product_id=item.product_id):
                 skipped += 1
                 continue
             
             # Create alert
             payload = {
-                "product_id": stock.product.id,
-                "product_name": stock.product.name,
-                "current_stock": float(stock.qty_on_hand),
-                "threshold": default_threshold,
-                "lot_code": stock.lot_code,
-                "warehouse": stock.warehouse.name if stock.warehouse else "Sin almacén"
+                "product_id": item.product_id,
+                "product_name": item.product_name,
+                "current_stock": float(item.on_hand),
+                "threshold": float(item.threshold),
             }
             
             notify(event="low_stock", payload=payload)
@@ -100,17 +93,12 @@ def generate_low_stock_alerts() -> GenerateResult:
 def generate_near_expiry_alerts() -> GenerateResult:
     """Generate alerts for products near expiry."""
     near_expiry_days = int(os.getenv("NEAR_EXPIRY_DAYS", "30"))
-    cutoff_date = timezone.now().date() + timedelta(days=near_expiry_days)
     created = 0
     skipped = 0
     
     with transaction.atomic():
-        # Get batches expiring soon
-        expiring_items = StockLot.objects.select_related("product").filter(
-            expiry_date__lte=cutoff_date,
-            expiry_date__gte=timezone.now().date(),  # Not already expired
-            qty_on_hand__gt=0
-        )
+        # Get batches expiring soon (the expiry-bucket index narrows the scan)
+        expiring_items = near_expiry_lots(near_expiry_days).select_related("product", "warehouse")
         
         for stock in expiring_items:
             # Check rate limiting (by lot code, otherwise by product)
@@ -13,6 +13,7 @@ from django.db.models import QuerySet
 from django_ratelimit.decorators import ratelimit
 
 from apps.orders.services import checkout
+from apps.stock.idempotency_service import idempotent_endpoint, skip_idempotent_store
 from apps.stock.services import ExitError
 from .models import Order, OrderItem
 from apps.customers.models import Customer
@@ -95,6 +96,7 @@ class OrderDetailOut(Schema):
 # ==== Endpoint ====
 @router.post("/order/checkout", response={201: CheckoutOut, 400: ErrorOut, 404: ErrorOut, 409: ErrorOut})
 @ratelimit(key='user', rate='10/m', method='POST', block=True)
+@idempotent_endpoint("checkout")
 def order_checkout(request, payload: CheckoutIn):
     try:
         o = checkout(
@@ -118,6 +120,8 @@ def order_checkout(request, payload: CheckoutIn):
         return 400, {"error": "VALIDATION_ERROR", "message": str(e)}
 
     except Exception as e:
+        # Puede ser transitorio (p. ej. error de base): un reintento con la misma clave se vuelve a ejecutar
+        skip_idempotent_store(request)
         return 400, {"error": "VALIDATION_ERROR", "message": str(e)}
 
 
@@ -0,0 +1,168 @@
+# apps/orders/delivery_service.py
+"""
+Entrega de órdenes desde sus reservas en bloque.
+
+`deliver_reservations()` bloquea la orden, sus reservas y todos sus lotes (una
+query ordenada por id cada uno), descuenta stock con un `bulk_update`, crea movimientos EXIT e
+ítems de auditoría con `bulk_create` y marca las reservas APPLIED con un único
+UPDATE: la cantidad de queries (y el tiempo con locks tomados) no crece con las
+líneas de la orden.
+"""
+
+import logging
+from decimal import Decimal
+from typing import Dict, List, NamedTuple, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.orders.audit import DeliveryAuditLog, DeliveryAuditLogItem
+from apps.orders.models import Order
+from apps.stock.models import Movement, StockLot
+from apps.stock.reservations import Reservation
+from apps.stock.summary_service import refresh_stock_summaries
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryError(Exception):
+    """Errores de negocio de la entrega (sin efectos en stock)."""
+    code: str
+    def __init__(self, code: str, message: str, failed_at_movement: Optional[int] = None):
+        super().__init__(message)
+        self.code = code
+        self.failed_at_movement = failed_at_movement
+
+
+class DeliveryResult(NamedTuple):
+    """Resultado de `deliver_reservations`."""
+    audit_log: DeliveryAuditLog
+    movements: List[Movement]
+    lots: Dict[int, StockLot]
+
+
+def _insufficient_stock(lots: Dict[int, StockLot], reservations: List[Reservation]) -> Optional[DeliveryError]:
+    """Primera reserva cuyo lote no alcanza (numerada desde 1, en orden de entrega)."""
+    for index, reservation in enumerate(reservations, start=1):
+        lot = lots[reservation.lot_id]
+        if lot.qty_on_hand < reservation.qty:
+            return DeliveryError(
+                "INSUFFICIENT_STOCK",
+                f"Lote {lot.lot_code} no tiene stock suficiente. "
+                f"Disponible: {lot.qty_on_hand}, Requerido: {reservation.qty}",
+                failed_at_movement=index
+            )
+    return None
+
+
+def deliver_reservations(order: Order, delivered_by) -> DeliveryResult:
+    """
+    Entrega la orden descontando stock de sus reservas activas (PENDING o APPLIED).
+
+    Todo o nada: si algún lote no alcanza no se toca stock. Una falta detectada
+    recién con los lotes bloqueados (cambio concurrente) deja un registro de
+    auditoría FAILED.
+
+    Raises:
+        DeliveryError: NO_RESERVATIONS o INSUFFICIENT_STOCK
+    """
+    reservations = list(
+        Reservation.objects.filter(
+            order=order,
+            status__in=[Reservation.Status.PENDING, Reservation.Status.APPLIED]
+        ).select_related('lot').order_by('id')
+    )
+    if not reservations:
+        raise DeliveryError("NO_RESERVATIONS", "La orden no tiene reservas activas para entregar")
+
+    # Validación previa sin locks: evita abrir la transacción para un faltante conocido
+    error = _insufficient_stock({r.lot_id: r.lot for r in reservations}, reservations)
+    if error:
+        raise error
+
+    try:
+        with transaction.atomic():
+            # Mismo orden de locks que reserve_lots y el sweeper: orden -> reservas -> lotes.
+            # El estado de cada reserva se toma de la fila bloqueada: otra entrega o el
+            # vencimiento de reservas pudo cambiarlo después de la lectura previa
+            Order.objects.select_for_update().only('id').get(pk=order.pk)
+            reservations = list(
+                Reservation.objects.select_for_update().filter(
+                    order=order,
+                    status__in=[Reservation.Status.PENDING, Reservation.Status.APPLIED]
+                ).order_by('id')
+            )
+            if not reservations:
+                raise DeliveryError("NO_RESERVATIONS", "La orden ya no tiene reservas activas para entregar")
+
+            lots = {
+                lot.id: lot
+                for lot in StockLot.objects.select_for_update().filter(
+                    id__in=[r.lot_id for r in reservations]
+                ).order_by('id')
+            }
+            error = _insufficient_stock(lots, reservations)
+            if error:
+                raise error
+
+            audit_log = DeliveryAuditLog.objects.create(
+                order=order,
+                delivered_by=delivered_by,
+                status=DeliveryAuditLog.Status.SUCCESS,
+                total_movements=len(reservations),
+                notes=f"Entrega automática de {len(reservations)} lotes"
+            )
+
+            # Descontar y liberar la retención de las reservas que seguían PENDING
+            for reservation in reservations:
+                lot = lots[reservation.lot_id]
+                lot.qty_on_hand -= reservation.qty
+                if reservation.status == Reservation.Status.PENDING:
+                    lot.qty_reserved -= reservation.qty
+            StockLot.objects.bulk_update(list(lots.values()), ['qty_on_hand', 'qty_reserved'])
+
+            movements = Movement.objects.bulk_create([
+                Movement(
+                    type=Movement.Type.EXIT,
+                    product_id=lots[reservation.lot_id].product_id,
+                    lot=lots[reservation.lot_id],
+                    qty=reservation.qty,
+                    unit_cost=lots[reservation.lot_id].unit_cost,
+                    reason=Movement.Reason.SALE,
+                    created_by=delivered_by
+                )
+                for reservation in reservations
+            ])
+
+            DeliveryAuditLogItem.objects.bulk_create([
+                DeliveryAuditLogItem(
+                    audit_log=audit_log,
+                    lot_id=movement.lot_id,
+                    qty_delivered=movement.qty,
+                    movement_id=movement.id
+                )
+                for movement in movements
+            ])
+
+            Reservation.objects.filter(id__in=[r.id for r in reservations]).update(
+                status=Reservation.Status.APPLIED, updated_at=timezone.now()
+            )
+
+            refresh_stock_summaries({(lot.product_id, lot.warehouse_id) for lot in lots.values()})
+
+    except DeliveryError as e:
+        # Faltante con los lotes bloqueados: queda constancia del intento
+        DeliveryAuditLog.objects.create(
+            order=order,
+            delivered_by=delivered_by,
+            status=DeliveryAuditLog.Status.FAILED,
+            total_movements=0,
+            error_details=str(e)
+        )
+        raise DeliveryError("DELIVERY_FAILED", f"Error durante la entrega: {e}", e.failed_at_movement)
+
+    logger.info(
+        "Order delivered",
+        extra={'order_id': order.id, 'movements': len(movements), 'audit_log_id': audit_log.id}
+    )
+    return DeliveryResult(audit_log=audit_log, movements=movements, lots=lots)
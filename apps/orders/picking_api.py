@@ -10,14 +10,14 @@ from datetime import date
 from ninja import Router, Schema
 from ninja.errors import HttpError
 from django.shortcuts import get_object_or_404
-from django.db import transaction
 from django.http import HttpRequest
 
 from apps.orders.models import Order
-from apps.stock.fefo_services import get_fefo_suggestions, validate_reservation_availability
-from apps.stock.reservations import Reservation
-from apps.stock.models import StockLot, Movement
-from apps.orders.audit import DeliveryAuditLog, DeliveryAuditLogItem
+from apps.orders.delivery_service import DeliveryError, deliver_reservations
+from apps.stock.fefo_services import get_fefo_suggestions
+from apps.stock.idempotency_service import idempotent_endpoint, skip_idempotent_store
+from apps.stock.reservation_service import ReservationUnavailable, reserve_lots
+from apps.stock.wave_picking_service import build_wave_pick_list
 
 picking_router = Router(tags=["picking"])
 
@@ -44,6 +44,45 @@ class PickingSuggestionsResponse(Schema):
     total_suggestions: int
 
 
+class WavePickingRequest(Schema):
+    """Schema para solicitud de picking por olas."""
+    order_ids: List[int]  # En orden de prioridad
+
+
+class WavePickLineOut(Schema):
+    """Schema para cantidad de un lote asignada a una orden."""
+    order_id: int
+    qty: Decimal
+
+
+class WavePickLotOut(Schema):
+    """Schema para lote de la lista de picking consolidada."""
+    lot_id: int
+    lot_code: str
+    product_id: int
+    expiry_date: date
+    warehouse_name: str
+    qty: Decimal
+    orders: List[WavePickLineOut]
+
+
+class WaveShortageOut(Schema):
+    """Schema para ítem sin stock suficiente en la ola."""
+    order_id: int
+    product_id: int
+    qty_requested: Decimal
+    qty_missing: Decimal
+
+
+class WavePickingResponse(Schema):
+    """Schema para respuesta de picking por olas."""
+    order_ids: List[int]
+    pick_list: List[WavePickLotOut]
+    shortages: List[WaveShortageOut]
+    total_lots: int
+    total_qty: Decimal
+
+
 class ReservationItemIn(Schema):
     """Schema para item de reserva."""
     lot_id: int
@@ -53,6 +92,7 @@ class ReservationItemIn(Schema):
 class CreateReservationRequest(Schema):
     """Schema para solicitud de creación de reservas."""
     reservations: List[ReservationItemIn]
+    ttl_minutes: Optional[int] = None  # None: settings.RESERVATION_TTL_MINUTES; 0: sin vencimiento
 
 
 class ReservationOut(Schema):
@@ -63,6 +103,7 @@ class ReservationOut(Schema):
     qty: Decimal
     status: str
     created_at: str
+    expires_at: Optional[str] = None
 
 
 class CreateReservationResponse(Schema):
@@ -150,7 +191,61 @@ def get_picking_suggestions(request: HttpRequest, order_id: int):
     )
 
 
+@picking_router.post("/picking/wave", response={200: WavePickingResponse, 404: ErrorResponse, 422: ErrorResponse})
+def get_wave_picking(request: HttpRequest, payload: WavePickingRequest):
+    """
+    Lista de picking FEFO consolidada por lote para una ola de órdenes.
+
+    Asigna FEFO en memoria sobre toda la ola: las órdenes se atienden en el
+    orden recibido y cada una toma los lotes de vencimiento más próximo antes
+    que las siguientes. No crea reservas.
+
+    Args:
+        payload: IDs de las órdenes, en orden de prioridad
+
+    Returns:
+        Lotes a pickear con la cantidad por orden y los faltantes por ítem
+
+    Raises:
+        404: Si alguna orden no existe
+        422: Si no se envían órdenes
+    """
+    order_ids = list(dict.fromkeys(payload.order_ids))
+    if not order_ids:
+        return 422, ErrorResponse(error="EMPTY_WAVE", detail="La ola no tiene órdenes")
+
+    found = set(Order.objects.filter(id__in=order_ids).values_list('id', flat=True))
+    missing = [order_id for order_id in order_ids if order_id not in found]
+    if missing:
+        return 404, ErrorResponse(
+            error="ORDER_NOT_FOUND",
+            detail=f"Órdenes inexistentes: {', '.join(str(order_id) for order_id in missing)}"
+        )
+
+    wave = build_wave_pick_list(order_ids)
+
+    return WavePickingResponse(
+        order_ids=wave.order_ids,
+        pick_list=[
+            WavePickLotOut(
+                lot_id=lot.lot_id,
+                lot_code=lot.lot_code,
+                product_id=lot.product_id,
+                expiry_date=lot.expiry_date,
+                warehouse_name=lot.warehouse_name,
+                qty=lot.qty,
+                orders=[WavePickLineOut(order_id=line.order_id, qty=line.qty) for line in lot.orders]
+            )
+            for lot in wave.lots
+        ],
+        shortages=[WaveShortageOut(**shortage._asdict()) for shortage in wave.shortages],
+        total_lots=len(wave.lots),
+        total_qty=wave.total_qty
+    )
+
+
 @picking_router.post("/{order_id}/reserve", response={200: CreateReservationResponse, 422: ErrorResponse, 404: ErrorResponse})
+@idempotent_endpoint("reserve")
 def create_reservations(request: HttpRequest, order_id: int, payload: CreateReservationRequest):
     """
     Crea reservas de lotes para una orden de forma transaccional.
@@ -162,10 +257,10 @@ def create_reservations(request: HttpRequest, order_id: int, payload: CreateRese
     
     Args:
         order_id: ID de la orden
-        payload: Lista de reservas a crear {lot_id, qty}
+        payload: Lista de reservas a crear {lot_id, qty} y ttl_minutes opcional
         
     Returns:
-        Lista de reservas creadas
+        Lista de reservas creadas (con expires_at si vencen)
         
     Raises:
         404: Si la orden no existe
@@ -174,89 +269,59 @@ def create_reservations(request: HttpRequest, order_id: int, payload: CreateRese
     # Verificar que la orden existe
     order = get_object_or_404(Order, id=order_id)
     
-    # Preparar datos de reservas para validación
-    reservations_data = [
-        {"lot_id": item.lot_id, "qty": item.qty}
-        for item in payload.reservations
-    ]
-    
-    # Validar disponibilidad
-    validation_result = validate_reservation_availability(order, reservations_data)
-    
-    if not validation_result['valid']:
+    # Bloqueo de lotes, validación y alta en bloque
+    try:
+        result = reserve_lots(
+            order,
+            [{"lot_id": item.lot_id, "qty": item.qty} for item in payload.reservations],
+            ttl_minutes=payload.ttl_minutes
+        )
+    except ReservationUnavailable as e:
         return 422, ErrorResponse(
-            error="INSUFFICIENT_STOCK",
-            detail="; ".join(validation_result['errors']),
-            availability_check=validation_result['availability_check']
+            error=e.code,
+            detail=str(e),
+            availability_check=e.availability_check
         )
-    
-    # Crear reservas de forma transaccional
-    created_reservations = []
-    
-    try:
-        with transaction.atomic():
-            # Cancelar reservas existentes para esta orden (si las hay)
-            existing_reservations = Reservation.objects.filter(
-                order=order,
-                status__in=[Reservation.Status.PENDING, Reservation.Status.APPLIED]
-            )
-            for existing in existing_reservations:
-                existing.cancel()
-            
-            # Eliminar reservas canceladas para evitar conflictos de unique constraint
-            Reservation.objects.filter(
-                order=order,
-                status=Reservation.Status.CANCELLED
-            ).delete()
-            
-            # Crear nuevas reservas
-            for item in payload.reservations:
-                lot = get_object_or_404(StockLot, id=item.lot_id)
-                
-                reservation = Reservation.objects.create(
-                    order=order,
-                    lot=lot,
-                    qty=item.qty,
-                    status=Reservation.Status.PENDING
-                )
-                
-                created_reservations.append(ReservationOut(
-                    id=reservation.id,
-                    lot_id=lot.id,
-                    lot_code=lot.lot_code,
-                    qty=reservation.qty,
-                    status=reservation.status,
-                    created_at=reservation.created_at.isoformat()
-                ))
-    
     except Exception as e:
-        # En caso de error, devolver 422 con detalles
+        # En caso de error, devolver 422 con detalles (sin guardarlo: puede ser transitorio)
+        skip_idempotent_store(request)
         return 422, ErrorResponse(
             error="RESERVATION_FAILED",
             detail=f"Error al crear reservas: {str(e)}"
         )
     
-    # Calcular total reservado
-    total_reserved = sum(item.qty for item in payload.reservations)
+    created_reservations = [
+        ReservationOut(
+            id=reservation.id,
+            lot_id=reservation.lot_id,
+            lot_code=result.lots[reservation.lot_id].lot_code,
+            qty=reservation.qty,
+            status=reservation.status,
+            created_at=reservation.created_at.isoformat(),
+            expires_at=reservation.expires_at.isoformat() if reservation.expires_at else None
+        )
+        for reservation in result.reservations
+    ]
     
     return CreateReservationResponse(
         order_id=order.id,
         reservations=created_reservations,
-        total_reserved=total_reserved
+        total_reserved=result.total_reserved
     )
 
 
 @picking_router.post("/{order_id}/deliver", response={200: DeliveryResponse, 409: DeliveryErrorResponse, 404: ErrorResponse})
+@idempotent_endpoint("deliver")
 def deliver_order(request: HttpRequest, order_id: int):
     """
     Entrega una orden de forma atómica creando movimientos EXIT desde las reservas.
     
     Proceso:
     1. Valida que la orden existe y tiene reservas activas
-    2. Por cada reserva, valida que hay stock suficiente disponible
-    3. Crea movimientos EXIT de forma transaccional (todo o nada)
+    2. Bloquea todos los lotes en una query y valida stock suficiente
+    3. Descuenta stock y crea movimientos EXIT en bloque (todo o nada)
     4. Registra auditoría con quién/cuándo/lotes/cantidades
-    5. Actualiza estado de reservas a APPLIED
+    5. Actualiza estado de reservas a APPLIED con un único UPDATE
     
     Args:
         order_id: ID de la orden a entregar
@@ -271,115 +336,31 @@ def deliver_order(request: HttpRequest, order_id: int):
     # Verificar que la orden existe
     order = get_object_or_404(Order, id=order_id)
     
-    # Obtener reservas activas para la orden
-    active_reservations = Reservation.objects.filter(
-        order=order,
-        status__in=[Reservation.Status.PENDING, Reservation.Status.APPLIED]
-    ).select_related('lot', 'lot__product', 'lot__warehouse')
-    
-    if not active_reservations.exists():
-        return 409, DeliveryErrorResponse(
-            error="NO_RESERVATIONS",
-            detail="La orden no tiene reservas activas para entregar"
-        )
-    
-    # Validar stock disponible antes de crear movimientos
-    for i, reservation in enumerate(active_reservations):
-        lot = reservation.lot
-        
-        # Verificar que el lote tiene stock suficiente
-        if lot.qty_on_hand < reservation.qty:
-            return 409, DeliveryErrorResponse(
-                error="INSUFFICIENT_STOCK",
-                detail=f"Lote {lot.lot_code} no tiene stock suficiente. Disponible: {lot.qty_on_hand}, Requerido: {reservation.qty}",
-                failed_at_movement=i + 1
-            )
-    
-    # Crear movimientos de forma transaccional
-    created_movements = []
-    audit_log = None
-    
+    # Lotes bloqueados en una query; stock, movimientos, auditoría y reservas en bloque
     try:
-        with transaction.atomic():
-            # Crear registro de auditoría
-            audit_log = DeliveryAuditLog.objects.create(
-                order=order,
-                delivered_by=getattr(request, 'user', None),
-                status=DeliveryAuditLog.Status.SUCCESS,
-                total_movements=len(active_reservations),
-                notes=f"Entrega automática de {len(active_reservations)} lotes"
-            )
-            
-            # Crear movimientos EXIT por cada reserva
-            for i, reservation in enumerate(active_reservations):
-                lot = reservation.lot
-                
-                # Verificar stock nuevamente con lock (protección contra concurrencia)
-                lot = StockLot.objects.select_for_update().get(id=lot.id)
-                
-                if lot.qty_on_hand < reservation.qty:
-                    raise ValueError(f"Stock insuficiente en lote {lot.lot_code} durante transacción")
-                
-                # Descontar del lote
-                lot.qty_on_hand -= reservation.qty
-                lot.save(update_fields=['qty_on_hand'])
-                
-                # Crear movimiento EXIT
-                movement = Movement.objects.create(
-                    type=Movement.Type.EXIT,
-                    product=lot.product,
-                    lot=lot,
-                    qty=reservation.qty,
-                    unit_cost=lot.unit_cost,
-                    reason=Movement.Reason.SALE,
-                    created_by=getattr(request, 'user', None)
-                )
-                
-                created_movements.append(movement)
-                
-                # Crear detalle de auditoría
-                DeliveryAuditLogItem.objects.create(
-                    audit_log=audit_log,
-                    lot=lot,
-                    qty_delivered=reservation.qty,
-                    movement_id=movement.id
-                )
-                
-                # Marcar reserva como aplicada
-                reservation.status = Reservation.Status.APPLIED
-                reservation.save(update_fields=['status'])
-    
-    except Exception as e:
-        # Actualizar auditoría con error si existe
-        if audit_log:
-            audit_log.status = DeliveryAuditLog.Status.FAILED
-            audit_log.error_details = str(e)
-            audit_log.save(update_fields=['status', 'error_details'])
-        
-        # Determinar en qué movimiento falló
-        failed_at = len(created_movements) + 1
-        
+        result = deliver_reservations(order, delivered_by=getattr(request, 'user', None))
+    except DeliveryError as e:
         return 409, DeliveryErrorResponse(
-            error="DELIVERY_FAILED",
-            detail=f"Error durante la entrega: {str(e)}",
-            failed_at_movement=failed_at
+            error=e.code,
+            detail=str(e),
+            failed_at_movement=e.failed_at_movement
         )
     
     # Preparar respuesta
     movement_details = [
         DeliveryMovementOut(
             movement_id=mv.id,
-            lot_id=mv.lot.id,
-            lot_code=mv.lot.lot_code,
+            lot_id=mv.lot_id,
+            lot_code=result.lots[mv.lot_id].lot_code,
             qty_delivered=mv.qty,
             unit_cost=mv.unit_cost
         )
-        for mv in created_movements
+        for mv in result.movements
     ]
     
     return DeliveryResponse(
         order_id=order.id,
         movements=movement_details,
-        total_movements=len(created_movements),
-        audit_log_id=audit_log.id
-    )
\ No newline at end of file
+        total_movements=len(result.movements),
+        audit_log_id=result.audit_log.id
+    )
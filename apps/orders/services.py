@@ -7,12 +7,13 @@ from typing import List, Dict, Optional
 
 from django.db import transaction
 from django.core.exceptions import ValidationError
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
 from apps.customers.models import Customer
 from apps.orders.models import Order, OrderItem
 from apps.stock.models import Product
-from apps.stock.services import record_exit_fefo, ExitError
+from apps.stock.services import allocate_many, ExitError
 from apps.catalog.models import Benefit
 from apps.notifications.models import Notification
 
@@ -129,7 +130,11 @@ def checkout(
         client_req_id=client_req_id,
     )
 
-    # --- Ítems: pricing + FEFO exit ---
+    # --- Ítems: pricing ---
+    products = Product.objects.in_bulk({int(it["product_id"]) for it in items})
+    order_items = []
+    allocation_lines = []
+
     for it in items:
         pid = int(it["product_id"])
         qty = Decimal(str(it["qty"]))
@@ -141,7 +146,9 @@ def checkout(
         if qty > 10000:
             raise ValidationError(f"qty no puede ser mayor a 10,000 (product_id={pid})")
 
-        product = get_object_or_404(Product, id=pid)
+        product = products.get(pid)
+        if product is None:
+            raise Http404(f"Producto {pid} no encontrado")
 
         # Precio final (beneficios)
         pricing = apply_benefits(product, customer)
@@ -157,24 +164,27 @@ def checkout(
         discount_total += line_discount
         tax_total += line_tax
 
-        # Crear OrderItem (guardamos precio final y benefit aplicado)
-        OrderItem.objects.create(
+        # OrderItem con precio final y benefit aplicado (se insertan juntos)
+        order_items.append(OrderItem(
             order=order,
             product=product,
             qty=qty,
             unit_price=unit_price,
             benefit_applied=pricing.benefit_payload,
-        )
-
-        # Descontar stock por FEFO, linkeando movimientos a la orden
-        # (si falla -> ExitError => 409, y hace rollback de todo)
-        record_exit_fefo(
-            product_id=product.id,
-            qty=qty,
-            user_id=1,           # reemplazar por request.user.id en capa API si hay auth
-            order_id=order.id,
-            warehouse_id=None,   # soporte multi-depósito opcional
-        )
+        ))
+        allocation_lines.append((product.id, qty, None))  # soporte multi-depósito opcional
+
+    OrderItem.objects.bulk_create(order_items)
+
+    # --- Descontar stock por FEFO para todas las líneas, linkeando movimientos a la orden ---
+    # (si falla -> ExitError => 409, y hace rollback de todo)
+    allocate_many(
+        allocation_lines,
+        user_id=1,           # reemplazar por request.user.id en capa API si hay auth
+        order_id=order.id,
+        reason="checkout",
+        customer=customer,      # estrategia de asignación del cliente (o la global)
+    )
 
     # --- Cerrar totales ---
     subtotal = _round2(subtotal)
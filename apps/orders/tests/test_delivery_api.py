@@ -4,6 +4,9 @@ Cubre casos felices, fallos intermedios con rollback, y errores 409.
 """
 
 from decimal import Decimal
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import F
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
@@ -462,4 +465,153 @@ class DeliveryEdgeCasesTestCase(DeliveryAPITestCase):
         self.lot1.refresh_from_db()
         self.lot2.refresh_from_db()
         self.assertEqual(self.lot1.qty_on_hand, Decimal('80'))  # 100 - 20
-        self.assertEqual(self.lot2.qty_on_hand, Decimal('50'))  # Sin cambios
\ No newline at end of file
+        self.assertEqual(self.lot2.qty_on_hand, Decimal('50'))  # Sin cambios
+
+class DeliveryIdempotencyTestCase(DeliveryAPITestCase):
+    """Pruebas de reintentos con Idempotency-Key."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_retry_with_same_key_replays_delivery(self):
+        """Test: Un reintento con la misma clave devuelve la respuesta original sin volver a entregar."""
+        Reservation.objects.create(
+            order=self.order,
+            lot=self.lot1,
+            qty=Decimal('20'),
+            status=Reservation.Status.PENDING
+        )
+        headers = {'Idempotency-Key': 'deliver-retry-1'}
+
+        with patch('apps.orders.picking_api.getattr') as mock_getattr:
+            mock_getattr.return_value = self.user
+            first = self.client.post(f"/{self.order.id}/deliver", headers=headers, user=self.user)
+            retry = self.client.post(f"/{self.order.id}/deliver", headers=headers, user=self.user)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Movement.objects.filter(lot=self.lot1).count(), 1)
+        self.assertEqual(DeliveryAuditLog.objects.filter(order=self.order).count(), 1)
+
+        self.lot1.refresh_from_db()
+        self.assertEqual(self.lot1.qty_on_hand, Decimal('80'))
+
+        # La misma clave para otra orden es un error del cliente
+        other = Order.objects.create(customer=self.order.customer, status=Order.Status.DRAFT)
+        response = self.client.post(f"/{other.id}/deliver", headers=headers, user=self.user)
+        self.assertEqual(response.status_code, 422)
+
+    def test_same_key_from_another_user_is_not_replayed(self):
+        """Test: La respuesta guardada solo se devuelve al usuario que la generó."""
+        Reservation.objects.create(order=self.order, lot=self.lot1, qty=Decimal('20'))
+        headers = {'Idempotency-Key': 'deliver-user-1'}
+        other_user = User.objects.create_user(username='other-deliverer', password='test123')
+
+        first = self.client.post(f"/{self.order.id}/deliver", headers=headers, user=self.user)
+        response = self.client.post(f"/{self.order.id}/deliver", headers=headers, user=other_user)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(response.status_code, 422)
+        self.assertNotIn('movements', response.json())
+
+    def test_unexpected_reservation_error_is_not_stored(self):
+        """Test: Un error genérico (posiblemente transitorio) se re-ejecuta en el reintento."""
+        headers = {'Idempotency-Key': 'reserve-transient-1'}
+        payload = {'reservations': [{'lot_id': self.lot1.id, 'qty': '5'}]}
+
+        with patch('apps.orders.picking_api.reserve_lots', side_effect=DatabaseError('connection reset')):
+            failed = self.client.post(f"/{self.order.id}/reserve", json=payload, headers=headers, user=self.user)
+        retry = self.client.post(f"/{self.order.id}/reserve", json=payload, headers=headers, user=self.user)
+
+        self.assertEqual(failed.status_code, 422)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json()['total_reserved'], '5')
+
+
+class DeliveryBulkTestCase(DeliveryAPITestCase):
+    """Pruebas de la entrega en bloque."""
+
+    def _deliver_queries(self, order):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from apps.orders.delivery_service import deliver_reservations
+
+        with CaptureQueriesContext(connection) as ctx:
+            deliver_reservations(order, self.user)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        """Test: Una orden de 1 línea y otra de 6 usan las mismas queries."""
+        small = Order.objects.create(customer=self.order.customer, status=Order.Status.DRAFT)
+        Reservation.objects.create(order=small, lot=self.lot1, qty=Decimal('1'))
+
+        large = Order.objects.create(customer=self.order.customer, status=Order.Status.DRAFT)
+        for index in range(6):
+            lot = StockLot.objects.create(
+                product=self.product1, lot_code=f'LOT-BULK-{index}', expiry_date='2024-12-31',
+                qty_on_hand=Decimal('10'), unit_cost=Decimal('10.00'), warehouse=self.warehouse
+            )
+            Reservation.objects.create(order=large, lot=lot, qty=Decimal('2'))
+
+        self.assertEqual(self._deliver_queries(small), self._deliver_queries(large))
+        self.assertEqual(
+            set(Reservation.objects.filter(order=large).values_list('status', flat=True)),
+            {Reservation.Status.APPLIED}
+        )
+        self.assertEqual(
+            set(StockLot.objects.filter(lot_code__startswith='LOT-BULK').values_list('qty_on_hand', 'qty_reserved')),
+            {(Decimal('8'), Decimal('0'))}
+        )
+        self.assertEqual(DeliveryAuditLogItem.objects.filter(audit_log__order=large).count(), 6)
+
+    def test_shortage_found_under_lock_is_audited_as_failed(self):
+        """Test: Un faltante detectado con los lotes bloqueados no toca stock y queda auditado."""
+        from apps.orders.delivery_service import DeliveryError, deliver_reservations
+
+        Reservation.objects.create(order=self.order, lot=self.lot1, qty=Decimal('20'))
+        Reservation.objects.create(order=self.order, lot=self.lot2, qty=Decimal('10'))
+
+        # El lote cambia entre la validación previa y el bloqueo
+        original = StockLot.objects.select_for_update
+        def concurrent_exit():
+            StockLot.objects.filter(id=self.lot2.id).update(qty_on_hand=Decimal('5'))
+            return original()
+
+        with patch.object(StockLot.objects, 'select_for_update', side_effect=concurrent_exit):
+            with self.assertRaises(DeliveryError) as ctx:
+                deliver_reservations(self.order, self.user)
+
+        self.assertEqual(ctx.exception.code, 'DELIVERY_FAILED')
+        self.assertEqual(ctx.exception.failed_at_movement, 2)
+        self.assertEqual(Movement.objects.count(), 0)
+        self.lot1.refresh_from_db()
+        self.assertEqual(self.lot1.qty_on_hand, Decimal('100'))
+        audit_log = DeliveryAuditLog.objects.get(order=self.order)
+        self.assertEqual(audit_log.status, DeliveryAuditLog.Status.FAILED)
+
+    def test_reservation_cancelled_before_lock_is_not_delivered(self):
+        """Test: Una reserva que el sweeper cancela antes del bloqueo no se entrega ni se libera dos veces."""
+        from apps.orders.delivery_service import deliver_reservations
+
+        kept = Reservation.objects.create(order=self.order, lot=self.lot1, qty=Decimal('5'))
+        cancelled = Reservation.objects.create(order=self.order, lot=self.lot2, qty=Decimal('3'))
+
+        # El sweeper cancela una reserva (y libera su retención) entre la lectura previa y el bloqueo
+        original = Order.objects.select_for_update
+        def concurrent_sweep():
+            Reservation.objects.filter(id=cancelled.id).update(status=Reservation.Status.CANCELLED)
+            StockLot.objects.filter(id=self.lot2.id).update(qty_reserved=F('qty_reserved') - Decimal('3'))
+            return original()
+
+        with patch.object(Order.objects, 'select_for_update', side_effect=concurrent_sweep):
+            result = deliver_reservations(self.order, self.user)
+
+        self.assertEqual([movement.lot_id for movement in result.movements], [self.lot1.id])
+        cancelled.refresh_from_db()
+        self.assertEqual(cancelled.status, Reservation.Status.CANCELLED)
+        kept.refresh_from_db()
+        self.assertEqual(kept.status, Reservation.Status.APPLIED)
+        self.lot2.refresh_from_db()
+        self.assertEqual((self.lot2.qty_on_hand, self.lot2.qty_reserved), (Decimal('50'), Decimal('0')))
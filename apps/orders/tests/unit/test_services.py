@@ -144,13 +144,13 @@ class TestCheckoutService:
             tax_rate=Decimal("10.50")
         )
     
-    @patch('apps.orders.services.record_exit_fefo')
+    @patch('apps.orders.services.allocate_many')
     @patch('apps.orders.services.Notification')
     @patch('apps.core.metrics.increment_orders_placed')
-    def test_checkout_success(self, mock_increment, mock_notification, mock_record_exit):
+    def test_checkout_success(self, mock_increment, mock_notification, mock_allocate):
         """Test checkout exitoso."""
         # Mock para evitar problemas de stock
-        mock_record_exit.return_value = []
+        mock_allocate.return_value = []
         
         items = [
             {"product_id": self.product1.id, "qty": "2"},
@@ -184,7 +184,9 @@ class TestCheckoutService:
         assert order_items.count() == 2
         
         # Verificar llamadas a servicios externos
-        assert mock_record_exit.call_count == 2
+        # Una sola asignación FEFO para todas las líneas
+        mock_allocate.assert_called_once()
+        assert len(mock_allocate.call_args.args[0]) == 2
         mock_notification.objects.create.assert_called_once()
         mock_increment.assert_called_once()
     
@@ -317,13 +319,13 @@ class TestCheckoutService:
                 delivery_method="pickup"
             )
     
-    @patch('apps.orders.services.record_exit_fefo')
+    @patch('apps.orders.services.allocate_many')
     @patch('apps.orders.services.Notification')
     @patch('apps.core.metrics.increment_orders_placed')
-    def test_checkout_idempotency(self, mock_increment, mock_notification, mock_record_exit):
+    def test_checkout_idempotency(self, mock_increment, mock_notification, mock_allocate):
         """Test idempotencia con client_req_id."""
         # Mock para evitar problemas de stock
-        mock_record_exit.return_value = []
+        mock_allocate.return_value = []
         
         items = [{"product_id": self.product1.id, "qty": "1"}]
         client_req_id = "unique-request-123"
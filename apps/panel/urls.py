@@ -40,6 +40,7 @@ urlpatterns = [
     
     # Reportes y analytics
     path("reports/", views.reports, name="reports"),
+    path("reports/expiry-waste/", views.expiry_waste_report, name="expiry_waste_report"),
     path("analytics/", views.analytics, name="analytics"),
     
     # Gestión de usuarios
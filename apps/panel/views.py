@@ -2,7 +2,8 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Count, Q, Value
+from django.db.models.functions import Coalesce
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth import update_session_auth_hash, logout
@@ -15,6 +16,7 @@ from apps.stock.models import StockLot
 from apps.orders.models import Order
 from apps.customers.models import Customer
 from apps.notifications.models import Notification
+from apps.stock.expiry_bucket_service import near_expiry_buckets, near_expiry_lots
 from .security import scope_required
 
 
@@ -24,9 +26,10 @@ def dashboard(request):
     now = timezone.now()
     new_orders_24h = Order.objects.filter(created_at__gte=now - timezone.timedelta(hours=24)).count()
     on_hand_total = StockLot.objects.aggregate(total=Sum("qty_on_hand")).get("total") or Decimal("0")
-    near_expiry_qs = StockLot.objects.filter(qty_on_hand__gt=0, expiry_date__lte=(now.date() + timezone.timedelta(days=30)))
-    near_expiry_count = near_expiry_qs.count()
-    near_expiry = near_expiry_qs.select_related("product").order_by("expiry_date")[:20]
+    # Conteo desde el índice de vencimientos; la lista sigue siendo de lotes,
+    # acotada por el índice a las claves con vencimientos en la ventana
+    near_expiry_count = near_expiry_buckets(30).aggregate(total=Sum("lot_count")).get("total") or 0
+    near_expiry = near_expiry_lots(30).select_related("product").order_by("expiry_date")[:20]
     orders_total_7d = Order.objects.filter(created_at__gte=now - timezone.timedelta(days=7)).count()
 
     ctx = {
@@ -42,11 +45,13 @@ def dashboard(request):
 @login_required
 @scope_required('inventory')
 def stock_list(request):
-    products = Product.objects.filter(is_active=True).order_by("name")[:500]
-    rows = []
-    for p in products:
-        on_hand = StockLot.objects.filter(product=p).aggregate(total=Sum("qty_on_hand")).get("total") or Decimal("0")
-        rows.append({"product": p, "on_hand": on_hand})
+    # Totales desde el resumen por (producto, depósito): una sola query
+    products = (
+        Product.objects.filter(is_active=True)
+        .annotate(on_hand=Coalesce(Sum("stock_summaries__on_hand"), Value(Decimal("0"))))
+        .order_by("name")[:500]
+    )
+    rows = [{"product": p, "on_hand": p.on_hand} for p in products]
     return render(request, "panel/stock_list.html", {"rows": rows})
 
 
@@ -344,6 +349,46 @@ def reports(request):
     return render(request, 'panel/reports.html', ctx)
 
 
+@login_required
+@scope_required('reports')
+def expiry_waste_report(request):
+    """Proyección de merma por vencimiento (simulación FEFO) para compras."""
+    # Import diferido: el simulador carga numpy y solo lo usa este reporte
+    from apps.stock.waste_simulator import DEFAULT_HISTORY_DAYS, DEFAULT_HORIZON_DAYS, simulate_expiry_waste
+
+    try:
+        horizon_days = int(request.GET.get('horizon', DEFAULT_HORIZON_DAYS))
+        history_days = int(request.GET.get('history_days', DEFAULT_HISTORY_DAYS))
+        warehouse_id = int(request.GET['warehouse']) if request.GET.get('warehouse') else None
+        result = simulate_expiry_waste(
+            horizon_days=horizon_days,
+            history_days=history_days,
+            warehouse_id=warehouse_id,
+        )
+    except ValueError as e:
+        if request.GET.get('format') == 'json':
+            return JsonResponse({'error': 'VALIDATION_ERROR', 'message': str(e)}, status=400)
+        messages.error(request, f'Parámetros inválidos: {e}')
+        return redirect('panel:reports')
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'as_of': result.as_of.isoformat(),
+            'horizon_days': result.horizon_days,
+            'history_days': result.history_days,
+            'total_waste_qty': result.total_waste_qty,
+            'value_at_risk': result.value_at_risk,
+            'stockout_keys': result.stockout_keys,
+            'rows': [row._asdict() for row in result.rows],
+        })
+
+    ctx = {
+        'result': result,
+        'rows': result.rows[:200],
+    }
+    return render(request, 'panel/expiry_waste_report.html', ctx)
+
+
 @login_required
 @scope_required('analytics')
 def analytics(request):
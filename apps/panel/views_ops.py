@@ -5,6 +5,7 @@ from django.db.models import F, Count
 from datetime import timedelta
 
 from apps.stock.models import Movement, StockLot
+from apps.stock.expiry_bucket_service import near_expiry_lots
 from apps.orders.models import Order
 from apps.notifications.models import Notification
 from apps.notifications.services import generate_low_stock_alerts, generate_near_expiry_alerts
@@ -32,13 +33,8 @@ def ops_feed(request):
             created_at__gte=week_ago
         ).select_related('customer').order_by('-created_at')[:10]
         
-        # Productos próximos a vencer (próximos 30 días)
-        next_month = timezone.now() + timedelta(days=30)
-        expiring_products = StockLot.objects.filter(
-            expiry_date__lte=next_month.date(),
-            expiry_date__gte=timezone.now().date(),
-            qty_on_hand__gt=0
-        ).select_related('product').order_by('expiry_date')[:10]
+        # Lotes próximos a vencer (próximos 30 días), acotados por el índice de vencimientos
+        expiring_products = near_expiry_lots(30).select_related('product').order_by('expiry_date')[:10]
         
         # Estadísticas rápidas
         stats = {
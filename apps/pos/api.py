@@ -18,7 +18,8 @@ from apps.catalog.pricing import price_quote
 from apps.customers.models import Customer
 from apps.panel.security import has_scope
 from apps.pos.models import LotOverrideAudit
-from apps.core.events import publish_pos_event
+from apps.core.events import publish_sync
+from apps.stock.idempotency_service import idempotent_endpoint
 from .events import (
     SaleCreated,
     SaleItemProcessed,
@@ -178,6 +179,7 @@ def pos_health_check(request):
 
 
 @router.post("/sale", response={200: SaleOut, 400: ErrorOut, 403: ErrorOut, 500: ErrorOut})
+@idempotent_endpoint("pos_sale")
 def create_pos_sale(request, sale_data: SaleIn):
     """
     Crea una venta POS con soporte para FEFO y override de lotes.
@@ -8,7 +8,7 @@ de otros dominios como Stock.
 
 from dataclasses import dataclass
 from decimal import Decimal
-from datetime import date
+from datetime import date, datetime
 from typing import List, Optional, Dict, Any
 from uuid import UUID
 
@@ -33,7 +33,7 @@ class SaleItemData:
     lot_override_reason: Optional[str] = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, kw_only=True)
 class SaleCreated(DomainEvent):
     """
     Evento publicado cuando se crea una nueva venta POS.
@@ -56,7 +56,7 @@ class SaleCreated(DomainEvent):
         super().__post_init__()
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, kw_only=True)
 class SaleItemProcessed(DomainEvent):
     """
     Evento publicado cuando se procesa un ítem individual de una venta.
@@ -90,7 +90,7 @@ class SaleItemProcessed(DomainEvent):
 # EVENTOS DE OVERRIDE DE LOTES
 # ============================================================================
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, kw_only=True)
 class LotOverrideRequested(DomainEvent):
     """
     Evento publicado cuando se solicita un override de lote.
@@ -114,7 +114,7 @@ class LotOverrideRequested(DomainEvent):
         super().__post_init__()
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, kw_only=True)
 class LotOverrideExecuted(DomainEvent):
     """
     Evento publicado cuando se ejecuta exitosamente un override de lote.
@@ -163,7 +163,7 @@ class ComboDiscountData:
     items_affected: List[str]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, kw_only=True)
 class PriceQuoteGenerated(DomainEvent):
     """
     Evento publicado cuando se genera una cotización de precios.
@@ -191,7 +191,7 @@ class PriceQuoteGenerated(DomainEvent):
 # EVENTOS DE TRAZABILIDAD
 # ============================================================================
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, kw_only=True)
 class SaleDetailRequested(DomainEvent):
     """
     Evento publicado cuando se solicita el detalle de una venta.
@@ -209,7 +209,7 @@ class SaleDetailRequested(DomainEvent):
         super().__post_init__()
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, kw_only=True)
 class SaleDataExported(DomainEvent):
     """
     Evento publicado cuando se exportan datos de una venta.
@@ -231,7 +231,7 @@ class SaleDataExported(DomainEvent):
 # EVENTOS DE VALIDACIÓN
 # ============================================================================
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, kw_only=True)
 class StockValidationRequested(DomainEvent):
     """
     Evento publicado cuando POS necesita validar disponibilidad de stock.
@@ -256,7 +256,29 @@ class StockValidationRequested(DomainEvent):
         super().__post_init__()
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, kw_only=True)
+class SaleStockConsumptionRequested(DomainEvent):
+    """
+    Evento publicado cuando POS necesita consumir el stock de una venta completa.
+    
+    El dominio Stock asigna y consume todos los ítems en una sola transacción
+    (los ítems con `lot_id` son overrides) y responde con los movimientos de
+    cada ítem, o con el error sin haber escrito nada. Si la transacción
+    terminaría después de `expires_at` se descarta: quien pidió ya no espera.
+    """
+    sale_id: str
+    user_id: int
+    items: List[SaleItemData]
+    customer_id: Optional[int] = None
+    min_shelf_life_days: int = 0
+    expires_at: Optional[datetime] = None
+    
+    def __post_init__(self):
+        object.__setattr__(self, 'aggregate_id', self.sale_id)
+        super().__post_init__()
+
+
+@dataclass(frozen=True, kw_only=True)
 class CustomerValidationRequested(DomainEvent):
     """
     Evento publicado cuando POS necesita validar un cliente.
@@ -277,7 +299,7 @@ class CustomerValidationRequested(DomainEvent):
 # EVENTOS DE ERROR
 # ============================================================================
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, kw_only=True)
 class SaleProcessingFailed(DomainEvent):
     """
     Evento publicado cuando falla el procesamiento de una venta.
@@ -297,7 +319,7 @@ class SaleProcessingFailed(DomainEvent):
         super().__post_init__()
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, kw_only=True)
 class PriceQuoteProcessingFailed(DomainEvent):
     """
     Evento publicado cuando falla el procesamiento de una cotización.
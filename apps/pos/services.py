@@ -14,16 +14,16 @@ Estructura:
 
 import logging
 import uuid
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 from typing import Optional, List, Dict, Any, NamedTuple, Tuple
 
-from django.db import transaction
 from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
 from django.http import Http404
 from django.conf import settings
+from django.utils import timezone
 
 from apps.catalog.models import Product
 from apps.catalog.utils import normalize_qty
@@ -31,7 +31,7 @@ from apps.catalog.pricing import price_quote
 from apps.customers.models import Customer
 from apps.panel.security import has_scope
 from .models import SaleItemLot, LotOverrideAudit
-from apps.core.events import publish_pos_event
+from apps.core.events import publish_many_sync, publish_sync, request_sync
 from .events import (
     SaleCreated,
     SaleItemProcessed,
@@ -41,6 +41,7 @@ from .events import (
     SaleDetailRequested,
     SaleDataExported,
     StockValidationRequested,
+    SaleStockConsumptionRequested,
     CustomerValidationRequested,
     SaleProcessingFailed,
     PriceQuoteProcessingFailed,
@@ -161,7 +162,7 @@ def handle_sale_detail_request(
             requested_by_username=request_user.username,
             access_reason="api_request"
         )
-        publish_pos_event(detail_event)
+        publish_sync(detail_event)
         
         # Obtener detalle de la venta
         sale_detail = get_sale_detail_data(sale_id, request_user)
@@ -244,6 +245,7 @@ def handle_price_quote_request(
 def request_sale_creation(
     sale_id: str,
     user_id: int,
+    username: str,
     customer_id: Optional[int],
     items: List[Dict[str, Any]],
     override_pin: Optional[str] = None,
@@ -255,17 +257,20 @@ def request_sale_creation(
     Returns:
         str: ID del evento publicado
     """
+    sale_items = [SaleItemData(**item) for item in items]
     event = SaleCreated(
         sale_id=sale_id,
         user_id=user_id,
+        username=username,
         customer_id=customer_id,
-        items=[SaleItemData(**item) for item in items],
-        total_items=len(items),
+        items=sale_items,
+        total_items=len(sale_items),
+        total_amount=sum((item.qty * item.unit_price for item in sale_items), Decimal('0')),
         override_pin_used=bool(override_pin),
         correlation_id=correlation_id
     )
     
-    return publish_pos_event(event)
+    return publish_sync(event)
 
 
 def request_stock_validation_for_sale(
@@ -289,7 +294,7 @@ def request_stock_validation_for_sale(
         correlation_id=correlation_id
     )
     
-    return publish_pos_event(event)
+    return publish_sync(event)
 
 
 def request_lot_override(
@@ -314,19 +319,18 @@ def request_lot_override(
         lot_id=lot_id,
         qty=qty,
         user_id=user_id,
-        override_pin=override_pin,
+        pin_provided=bool(override_pin),
         reason=reason,
         correlation_id=correlation_id
     )
     
-    return publish_pos_event(event)
+    return publish_sync(event)
 
 
 # ============================================================================
 # Business Logic Functions
 # ============================================================================
 
-@transaction.atomic
 def process_pos_sale(
     sale_id: str,
     user: User,
@@ -338,6 +342,12 @@ def process_pos_sale(
     """
     Procesa una venta POS completa usando eventos para validaciones y movimientos.
     
+    Los movimientos los crea el handler de stock en una sola transacción para
+    toda la venta (ver `request_sale_consumption`): o se consumen todos los
+    ítems o ninguno. No se abre una transacción acá, que no cubriría esas
+    escrituras y dejaría la conexión con un snapshot abierto mientras el
+    handler escribe.
+    
     Args:
         sale_id: ID único de la venta
         user: Usuario que realiza la venta
@@ -390,55 +400,96 @@ def process_pos_sale(
                 'lot_override_reason': item.get('lot_override_reason')
             })
         
-        # Procesar cada item usando eventos
-        all_movements = []
-        total_amount = Decimal('0')
-        
-        for item in validated_items:
-            if item['lot_id'] is None:
-                # FEFO automático - usar eventos
-                result = process_fefo_allocation(
-                    product=item['product'],
-                    qty=item['qty'],
-                    customer=customer,
-                    user=user,
-                    sale_id=sale_id,
-                    sequence=item['sequence'],
-                    correlation_id=correlation_id
-                )
-            else:
-                # Override de lote - usar eventos
-                result = process_lot_override(
-                    product=item['product'],
-                    lot_id=item['lot_id'],
-                    qty=item['qty'],
-                    user=user,
+        # Asignar y consumir toda la venta en una sola solicitud (una transacción en Stock)
+        sale_items = [
+            SaleItemData(
+                product_id=item['product'].id,
+                product_name=item['product'].name,
+                product_code=item['product'].code,
+                sequence=item['sequence'],
+                qty=item['qty'],
+                unit_price=item['unit_price'],
+                lot_id=item['lot_id'],
+                lot_override_reason=item['lot_override_reason']
+            )
+            for item in validated_items
+        ]
+        consumption = request_sale_consumption(sale_id, user, customer, sale_items)
+        
+        if consumption.get('error'):
+            return {
+                'success': False,
+                'error_code': consumption['error_code'],
+                'error_message': consumption['detail']
+            }
+        
+        all_movements = [
+            {
+                'product_id': item.product_id,
+                'product_name': item.product_name,
+                'lot_id': movement['lot_id'],
+                'lot_code': movement['lot_code'],
+                'qty': movement['qty'],
+                'unit_cost': movement['unit_cost'],
+                'movement_id': movement['movement_id'],
+                'sequence': item.sequence
+            }
+            for item, line in zip(sale_items, consumption['lines'])
+            for movement in line['movements']
+        ]
+        total_amount = sum(
+            (Decimal(str(m['qty'])) * Decimal(str(m['unit_cost'])) for m in all_movements),
+            Decimal('0')
+        )
+        
+        # El stock ya quedó consumido: si la notificación falla no se revierte la venta
+        notifications = [
+            SaleItemProcessed(
+                sale_id=sale_id,
+                item_sequence=m['sequence'],
+                product_id=m['product_id'],
+                product_name=m['product_name'],
+                qty_from_lot=m['qty'],
+                lot_id=m['lot_id'],
+                lot_code=m['lot_code'],
+                movement_id=m['movement_id'],
+                user_id=user.id,
+                correlation_id=correlation_id
+            )
+            for m in all_movements
+        ]
+        for item, line in zip(sale_items, consumption['lines']):
+            if item.lot_id is not None:
+                movement = line['movements'][0]
+                notifications.append(LotOverrideExecuted(
                     sale_id=sale_id,
-                    sequence=item['sequence'],
-                    override_pin=override_pin,
-                    reason=item['lot_override_reason'],
+                    user_id=user.id,
+                    username=user.username,
+                    product_id=item.product_id,
+                    product_name=item.product_name,
+                    lot_id=item.lot_id,
+                    lot_code=movement['lot_code'],
+                    qty_consumed=item.qty,
+                    reason=item.lot_override_reason or '',
+                    audit_id=line.get('audit_id'),
+                    movement_id=movement['movement_id'],
                     correlation_id=correlation_id
-                )
-            
-            if not result['success']:
-                return result
-            
-            all_movements.extend(result['movements'])
-            total_amount += sum(Decimal(str(m['qty'])) * Decimal(str(m['unit_cost'])) 
-                              for m in result['movements'])
-        
-        # Publicar evento de venta creada
-        sale_created_event = SaleCreated(
+                ))
+        notifications.append(SaleCreated(
             sale_id=sale_id,
             user_id=user.id,
             username=user.username,
             customer_id=customer.id if customer else None,
+            items=sale_items,
             total_items=len(validated_items),
             total_amount=total_amount,
             override_pin_used=bool(override_pin),
             correlation_id=correlation_id
-        )
-        publish_pos_event(sale_created_event)
+        ))
+        try:
+            publish_many_sync(notifications)
+        except Exception as e:
+            logger.error(f"Sale {sale_id} committed but its events were not published: {str(e)}")
         
         return {
             'success': True,
@@ -458,7 +509,7 @@ def process_pos_sale(
             user_id=user.id,
             correlation_id=correlation_id
         )
-        publish_pos_event(error_event)
+        publish_sync(error_event)
         
         return {
             'success': False,
@@ -467,204 +518,95 @@ def process_pos_sale(
         }
 
 
-def process_fefo_allocation(
-    product: Product,
-    qty: Decimal,
-    customer: Optional[Customer],
-    user: User,
+def _sale_consumption_event(
     sale_id: str,
-    sequence: int,
-    correlation_id: Optional[str] = None
-) -> Dict[str, Any]:
-    """
-    Procesa la asignación FEFO para un producto usando eventos.
-    
-    Returns:
-        Dict con resultado del procesamiento
-    """
-    try:
-        # Determinar vida útil mínima
-        min_shelf_life_days = customer.min_shelf_life_days if customer else 0
-        
-        # Solicitar validación de stock via eventos
-        validation_event = StockValidationRequested(
-            product_id=product.id,
-            qty=qty,
-            customer_id=customer.id if customer else None,
-            min_shelf_life_days=min_shelf_life_days,
-            allocation_type='fefo',
-            sale_id=sale_id,
-            user_id=user.id,
-            correlation_id=correlation_id
-        )
-        
-        # Publicar evento y esperar respuesta del handler
-        validation_result = publish_pos_event(validation_event)
-        
-        if validation_result.get('error'):
-            return {
-                'success': False,
-                'error_code': validation_result['error_code'],
-                'error_message': validation_result['detail']
-            }
-        
-        # Procesar cada asignación del plan FEFO
-        movements = []
-        for allocation in validation_result.get('allocation_plan', []):
-            # Crear datos del ítem para el evento
-            sale_item_data = SaleItemData(
-                product_id=product.id,
-                lot_id=allocation['lot_id'],
-                qty_allocated=allocation['qty_allocated'],
-                unit_price=Decimal('0'),  # Se calculará en el handler
-                sequence=sequence
-            )
-            
-            # Publicar evento de procesamiento de ítem
-            item_event = SaleItemProcessed(
-                sale_id=sale_id,
-                item_data=sale_item_data,
-                allocation_type='fefo',
-                user_id=user.id,
-                correlation_id=correlation_id
-            )
-            
-            item_result = publish_pos_event(item_event)
-            
-            if item_result.get('error'):
-                return {
-                    'success': False,
-                    'error_code': item_result['error_code'],
-                    'error_message': item_result['detail']
+    user: User,
+    customer: Optional[Customer],
+    items: List[SaleItemData],
+    expires_at: datetime
+) -> SaleStockConsumptionRequested:
+    """Arma la solicitud de consumo de stock de la venta completa."""
+    return SaleStockConsumptionRequested(
+        sale_id=sale_id,
+        user_id=user.id,
+        items=items,
+        customer_id=customer.id if customer else None,
+        min_shelf_life_days=customer.min_shelf_life_days if customer else 0,
+        expires_at=expires_at,
+        correlation_id=str(uuid.uuid4())
+    )
+
+
+def _committed_sale_lines(sale_id: str, items: List[SaleItemData]) -> Optional[List[Dict[str, Any]]]:
+    """Líneas ya consumidas de la venta (por SaleItemLot), o None si no se confirmó nada."""
+    rows = list(
+        SaleItemLot.objects.filter(sale_id=sale_id)
+        .select_related('lot', 'movement')
+        .order_by('item_sequence', 'id')
+    )
+    if not rows:
+        return None
+    audits = {
+        (product_id, lot_id): audit_id
+        for audit_id, product_id, lot_id in LotOverrideAudit.objects.filter(sale_id=sale_id)
+        .values_list('id', 'product_id', 'lot_chosen_id')
+    }
+    return [
+        {
+            'sequence': item.sequence,
+            'audit_id': audits.get((item.product_id, item.lot_id)) if item.lot_id is not None else None,
+            'movements': [
+                {
+                    'lot_id': row.lot_id,
+                    'lot_code': row.lot.lot_code,
+                    'qty': row.qty_consumed,
+                    'unit_cost': row.movement.unit_cost,
+                    'movement_id': row.movement_id
                 }
-            
-            movements.append({
-                'product_id': product.id,
-                'lot_id': allocation['lot_id'],
-                'qty': allocation['qty_allocated'],
-                'unit_cost': item_result.get('unit_cost', Decimal('0')),
-                'movement_id': item_result.get('movement_id'),
-                'sequence': sequence
-            })
-        
-        return {
-            'success': True,
-            'movements': movements
-        }
-        
-    except Exception as e:
-        logger.error(f"Error in FEFO allocation for product {product.id}: {str(e)}")
-        return {
-            'success': False,
-            'error_code': 'FEFO_ERROR',
-            'error_message': str(e)
+                for row in rows if row.item_sequence == item.sequence
+            ]
         }
+        for item in items
+    ]
 
 
-def process_lot_override(
-    product: Product,
-    lot_id: int,
-    qty: Decimal,
-    user: User,
+def request_sale_consumption(
     sale_id: str,
-    sequence: int,
-    override_pin: Optional[str] = None,
-    reason: Optional[str] = None,
-    correlation_id: Optional[str] = None
+    user: User,
+    customer: Optional[Customer],
+    items: List[SaleItemData]
 ) -> Dict[str, Any]:
     """
-    Procesa un override de lote específico usando eventos.
+    Solicita a Stock el consumo de todos los ítems de la venta y espera la respuesta.
+    
+    Stock asigna cada ítem después de descontar lo que tomaron los anteriores y
+    confirma todo junto o nada. Si la respuesta no llega a tiempo se consulta
+    lo confirmado: la transacción se descarta pasado `expires_at`, así que
+    después del margen de commit lo que haya en SaleItemLot es definitivo.
     
     Returns:
-        Dict con resultado del procesamiento
+        Dict con `lines` (movimientos por ítem, en el orden de `items`) o con
+        error, error_code y detail
     """
+    timeout = settings.EVENT_REQUEST_TIMEOUT_SECONDS
+    event = _sale_consumption_event(
+        sale_id, user, customer, items, timezone.now() + timedelta(seconds=timeout)
+    )
     try:
-        # Solicitar override via eventos
-        override_event = LotOverrideRequested(
-            sale_id=sale_id,
-            product_id=product.id,
-            lot_id=lot_id,
-            qty=qty,
-            user_id=user.id,
-            override_pin=override_pin or '',
-            reason=reason,
-            correlation_id=correlation_id
-        )
-        
-        # Publicar evento y esperar respuesta del handler
-        override_result = publish_pos_event(override_event)
-        
-        if override_result.get('error'):
+        reply = request_sync(event, timeout=timeout + settings.POS_SALE_COMMIT_GRACE_SECONDS)
+    except TimeoutError:
+        reply = None
+    if reply is None or reply.get('error_code') == 'SALE_ALREADY_PROCESSED':
+        lines = _committed_sale_lines(sale_id, items)
+        if lines is None:
             return {
-                'success': False,
-                'error_code': override_result['error_code'],
-                'error_message': override_result['detail']
+                'error': True,
+                'error_code': 'STOCK_TIMEOUT',
+                'detail': f"Stock no respondió a tiempo; la venta {sale_id} no se registró"
             }
-        
-        # Crear datos del ítem para el evento de procesamiento
-        sale_item_data = SaleItemData(
-            product_id=product.id,
-            lot_id=lot_id,
-            qty_allocated=qty,
-            unit_price=Decimal('0'),  # Se calculará en el handler
-            sequence=sequence
-        )
-        
-        # Publicar evento de procesamiento de ítem
-        item_event = SaleItemProcessed(
-            sale_id=sale_id,
-            item_data=sale_item_data,
-            allocation_type='override',
-            override_reason=reason,
-            user_id=user.id,
-            correlation_id=correlation_id
-        )
-        
-        item_result = publish_pos_event(item_event)
-        
-        if item_result.get('error'):
-            return {
-                'success': False,
-                'error_code': item_result['error_code'],
-                'error_message': item_result['detail']
-            }
-        
-        # Publicar evento de override ejecutado
-        override_executed_event = LotOverrideExecuted(
-            sale_id=sale_id,
-            product_id=product.id,
-            lot_id=lot_id,
-            qty=qty,
-            reason=reason,
-            user_id=user.id,
-            username=user.username,
-            lot_code=override_result.get('lot_code', f'LOT-{lot_id}'),
-            movement_id=item_result.get('movement_id'),
-            correlation_id=correlation_id
-        )
-        publish_pos_event(override_executed_event)
-        
-        movement_data = {
-            'product_id': product.id,
-            'lot_id': lot_id,
-            'qty': qty,
-            'unit_cost': item_result.get('unit_cost', Decimal('0')),
-            'movement_id': item_result.get('movement_id'),
-            'sequence': sequence
-        }
-        
-        return {
-            'success': True,
-            'movements': [movement_data]
-        }
-        
-    except Exception as e:
-        logger.error(f"Error in lot override for product {product.id}, lot {lot_id}: {str(e)}")
-        return {
-            'success': False,
-            'error_code': 'OVERRIDE_ERROR',
-            'error_message': str(e)
-        }
+        logger.warning(f"Sale {sale_id} stock reply missing or repeated; using the committed lines")
+        return {'error': False, 'lines': lines}
+    return reply
 
 
 def get_sale_detail_data(sale_id: str, user: User) -> Dict[str, Any]:
@@ -835,7 +777,7 @@ def generate_price_quote(customer: Customer, items: List[Dict[str, Any]]) -> Dic
             total_amount=quote.total,
             correlation_id=str(uuid.uuid4())
         )
-        publish_pos_event(quote_event)
+        publish_sync(quote_event)
         
         return {
             'success': True,
@@ -859,7 +801,7 @@ def generate_price_quote(customer: Customer, items: List[Dict[str, Any]]) -> Dic
             error_message=str(e),
             correlation_id=str(uuid.uuid4())
         )
-        publish_pos_event(failure_event)
+        publish_sync(failure_event)
         
         return {
             'success': False,
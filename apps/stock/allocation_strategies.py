@@ -0,0 +1,181 @@
+# apps/stock/allocation_strategies.py
+"""
+Estrategias de asignación de lotes.
+
+Una estrategia recibe los lotes candidatos ya filtrados y en orden FEFO
+`(expiry_date, id)` junto con la cantidad disponible de cada uno y decide, en
+memoria, de qué lotes sale cada unidad. La usan `allocate_lots_fefo`,
+`allocate_many` y `FEFOService.allocate_stock_fefo`:
+
+- `fefo` (default): FEFO estricto, llena los lotes en orden.
+- `min_splits`: FEFO dentro de una tolerancia de vencimiento
+  (settings.STOCK_ALLOCATION_EXPIRY_TOLERANCE_DAYS): entre los lotes que
+  vencen dentro de esa ventana elige la combinación con menos lotes y
+  depósitos, para generar menos movimientos por línea.
+
+La estrategia se elige por llamada (`strategy=`), por cliente
+(`Customer.allocation_strategy`) o globalmente (settings.STOCK_ALLOCATION_STRATEGY).
+Se pueden registrar estrategias nuevas con `register_allocation_strategy()`.
+"""
+
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from decimal import Decimal
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from apps.core.metrics import observe_allocation_movements
+
+STRATEGY_FEFO = 'fefo'
+STRATEGY_MIN_SPLITS = 'min_splits'
+
+AllocationStep = Tuple[object, Decimal]
+
+
+class AllocationStrategy(ABC):
+    """
+    Interfaz de una estrategia de asignación.
+
+    `plan()` no toca la base: devuelve (lote, cantidad) por lote usado. Si
+    los lotes no alcanzan, asigna lo que hay y el llamador informa el faltante.
+    """
+    name: str = ''
+
+    @abstractmethod
+    def plan(self, lots: Sequence, qty: Decimal, available: Mapping[int, Decimal]) -> List[AllocationStep]:
+        """Reparte `qty` entre `lots` según `available` (lot_id -> cantidad)."""
+        pass
+
+
+class StrictFEFOStrategy(AllocationStrategy):
+    """Llena los lotes en orden de vencimiento."""
+    name = STRATEGY_FEFO
+
+    def plan(self, lots, qty, available):
+        steps = []
+        remaining = qty
+        for lot in lots:
+            if remaining <= 0:
+                break
+            take = min(remaining, available.get(lot.id, Decimal('0')))
+            if take <= 0:
+                continue
+            steps.append((lot, take))
+            remaining -= take
+        return steps
+
+
+class MinSplitFEFOStrategy(AllocationStrategy):
+    """
+    FEFO con tolerancia de vencimiento que minimiza lotes y depósitos.
+
+    Toma como ventana los lotes que vencen hasta `tolerance_days` después del
+    más próximo. Si la ventana alcanza, compara la mejor combinación de cada
+    depósito con la mejor global y se queda con la de menos lotes (luego menos
+    depósitos). Si no alcanza, consume la ventana entera y repite con los lotes
+    siguientes.
+    """
+    name = STRATEGY_MIN_SPLITS
+
+    def __init__(self, tolerance_days: Optional[int] = None):
+        if tolerance_days is None:
+            tolerance_days = settings.STOCK_ALLOCATION_EXPIRY_TOLERANCE_DAYS
+        self.tolerance = timedelta(days=tolerance_days)
+
+    @staticmethod
+    def _fewest_lots(lots, qty, available) -> List[AllocationStep]:
+        """Lotes grandes primero hasta que uno solo cubra el resto; ese, el de vencimiento más próximo."""
+        steps = []
+        remaining = qty
+        pool = list(lots)
+        while remaining > 0 and pool:
+            closing = next((lot for lot in pool if available[lot.id] >= remaining), None)
+            if closing is not None:
+                steps.append((closing, remaining))
+                break
+            largest = max(pool, key=lambda lot: (available[lot.id], -lot.expiry_date.toordinal(), -lot.id))
+            pool.remove(largest)
+            steps.append((largest, available[largest.id]))
+            remaining -= available[largest.id]
+        return steps
+
+    def plan(self, lots, qty, available):
+        lots = [lot for lot in lots if available.get(lot.id, Decimal('0')) > 0]
+        steps: List[AllocationStep] = []
+        remaining = qty
+
+        while remaining > 0 and lots:
+            horizon = lots[0].expiry_date + self.tolerance
+            window = [lot for lot in lots if lot.expiry_date <= horizon]
+            window_qty = sum((available[lot.id] for lot in window), Decimal('0'))
+
+            if window_qty < remaining:
+                steps.extend((lot, available[lot.id]) for lot in window)
+                remaining -= window_qty
+                lots = lots[len(window):]
+                continue
+
+            by_warehouse: Dict[Optional[int], list] = {}
+            for lot in window:
+                by_warehouse.setdefault(lot.warehouse_id, []).append(lot)
+            options = [self._fewest_lots(window, remaining, available)]
+            for warehouse_lots in by_warehouse.values():
+                if sum((available[lot.id] for lot in warehouse_lots), Decimal('0')) >= remaining:
+                    options.append(self._fewest_lots(warehouse_lots, remaining, available))
+
+            best = min(options, key=lambda option: (
+                len(option),
+                len({lot.warehouse_id for lot, _ in option}),
+                [(lot.expiry_date, lot.id) for lot, _ in option],
+            ))
+            # Orden FEFO dentro del plan elegido
+            steps.extend(sorted(best, key=lambda step: (step[0].expiry_date, step[0].id)))
+            remaining = Decimal('0')
+
+        return steps
+
+
+_STRATEGIES: Dict[str, Callable[[], AllocationStrategy]] = {
+    STRATEGY_FEFO: StrictFEFOStrategy,
+    STRATEGY_MIN_SPLITS: MinSplitFEFOStrategy,
+}
+
+
+def register_allocation_strategy(name: str, factory: Callable[[], AllocationStrategy]) -> None:
+    """Registra (o reemplaza) una estrategia seleccionable por nombre."""
+    _STRATEGIES[name] = factory
+
+
+def allocation_strategy_names() -> List[str]:
+    return sorted(_STRATEGIES)
+
+
+def get_allocation_strategy(strategy=None, customer=None) -> AllocationStrategy:
+    """
+    Resuelve la estrategia: la de la llamada, la del cliente o la global.
+
+    Args:
+        strategy: Nombre o instancia de AllocationStrategy (opcional)
+        customer: Cliente con `allocation_strategy` (opcional; vacío = global)
+
+    Raises:
+        ValueError: Si el nombre no está registrado
+    """
+    if isinstance(strategy, AllocationStrategy):
+        return strategy
+    name = (
+        strategy
+        or getattr(customer, 'allocation_strategy', '')
+        or settings.STOCK_ALLOCATION_STRATEGY
+    )
+    try:
+        return _STRATEGIES[name]()
+    except KeyError:
+        raise ValueError(f"Estrategia de asignación desconocida: {name}")
+
+
+def record_allocation_metrics(strategy: AllocationStrategy, movements_per_line: Sequence[int]) -> None:
+    """Registra cuántos movimientos generó cada línea asignada con `strategy`."""
+    for movements in movements_per_line:
+        observe_allocation_movements(movements, strategy=strategy.name)
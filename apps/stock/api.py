@@ -18,6 +18,7 @@ from .services import (
     handle_legacy_stock_entry, handle_legacy_stock_exit, handle_stock_lots_query
 )
 from .idempotency_service import IdempotencyService
+from .receipt_service import handle_bulk_receipt_request, parse_receipt_file
 from apps.events.manager import EventSystemManager
 
 router = Router()
@@ -81,8 +82,8 @@ class ErrorOut(Schema):
 
 # New event-driven endpoints (v2)
 
-@router.post("/v2/entry", response={202: dict, 400: ErrorOut, 404: ErrorOut})
-def request_stock_entry_v2(request: HttpRequest, payload: EntryIn):
+@router.post("/v2/entry", response={201: dict, 202: dict, 400: ErrorOut, 404: ErrorOut, 409: ErrorOut})
+def request_stock_entry_v2(request: HttpRequest, payload: EntryIn, mode: Optional[str] = None):
     """
     Solicita una entrada de stock usando eventos (v2 - event-driven).
     
@@ -90,6 +91,8 @@ def request_stock_entry_v2(request: HttpRequest, payload: EntryIn):
     - Procesamiento asíncrono mediante event handlers
     - Respuesta inmediata con event_id para tracking
     - Idempotencia mediante Idempotency-Key header
+    - ?mode=direct: alta en línea (201) y eventos solo como notificación
+      (default: settings.STOCK_ENTRY_MODE)
     """
     # Check for idempotency key
     idempotency_key = IdempotencyService.get_idempotency_key(request)
@@ -107,13 +110,14 @@ def request_stock_entry_v2(request: HttpRequest, payload: EntryIn):
             "warehouse_id": payload.warehouse_id,
             "reason": payload.reason,
         },
-        idempotency_key=idempotency_key
+        idempotency_key=idempotency_key,
+        mode=mode
     )
     
     return status_code, response_data
 
 
-@router.post("/v2/exit", response={202: dict, 400: ErrorOut, 404: ErrorOut})
+@router.post("/v2/exit", response={202: dict, 400: ErrorOut, 404: ErrorOut, 409: ErrorOut})
 def request_stock_exit_v2(request: HttpRequest, payload: ExitIn):
     """
     Solicita una salida de stock usando eventos (v2 - event-driven).
@@ -198,6 +202,37 @@ def validate_stock_v2(
     return status_code, response_data
 
 
+@router.post("/receipts/bulk", response={201: dict, 400: dict, 409: dict})
+def bulk_stock_receipt(
+    request: HttpRequest,
+    allow_partial: bool = Query(False, description="Aplicar filas válidas aunque otras fallen")
+):
+    """
+    Recepción masiva de stock (JSON o CSV) con upsert por lote.
+    
+    - Body JSON: lista de filas o {"rows": [...]}; CSV con Content-Type text/csv
+    - Columnas: product_code, lot_code, expiry_date, qty, unit_cost, warehouse
+    - Errores reportados por fila; sin allow_partial cualquier error rechaza todo
+    - Idempotencia mediante Idempotency-Key header
+    """
+    idempotency_key = IdempotencyService.get_idempotency_key(request)
+    if not idempotency_key:
+        return 400, {"error": "MISSING_IDEMPOTENCY_KEY", "message": "Idempotency-Key header is required"}
+    
+    fmt = "csv" if request.content_type in ("text/csv", "application/csv") else "json"
+    try:
+        rows = parse_receipt_file(request.body.decode("utf-8"), fmt)
+    except (ValueError, UnicodeDecodeError) as e:
+        return 400, {"error": "INVALID_PAYLOAD", "message": str(e)}
+    
+    return handle_bulk_receipt_request(
+        request_user=getattr(request, 'user', None),
+        rows=rows,
+        idempotency_key=idempotency_key,
+        allow_partial=allow_partial
+    )
+
+
 # Legacy endpoints (v1 - deprecated but maintained for backward compatibility)
 
 @router.get("/health")
@@ -205,7 +240,7 @@ def stock_health(request) -> dict:
     """Health check endpoint for stock module."""
     return {"status": "ok", "module": "stock", "version": "2.0.0"}
 
-@router.post("/entry", response={201: EntryOut, 400: ErrorOut, 404: ErrorOut})
+@router.post("/entry", response={201: EntryOut, 400: ErrorOut, 404: ErrorOut, 409: ErrorOut})
 def create_stock_entry(request: HttpRequest, payload: EntryIn):
     """
     LEGACY: Crea una entrada de stock de forma transaccional.
@@ -238,7 +273,7 @@ def create_stock_entry(request: HttpRequest, payload: EntryIn):
     
     return status_code, response_data
 
-@router.post("/exit", response={201: ExitOut, 400: ErrorOut, 404: ErrorOut})
+@router.post("/exit", response={201: ExitOut, 400: ErrorOut, 404: ErrorOut, 409: ErrorOut})
 def create_stock_exit(request: HttpRequest, payload: ExitIn):
     """
     LEGACY: Crea una salida de stock siguiendo FEFO de forma transaccional.
@@ -1,8 +1,11 @@
+from datetime import date
 from decimal import Decimal
 from typing import Optional, List
-from ninja import Router, Schema
+from ninja import Router, Schema, Query
+from django.http import StreamingHttpResponse
 
 from apps.stock.services import record_exit_fefo, ExitError
+from apps.stock.export_service import EXPORT_FORMATS, DEFAULT_CHUNK_SIZE, stream_movements
 
 
 router = Router()
@@ -45,4 +48,40 @@ def create_exit(request, payload: ExitIn):
         }
     except ExitError as e:
         status = 409 if e.code == "INSUFFICIENT_STOCK" else 400
-        return status, {"error": e.code, "message": str(e)}
\ No newline at end of file
+        return status, {"error": e.code, "message": str(e)}
+
+
+@router.get("/export", response={200: None, 400: ErrorOut})
+def export_movements(
+    request,
+    format: str = Query("csv", description="csv | ndjson"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    product_id: Optional[int] = None,
+    reason: Optional[str] = None,
+    warehouse_id: Optional[int] = None,
+    chunk_size: int = Query(DEFAULT_CHUNK_SIZE, ge=100, le=10000),
+):
+    """
+    Exporta el libro de movimientos en streaming (CSV o NDJSON).
+    La memoria se mantiene constante sin importar la cantidad de filas.
+    """
+    if format not in EXPORT_FORMATS:
+        return 400, {"error": "VALIDATION_ERROR", "message": f"Formato no soportado: {format}"}
+    if date_from and date_to and date_from > date_to:
+        return 400, {"error": "VALIDATION_ERROR", "message": "date_from no puede ser mayor a date_to"}
+
+    content = stream_movements(
+        format,
+        chunk_size=chunk_size,
+        date_from=date_from,
+        date_to=date_to,
+        product_id=product_id,
+        reason=reason,
+        warehouse_id=warehouse_id,
+    )
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[format])
+    response["Content-Disposition"] = f'attachment; filename="movements.{format}"'
+    # Evita que nginx acumule la respuesta completa antes de enviarla
+    response["X-Accel-Buffering"] = "no"
+    return response
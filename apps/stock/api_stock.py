@@ -3,13 +3,14 @@ from datetime import date, timedelta
 from decimal import Decimal
 from typing import List, Optional
 
-from ninja import Router, Schema
+from ninja import Query, Router, Schema
 from django.shortcuts import get_object_or_404
 from django.db.models import Sum
 import os
 
 from apps.catalog.models import Product
 from apps.stock.models import StockLot
+from apps.stock.snapshot_service import as_of
 
 router = Router(tags=["stock"])
 
@@ -38,7 +39,43 @@ class ErrorOut(Schema):
     error: str
     message: str
 
-# ===== Endpoint =====
+class LotAsOfOut(Schema):
+    lot_id: int
+    product_id: int
+    warehouse_id: int
+    qty_on_hand: Decimal
+
+class StockAsOfOut(Schema):
+    as_of_date: date
+    source: str
+    source_date: date
+    lots: List[LotAsOfOut]
+
+# ===== Endpoints =====
+@router.get("/stock/as-of", response={200: StockAsOfOut, 400: ErrorOut})
+def get_stock_as_of(
+    request,
+    as_of_date: date = Query(..., description="Fecha YYYY-MM-DD (existencia al cierre del día)"),
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    lot_id: Optional[int] = None,
+):
+    """
+    Existencia por lote al cierre de una fecha, reconstruida desde el snapshot
+    más cercano más el delta de movimientos.
+    """
+    try:
+        result = as_of(as_of_date, product_id=product_id, warehouse_id=warehouse_id, lot_id=lot_id)
+    except ValueError as e:
+        return 400, {"error": "VALIDATION_ERROR", "message": str(e)}
+
+    return {
+        "as_of_date": result.day,
+        "source": result.source,
+        "source_date": result.source_date,
+        "lots": [lot._asdict() for lot in result.lots],
+    }
+
 @router.get("/stock/{product_id}", response={200: StockOut, 404: ErrorOut})
 def get_stock_by_product(request, product_id: int):
     """
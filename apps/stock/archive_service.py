@@ -0,0 +1,404 @@
+# apps/stock/archive_service.py
+"""
+Retención del libro de movimientos.
+
+`archive_movements()` procesa los movimientos anteriores a una fecha de corte en
+lotes; cada lote, en una transacción:
+1. suma sus importes a MovementDailyAggregate (día, producto, depósito, motivo, tipo),
+2. copia las filas crudas a `stock_movement_archive` con INSERT ... SELECT,
+3. las borra de `stock_movement`.
+
+Los movimientos referenciados por SaleItemLot (PROTECT) quedan en la tabla viva,
+igual que los movimientos sin lote (anteriores a los constraints de la migración
+0004): el agregado diario necesita el depósito, que sale del lote.
+
+`retire_expired_lots()` retira los lotes vencidos y agotados por rangos de id:
+los marca `is_archived` y, cuando ya nada los referencia (movimientos vivos,
+reservas, ventas POS...), los mueve a `stock_lot_archive`.
+
+`movement_ledger()` y `daily_movement_totals()` son la API de lectura unificada
+(tabla viva + archivo), para que reportes y exportaciones no dependan de dónde
+esté cada fila.
+"""
+
+import logging
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, Exists, F, Max, Min, OuterRef, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Movement, StockLot
+from .models_archive import MovementArchive, MovementDailyAggregate, StockLotArchive
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_LOT_BATCH_SIZE = 1000
+
+# Columnas copiadas al archivo: (columna en stock_movement_archive, lookup en Movement)
+ARCHIVE_COLUMNS = [
+    ('id', 'id'),
+    ('type', 'type'),
+    ('product_id', 'product_id'),
+    ('lot_id', 'lot_id'),
+    ('warehouse_id', 'lot__warehouse_id'),
+    ('qty', 'qty'),
+    ('unit_cost', 'unit_cost'),
+    ('reason', 'reason'),
+    ('order_id', 'order_id'),
+    ('created_by_id', 'created_by_id'),
+    ('created_at', 'created_at'),
+]
+
+# Columnas copiadas al archivo de lotes (mismo nombre en ambas tablas)
+LOT_ARCHIVE_COLUMNS = ['id', 'product_id', 'warehouse_id', 'lot_code', 'expiry_date', 'unit_cost', 'created_at']
+
+COST_FIELD = DecimalField(max_digits=18, decimal_places=2)
+
+
+def _day_start(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _month_start(value: date) -> date:
+    return value.replace(day=1)
+
+
+def _next_month(value: date) -> date:
+    return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def archive_partition_name(month: date) -> str:
+    return f"{MovementArchive._meta.db_table}_y{month.year}m{month.month:02d}"
+
+
+def ensure_archive_partitions(start: date, end: date) -> List[str]:
+    """
+    Crea (si faltan) las particiones mensuales del archivo que cubren [start, end].
+
+    Solo aplica en PostgreSQL; en otros motores el archivo es una tabla común.
+    """
+    if connection.vendor != 'postgresql':
+        return []
+
+    table = MovementArchive._meta.db_table
+    created = []
+    month = _month_start(start)
+    with connection.cursor() as cursor:
+        while month <= end:
+            partition = archive_partition_name(month)
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{partition}" PARTITION OF "{table}" '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [_day_start(month), _day_start(_next_month(month))]
+            )
+            created.append(partition)
+            month = _next_month(month)
+    return created
+
+
+def _rollup(batch) -> int:
+    """Suma el lote de movimientos a los agregados diarios existentes."""
+    rows = list(
+        batch.order_by()
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'product_id', 'lot__warehouse_id', 'reason', 'type')
+        .annotate(
+            total_qty=Sum('qty'),
+            total_cost=Coalesce(
+                Sum(F('qty') * F('unit_cost'), output_field=COST_FIELD),
+                Value(Decimal('0'), output_field=COST_FIELD)
+            ),
+            count=Count('id'),
+        )
+    )
+    if not rows:
+        return 0
+
+    def key_of(day, product_id, warehouse_id, reason, movement_type):
+        return (day, product_id, warehouse_id, reason, movement_type)
+
+    aggregates = {}
+    existing = MovementDailyAggregate.objects.select_for_update().filter(
+        day__in={row['day'] for row in rows},
+        product_id__in={row['product_id'] for row in rows},
+    )
+    for aggregate in existing:
+        aggregates[key_of(aggregate.day, aggregate.product_id, aggregate.warehouse_id,
+                          aggregate.reason, aggregate.type)] = aggregate
+
+    for row in rows:
+        key = key_of(row['day'], row['product_id'], row['lot__warehouse_id'], row['reason'], row['type'])
+        aggregate = aggregates.get(key)
+        if aggregate is None:
+            aggregate = aggregates[key] = MovementDailyAggregate(
+                day=row['day'],
+                product_id=row['product_id'],
+                warehouse_id=row['lot__warehouse_id'],
+                reason=row['reason'],
+                type=row['type'],
+            )
+        aggregate.qty += row['total_qty']
+        aggregate.cost += row['total_cost']
+        aggregate.movement_count += row['count']
+
+    MovementDailyAggregate.objects.bulk_create(
+        list(aggregates.values()),
+        update_conflicts=True,
+        unique_fields=['day', 'product', 'warehouse', 'reason', 'type'],
+        update_fields=['qty', 'cost', 'movement_count'],
+    )
+    return len(rows)
+
+
+def _copy_to_archive(batch, archived_at: datetime) -> int:
+    """Copia el lote a stock_movement_archive con un único INSERT ... SELECT."""
+    select = batch.order_by().annotate(
+        archived_at_value=Value(archived_at, output_field=MovementArchive._meta.get_field('archived_at'))
+    ).values_list(*[lookup for _, lookup in ARCHIVE_COLUMNS], 'archived_at_value')
+    sql, params = select.query.sql_with_params()
+
+    columns = ', '.join(f'"{column}"' for column, _ in ARCHIVE_COLUMNS + [('archived_at', None)])
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO "{MovementArchive._meta.db_table}" ({columns}) {sql}', params)
+        return cursor.rowcount
+
+
+def archivable_movements(before: date):
+    """Movimientos anteriores a `before` que pueden salir de la tabla viva."""
+    return Movement.objects.filter(
+        created_at__lt=_day_start(before),
+        saleitemlot__isnull=True,
+        lot__isnull=False,
+    )
+
+
+def archive_movements(before: date, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Archiva los movimientos anteriores a `before` (exclusivo).
+
+    Returns:
+        Dict con movements_archived, aggregate_groups y batches.
+    """
+    result = {'movements_archived': 0, 'aggregate_groups': 0, 'batches': 0}
+    candidates = archivable_movements(before)
+
+    oldest = candidates.order_by('created_at').values_list('created_at', flat=True).first()
+    if oldest is None:
+        return result
+    ensure_archive_partitions(timezone.localdate(oldest), before)
+
+    while True:
+        with transaction.atomic():
+            ids = list(candidates.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+
+            batch = Movement.objects.filter(id__in=ids)
+            result['aggregate_groups'] += _rollup(batch)
+            copied = _copy_to_archive(batch, timezone.now())
+            deleted, _ = batch.delete()
+            if copied != len(ids) or deleted != len(ids):
+                raise RuntimeError(
+                    f"Archivado inconsistente: {len(ids)} seleccionados, {copied} copiados, {deleted} borrados"
+                )
+
+        result['movements_archived'] += len(ids)
+        result['batches'] += 1
+
+    logger.info("Movements archived", extra={'before': before.isoformat(), **result})
+    return result
+
+
+def retention_cutoff(today: Optional[date] = None, retention_days: Optional[int] = None) -> date:
+    """Fecha de corte según retention_days (default: settings.MOVEMENT_RETENTION_DAYS)."""
+    today = today or timezone.localdate()
+    if retention_days is None:
+        retention_days = settings.MOVEMENT_RETENTION_DAYS
+    return today - timedelta(days=retention_days)
+
+
+# Retiro de lotes
+
+def _retirable(today: date) -> Q:
+    return Q(is_archived=False, expiry_date__lt=today, qty_on_hand=0, qty_reserved=0)
+
+
+def _unreferenced_lot_filters() -> List[Exists]:
+    """
+    Un ~Exists por cada tabla con FK con constraint hacia StockLot.
+
+    Archivo de movimientos y snapshots no cuentan: sus FKs no tienen constraint.
+    """
+    return [
+        ~Exists(relation.related_model._base_manager.filter(**{relation.field.name: OuterRef('pk')}))
+        for relation in StockLot._meta.related_objects
+        if not relation.many_to_many and relation.field.db_constraint
+    ]
+
+
+def _move_lots_to_archive(ids: List[int], archived_at: datetime) -> int:
+    """Copia los lotes a stock_lot_archive con INSERT ... SELECT y los borra."""
+    select = StockLot.objects.filter(id__in=ids).order_by().annotate(
+        archived_at_value=Value(archived_at, output_field=StockLotArchive._meta.get_field('archived_at'))
+    ).values_list(*LOT_ARCHIVE_COLUMNS, 'archived_at_value')
+    sql, params = select.query.sql_with_params()
+
+    columns = ', '.join(f'"{column}"' for column in LOT_ARCHIVE_COLUMNS + ['archived_at'])
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO "{StockLotArchive._meta.db_table}" ({columns}) {sql}', params)
+        copied = cursor.rowcount
+
+    deleted, _ = StockLot.objects.filter(id__in=ids).delete()
+    if copied != len(ids) or deleted != len(ids):
+        raise RuntimeError(
+            f"Retiro de lotes inconsistente: {len(ids)} seleccionados, {copied} copiados, {deleted} borrados"
+        )
+    return deleted
+
+
+def retire_expired_lots(today: Optional[date] = None, batch_size: int = DEFAULT_LOT_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Retira los lotes vencidos antes de `today` sin stock ni reservas.
+
+    Recorre rangos fijos de `batch_size` ids, cada uno en su propia transacción:
+    marca los lotes como `is_archived` y mueve a stock_lot_archive los lotes
+    archivados que ya no tienen referencias (incluye los marcados en corridas
+    anteriores cuyos movimientos pasó a archivo la retención).
+
+    Returns:
+        Dict con lots_flagged, lots_moved y batches.
+    """
+    today = today or timezone.localdate()
+    result = {'lots_flagged': 0, 'lots_moved': 0, 'batches': 0}
+
+    bounds = StockLot.objects.filter(Q(is_archived=True) | _retirable(today)).aggregate(
+        first=Min('id'), last=Max('id')
+    )
+    if bounds['first'] is None:
+        return result
+
+    unreferenced = _unreferenced_lot_filters()
+    for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+        id_range = Q(id__gte=start, id__lt=start + batch_size)
+        with transaction.atomic():
+            result['lots_flagged'] += StockLot.objects.filter(id_range, _retirable(today)).update(is_archived=True)
+
+            ids = list(
+                StockLot.objects.select_for_update()
+                .filter(id_range, *unreferenced, is_archived=True, qty_on_hand=0)
+                .values_list('id', flat=True)
+            )
+            if ids:
+                result['lots_moved'] += _move_lots_to_archive(ids, timezone.now())
+        result['batches'] += 1
+
+    logger.info("Expired lots retired", extra={'before': today.isoformat(), **result})
+    return result
+
+
+# API de lectura unificada
+
+def _filter_ledger(qs, warehouse_lookup: str, date_from, date_to, product_id, reason, warehouse_id):
+    if date_from is not None:
+        qs = qs.filter(created_at__gte=_day_start(date_from))
+    if date_to is not None:
+        qs = qs.filter(created_at__lt=_day_start(date_to + timedelta(days=1)))
+    if product_id is not None:
+        qs = qs.filter(product_id=product_id)
+    if reason:
+        qs = qs.filter(reason=reason)
+    if warehouse_id is not None:
+        qs = qs.filter(**{warehouse_lookup: warehouse_id})
+    return qs
+
+
+def movement_ledger(
+    columns: Sequence[Tuple[str, str]],
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    product_id: Optional[int] = None,
+    reason: Optional[str] = None,
+    warehouse_id: Optional[int] = None,
+):
+    """
+    Movimientos vivos + archivados como un único queryset (UNION ALL) ordenado por id.
+
+    Args:
+        columns: Pares (lookup en Movement, lookup en MovementArchive) en el
+            orden de las tuplas devueltas.
+    """
+    filters = dict(date_from=date_from, date_to=date_to, product_id=product_id,
+                   reason=reason, warehouse_id=warehouse_id)
+
+    live = _filter_ledger(Movement.objects.all(), 'lot__warehouse_id', **filters)
+    archived = _filter_ledger(MovementArchive.objects.all(), 'warehouse_id', **filters)
+
+    return (
+        live.values_list(*[live_lookup for live_lookup, _ in columns])
+        .union(archived.values_list(*[archive_lookup for _, archive_lookup in columns]), all=True)
+        .order_by('id')
+    )
+
+
+def daily_movement_totals(
+    date_from: date,
+    date_to: date,
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Totales diarios por (día, producto, depósito, motivo, tipo) en el rango inclusivo.
+
+    Los días archivados salen de MovementDailyAggregate y los vivos se agregan
+    al vuelo; si un día tiene ambos (p. ej. ventas POS no archivables) se suman.
+    """
+    live = _filter_ledger(
+        Movement.objects.all(), 'lot__warehouse_id',
+        date_from, date_to, product_id, None, warehouse_id
+    )
+    live_rows = (
+        live.order_by()
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'product_id', 'lot__warehouse_id', 'reason', 'type')
+        .annotate(
+            total_qty=Sum('qty'),
+            total_cost=Coalesce(
+                Sum(F('qty') * F('unit_cost'), output_field=COST_FIELD),
+                Value(Decimal('0'), output_field=COST_FIELD)
+            ),
+            count=Count('id'),
+        )
+    )
+
+    aggregates = MovementDailyAggregate.objects.filter(day__gte=date_from, day__lte=date_to)
+    if product_id is not None:
+        aggregates = aggregates.filter(product_id=product_id)
+    if warehouse_id is not None:
+        aggregates = aggregates.filter(warehouse_id=warehouse_id)
+
+    totals: Dict[tuple, Dict[str, Any]] = {}
+
+    def add(day, product, warehouse, reason, movement_type, qty, cost, count):
+        key = (day, product, warehouse, reason, movement_type)
+        entry = totals.setdefault(key, {
+            'day': day, 'product_id': product, 'warehouse_id': warehouse, 'reason': reason,
+            'type': movement_type, 'qty': Decimal('0'), 'cost': Decimal('0'), 'movement_count': 0,
+        })
+        entry['qty'] += qty
+        entry['cost'] += cost
+        entry['movement_count'] += count
+
+    for row in aggregates.values_list('day', 'product_id', 'warehouse_id', 'reason', 'type',
+                                      'qty', 'cost', 'movement_count'):
+        add(*row)
+    for row in live_rows:
+        add(row['day'], row['product_id'], row['lot__warehouse_id'], row['reason'], row['type'],
+            row['total_qty'], row['total_cost'], row['count'])
+
+    return sorted(totals.values(), key=lambda entry: (entry['day'], entry['product_id'], entry['warehouse_id'] or 0))
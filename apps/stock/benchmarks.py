@@ -0,0 +1,236 @@
+# apps/stock/benchmarks.py
+"""
+Harness de benchmarks de concurrencia para la asignación de stock.
+
+`run_allocation_benchmark()` crea un producto/depósito temporales con stock
+exactamente igual a la demanda, lanza N hilos que asignan en paralelo con
+`FEFOService.allocate_stock_fefo` y mide throughput y falsos "sin stock": como
+la oferta alcanza para todas las asignaciones, cualquier NotEnoughStock /
+NoLotsAvailable es un falso negativo causado por la estrategia de lock.
+
+Solo es representativo en PostgreSQL; en SQLite la base entera se serializa.
+
+`run_entry_benchmark()` mide la latencia p50/p99 de `handle_stock_entry_request`
+en modo 'events' (cadena de eventos) o 'direct' (alta en línea).
+"""
+
+import logging
+import math
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import List, NamedTuple
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from apps.catalog.models import Product
+from .fefo_service import FEFOService
+from .models import Movement, ProductStockSummary, StockLot, Warehouse
+from .models_idempotency import StockIdempotencyKey
+from .services import NoLotsAvailable, NotEnoughStock, StockError, handle_stock_entry_request
+
+logger = logging.getLogger(__name__)
+
+
+class AllocationBenchmarkResult(NamedTuple):
+    """Resultado de una corrida del benchmark de asignación."""
+    strategy: str
+    threads: int
+    attempts: int
+    succeeded: int
+    false_out_of_stock: int
+    conflicts: int
+    errors: int
+    elapsed_seconds: float
+    remaining_qty: Decimal
+
+    @property
+    def throughput(self) -> float:
+        """Asignaciones exitosas por segundo."""
+        return self.succeeded / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def false_out_of_stock_rate(self) -> float:
+        return self.false_out_of_stock / self.attempts if self.attempts else 0.0
+
+
+def _create_fixture(allocations: int, qty: Decimal, lots: int):
+    """Producto, depósito y lotes temporales con stock total = allocations * qty."""
+    suffix = uuid.uuid4().hex[:8]
+    warehouse = Warehouse.objects.create(name=f"bench-{suffix}")
+    product = Product.objects.create(code=f"BENCH-{suffix}", name=f"Benchmark {suffix}", price=Decimal('1.00'))
+
+    total = qty * allocations
+    per_lot = (total / lots).quantize(Decimal('0.001'))
+    today = date.today()
+    for index in range(lots):
+        lot_qty = per_lot if index < lots - 1 else total - per_lot * (lots - 1)
+        StockLot.objects.create(
+            product=product, lot_code=f"B{index:03d}", expiry_date=today + timedelta(days=30 + index),
+            qty_on_hand=lot_qty, unit_cost=Decimal('1.00'), warehouse=warehouse
+        )
+    return product, warehouse
+
+
+def _drop_fixture(product: Product, warehouse: Warehouse) -> None:
+    Movement.objects.filter(product=product).delete()
+    ProductStockSummary.objects.filter(product=product).delete()
+    StockLot.objects.filter(product=product).delete()
+    product.delete()
+    warehouse.delete()
+
+
+def run_allocation_benchmark(
+    strategy: str,
+    threads: int = 8,
+    allocations: int = 200,
+    qty: Decimal = Decimal('1'),
+    lots: int = 5,
+) -> AllocationBenchmarkResult:
+    """
+    Ejecuta `allocations` asignaciones de `qty` repartidas entre `threads` hilos.
+
+    Debe correr fuera de una transacción (cada hilo usa su propia conexión y
+    necesita ver los datos ya commiteados). Los datos temporales se borran al final.
+    """
+    user, _ = get_user_model().objects.get_or_create(username='stock-benchmark')
+    product, warehouse = _create_fixture(allocations, qty, lots)
+
+    counters = {'attempts': 0, 'succeeded': 0, 'false_out_of_stock': 0, 'conflicts': 0, 'errors': 0}
+    counters_lock = threading.Lock()
+
+    def next_attempt() -> bool:
+        with counters_lock:
+            if counters['attempts'] >= allocations:
+                return False
+            counters['attempts'] += 1
+            return True
+
+    def record(outcome: str) -> None:
+        with counters_lock:
+            counters[outcome] += 1
+
+    def worker():
+        try:
+            while next_attempt():
+                try:
+                    FEFOService.allocate_stock_fefo(
+                        product_id=product.id,
+                        qty_needed=qty,
+                        user_id=user.id,
+                        warehouse_id=warehouse.id,
+                        reason=Movement.Reason.ADJUSTMENT,
+                        lock_strategy=strategy,
+                    )
+                    record('succeeded')
+                except (NotEnoughStock, NoLotsAvailable):
+                    record('false_out_of_stock')
+                except StockError:
+                    record('conflicts')
+                except Exception:
+                    logger.warning("Benchmark allocation failed", exc_info=True)
+                    record('errors')
+        finally:
+            connection.close()
+
+    try:
+        pool = [threading.Thread(target=worker, name=f"bench-{index}") for index in range(threads)]
+        started = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        remaining = sum(StockLot.objects.filter(product=product).values_list('qty_on_hand', flat=True), Decimal('0'))
+    finally:
+        _drop_fixture(product, warehouse)
+
+    return AllocationBenchmarkResult(
+        strategy=strategy,
+        threads=threads,
+        elapsed_seconds=elapsed,
+        remaining_qty=remaining,
+        **counters,
+    )
+
+
+class EntryBenchmarkResult(NamedTuple):
+    """Resultado de una corrida del benchmark de entradas."""
+    mode: str
+    iterations: int
+    succeeded: int
+    errors: int
+    lots_written: int
+    p50_ms: float
+    p99_ms: float
+    elapsed_seconds: float
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    """Percentil por rango más cercano (samples ordenados)."""
+    if not samples:
+        return 0.0
+    index = max(0, math.ceil(pct / 100 * len(samples)) - 1)
+    return samples[index]
+
+
+def run_entry_benchmark(mode: str, iterations: int = 200) -> EntryBenchmarkResult:
+    """
+    Ejecuta `iterations` entradas v2 en `mode` y mide la latencia de cada llamada.
+
+    Cada entrada usa un lote y una Idempotency-Key nuevos. `lots_written`
+    cuenta los lotes que quedaron persistidos al terminar (en modo 'events'
+    dependen de que la cadena de eventos los procese); las latencias de dos
+    modos solo son comparables si escribieron los mismos lotes. Los datos
+    temporales se borran al final.
+    """
+    user, _ = get_user_model().objects.get_or_create(username='stock-benchmark')
+    suffix = uuid.uuid4().hex[:8]
+    warehouse = Warehouse.objects.create(name=f"bench-entry-{suffix}")
+    product = Product.objects.create(code=f"BENCH-E-{suffix}", name=f"Benchmark entry {suffix}", price=Decimal('1.00'))
+    expiry_date = date.today() + timedelta(days=90)
+
+    latencies = []
+    succeeded = 0
+    try:
+        started = time.perf_counter()
+        for index in range(iterations):
+            call_started = time.perf_counter()
+            status_code, _ = handle_stock_entry_request(
+                request_user=user,
+                payload_data={
+                    "product_id": product.id,
+                    "lot_code": f"E{index:05d}",
+                    "expiry_date": expiry_date,
+                    "qty": Decimal('1'),
+                    "unit_cost": Decimal('1.00'),
+                    "warehouse_id": warehouse.id,
+                },
+                idempotency_key=f"bench-entry-{suffix}-{index}",
+                mode=mode,
+            )
+            latencies.append((time.perf_counter() - call_started) * 1000)
+            if status_code in (201, 202):
+                succeeded += 1
+        elapsed = time.perf_counter() - started
+
+        lots_written = StockLot.objects.filter(product=product).count()
+    finally:
+        StockIdempotencyKey.objects.filter(key__startswith=f"bench-entry-{suffix}-").delete()
+        _drop_fixture(product, warehouse)
+
+    latencies.sort()
+    return EntryBenchmarkResult(
+        mode=mode,
+        iterations=iterations,
+        succeeded=succeeded,
+        errors=iterations - succeeded,
+        lots_written=lots_written,
+        p50_ms=_percentile(latencies, 50),
+        p99_ms=_percentile(latencies, 99),
+        elapsed_seconds=elapsed,
+    )
@@ -11,14 +11,17 @@ from decimal import Decimal
 from typing import Optional, List, Dict, Any
 from uuid import uuid4
 
+from asgiref.sync import sync_to_async
 from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 from apps.events.base import IEventHandler, HandlerResult, DomainEvent
 from apps.events.utils import event_handler, publish_event
 from apps.core.events import EventBus
 from .models import StockLot, Movement, Warehouse
+from .summary_service import refresh_lot_summaries, refresh_stock_summaries, refresh_stock_summary
 from .events import (
     # Entry events
     StockEntryRequested, StockEntryValidated, StockEntryCompleted, StockEntryFailed,
@@ -38,6 +41,11 @@ from .events import (
     # Notification events
     StockNotificationRequested
 )
+from apps.pos.events import (
+    StockValidationRequested as POSStockValidationRequested,
+    SaleStockConsumptionRequested,
+    LotOverrideRequested
+)
 
 logger = logging.getLogger(__name__)
 
@@ -199,6 +207,7 @@ class StockEntryHandler(IEventHandler):
                 reason=event.reason,
                 created_by_id=None  # Se puede obtener del contexto del evento
             )
+            refresh_stock_summary(product.id, stock_lot.warehouse_id)
             
             # Publicar evento de entrada completada
             await EventBus.publish(StockEntryCompleted(
@@ -426,6 +435,8 @@ class StockExitHandler(IEventHandler):
                     movement_id=str(movement.id)
                 ))
             
+            refresh_lot_summaries(movement["lot_id"] for movement in movements)
+            
             # Publicar evento de salida completada
             await EventBus.publish(StockExitCompleted(
                 event_id=str(uuid4()),
@@ -826,4 +837,223 @@ class StockValidationHandler(IEventHandler):
             
         except Exception as e:
             logger.error(f"Error validating stock for product {event.product_id}: {str(e)}")
-            return HandlerResult.failure(str(e))
\ No newline at end of file
+            return HandlerResult.failure(str(e))
+
+
+# ============================================================================
+# POS REQUEST HANDLERS
+# ============================================================================
+
+class POSStockRequestHandler(IEventHandler):
+    """
+    Responde las solicitudes de stock del POS (request/reply por correlation_id).
+    
+    - StockValidationRequested: plan de asignación FEFO del producto
+    - LotOverrideRequested: valida el lote elegido manualmente
+    - SaleStockConsumptionRequested: asigna y consume todos los ítems de la
+      venta en una sola transacción (movimientos EXIT + SaleItemLot, y la
+      auditoría de los overrides)
+    
+    Cada respuesta lleva `error` y, si falla, `error_code` y `detail`; el resto
+    de las claves es lo que lee `apps.pos.services` de cada solicitud.
+    """
+    
+    @property
+    def handler_name(self) -> str:
+        """Unique name for this handler"""
+        return "pos_stock_request_handler"
+    
+    @property
+    def handled_events(self) -> List[str]:
+        """List of event types this handler can process"""
+        return ["StockValidationRequested", "SaleStockConsumptionRequested", "LotOverrideRequested"]
+    
+    async def handle(self, event: DomainEvent) -> HandlerResult:
+        """Procesa la solicitud y responde a quien la espera"""
+        if isinstance(event, POSStockValidationRequested):
+            process = self._validate_stock
+        elif isinstance(event, LotOverrideRequested):
+            process = self._validate_override
+        elif isinstance(event, SaleStockConsumptionRequested):
+            process = self._consume_sale
+        else:
+            return HandlerResult.success_no_events()
+        
+        # Sin correlation_id es una notificación: nadie espera respuesta
+        if event.correlation_id is None:
+            return HandlerResult.success_no_events()
+        
+        from .services import StockError
+        try:
+            payload = await sync_to_async(process)(event)
+        except StockError as e:
+            payload = {'error': True, 'error_code': e.code, 'detail': str(e)}
+        except Exception as e:
+            logger.error(f"Error processing POS request {event.event_type} for sale {getattr(event, 'sale_id', None)}: {str(e)}")
+            payload = {'error': True, 'error_code': 'INTERNAL_ERROR', 'detail': str(e)}
+        
+        await EventBus.reply(event, payload)
+        return HandlerResult.success_no_events()
+    
+    def _validate_stock(self, event: POSStockValidationRequested) -> Dict[str, Any]:
+        """Plan FEFO para el producto (con la estrategia del cliente si lo hay)"""
+        from apps.catalog.models import Product
+        from apps.customers.models import Customer
+        from .services import StockError, allocate_lots_fefo
+        
+        product = Product.objects.filter(id=event.product_id).first()
+        if product is None:
+            raise StockError("PRODUCT_NOT_FOUND", f"Producto {event.product_id} no encontrado")
+        customer = Customer.objects.filter(id=event.customer_id).first() if event.customer_id else None
+        
+        allocation_plan = allocate_lots_fefo(
+            product,
+            event.qty_needed or event.qty,
+            chosen_lot_id=event.preferred_lot_id,
+            min_shelf_life_days=event.min_shelf_life_days,
+            customer=customer
+        )
+        return {
+            'error': False,
+            'allocation_plan': [
+                {'lot_id': plan.lot_id, 'qty_allocated': plan.qty_allocated}
+                for plan in allocation_plan
+            ]
+        }
+    
+    def _validate_override(self, event: LotOverrideRequested) -> Dict[str, Any]:
+        """El lote elegido tiene que ser del producto, no estar en cuarentena y alcanzar"""
+        from .services import StockError
+        
+        lot = StockLot.objects.filter(id=event.lot_id, product_id=event.product_id).first()
+        if lot is None:
+            raise StockError("INVALID_LOT", f"Lote {event.lot_id} no pertenece al producto {event.product_id}")
+        if lot.is_quarantined:
+            raise StockError("LOT_QUARANTINED", f"Lote {lot.lot_code} en cuarentena")
+        available = self._override_available(lot)
+        if available < event.qty:
+            raise StockError(
+                "INSUFFICIENT_STOCK",
+                f"Lote {lot.lot_code}: solicitado {event.qty}, disponible {available}"
+            )
+        return {'error': False, 'lot_code': lot.lot_code}
+    
+    @transaction.atomic
+    def _consume_sale(self, event: SaleStockConsumptionRequested) -> Dict[str, Any]:
+        """
+        Consume todos los ítems de la venta en una transacción: cualquier error
+        (o terminar después de `expires_at`) la revierte completa.
+        
+        Cada ítem FEFO se asigna sobre el stock que dejaron los ítems anteriores,
+        así dos líneas del mismo producto no reciben el mismo lote.
+        """
+        from apps.catalog.models import Product
+        from apps.customers.models import Customer
+        from apps.pos.models import SaleItemLot
+        from .services import StockError, allocate_lots_fefo
+        
+        # Reentrega de una venta ya confirmada: no se vuelve a consumir
+        if SaleItemLot.objects.filter(sale_id=event.sale_id).exists():
+            raise StockError("SALE_ALREADY_PROCESSED", f"La venta {event.sale_id} ya consumió stock")
+        
+        product_ids = {item.product_id for item in event.items}
+        products = {product.id: product for product in Product.objects.filter(id__in=product_ids)}
+        missing = product_ids - set(products)
+        if missing:
+            raise StockError("PRODUCT_NOT_FOUND", f"Productos inexistentes: {sorted(missing)}")
+        customer = Customer.objects.filter(id=event.customer_id).first() if event.customer_id else None
+        
+        # Lotes de todos los productos de la venta bloqueados en orden de id
+        lots = {
+            lot.id: lot
+            for lot in StockLot.objects.select_for_update().filter(product_id__in=product_ids).order_by('id')
+        }
+        
+        lines = []
+        touched = set()
+        for item in event.items:
+            if item.lot_id is not None:
+                lot = lots.get(item.lot_id)
+                if lot is None or lot.product_id != item.product_id:
+                    raise StockError("INVALID_LOT", f"Lote {item.lot_id} no pertenece al producto {item.product_id}")
+                if lot.is_quarantined:
+                    raise StockError("LOT_QUARANTINED", f"Lote {lot.lot_code} en cuarentena")
+                plan = [(lot, item.qty, self._override_available(lot))]
+            else:
+                plan = [
+                    (lots[allocation.lot_id], allocation.qty_allocated, None)
+                    for allocation in allocate_lots_fefo(
+                        products[item.product_id],
+                        item.qty,
+                        min_shelf_life_days=event.min_shelf_life_days,
+                        customer=customer
+                    )
+                ]
+            
+            movements = []
+            audit_id = None
+            for lot, qty, available in plan:
+                if available is not None and available < qty:
+                    raise StockError(
+                        "INSUFFICIENT_STOCK",
+                        f"Lote {lot.lot_code}: solicitado {qty}, disponible {available}"
+                    )
+                movement, audit_id = self._consume_lot(event, item, lot, qty)
+                movements.append({
+                    'lot_id': lot.id,
+                    'lot_code': lot.lot_code,
+                    'qty': qty,
+                    'unit_cost': movement.unit_cost,
+                    'movement_id': movement.id
+                })
+                touched.add((item.product_id, lot.warehouse_id))
+            lines.append({'sequence': item.sequence, 'movements': movements, 'audit_id': audit_id})
+        
+        refresh_stock_summaries(touched)
+        
+        if event.expires_at is not None and timezone.now() > event.expires_at:
+            raise StockError("REQUEST_EXPIRED", f"La solicitud de la venta {event.sale_id} venció antes del commit")
+        
+        return {'error': False, 'lines': lines}
+    
+    def _consume_lot(self, event: SaleStockConsumptionRequested, item, lot: StockLot, qty: Decimal):
+        """Descuenta el lote (ya bloqueado) y registra movimiento, trazabilidad y auditoría"""
+        from apps.pos.models import LotOverrideAudit, SaleItemLot
+        
+        lot.qty_on_hand -= qty
+        lot.save(update_fields=['qty_on_hand'])
+        
+        movement = Movement.objects.create(
+            type=Movement.Type.EXIT,
+            product_id=item.product_id,
+            lot=lot,
+            qty=qty,
+            unit_cost=lot.unit_cost,
+            reason=Movement.Reason.SALE,
+            created_by_id=event.user_id
+        )
+        SaleItemLot.objects.create(
+            sale_id=event.sale_id,
+            item_sequence=item.sequence,
+            product_id=item.product_id,
+            lot=lot,
+            qty_consumed=qty,
+            unit_price=item.unit_price,
+            movement=movement
+        )
+        audit_id = None
+        if item.lot_id is not None:
+            audit_id = LotOverrideAudit.objects.create(
+                actor_id=event.user_id,
+                sale_id=event.sale_id,
+                product_id=item.product_id,
+                lot_chosen=lot,
+                qty=qty,
+                reason=item.lot_override_reason or ''
+            ).id
+        return movement, audit_id
+    
+    @staticmethod
+    def _override_available(lot: StockLot) -> Decimal:
+        """Disponible para override: ignora `is_reserved` pero no las reservas PENDING"""
+        return max(Decimal('0'), lot.qty_on_hand - lot.qty_reserved)
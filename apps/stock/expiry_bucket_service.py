@@ -0,0 +1,265 @@
+# apps/stock/expiry_bucket_service.py
+"""
+Índice de vencimientos por (producto, depósito, rango de días).
+
+Cada clave tiene una fila por rango (0-7, 8-30, 31-90 días) con la cantidad,
+la cantidad de lotes y el vencimiento más próximo. Se mantiene igual que
+ProductStockSummary:
+
+- `refresh_stock_summaries()` llama a `refresh_expiry_buckets()` con las claves
+  tocadas, dentro de la transacción de la entrada/salida;
+- `roll_expiry_buckets()` (job nocturno) recalcula todo para la fecha nueva,
+  porque los lotes cambian de rango solo con el paso de los días.
+
+Métricas, dashboards y scans de vencimiento leen de acá en lugar de escanear
+StockLot por rango de fechas.
+"""
+
+import logging
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import transaction
+from django.db.models import Case, CharField, Count, Exists, Min, OuterRef, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import QTY_FIELD, ExpiryBucket, StockLot
+
+logger = logging.getLogger(__name__)
+
+BucketKey = Tuple[int, int]  # (product_id, warehouse_id)
+
+# (bucket, desde día, hasta día) contados desde hoy, ambos inclusive
+EXPIRY_BUCKETS = [
+    (ExpiryBucket.Bucket.DAYS_0_7, 0, 7),
+    (ExpiryBucket.Bucket.DAYS_8_30, 8, 30),
+    (ExpiryBucket.Bucket.DAYS_31_90, 31, 90),
+]
+MAX_BUCKET_DAYS = EXPIRY_BUCKETS[-1][2]
+
+BUCKET_FIELDS = ['qty', 'lot_count', 'nearest_expiry', 'as_of']
+
+# Productos por transacción en el roll nocturno
+DEFAULT_ROLL_BATCH_SIZE = 500
+
+
+def buckets_within(days: int) -> List[str]:
+    """Rangos necesarios para cubrir los vencimientos de hoy a hoy + `days`."""
+    return [bucket for bucket, start, _ in EXPIRY_BUCKETS if start <= days]
+
+
+def expiry_boundaries(days: int) -> List[int]:
+    """
+    Días-a-vencer en los que un lote entra a un rango nuevo dentro de los
+    próximos `days` días (incluye la entrada a la ventana misma).
+    """
+    return sorted({end for _, _, end in EXPIRY_BUCKETS if end <= days} | {days})
+
+
+def _bucket_expression(today: date) -> Case:
+    return Case(
+        *[
+            When(
+                expiry_date__gte=today + timedelta(days=start),
+                expiry_date__lte=today + timedelta(days=end),
+                then=Value(bucket),
+            )
+            for bucket, start, end in EXPIRY_BUCKETS
+        ],
+        output_field=CharField(),
+    )
+
+
+def _aggregate_buckets(lots, today: date) -> Dict[Tuple[int, int, str], Dict]:
+    """Agrega los lotes con stock por (producto, depósito, rango) en una sola query."""
+    zero = Value(Decimal('0'), output_field=QTY_FIELD)
+    rows = (
+        lots.filter(
+            qty_on_hand__gt=0,
+            expiry_date__gte=today,
+            expiry_date__lte=today + timedelta(days=MAX_BUCKET_DAYS),
+        )
+        .order_by()
+        .annotate(bucket=_bucket_expression(today))
+        .values('product_id', 'warehouse_id', 'bucket')
+        .annotate(
+            total_qty=Coalesce(Sum('qty_on_hand'), zero),
+            lots=Count('id'),
+            nearest=Min('expiry_date'),
+        )
+    )
+    return {
+        (row['product_id'], row['warehouse_id'], row['bucket']): {
+            'qty': row['total_qty'],
+            'lot_count': row['lots'],
+            'nearest_expiry': row['nearest'],
+            'as_of': today,
+        }
+        for row in rows
+    }
+
+
+def _empty_bucket(today: date) -> Dict:
+    return {'qty': Decimal('0'), 'lot_count': 0, 'nearest_expiry': None, 'as_of': today}
+
+
+def _upsert(totals_by_bucket: Dict[Tuple[int, int, str], Dict]) -> None:
+    ExpiryBucket.objects.bulk_create(
+        [
+            ExpiryBucket(product_id=product_id, warehouse_id=warehouse_id, bucket=bucket, **totals)
+            for (product_id, warehouse_id, bucket), totals in totals_by_bucket.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['product', 'warehouse', 'bucket'],
+        update_fields=BUCKET_FIELDS + ['updated_at'],
+        batch_size=1000,
+    )
+
+
+def refresh_expiry_buckets(keys: Iterable[BucketKey], today: Optional[date] = None) -> None:
+    """
+    Recalcula los rangos de las claves (product_id, warehouse_id) indicadas.
+
+    Se llama desde `refresh_stock_summaries()`, dentro de la transacción que
+    modificó los lotes. Los rangos sin lotes quedan en cero.
+    """
+    keys = {(product_id, warehouse_id) for product_id, warehouse_id in keys if warehouse_id is not None}
+    if not keys:
+        return
+
+    today = today or timezone.localdate()
+    lots = StockLot.objects.filter(
+        product_id__in={product_id for product_id, _ in keys},
+        warehouse_id__in={warehouse_id for _, warehouse_id in keys},
+    )
+    aggregated = _aggregate_buckets(lots, today)
+
+    _upsert({
+        (product_id, warehouse_id, bucket): (
+            aggregated.get((product_id, warehouse_id, bucket)) or _empty_bucket(today)
+        )
+        for product_id, warehouse_id in keys
+        for bucket, _, _ in EXPIRY_BUCKETS
+    })
+
+
+def roll_expiry_buckets(today: Optional[date] = None, batch_size: int = DEFAULT_ROLL_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Recalcula el índice completo para `today` (default: hoy).
+
+    Los lotes avanzan de rango (o salen del índice al vencer) con el paso de
+    los días aunque nadie los toque; este job nocturno los reubica. Se procesa
+    por tandas de `batch_size` productos, cada una en su propia transacción,
+    para no bloquear el índice entero frente a las entradas y salidas.
+
+    Returns:
+        Dict con buckets (filas con stock) y removed (filas sin stock borradas).
+    """
+    today = today or timezone.localdate()
+    product_ids = sorted(
+        set(StockLot.objects.filter(qty_on_hand__gt=0).values_list('product_id', flat=True).distinct())
+        | set(ExpiryBucket.objects.values_list('product_id', flat=True).distinct())
+    )
+
+    result = {'buckets': 0, 'removed': 0}
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        with transaction.atomic():
+            aggregated = _aggregate_buckets(StockLot.objects.filter(product_id__in=batch), today)
+            if aggregated:
+                _upsert(aggregated)
+
+            # Lo que no se recalculó hoy ya no tiene stock en ningún rango
+            removed, _ = ExpiryBucket.objects.filter(
+                Q(as_of__lt=today) | Q(lot_count=0), product_id__in=batch
+            ).delete()
+
+        result['buckets'] += len(aggregated)
+        result['removed'] += removed
+
+    logger.info("Expiry buckets rolled", extra={'as_of': today.isoformat(), **result})
+    return result
+
+
+def near_expiry_buckets(days: int, product_id: Optional[int] = None, warehouse_id: Optional[int] = None):
+    """Filas del índice con stock que vence dentro de `days` días."""
+    qs = ExpiryBucket.objects.filter(bucket__in=buckets_within(days), lot_count__gt=0)
+    if product_id is not None:
+        qs = qs.filter(product_id=product_id)
+    if warehouse_id is not None:
+        qs = qs.filter(warehouse_id=warehouse_id)
+    return qs
+
+
+def near_expiry_keys(days: int) -> Set[BucketKey]:
+    """Claves (producto, depósito) con stock que vence dentro de `days` días."""
+    return set(near_expiry_buckets(days).values_list('product_id', 'warehouse_id').distinct())
+
+
+def lots_expiring_within(days: int, today: Optional[date] = None):
+    """Lotes con stock que vencen entre hoy y hoy + `days`, sin pasar por el índice."""
+    today = today or timezone.localdate()
+    return StockLot.objects.filter(
+        qty_on_hand__gt=0,
+        expiry_date__gte=today,
+        expiry_date__lte=today + timedelta(days=days),
+    )
+
+
+def near_expiry_lots(days: int, today: Optional[date] = None):
+    """
+    Lotes con stock que vencen entre hoy y hoy + `days`.
+
+    El índice reduce la búsqueda a las claves con vencimientos en el rango; los
+    lotes se filtran por fecha exacta solo dentro de esas claves. Más allá de
+    MAX_BUCKET_DAYS el índice no alcanza y se filtra sobre todos los lotes.
+
+    Si el índice tiene filas calculadas para otra fecha (el roll de hoy todavía
+    no corrió), los lotes que cambiaron de rango durante la noche no figuran en
+    el rango correcto: se filtra sobre todos los lotes hasta que se recalcule.
+    """
+    today = today or timezone.localdate()
+    lots = lots_expiring_within(days, today)
+    if days > MAX_BUCKET_DAYS:
+        return lots
+
+    indexed = near_expiry_buckets(days).filter(
+        product_id=OuterRef('product_id'),
+        warehouse_id=OuterRef('warehouse_id'),
+    )
+    stale = ExpiryBucket.objects.exclude(as_of=today)
+    return lots.filter(Exists(indexed) | Exists(stale))
+
+
+def near_expiry_lot_counts(days: int) -> Dict[Tuple[str, str], int]:
+    """Cantidad de lotes por (categoría de producto, rango) dentro de `days` días."""
+    rows = (
+        near_expiry_buckets(days)
+        .order_by()
+        .values('product__category', 'bucket')
+        .annotate(lots=Sum('lot_count'))
+    )
+    return {(row['product__category'] or 'unknown', row['bucket']): row['lots'] for row in rows}
+
+
+def publish_near_expiry_metrics(days: int = MAX_BUCKET_DAYS) -> Dict[Tuple[str, str], int]:
+    """
+    Publica el gauge near_expiry_lots por categoría y rango desde el índice.
+
+    Los rangos sin lotes de cada categoría se publican en cero para que el
+    gauge no quede con valores viejos.
+    """
+    from apps.core.metrics import update_near_expiry_lots
+
+    counts = near_expiry_lot_counts(days)
+    categories = {category for category, _ in counts} or {'unknown'}
+    for category in sorted(categories):
+        for bucket in buckets_within(days):
+            update_near_expiry_lots(
+                product_category=category,
+                days_range=bucket,
+                count=counts.get((category, bucket), 0),
+            )
+    return counts
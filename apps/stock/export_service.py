@@ -0,0 +1,125 @@
+# apps/stock/export_service.py
+"""
+Exportación en streaming del libro de movimientos (CSV / NDJSON).
+
+Las filas salen de `archive_service.movement_ledger()` (tabla viva + archivo)
+recorrido con `iterator(chunk_size)` (cursor del lado del servidor en
+PostgreSQL), se serializan de a una y se entregan como generador:
+la memoria no depende de la cantidad de movimientos exportados.
+"""
+
+import csv
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from .archive_service import movement_ledger
+
+# (columna exportada, lookup en Movement, lookup en MovementArchive)
+EXPORT_COLUMNS = [
+    ('movement_id', 'id', 'id'),
+    ('created_at', 'created_at', 'created_at'),
+    ('type', 'type', 'type'),
+    ('reason', 'reason', 'reason'),
+    ('product_id', 'product_id', 'product_id'),
+    ('product_code', 'product__code', 'product__code'),
+    ('product_name', 'product__name', 'product__name'),
+    ('lot_id', 'lot_id', 'lot_id'),
+    ('lot_code', 'lot__lot_code', 'lot__lot_code'),
+    ('expiry_date', 'lot__expiry_date', 'lot__expiry_date'),
+    ('warehouse_id', 'lot__warehouse_id', 'warehouse_id'),
+    ('warehouse_name', 'lot__warehouse__name', 'warehouse__name'),
+    ('qty', 'qty', 'qty'),
+    ('unit_cost', 'unit_cost', 'unit_cost'),
+    ('order_id', 'order_id', 'order_id'),
+    ('created_by', 'created_by__username', 'created_by__username'),
+]
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def movement_export_queryset(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    product_id: Optional[int] = None,
+    reason: Optional[str] = None,
+    warehouse_id: Optional[int] = None,
+):
+    """
+    Movimientos filtrados (vivos y archivados) como tuplas en el orden de EXPORT_COLUMNS.
+
+    El rango de fechas es inclusivo y se traduce a created_at >= / < para usar
+    idx_movement_product_date / idx_movement_type_date (e idx_mv_archive_* en el archivo).
+    """
+    return movement_ledger(
+        [(live_lookup, archive_lookup) for _, live_lookup, archive_lookup in EXPORT_COLUMNS],
+        date_from=date_from,
+        date_to=date_to,
+        product_id=product_id,
+        reason=reason,
+        warehouse_id=warehouse_id,
+    )
+
+
+def iter_movement_rows(queryset, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Recorre el queryset con iterator() y devuelve una fila (dict) por movimiento."""
+    names = [name for name, _, _ in EXPORT_COLUMNS]
+    for values in queryset.iterator(chunk_size=chunk_size):
+        yield dict(zip(names, values))
+
+
+def _to_text(value: Any) -> Any:
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class _Echo:
+    """Buffer mínimo para csv.writer: devuelve la línea en lugar de guardarla."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Serializa las filas como CSV (con encabezado), una línea por iteración."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow([_to_text(value) for value in row.values()])
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def iter_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Serializa las filas como NDJSON (un objeto JSON por línea)."""
+    for row in rows:
+        yield json.dumps(row, default=_json_default, ensure_ascii=False) + '\n'
+
+
+def stream_movements(fmt: str, chunk_size: int = DEFAULT_CHUNK_SIZE, **filters) -> Iterator[str]:
+    """
+    Generador de la exportación completa en el formato pedido.
+
+    Raises:
+        ValueError: Si el formato no es csv ni ndjson
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato no soportado: {fmt}")
+
+    rows = iter_movement_rows(movement_export_queryset(**filters), chunk_size=chunk_size)
+    return iter_csv(rows) if fmt == 'csv' else iter_ndjson(rows)
@@ -2,6 +2,7 @@
 from datetime import date, timedelta
 from decimal import Decimal
 from typing import List, Optional, NamedTuple
+from django.conf import settings
 from django.db import transaction, models
 from django.db.models import F, Sum
 from django.core.exceptions import ValidationError
@@ -9,6 +10,14 @@ from django.core.exceptions import ValidationError
 from apps.catalog.models import Product
 from .models import StockLot, Movement, Warehouse
 from .services import NotEnoughStock, NoLotsAvailable, StockError
+from .summary_service import refresh_stock_summaries
+from .locking import acquire_stock_lock
+from .allocation_strategies import get_allocation_strategy, record_allocation_metrics
+
+# Estrategias de concurrencia de allocate_stock_fefo (settings.FEFO_LOCK_STRATEGY)
+LOCK_STRATEGY_SKIP_LOCKED = 'skip_locked'
+LOCK_STRATEGY_ADVISORY = 'advisory'
+LOCK_STRATEGIES = (LOCK_STRATEGY_SKIP_LOCKED, LOCK_STRATEGY_ADVISORY)
 
 
 class FEFOAllocation(NamedTuple):
@@ -30,7 +39,10 @@ class FEFOService:
         user_id: int,
         warehouse_id: Optional[int] = None,
         min_shelf_life_days: int = 0,
-        reason: str = "FEFO allocation"
+        reason: str = "FEFO allocation",
+        lock_strategy: Optional[str] = None,
+        strategy=None,
+        customer=None
     ) -> List[FEFOAllocation]:
         """
         Asigna stock siguiendo FEFO de manera thread-safe.
@@ -42,6 +54,13 @@ class FEFOService:
             warehouse_id: ID del almacén (opcional)
             min_shelf_life_days: Días mínimos de vida útil
             reason: Razón del movimiento
+            lock_strategy: 'skip_locked' (saltea lotes bloqueados por otra
+                transacción; puede dar falso sin stock bajo contención) o
+                'advisory' (serializa por advisory lock de (producto, depósito)
+                y espera los locks de fila); default settings.FEFO_LOCK_STRATEGY
+            strategy: Estrategia de asignación de lotes (nombre o instancia;
+                ver allocation_strategies)
+            customer: Cliente cuya estrategia se usa si no se pasa `strategy`
             
         Returns:
             Lista de asignaciones FEFO realizadas
@@ -53,6 +72,15 @@ class FEFOService:
         if qty_needed <= 0:
             raise ValidationError("La cantidad debe ser mayor a 0")
         
+        lock_strategy = lock_strategy or settings.FEFO_LOCK_STRATEGY
+        if lock_strategy not in LOCK_STRATEGIES:
+            raise ValidationError(f"Estrategia de lock desconocida: {lock_strategy}")
+        
+        try:
+            allocation_strategy = get_allocation_strategy(strategy, customer)
+        except ValueError as e:
+            raise ValidationError(str(e))
+        
         with transaction.atomic():
             # Obtener producto
             try:
@@ -64,7 +92,14 @@ class FEFOService:
             min_expiry_date = date.today() + timedelta(days=min_shelf_life_days)
             
             # Query FEFO con lock para evitar condiciones de carrera
-            lots_query = StockLot.objects.select_for_update(skip_locked=True).filter(
+            if lock_strategy == LOCK_STRATEGY_ADVISORY:
+                # Una asignación a la vez por (producto, depósito); no-op fuera de PostgreSQL
+                acquire_stock_lock(product_id, warehouse_id)
+                lots_query = StockLot.objects.select_for_update()
+            else:
+                lots_query = StockLot.objects.select_for_update(skip_locked=True)
+            
+            lots_query = lots_query.filter(
                 product_id=product_id,
                 qty_on_hand__gt=0,
                 expiry_date__gte=min_expiry_date,
@@ -89,17 +124,14 @@ class FEFOService:
             if total_available < qty_needed:
                 raise NotEnoughStock(product_id, qty_needed, total_available)
             
-            # Realizar asignación FEFO
+            # Realizar asignación según la estrategia (en memoria sobre los lotes bloqueados)
             allocations = []
             remaining_qty = qty_needed
+            steps = allocation_strategy.plan(
+                available_lots, qty_needed, {lot.id: lot.qty_on_hand for lot in available_lots}
+            )
             
-            for lot in available_lots:
-                if remaining_qty <= 0:
-                    break
-                
-                # Cantidad a asignar de este lote
-                qty_from_lot = min(remaining_qty, lot.qty_on_hand)
-                
+            for lot, qty_from_lot in steps:
                 # Update atómico usando F() para evitar condiciones de carrera
                 updated_rows = StockLot.objects.filter(
                     id=lot.id,
@@ -144,6 +176,12 @@ class FEFOService:
                     f"No se pudo asignar toda la cantidad. Faltante: {remaining_qty}"
                 )
             
+            lots_by_id = {lot.id: lot for lot in available_lots}
+            refresh_stock_summaries(
+                {(product_id, lots_by_id[allocation.lot_id].warehouse_id) for allocation in allocations}
+            )
+            record_allocation_metrics(allocation_strategy, [len(allocations)])
+            
             return allocations
     
     @staticmethod
@@ -12,6 +12,7 @@ from django.db import models
 from apps.orders.models import Order, OrderItem
 from apps.stock.models import StockLot
 from apps.stock.reservations import Reservation
+from apps.stock.reservation_service import check_availability, pending_by_lot, requested_by_lot
 
 
 class PickingSuggestion(NamedTuple):
@@ -50,10 +51,11 @@ def get_fefo_suggestions(order: Order) -> List[PickingSuggestion]:
         product = item.product
         qty_needed = item.qty
         
-        # Obtener reservas activas existentes para este producto (excluyendo esta orden)
+        # Obtener reservas pendientes existentes para este producto (excluyendo esta orden).
+        # Las APPLIED ya se descontaron de qty_on_hand al entregar.
         active_reservations = Reservation.objects.filter(
             lot__product=product,
-            status__in=[Reservation.Status.PENDING, Reservation.Status.APPLIED]
+            status=Reservation.Status.PENDING
         ).exclude(order=order)
         
         # Calcular cantidad reservada por lote
@@ -117,61 +119,10 @@ def validate_reservation_availability(order: Order, reservations_data: List[Dict
             'availability_check': Dict[lot_id, {'available': Decimal, 'requested': Decimal}]
         }
     """
-    result = {
-        'valid': True,
-        'errors': [],
-        'availability_check': {}
-    }
-    
-    # Agrupar reservas por lote
-    reservations_by_lot = {}
-    for reservation in reservations_data:
-        lot_id = reservation['lot_id']
-        qty = Decimal(str(reservation['qty']))
-        
-        if lot_id in reservations_by_lot:
-            reservations_by_lot[lot_id] += qty
-        else:
-            reservations_by_lot[lot_id] = qty
-    
-    # Validar cada lote
-    for lot_id, requested_qty in reservations_by_lot.items():
-        try:
-            lot = StockLot.objects.get(id=lot_id)
-            
-            # Calcular reservas activas existentes (excluyendo esta orden)
-            existing_reservations = Reservation.objects.filter(
-                lot_id=lot_id,
-                status__in=[Reservation.Status.PENDING, Reservation.Status.APPLIED]
-            ).exclude(order=order).aggregate(
-                total=Sum('qty')
-            )['total'] or Decimal('0')
-            
-            available_qty = lot.qty_on_hand - existing_reservations
-            
-            result['availability_check'][str(lot_id)] = {
-                'available': available_qty,
-                'requested': requested_qty,
-                'on_hand': lot.qty_on_hand,
-                'existing_reservations': existing_reservations
-            }
-            
-            if requested_qty > available_qty:
-                result['valid'] = False
-                result['errors'].append(
-                    f"Lote {lot.lot_code}: solicitado {requested_qty}, disponible {available_qty}"
-                )
-                
-        except StockLot.DoesNotExist:
-            result['valid'] = False
-            result['errors'].append(f"Lote ID {lot_id} no existe")
-            result['availability_check'][str(lot_id)] = {
-                'available': Decimal('0'),
-                'requested': requested_qty,
-                'error': 'Lote no encontrado'
-            }
-    
-    return result
+    # Una query de lotes y un aggregate agrupado de reservas de otras órdenes
+    requested = requested_by_lot(reservations_data)
+    lots = StockLot.objects.in_bulk(list(requested))
+    return check_availability(requested, lots, pending_by_lot(requested, exclude_order=order))
 
 
 def get_product_availability(product_id: int) -> Dict[str, Any]:
@@ -191,16 +142,6 @@ def get_product_availability(product_id: int) -> Dict[str, Any]:
         is_quarantined=False
     ).select_related('warehouse').order_by('expiry_date', 'id')
     
-    # Calcular reservas activas por lote
-    active_reservations = Reservation.objects.filter(
-        lot__product_id=product_id,
-        status__in=[Reservation.Status.PENDING, Reservation.Status.APPLIED]
-    ).values('lot_id').annotate(
-        total_reserved=Sum('qty')
-    )
-    
-    reserved_dict = {item['lot_id']: item['total_reserved'] for item in active_reservations}
-    
     availability_info = {
         'product_id': product_id,
         'lots': [],
@@ -210,7 +151,7 @@ def get_product_availability(product_id: int) -> Dict[str, Any]:
     }
     
     for lot in lots:
-        reserved_qty = reserved_dict.get(lot.id, Decimal('0'))
+        reserved_qty = lot.qty_reserved
         available_qty = lot.qty_on_hand - reserved_qty
         
         lot_info = {
@@ -1,81 +1,216 @@
 # apps/stock/idempotency_service.py
-"""Service for handling idempotency keys in stock operations."""
+"""
+Service for handling idempotency keys in stock operations.
 
+The cache fronts `StockIdempotencyKey`: `check_existing_request()` serves
+replays from the cache and claims new keys atomically (SET NX with a short
+TTL) before falling back to the database, so concurrent duplicates wait for
+the original response or get `IdempotencyInProgress` (409) instead of
+executing the stock movement twice. `store_response()` persists the response,
+caches it and releases the claim.
+
+`idempotent_endpoint()` applies the same replay to any django-ninja view.
+"""
+
+import functools
 import hashlib
 import json
+import threading
+import time
+import uuid
 from datetime import timedelta
 from typing import Optional, Dict, Any, Tuple
 
+from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
-from django.http import HttpRequest
+from django.db import IntegrityError, transaction
+from django.http import HttpRequest, HttpResponse
+from ninja.errors import HttpError
+from ninja.responses import NinjaJSONEncoder
 
+from apps.core.cache import fault_tolerant_cache
+from apps.core.metrics import increment_counter
 from .models_idempotency import StockIdempotencyKey
 
 
+class IdempotencyInProgress(Exception):
+    """Another request with the same idempotency key is still being processed."""
+
+
 class IdempotencyService:
     """Service for managing idempotency keys in stock operations."""
-    
+
     # Default TTL for idempotency keys (24 hours)
     DEFAULT_TTL_HOURS = 24
-    
+
+    # Poll interval while a concurrent duplicate waits for the original response
+    WAIT_POLL_SECONDS = 0.05
+
+    # Claim tokens held by the current thread, by idempotency key
+    _claims = threading.local()
+
     @staticmethod
     def get_idempotency_key(request: HttpRequest) -> Optional[str]:
         """Extract idempotency key from request headers."""
         return request.headers.get('Idempotency-Key')
-    
+
     @staticmethod
     def _hash_request_data(data: Dict[str, Any]) -> str:
         """Create a hash of the request data for validation."""
         # Sort keys to ensure consistent hashing
         sorted_data = json.dumps(data, sort_keys=True, default=str)
         return hashlib.sha256(sorted_data.encode()).hexdigest()
-    
+
+    @staticmethod
+    def _response_cache_key(key: str) -> str:
+        return f"idempotency:response:{key}"
+
+    @staticmethod
+    def _claim_cache_key(key: str) -> str:
+        return f"idempotency:claim:{key}"
+
+    @classmethod
+    def _held_claims(cls) -> Dict[str, str]:
+        if not hasattr(cls._claims, 'tokens'):
+            cls._claims.tokens = {}
+        return cls._claims.tokens
+
+    @classmethod
+    def _validate(cls, key: str, stored_operation: str, stored_hash: str, operation_type: str, request_hash: str):
+        """Raise ValueError if the key was used for another operation or payload."""
+        if stored_operation != operation_type:
+            raise ValueError(
+                f"Idempotency key '{key}' was used for {stored_operation}, "
+                f"but current request is for {operation_type}"
+            )
+        if stored_hash != request_hash:
+            raise ValueError(
+                f"Idempotency key '{key}' was used with different request data"
+            )
+
+    @classmethod
+    def _cached_response(cls, key: str, operation_type: str, request_hash: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        cached = fault_tolerant_cache.get(cls._response_cache_key(key))
+        if cached is None:
+            return None
+        cls._validate(key, cached['operation_type'], cached['request_hash'], operation_type, request_hash)
+        return cached['status_code'], cached['response_data']
+
+    @classmethod
+    def _cache_response(cls, record: StockIdempotencyKey) -> None:
+        """Cache a stored response until the record expires."""
+        timeout = None
+        if record.expires_at:
+            timeout = int((record.expires_at - timezone.now()).total_seconds())
+            if timeout <= 0:
+                return
+        fault_tolerant_cache.set(cls._response_cache_key(record.key), {
+            'operation_type': record.operation_type,
+            'request_hash': record.request_hash,
+            'status_code': record.status_code,
+            'response_data': record.response_data,
+        }, timeout)
+
+    @classmethod
+    def _claim(cls, key: str) -> bool:
+        """
+        Claim the key for this request (SET NX with TTL).
+
+        Returns True if claimed, or if the cache is down (the database
+        unique constraint is then the only guard).
+        """
+        token = uuid.uuid4().hex
+        claimed = fault_tolerant_cache.add(cls._claim_cache_key(key), token, settings.IDEMPOTENCY_IN_FLIGHT_TTL)
+        if claimed:
+            cls._held_claims()[key] = token
+        return claimed is not False
+
+    @classmethod
+    def release_claim(cls, key: str) -> None:
+        """Release the in-flight claim on `key` if this thread holds it."""
+        token = cls._held_claims().pop(key, None)
+        if token is None:
+            return
+        claim_key = cls._claim_cache_key(key)
+        if fault_tolerant_cache.get(claim_key) == token:
+            fault_tolerant_cache.delete(claim_key)
+
+    @classmethod
+    def _wait_for_response(cls, key: str, operation_type: str, request_hash: str) -> Tuple[int, Dict[str, Any]]:
+        """Wait for a concurrent duplicate to finish, or raise IdempotencyInProgress."""
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            cached = cls._cached_response(key, operation_type, request_hash)
+            if cached:
+                increment_counter('idempotency_requests_total', {'result': 'replayed_after_wait'})
+                return cached
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(cls.WAIT_POLL_SECONDS)
+
+        increment_counter('idempotency_requests_total', {'result': 'in_progress'})
+        raise IdempotencyInProgress(
+            f"Idempotency key '{key}' is already being processed by another request"
+        )
+
     @classmethod
     def check_existing_request(
-        self, 
-        key: str, 
-        operation_type: str, 
+        self,
+        key: str,
+        operation_type: str,
         request_data: Dict[str, Any]
     ) -> Optional[Tuple[int, Dict[str, Any]]]:
         """
         Check if this idempotency key was already processed.
-        
+
+        A None result means the caller now holds the key's claim and must
+        call `store_response()` (or `release_claim()` if it stores nothing).
+
         Returns:
             Tuple of (status_code, response_data) if found, None otherwise
-            
+
         Raises:
             ValueError: If key exists but request data doesn't match
+            IdempotencyInProgress: If a concurrent request holds the key
         """
+        request_hash = self._hash_request_data(request_data)
+
+        # Replays are served from the cache without touching the database
+        cached = self._cached_response(key, operation_type, request_hash)
+        if cached:
+            increment_counter('idempotency_requests_total', {'result': 'replayed'})
+            return cached
+
+        if not self._claim(key):
+            return self._wait_for_response(key, operation_type, request_hash)
+
+        # Durable fallback: the response may have been evicted from the cache
         try:
             existing = StockIdempotencyKey.objects.get(key=key)
-            
-            # Check if expired
-            if existing.is_expired():
-                # Clean up expired key
-                existing.delete()
-                return None
-            
-            # Validate operation type matches
-            if existing.operation_type != operation_type:
-                raise ValueError(
-                    f"Idempotency key '{key}' was used for {existing.operation_type}, "
-                    f"but current request is for {operation_type}"
-                )
-            
-            # Validate request data matches
-            request_hash = self._hash_request_data(request_data)
-            if existing.request_hash != request_hash:
-                raise ValueError(
-                    f"Idempotency key '{key}' was used with different request data"
-                )
-            
-            # Return cached response
-            return existing.status_code, existing.response_data
-            
         except StockIdempotencyKey.DoesNotExist:
+            increment_counter('idempotency_requests_total', {'result': 'new'})
             return None
-    
+
+        # Check if expired
+        if existing.is_expired():
+            # Clean up expired key
+            existing.delete()
+            increment_counter('idempotency_requests_total', {'result': 'new'})
+            return None
+
+        try:
+            self._validate(key, existing.operation_type, existing.request_hash, operation_type, request_hash)
+        except ValueError:
+            self.release_claim(key)
+            raise
+
+        self._cache_response(existing)
+        self.release_claim(key)
+        increment_counter('idempotency_requests_total', {'result': 'replayed'})
+
+        # Return cached response
+        return existing.status_code, existing.response_data
+
     @classmethod
     def store_response(
         self,
@@ -88,8 +223,8 @@ class IdempotencyService:
         ttl_hours: Optional[int] = None
     ) -> StockIdempotencyKey:
         """
-        Store the response for this idempotency key.
-        
+        Store the response for this idempotency key and release its claim.
+
         Args:
             key: The idempotency key
             operation_type: Type of operation (entry/exit)
@@ -102,23 +237,23 @@ class IdempotencyService:
         ttl_hours = ttl_hours or self.DEFAULT_TTL_HOURS
         expires_at = timezone.now() + timedelta(hours=ttl_hours)
         request_hash = self._hash_request_data(request_data)
-        
-        with transaction.atomic():
-            # Use get_or_create to handle race conditions
-            idempotency_record, created = StockIdempotencyKey.objects.get_or_create(
-                key=key,
-                defaults={
-                    'operation_type': operation_type,
-                    'request_hash': request_hash,
-                    'response_data': response_data,
-                    'status_code': status_code,
-                    'created_by': created_by,
-                    'expires_at': expires_at,
-                }
-            )
-            
-            if not created:
+
+        try:
+            try:
+                # The claim makes a conflict rare: insert directly and only read on conflict
+                with transaction.atomic():
+                    idempotency_record = StockIdempotencyKey.objects.create(
+                        key=key,
+                        operation_type=operation_type,
+                        request_hash=request_hash,
+                        response_data=response_data,
+                        status_code=status_code,
+                        created_by=created_by,
+                        expires_at=expires_at,
+                    )
+            except IntegrityError:
                 # Key already exists - validate it matches
+                idempotency_record = StockIdempotencyKey.objects.get(key=key)
                 if idempotency_record.request_hash != request_hash:
                     raise ValueError(
                         f"Idempotency key '{key}' already exists with different request data"
@@ -127,14 +262,17 @@ class IdempotencyService:
                     raise ValueError(
                         f"Idempotency key '{key}' already exists for different operation type"
                     )
-            
+
+            self._cache_response(idempotency_record)
             return idempotency_record
-    
+        finally:
+            self.release_claim(key)
+
     @classmethod
     def cleanup_expired_keys(cls, batch_size: int = 1000) -> int:
         """
         Clean up expired idempotency keys.
-        
+
         Returns:
             Number of keys deleted
         """
@@ -142,11 +280,103 @@ class IdempotencyService:
         expired_keys = StockIdempotencyKey.objects.filter(
             expires_at__lt=now
         )[:batch_size]
-        
+
         count = len(expired_keys)
         if count > 0:
             StockIdempotencyKey.objects.filter(
                 id__in=[key.id for key in expired_keys]
             ).delete()
-        
-        return count
\ No newline at end of file
+
+        return count
+
+
+def _request_payload(request: HttpRequest) -> Any:
+    """Request body as parsed JSON (key order does not change the hash) or text."""
+    body = request.body.decode('utf-8', errors='replace')
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return body
+
+
+def _request_subject(request: HttpRequest) -> Optional[str]:
+    """Authenticated user (or ninja auth subject) the request runs as, if any."""
+    user = getattr(request, 'user', None)
+    if getattr(user, 'is_authenticated', False):
+        return f"user:{user.pk}"
+    auth = getattr(request, 'auth', None)
+    if getattr(auth, 'pk', None) is not None:
+        return f"user:{auth.pk}"
+    return None
+
+
+def skip_idempotent_store(request: HttpRequest) -> None:
+    """
+    Keep `idempotent_endpoint` from storing this request's response.
+
+    For error paths whose cause may be transient (e.g. a database error
+    caught by a generic handler): a retry with the same key runs the view
+    again instead of replaying the error.
+    """
+    request._idempotency_skip_store = True
+
+
+def idempotent_endpoint(operation_type: str):
+    """
+    Make a django-ninja view replayable with the Idempotency-Key header.
+
+    The first request runs the view and stores its status and body (except
+    5xx and responses marked with `skip_idempotent_store`); retries with the
+    same key, request and user get the stored response without running the
+    view again. The same key from another user is rejected like a different
+    request. Requests without the header run as usual.
+
+    Args:
+        operation_type: Short operation name stored with the key (max 10 chars)
+
+    Raises:
+        HttpError 409: A request with the same key is still in progress
+        HttpError 422: The key was already used for another request
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key = IdempotencyService.get_idempotency_key(request)
+            if not key:
+                return view_func(request, *args, **kwargs)
+
+            request_data = {
+                'path': request.path,
+                'body': _request_payload(request),
+                'subject': _request_subject(request),
+            }
+            try:
+                existing = IdempotencyService.check_existing_request(key, operation_type, request_data)
+            except IdempotencyInProgress as e:
+                raise HttpError(409, str(e))
+            except ValueError as e:
+                raise HttpError(422, str(e))
+            if existing:
+                return existing
+
+            try:
+                result = view_func(request, *args, **kwargs)
+            except BaseException:
+                IdempotencyService.release_claim(key)
+                raise
+
+            status_code, body = result if isinstance(result, tuple) else (200, result)
+            if status_code >= 500 or isinstance(body, HttpResponse) or getattr(request, '_idempotency_skip_store', False):
+                # Transient failures and raw responses are not replayed
+                IdempotencyService.release_claim(key)
+                return result
+
+            user = getattr(request, 'user', None)
+            IdempotencyService.store_response(
+                key, operation_type, request_data, status_code,
+                json.loads(json.dumps(body, cls=NinjaJSONEncoder)),
+                created_by=user if getattr(user, 'is_authenticated', False) else None
+            )
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,52 @@
+# apps/stock/locking.py
+"""
+Locks de aplicación para serializar asignaciones de stock por (producto, depósito).
+
+En PostgreSQL se usa `pg_advisory_xact_lock`: el lock se libera solo al
+terminar la transacción, así que debe tomarse dentro de `transaction.atomic()`.
+En otros motores (SQLite en tests/desarrollo) es un no-op: la escritura ya
+está serializada por el lock de la base.
+"""
+
+import hashlib
+from typing import Optional
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+# Prefijo para que las claves no choquen con otros usos de advisory locks
+LOCK_NAMESPACE = "stock-allocation"
+
+
+def stock_lock_key(product_id: int, warehouse_id: Optional[int]) -> int:
+    """
+    Clave bigint estable para (producto, depósito).
+
+    warehouse_id=None representa "todos los depósitos" y tiene su propia clave.
+    """
+    raw = f"{LOCK_NAMESPACE}:{product_id}:{warehouse_id if warehouse_id is not None else '*'}"
+    digest = hashlib.blake2b(raw.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def acquire_stock_lock(product_id: int, warehouse_id: Optional[int], using: str = DEFAULT_DB_ALIAS) -> bool:
+    """
+    Bloquea (esperando) la clave (producto, depósito) hasta el fin de la transacción.
+
+    Returns:
+        True si se tomó un advisory lock, False en motores sin soporte (no-op)
+
+    Raises:
+        TransactionManagementError: Si se llama fuera de una transacción
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+
+    if not connection.in_atomic_block:
+        raise transaction.TransactionManagementError(
+            "acquire_stock_lock requiere una transacción activa (transaction.atomic)"
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [stock_lock_key(product_id, warehouse_id)])
+    return True
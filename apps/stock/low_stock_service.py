@@ -0,0 +1,78 @@
+# apps/stock/low_stock_service.py
+"""
+Detección de stock bajo por producto.
+
+Una sola query agrupa el resumen por (producto, depósito) por producto, compara
+el total contra `Product.low_stock_threshold` (o el umbral por defecto) y
+devuelve solo los productos en falta, en streaming. La usan la tarea
+`scan_low_stock` y el generador de notificaciones.
+"""
+
+from decimal import Decimal
+from typing import Iterator, NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from apps.catalog.models import Product
+
+from .models import QTY_FIELD
+
+DETECT_CHUNK_SIZE = 2000
+
+
+class LowStockItem(NamedTuple):
+    """Producto con stock total en o por debajo de su umbral."""
+    product_id: int
+    product_code: str
+    product_name: str
+    on_hand: Decimal
+    threshold: Decimal
+
+    @property
+    def shortage(self) -> Decimal:
+        return self.threshold - self.on_hand
+
+
+def default_low_stock_threshold() -> Decimal:
+    """Umbral para productos sin `low_stock_threshold` (settings.LOW_STOCK_THRESHOLD_DEFAULT)."""
+    return Decimal(str(settings.LOW_STOCK_THRESHOLD_DEFAULT))
+
+
+def detect_low_stock(
+    default_threshold: Optional[Decimal] = None,
+    include_out_of_stock: bool = True,
+    product_ids=None,
+) -> Iterator[LowStockItem]:
+    """
+    Productos activos con stock total <= umbral, ordenados por nombre.
+
+    Args:
+        default_threshold: Umbral para productos sin umbral propio
+            (default: settings.LOW_STOCK_THRESHOLD_DEFAULT)
+        include_out_of_stock: Con False se omiten los productos sin stock
+        product_ids: Limita la detección a estos productos (ids o subquery)
+    """
+    if default_threshold is None:
+        default_threshold = default_low_stock_threshold()
+
+    rows = (
+        Product.objects.filter(is_active=True)
+        .annotate(
+            on_hand=Coalesce(Sum('stock_summaries__on_hand'), Value(Decimal('0'), output_field=QTY_FIELD)),
+            threshold=Coalesce(
+                'low_stock_threshold', Value(Decimal(default_threshold), output_field=QTY_FIELD)
+            ),
+        )
+        .filter(on_hand__lte=F('threshold'))
+    )
+    if not include_out_of_stock:
+        rows = rows.filter(on_hand__gt=0)
+    if product_ids is not None:
+        rows = rows.filter(id__in=product_ids)
+
+    for row in rows.order_by('name', 'id').values_list(
+        'id', 'code', 'name', 'on_hand', 'threshold'
+    ).iterator(chunk_size=DETECT_CHUNK_SIZE):
+        yield LowStockItem(*row)
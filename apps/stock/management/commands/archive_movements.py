@@ -0,0 +1,47 @@
+"""
+Comando Django para archivar movimientos fuera del período de retención.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from apps.stock.archive_service import DEFAULT_BATCH_SIZE, archive_movements, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Archiva los movimientos anteriores a la fecha de corte (rollup diario + tabla de archivo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before',
+            type=str,
+            help='Fecha de corte YYYY-MM-DD, exclusiva (default: hoy - MOVEMENT_RETENTION_DAYS)'
+        )
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            help='Días de retención; alternativa a --before'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Movimientos archivados por transacción (default: {DEFAULT_BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        if options['before'] and options['retention_days'] is not None:
+            raise CommandError('Use --before o --retention-days, no ambos')
+
+        if options['before']:
+            before = parse_date(options['before'])
+            if before is None:
+                raise CommandError(f"Fecha inválida: {options['before']}")
+        else:
+            before = retention_cutoff(retention_days=options['retention_days'])
+
+        result = archive_movements(before, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Movimientos archivados antes de {before}: {result['movements_archived']} "
+            f"en {result['batches']} lotes ({result['aggregate_groups']} grupos diarios)"
+        ))
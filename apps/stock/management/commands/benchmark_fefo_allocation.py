@@ -0,0 +1,55 @@
+"""
+Comando Django para comparar estrategias de lock de la asignación FEFO bajo contención.
+"""
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.stock.benchmarks import run_allocation_benchmark
+from apps.stock.fefo_service import LOCK_STRATEGIES
+
+
+class Command(BaseCommand):
+    help = 'Mide throughput y falsos "sin stock" de allocate_stock_fefo con varios hilos sobre un mismo producto'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--strategy',
+            choices=LOCK_STRATEGIES + ('all',),
+            default='all',
+            help='Estrategia a medir (default: all)'
+        )
+        parser.add_argument('--threads', type=int, default=8, help='Hilos concurrentes (default: 8)')
+        parser.add_argument('--allocations', type=int, default=200, help='Asignaciones totales (default: 200)')
+        parser.add_argument('--qty', type=str, default='1', help='Cantidad por asignación (default: 1)')
+        parser.add_argument('--lots', type=int, default=5, help='Lotes del producto de prueba (default: 5)')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['allocations'] < 1 or options['lots'] < 1:
+            raise CommandError('--threads, --allocations y --lots deben ser mayores a 0')
+
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                f'Base {connection.vendor}: los resultados solo son representativos en PostgreSQL'
+            ))
+
+        strategies = LOCK_STRATEGIES if options['strategy'] == 'all' else (options['strategy'],)
+
+        for strategy in strategies:
+            result = run_allocation_benchmark(
+                strategy,
+                threads=options['threads'],
+                allocations=options['allocations'],
+                qty=Decimal(options['qty']),
+                lots=options['lots'],
+            )
+            self.stdout.write(
+                f"{strategy:<12} hilos={result.threads} ok={result.succeeded}/{result.attempts} "
+                f"throughput={result.throughput:.1f}/s "
+                f"falso_sin_stock={result.false_out_of_stock} ({result.false_out_of_stock_rate:.1%}) "
+                f"conflictos={result.conflicts} errores={result.errors} "
+                f"restante={result.remaining_qty} tiempo={result.elapsed_seconds:.2f}s"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completado'))
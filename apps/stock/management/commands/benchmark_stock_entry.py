@@ -0,0 +1,59 @@
+"""
+Comando Django para comparar la latencia de las entradas v2 en modo eventos y directo.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.stock.benchmarks import run_entry_benchmark
+from apps.stock.services import ENTRY_MODES
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia p50/p99 de handle_stock_entry_request en modo events y direct'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            choices=ENTRY_MODES + ('all',),
+            default='all',
+            help='Modo a medir (default: all)'
+        )
+        parser.add_argument('--iterations', type=int, default=200, help='Entradas por modo (default: 200)')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations debe ser mayor a 0')
+
+        modes = ENTRY_MODES if options['mode'] == 'all' else (options['mode'],)
+
+        results = []
+        for mode in modes:
+            result = run_entry_benchmark(mode, iterations=options['iterations'])
+            results.append(result)
+            self.stdout.write(
+                f"{mode:<8} ok={result.succeeded}/{result.iterations} errores={result.errors} "
+                f"lotes={result.lots_written} p50={result.p50_ms:.2f}ms p99={result.p99_ms:.2f}ms "
+                f"tiempo={result.elapsed_seconds:.2f}s"
+            )
+
+        if len(results) > 1:
+            self._write_comparison(results)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completado'))
+
+    def _write_comparison(self, results):
+        """Compara latencias solo si todos los modos persistieron los mismos lotes."""
+        written = {result.mode: result.lots_written for result in results}
+        if len(set(written.values())) != 1:
+            detail = ', '.join(f"{mode}={lots}" for mode, lots in written.items())
+            self.stdout.write(self.style.WARNING(
+                f"Sin comparación: los modos no escribieron los mismos lotes ({detail})"
+            ))
+            return
+
+        baseline = results[0]
+        for result in results[1:]:
+            if result.p50_ms and result.p99_ms:
+                self.stdout.write(
+                    f"{baseline.mode}/{result.mode} p50 x{baseline.p50_ms / result.p50_ms:.2f} "
+                    f"p99 x{baseline.p99_ms / result.p99_ms:.2f}"
+                )
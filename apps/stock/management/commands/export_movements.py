@@ -0,0 +1,58 @@
+"""
+Comando Django para exportar el libro de movimientos en streaming (CSV o NDJSON).
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from apps.stock.export_service import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, stream_movements
+
+
+class Command(BaseCommand):
+    help = 'Exporta movimientos de stock (con lote/producto/depósito) a CSV o NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv', help='Formato de salida')
+        parser.add_argument('--output', help='Archivo de salida (por defecto stdout)')
+        parser.add_argument('--date-from', help='Fecha desde (YYYY-MM-DD, inclusive)')
+        parser.add_argument('--date-to', help='Fecha hasta (YYYY-MM-DD, inclusive)')
+        parser.add_argument('--product-id', type=int, help='Filtrar por producto')
+        parser.add_argument('--reason', help='Filtrar por motivo')
+        parser.add_argument('--warehouse-id', type=int, help='Filtrar por depósito')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Filas por fetch del cursor (default: {DEFAULT_CHUNK_SIZE})'
+        )
+
+    def _parse_date(self, value, option):
+        if value is None:
+            return None
+        parsed = parse_date(value)
+        if parsed is None:
+            raise CommandError(f'{option} inválida: {value}')
+        return parsed
+
+    def handle(self, *args, **options):
+        content = stream_movements(
+            options['format'],
+            chunk_size=options['chunk_size'],
+            date_from=self._parse_date(options['date_from'], '--date-from'),
+            date_to=self._parse_date(options['date_to'], '--date-to'),
+            product_id=options['product_id'],
+            reason=options['reason'],
+            warehouse_id=options['warehouse_id'],
+        )
+
+        if not options['output']:
+            for line in content:
+                self.stdout.write(line, ending='')
+            return
+
+        lines = 0
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for line in content:
+                output.write(line)
+                lines += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Exportación completa: {lines} líneas en {options['output']}"))
@@ -0,0 +1,89 @@
+"""
+Comando Django para importar una recepción masiva de stock desde JSON o CSV.
+"""
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.stock.idempotency_service import IdempotencyInProgress, IdempotencyService
+from apps.stock.receipt_service import parse_receipt_file, receive_bulk
+
+
+class Command(BaseCommand):
+    help = 'Importa una recepción de stock (JSON o CSV) con upsert de lotes y movimientos ENTRY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archivo .json o .csv')
+        parser.add_argument(
+            '--format',
+            choices=['json', 'csv'],
+            help='Formato del archivo (por defecto según la extensión)'
+        )
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='Username que registra los movimientos'
+        )
+        parser.add_argument(
+            '--allow-partial',
+            action='store_true',
+            help='Aplica las filas válidas aunque otras fallen'
+        )
+        parser.add_argument(
+            '--idempotency-key',
+            help='Clave de idempotencia: reimportar con la misma clave no duplica stock'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Usuario {options['user']} no existe")
+
+        try:
+            with open(path, encoding='utf-8') as handle:
+                rows = parse_receipt_file(handle.read(), fmt)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'No se pudo leer {path}: {e}')
+
+        idempotency_key = options['idempotency_key']
+        request_data = {"rows": rows, "allow_partial": options['allow_partial']}
+        if idempotency_key:
+            try:
+                existing = IdempotencyService.check_existing_request(idempotency_key, "receipt", request_data)
+            except (ValueError, IdempotencyInProgress) as e:
+                raise CommandError(str(e))
+            if existing:
+                self.stdout.write(self.style.WARNING(
+                    f'Recepción ya procesada con la clave {idempotency_key}; no se aplican cambios'
+                ))
+                return
+
+        try:
+            result = receive_bulk(rows, user_id=user.id, allow_partial=options['allow_partial'])
+        except Exception:
+            if idempotency_key:
+                IdempotencyService.release_claim(idempotency_key)
+            raise
+
+        for error in result.errors:
+            self.stdout.write(self.style.ERROR(f'  Fila {error.row}: [{error.error}] {error.message}'))
+
+        if idempotency_key:
+            status_code = 201 if result.rows_applied else 400
+            IdempotencyService.store_response(
+                idempotency_key, "receipt", request_data, status_code, result.as_dict(), created_by=user
+            )
+
+        if result.rows_applied == 0:
+            raise CommandError(f'Recepción rechazada: {len(result.errors)} filas con errores')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recepción importada: {result.rows_applied}/{result.rows_total} filas, '
+            f'{result.lots_created} lotes nuevos, {result.lots_updated} actualizados, '
+            f'{result.movements_created} movimientos'
+        ))
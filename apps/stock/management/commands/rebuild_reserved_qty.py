@@ -0,0 +1,76 @@
+"""
+Comando Django para reconstruir/verificar StockLot.qty_reserved desde las reservas.
+"""
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from apps.stock.models import StockLot
+from apps.stock.reservations import Reservation
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye y verifica el contador StockLot.qty_reserved a partir de las reservas PENDING'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Solo verifica; falla si hay diferencias (no modifica datos)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Cantidad de lotes corregidos por UPDATE (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        verify_only = options['verify']
+        batch_size = options['batch_size']
+
+        # Totales esperados en una sola query agrupada
+        expected = dict(
+            Reservation.objects.filter(status=Reservation.Status.PENDING)
+            .values('lot_id')
+            .annotate(total=Sum('qty'))
+            .values_list('lot_id', 'total')
+        )
+
+        drift = []
+        for lot_id, qty_reserved in StockLot.objects.values_list('id', 'qty_reserved').iterator(chunk_size=2000):
+            expected_qty = expected.get(lot_id) or Decimal('0')
+            if qty_reserved != expected_qty:
+                drift.append(lot_id)
+                self.stdout.write(f'  - Lote {lot_id}: contador {qty_reserved}, esperado {expected_qty}')
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('qty_reserved consistente en todos los lotes'))
+            return
+
+        if verify_only:
+            raise CommandError(f'{len(drift)} lotes con qty_reserved inconsistente')
+
+        # Recalcular en la base (subquery) para no pisar cambios concurrentes
+        qty_field = models.DecimalField(max_digits=12, decimal_places=3)
+        pending = (
+            Reservation.objects.filter(lot=OuterRef('pk'), status=Reservation.Status.PENDING)
+            .order_by()
+            .values('lot')
+            .annotate(total=Sum('qty'))
+            .values('total')
+        )
+        fixed = 0
+        for start in range(0, len(drift), batch_size):
+            with transaction.atomic():
+                fixed += StockLot.objects.filter(id__in=drift[start:start + batch_size]).update(
+                    qty_reserved=Coalesce(
+                        Subquery(pending, output_field=qty_field),
+                        Value(Decimal('0'), output_field=qty_field)
+                    )
+                )
+
+        self.stdout.write(self.style.SUCCESS(f'qty_reserved reconstruido en {fixed} lotes'))
@@ -0,0 +1,40 @@
+"""
+Comando Django para reconciliar ProductStockSummary con los lotes.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.stock.summary_service import reconcile_stock_summaries
+
+
+class Command(BaseCommand):
+    help = 'Reconcilia el resumen de stock por producto/depósito con los lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Solo verifica; falla si hay diferencias (no modifica datos)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Cantidad de claves recalculadas por transacción (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        verify_only = options['verify']
+
+        result = reconcile_stock_summaries(apply=not verify_only, batch_size=options['batch_size'])
+
+        self.stdout.write(f"Claves verificadas: {result['checked']}")
+
+        if verify_only:
+            if result['drifted']:
+                raise CommandError(f"{result['drifted']} claves con resumen inconsistente")
+            self.stdout.write(self.style.SUCCESS('Resumen de stock consistente'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Resumen reconciliado: {result['fixed']} corregidas, {result['removed']} eliminadas"
+        ))
@@ -0,0 +1,75 @@
+"""
+Comando Django para proyectar merma por vencimiento bajo FEFO.
+"""
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.stock.waste_simulator import (
+    DEFAULT_HISTORY_DAYS, DEFAULT_HORIZON_DAYS, WasteProjection, simulate_expiry_waste
+)
+
+
+class Command(BaseCommand):
+    help = 'Simula el agotamiento FEFO del stock actual y proyecta merma, quiebres y valor en riesgo'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horizon',
+            type=int,
+            default=DEFAULT_HORIZON_DAYS,
+            help=f'Días a simular (default: {DEFAULT_HORIZON_DAYS})'
+        )
+        parser.add_argument(
+            '--history-days',
+            type=int,
+            default=DEFAULT_HISTORY_DAYS,
+            help=f'Días de consumo histórico para la demanda diaria (default: {DEFAULT_HISTORY_DAYS})'
+        )
+        parser.add_argument('--product-id', type=int, help='Filtrar por producto')
+        parser.add_argument('--warehouse-id', type=int, help='Filtrar por depósito')
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=20,
+            help='Filas a mostrar, ordenadas por valor en riesgo (0 = todas; default: 20)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=['table', 'csv'],
+            default='table',
+            help='Formato de salida (default: table)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            result = simulate_expiry_waste(
+                horizon_days=options['horizon'],
+                history_days=options['history_days'],
+                product_id=options['product_id'],
+                warehouse_id=options['warehouse_id'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        rows = result.rows[:options['top']] if options['top'] else result.rows
+
+        if options['format'] == 'csv':
+            writer = csv.writer(self.stdout)
+            writer.writerow(WasteProjection._fields)
+            for row in rows:
+                writer.writerow(['' if value is None else value for value in row])
+            return
+
+        for row in rows:
+            self.stdout.write(
+                f"{row.product_code:<16} {row.warehouse_name:<16} disponible={row.available_qty:>10} "
+                f"demanda/día={row.daily_demand:>8} merma={row.projected_waste:>10} "
+                f"valor={row.waste_value:>12} quiebre={row.stockout_days}d"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(result.rows)} claves, {result.lots} lotes, horizonte {result.horizon_days} días: "
+            f"merma {result.total_waste_qty}, valor en riesgo {result.value_at_risk}, "
+            f"{result.stockout_keys} claves con quiebre ({result.elapsed_seconds:.2f}s)"
+        ))
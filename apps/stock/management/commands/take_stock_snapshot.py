@@ -0,0 +1,46 @@
+"""
+Comando Django para tomar snapshots de stock por lote.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.stock.snapshot_service import take_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Guarda la existencia de cada lote al cierre de una fecha (default: ayer)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=str,
+            help='Fecha del snapshot YYYY-MM-DD (default: ayer)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=1,
+            help='Cantidad de días consecutivos hasta --date inclusive, para backfill (default: 1)'
+        )
+
+    def handle(self, *args, **options):
+        if options['date']:
+            last_day = parse_date(options['date'])
+            if last_day is None:
+                raise CommandError(f"Fecha inválida: {options['date']}")
+        else:
+            last_day = timezone.localdate() - timedelta(days=1)
+
+        if options['days'] < 1:
+            raise CommandError('--days debe ser mayor a 0')
+
+        for offset in range(options['days'] - 1, -1, -1):
+            day = last_day - timedelta(days=offset)
+            try:
+                lots = take_snapshot(day)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"Snapshot {day}: {lots} lotes"))
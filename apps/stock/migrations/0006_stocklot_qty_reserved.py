@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_qty_reserved(apps, schema_editor):
+    """Inicializa el contador con la suma de reservas PENDING de cada lote."""
+    StockLot = apps.get_model("stock", "StockLot")
+    Reservation = apps.get_model("stock", "Reservation")
+
+    qty_field = models.DecimalField(max_digits=12, decimal_places=3)
+    pending = (
+        Reservation.objects.filter(lot=OuterRef("pk"), status="pending")
+        .order_by()
+        .values("lot")
+        .annotate(total=Sum("qty"))
+        .values("total")
+    )
+    StockLot.objects.update(
+        qty_reserved=Coalesce(
+            Subquery(pending, output_field=qty_field),
+            Value(Decimal("0"), output_field=qty_field),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stock", "0005_stockidempotencykey"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stocklot",
+            name="qty_reserved",
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_qty_reserved, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="stocklot",
+            constraint=models.CheckConstraint(
+                check=models.Q(("qty_reserved__gte", 0)),
+                name="ck_lot_qty_reserved_non_negative",
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="reservation",
+            name="idx_reservation_availability",
+        ),
+    ]
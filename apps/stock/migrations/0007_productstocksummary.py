@@ -0,0 +1,87 @@
+from datetime import date
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Min, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+
+def backfill_stock_summary(apps, schema_editor):
+    """Crea el resumen inicial agregando los lotes existentes."""
+    StockLot = apps.get_model("stock", "StockLot")
+    ProductStockSummary = apps.get_model("stock", "ProductStockSummary")
+
+    qty_field = models.DecimalField(max_digits=12, decimal_places=3)
+    zero = Value(Decimal("0"), output_field=qty_field)
+    available = Case(
+        When(Q(is_quarantined=True) | Q(is_reserved=True) | Q(expiry_date__lt=date.today()), then=zero),
+        default=Greatest(F("qty_on_hand") - F("qty_reserved"), zero),
+        output_field=qty_field,
+    )
+    rows = (
+        StockLot.objects.order_by()
+        .values("product_id", "warehouse_id")
+        .annotate(
+            on_hand=Coalesce(Sum("qty_on_hand"), zero),
+            reserved=Coalesce(Sum("qty_reserved"), zero),
+            available=Coalesce(Sum(available), zero),
+            lot_count=Count("id", filter=Q(qty_on_hand__gt=0)),
+            nearest_expiry=Min("expiry_date", filter=Q(qty_on_hand__gt=0)),
+        )
+    )
+    ProductStockSummary.objects.bulk_create(
+        [ProductStockSummary(**row) for row in rows.iterator(chunk_size=2000)],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0001_initial"),
+        ("stock", "0006_stocklot_qty_reserved"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductStockSummary",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("on_hand", models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ("reserved", models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ("available", models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ("lot_count", models.PositiveIntegerField(default=0)),
+                ("nearest_expiry", models.DateField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_summaries",
+                        to="catalog.product",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_summaries",
+                        to="stock.warehouse",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["warehouse", "on_hand"], name="idx_stock_summary_wh_on_hand"),
+                    models.Index(fields=["nearest_expiry"], name="idx_stock_summary_expiry"),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("product", "warehouse"), name="uq_stock_summary_product_warehouse"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_stock_summary, migrations.RunPython.noop),
+    ]
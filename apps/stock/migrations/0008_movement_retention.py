@@ -0,0 +1,113 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+ARCHIVE_TABLE = "stock_movement_archive"
+
+POSTGRES_ARCHIVE_SQL = [
+    f"""
+    CREATE TABLE "{ARCHIVE_TABLE}" (
+        "id" bigint NOT NULL,
+        "type" varchar(8) NOT NULL,
+        "product_id" bigint NOT NULL,
+        "lot_id" bigint NULL,
+        "warehouse_id" bigint NULL,
+        "qty" numeric(12, 3) NOT NULL,
+        "unit_cost" numeric(12, 2) NULL,
+        "reason" varchar(20) NOT NULL,
+        "order_id" bigint NULL,
+        "created_by_id" integer NOT NULL,
+        "created_at" timestamp with time zone NOT NULL,
+        "archived_at" timestamp with time zone NOT NULL,
+        PRIMARY KEY ("id", "created_at")
+    ) PARTITION BY RANGE ("created_at")
+    """,
+    # Red de seguridad: filas fuera de las particiones mensuales creadas por el servicio
+    f'CREATE TABLE "{ARCHIVE_TABLE}_default" PARTITION OF "{ARCHIVE_TABLE}" DEFAULT',
+    f'CREATE INDEX "idx_mv_archive_product_date" ON "{ARCHIVE_TABLE}" ("product_id", "created_at")',
+    f'CREATE INDEX "idx_mv_archive_date" ON "{ARCHIVE_TABLE}" ("created_at")',
+]
+
+
+def create_archive_table(apps, schema_editor):
+    """En PostgreSQL la tabla de archivo se particiona por mes; en el resto es una tabla común."""
+    if schema_editor.connection.vendor == "postgresql":
+        for statement in POSTGRES_ARCHIVE_SQL:
+            schema_editor.execute(statement)
+    else:
+        schema_editor.create_model(apps.get_model("stock", "MovementArchive"))
+
+
+def drop_archive_table(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{ARCHIVE_TABLE}" CASCADE')
+    else:
+        schema_editor.delete_model(apps.get_model("stock", "MovementArchive"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0001_initial"),
+        ("orders", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("stock", "0007_productstocksummary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MovementDailyAggregate",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("reason", models.CharField(choices=[("purchase", "Purchase"), ("sale", "Sale"), ("adjustment", "Adjustment"), ("return_customer", "Return from Customer"), ("return_supplier", "Return to Supplier"), ("transfer", "Transfer"), ("damage", "Damage"), ("expiry", "Expiry")], max_length=20)),
+                ("type", models.CharField(choices=[("entry", "Entry"), ("exit", "Exit")], max_length=8)),
+                ("qty", models.DecimalField(decimal_places=3, default=0, max_digits=16)),
+                ("cost", models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ("movement_count", models.PositiveIntegerField(default=0)),
+                ("product", models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name="+", to="catalog.product")),
+                ("warehouse", models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name="+", to="stock.warehouse")),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["product", "day"], name="idx_mv_daily_product_day"),
+                    models.Index(fields=["warehouse", "day"], name="idx_mv_daily_warehouse_day"),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(fields=("day", "product", "warehouse", "reason", "type"), name="uq_movement_daily_aggregate"),
+                    models.CheckConstraint(check=models.Q(("qty__gte", 0)), name="ck_movement_daily_qty_non_negative"),
+                ],
+            },
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="MovementArchive",
+                    fields=[
+                        ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                        ("type", models.CharField(choices=[("entry", "Entry"), ("exit", "Exit")], max_length=8)),
+                        ("qty", models.DecimalField(decimal_places=3, max_digits=12)),
+                        ("unit_cost", models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                        ("reason", models.CharField(choices=[("purchase", "Purchase"), ("sale", "Sale"), ("adjustment", "Adjustment"), ("return_customer", "Return from Customer"), ("return_supplier", "Return to Supplier"), ("transfer", "Transfer"), ("damage", "Damage"), ("expiry", "Expiry")], max_length=20)),
+                        ("created_at", models.DateTimeField()),
+                        ("archived_at", models.DateTimeField()),
+                        ("created_by", models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name="+", to=settings.AUTH_USER_MODEL)),
+                        ("lot", models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name="+", to="stock.stocklot")),
+                        ("order", models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name="+", to="orders.order")),
+                        ("product", models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name="+", to="catalog.product")),
+                        ("warehouse", models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name="+", to="stock.warehouse")),
+                    ],
+                    options={
+                        "db_table": "stock_movement_archive",
+                        "indexes": [
+                            models.Index(fields=["product", "created_at"], name="idx_mv_archive_product_date"),
+                            models.Index(fields=["created_at"], name="idx_mv_archive_date"),
+                        ],
+                    },
+                ),
+            ],
+        ),
+        # La tabla se crea aparte: en PostgreSQL va particionada por mes
+        migrations.RunPython(create_archive_table, drop_archive_table),
+    ]
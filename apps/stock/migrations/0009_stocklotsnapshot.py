@@ -0,0 +1,34 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0001_initial"),
+        ("stock", "0008_movement_retention"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockLotSnapshot",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("snapshot_date", models.DateField()),
+                ("qty_on_hand", models.DecimalField(decimal_places=3, max_digits=12)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("lot", models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name="+", to="stock.stocklot")),
+                ("product", models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name="+", to="catalog.product")),
+                ("warehouse", models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name="+", to="stock.warehouse")),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["snapshot_date", "product"], name="idx_stock_snapshot_product"),
+                    models.Index(fields=["snapshot_date", "warehouse"], name="idx_stock_snapshot_warehouse"),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(fields=("snapshot_date", "lot"), name="uq_stock_snapshot_date_lot"),
+                ],
+            },
+        ),
+    ]
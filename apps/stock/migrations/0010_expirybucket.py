@@ -0,0 +1,71 @@
+from datetime import date, timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, Count, Min, Sum, Value, When
+
+BUCKETS = [("0-7", 0, 7), ("8-30", 8, 30), ("31-90", 31, 90)]
+
+
+def backfill_expiry_buckets(apps, schema_editor):
+    """Crea el índice inicial agregando los lotes con stock por rango de vencimiento."""
+    StockLot = apps.get_model("stock", "StockLot")
+    ExpiryBucket = apps.get_model("stock", "ExpiryBucket")
+
+    today = date.today()
+    bucket = Case(
+        *[
+            When(
+                expiry_date__gte=today + timedelta(days=start),
+                expiry_date__lte=today + timedelta(days=end),
+                then=Value(name),
+            )
+            for name, start, end in BUCKETS
+        ],
+        output_field=models.CharField(),
+    )
+    rows = (
+        StockLot.objects.filter(
+            qty_on_hand__gt=0,
+            expiry_date__gte=today,
+            expiry_date__lte=today + timedelta(days=BUCKETS[-1][2]),
+        )
+        .order_by()
+        .annotate(bucket=bucket)
+        .values("product_id", "warehouse_id", "bucket")
+        .annotate(qty=Sum("qty_on_hand"), lot_count=Count("id"), nearest_expiry=Min("expiry_date"))
+    )
+    ExpiryBucket.objects.bulk_create(
+        [ExpiryBucket(as_of=today, **row) for row in rows.iterator(chunk_size=2000)],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0001_initial"),
+        ("stock", "0009_stocklotsnapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExpiryBucket",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("bucket", models.CharField(choices=[("0-7", "0-7 días"), ("8-30", "8-30 días"), ("31-90", "31-90 días")], max_length=8)),
+                ("qty", models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ("lot_count", models.PositiveIntegerField(default=0)),
+                ("nearest_expiry", models.DateField(blank=True, null=True)),
+                ("as_of", models.DateField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("product", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="expiry_buckets", to="catalog.product")),
+                ("warehouse", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="expiry_buckets", to="stock.warehouse")),
+            ],
+            options={
+                "indexes": [models.Index(fields=["bucket", "nearest_expiry"], name="idx_expiry_bucket_nearest")],
+                "constraints": [models.UniqueConstraint(fields=("product", "warehouse", "bucket"), name="uq_expiry_bucket")],
+            },
+        ),
+        migrations.RunPython(backfill_expiry_buckets, migrations.RunPython.noop),
+    ]
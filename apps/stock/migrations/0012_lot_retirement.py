@@ -0,0 +1,64 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0001_initial"),
+        ("stock", "0011_stockscanwatermark"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stocklot",
+            name="is_archived",
+            field=models.BooleanField(default=False),
+        ),
+        # idx_lot_fefo_pick pasa a ser parcial: solo lotes con stock
+        migrations.RemoveIndex(
+            model_name="stocklot",
+            name="idx_lot_fefo_pick",
+        ),
+        migrations.AddIndex(
+            model_name="stocklot",
+            index=models.Index(
+                condition=models.Q(("qty_on_hand__gt", 0)),
+                fields=["product", "warehouse", "is_quarantined", "is_reserved", "expiry_date"],
+                name="idx_lot_fefo_pick",
+            ),
+        ),
+        migrations.CreateModel(
+            name="StockLotArchive",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("lot_code", models.CharField(max_length=40)),
+                ("expiry_date", models.DateField()),
+                ("unit_cost", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("created_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField()),
+                (
+                    "product",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="catalog.product",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="stock.warehouse",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "stock_lot_archive",
+                "indexes": [models.Index(fields=["product", "expiry_date"], name="idx_lot_archive_product")],
+            },
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stock", "0013_reservation_expires_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="movement",
+            index=models.Index(fields=["created_at"], name="idx_movement_created_at"),
+        ),
+    ]
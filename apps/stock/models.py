@@ -1,10 +1,16 @@
+from datetime import date
+from decimal import Decimal
+
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import Q
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
 
 from apps.catalog.models import Product
 
+QTY_FIELD = models.DecimalField(max_digits=12, decimal_places=3)
+
 
 class Warehouse(models.Model):
     name = models.CharField(max_length=80, unique=True)
@@ -14,52 +20,80 @@ class Warehouse(models.Model):
         return self.name
 
 
+def available_qty_expression():
+    """
+    Expresión SQL de la cantidad disponible de un lote.
+
+    max(0, qty_on_hand - qty_reserved), y 0 si el lote está en cuarentena,
+    reservado o vencido (misma regla que `StockLot.qty_available`).
+    """
+    zero = Value(Decimal('0'), output_field=QTY_FIELD)
+    return Case(
+        When(
+            Q(is_quarantined=True) | Q(is_reserved=True) | Q(expiry_date__lt=date.today()),
+            then=zero
+        ),
+        default=Greatest(F('qty_on_hand') - F('qty_reserved'), zero),
+        output_field=QTY_FIELD,
+    )
+
+
+class StockLotQuerySet(models.QuerySet):
+    """QuerySet de lotes con helpers set-based para FEFO."""
+
+    def with_availability(self):
+        """Anota `available_qty` (ver `available_qty_expression`) en la misma query."""
+        return self.annotate(available_qty=available_qty_expression())
+
+
 class StockLot(models.Model):
     product = models.ForeignKey(Product, on_delete=models.PROTECT, db_index=True)
     lot_code = models.CharField(max_length=40)
     expiry_date = models.DateField(db_index=True)
     qty_on_hand = models.DecimalField(max_digits=12, decimal_places=3, default=0)
+    # Contador desnormalizado de reservas PENDING (lo mantiene Reservation)
+    qty_reserved = models.DecimalField(max_digits=12, decimal_places=3, default=0)
     unit_cost = models.DecimalField(max_digits=12, decimal_places=2)
     warehouse = models.ForeignKey(Warehouse, null=False, on_delete=models.PROTECT)  # Siempre requerido
     is_quarantined = models.BooleanField(default=False, help_text="Lote en cuarentena, no disponible para venta")
     is_reserved = models.BooleanField(default=False, help_text="Lote reservado, no disponible para asignación automática")
+    # Lote vencido y agotado retirado por `archive_service.retire_expired_lots`
+    is_archived = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = StockLotQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["product", "lot_code", "warehouse"], name="uq_lot_per_product_warehouse"),
             models.CheckConstraint(check=Q(qty_on_hand__gte=0), name="ck_lot_qty_non_negative"),
+            models.CheckConstraint(check=Q(qty_reserved__gte=0), name="ck_lot_qty_reserved_non_negative"),
             models.CheckConstraint(check=Q(unit_cost__gt=0), name="ck_lot_unit_cost_positive"),  # Nuevo: unit_cost > 0
         ]
         indexes = [
             models.Index(fields=["product", "expiry_date"], name="idx_lot_fefo"),
-            # Nuevo: índice compuesto para FEFO optimizado
-            models.Index(fields=["product", "warehouse", "is_quarantined", "is_reserved", "expiry_date"], 
-                        name="idx_lot_fefo_pick"),
+            # Índice compuesto para FEFO: parcial, solo lotes con stock (los retirados quedan fuera)
+            models.Index(fields=["product", "warehouse", "is_quarantined", "is_reserved", "expiry_date"],
+                        name="idx_lot_fefo_pick", condition=Q(qty_on_hand__gt=0)),
         ]
 
     @property
     def qty_available(self):
         """Cantidad disponible para asignación considerando reservas activas"""
+        # Si viene de with_availability() no hace falta otra query
+        annotated = self.__dict__.get('available_qty')
+        if annotated is not None:
+            return annotated
+
         if self.is_quarantined or self.is_reserved:
             return 0
         
         # Verificar si el lote está vencido
-        from datetime import date
         if self.expiry_date < date.today():
             return 0
         
-        # Calcular reservas activas para este lote
-        from apps.stock.reservations import Reservation
-        active_reservations = Reservation.objects.filter(
-            lot=self,
-            status__in=[Reservation.Status.PENDING, Reservation.Status.APPLIED]
-        ).aggregate(
-            total_reserved=models.Sum('qty')
-        )['total_reserved'] or 0
-        
-        # Disponible = on_hand - reservas activas
-        available = self.qty_on_hand - active_reservations
+        # Disponible = on_hand - reservas pendientes (contador desnormalizado)
+        available = self.qty_on_hand - self.qty_reserved
         return max(0, available)  # No puede ser negativo
 
     def __str__(self) -> str:  # pragma: no cover
@@ -114,6 +148,7 @@ class Movement(models.Model):
         indexes = [
             models.Index(fields=['product', 'created_at'], name='idx_movement_product_date'),
             models.Index(fields=['type', 'created_at'], name='idx_movement_type_date'),
+            models.Index(fields=['created_at'], name='idx_movement_created_at'),
         ]
 
     def clean(self):
@@ -132,7 +167,94 @@ class Movement(models.Model):
         return f"{self.type.title()} · {self.product.code} · {self.qty}"
 
 
+class ProductStockSummary(models.Model):
+    """
+    Resumen de stock por (producto, depósito).
+
+    Lo mantienen los servicios de entrada/salida/entrega dentro de la misma
+    transacción (ver `apps.stock.summary_service`). Lecturas de dashboards y
+    scans usan esta tabla en lugar de agregar lotes.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="stock_summaries")
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name="stock_summaries")
+    on_hand = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    reserved = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    # Disponible a la fecha de `updated_at` (los vencimientos del día los corrige la reconciliación)
+    available = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    lot_count = models.PositiveIntegerField(default=0)
+    nearest_expiry = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["product", "warehouse"], name="uq_stock_summary_product_warehouse"),
+        ]
+        indexes = [
+            models.Index(fields=["warehouse", "on_hand"], name="idx_stock_summary_wh_on_hand"),
+            models.Index(fields=["nearest_expiry"], name="idx_stock_summary_expiry"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.product_id}@{self.warehouse_id}: {self.on_hand}"
+
+
+class ExpiryBucket(models.Model):
+    """
+    Stock por (producto, depósito, rango de días a vencer).
+
+    Rangos 0-7 / 8-30 / 31-90 días contados desde `as_of`. Se actualiza junto
+    con ProductStockSummary en entradas/salidas y un job nocturno lo corre al
+    día siguiente (ver `apps.stock.expiry_bucket_service`). Métricas, dashboards
+    y scans de vencimiento leen esta tabla en lugar de escanear lotes.
+    """
+    class Bucket(models.TextChoices):
+        DAYS_0_7 = "0-7", "0-7 días"
+        DAYS_8_30 = "8-30", "8-30 días"
+        DAYS_31_90 = "31-90", "31-90 días"
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="expiry_buckets")
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name="expiry_buckets")
+    bucket = models.CharField(max_length=8, choices=Bucket.choices)
+    qty = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    lot_count = models.PositiveIntegerField(default=0)
+    nearest_expiry = models.DateField(null=True, blank=True)
+    as_of = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["product", "warehouse", "bucket"], name="uq_expiry_bucket"),
+        ]
+        indexes = [
+            models.Index(fields=["bucket", "nearest_expiry"], name="idx_expiry_bucket_nearest"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.product_id}@{self.warehouse_id} [{self.bucket}]: {self.qty}"
+
+
+class StockScanWatermark(models.Model):
+    """
+    Hasta dónde llegó cada scan incremental de stock (ver `apps.stock.watermark_service`).
+
+    last_movement_id es el último Movement procesado (null: nunca corrió, el
+    próximo scan es completo) y last_scan_date el último día cuyos cruces de
+    rango de vencimiento ya se evaluaron.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    last_movement_id = models.BigIntegerField(null=True, blank=True)
+    last_scan_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.name}: {self.last_movement_id} ({self.last_scan_date})"
+
+
 # Import Reservation model to make it available in the stock app
 from .reservations import Reservation
+from .models_archive import MovementArchive, MovementDailyAggregate, StockLotArchive, StockLotSnapshot
 
-__all__ = ['Warehouse', 'StockLot', 'Movement', 'Reservation']
+__all__ = [
+    'Warehouse', 'StockLot', 'Movement', 'ProductStockSummary', 'ExpiryBucket', 'StockScanWatermark', 'Reservation',
+    'MovementArchive', 'MovementDailyAggregate', 'StockLotArchive', 'StockLotSnapshot',
+]
@@ -0,0 +1,148 @@
+# apps/stock/models_archive.py
+"""Modelos históricos del stock: rollups diarios, archivo de movimientos y lotes, y snapshots."""
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Q
+
+from apps.catalog.models import Product
+from .models import Movement, StockLot, Warehouse
+
+
+class MovementDailyAggregate(models.Model):
+    """
+    Rollup diario de movimientos archivados por (día, producto, depósito, motivo, tipo).
+
+    `cost` es la suma de qty * unit_cost de los movimientos del grupo.
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name="+")
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT, related_name="+")
+    reason = models.CharField(max_length=20, choices=Movement.Reason.choices)
+    type = models.CharField(max_length=8, choices=Movement.Type.choices)
+    qty = models.DecimalField(max_digits=16, decimal_places=3, default=0)
+    cost = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    movement_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "product", "warehouse", "reason", "type"],
+                name="uq_movement_daily_aggregate"
+            ),
+            models.CheckConstraint(check=Q(qty__gte=0), name="ck_movement_daily_qty_non_negative"),
+        ]
+        indexes = [
+            models.Index(fields=["product", "day"], name="idx_mv_daily_product_day"),
+            models.Index(fields=["warehouse", "day"], name="idx_mv_daily_warehouse_day"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.day} · {self.product_id}@{self.warehouse_id} · {self.type}/{self.reason} · {self.qty}"
+
+
+class MovementArchive(models.Model):
+    """
+    Movimientos crudos movidos fuera de `stock_movement` por la retención.
+
+    Conserva el id original. En PostgreSQL la tabla está particionada por mes
+    sobre created_at (ver migración 0008 y `archive_service.ensure_archive_partitions`).
+    Las FKs no tienen constraint para que el archivo no bloquee la baja de lotes.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    type = models.CharField(max_length=8, choices=Movement.Type.choices)
+    product = models.ForeignKey(
+        Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    lot = models.ForeignKey(
+        StockLot, null=True, blank=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    # Desnormalizado del lote al archivar
+    warehouse = models.ForeignKey(
+        Warehouse, null=True, blank=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    qty = models.DecimalField(max_digits=12, decimal_places=3)
+    unit_cost = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    reason = models.CharField(max_length=20, choices=Movement.Reason.choices)
+    order = models.ForeignKey(
+        'orders.Order', null=True, blank=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "stock_movement_archive"
+        indexes = [
+            models.Index(fields=["product", "created_at"], name="idx_mv_archive_product_date"),
+            models.Index(fields=["created_at"], name="idx_mv_archive_date"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"Archived {self.type} · {self.product_id} · {self.qty}"
+
+
+class StockLotArchive(models.Model):
+    """
+    Lotes vencidos y agotados movidos fuera de `stock_stocklot` por
+    `archive_service.retire_expired_lots`, una vez que nada los referencia.
+
+    Conserva el id original para resolver el lote de movimientos archivados y snapshots.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    product = models.ForeignKey(
+        Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    lot_code = models.CharField(max_length=40)
+    expiry_date = models.DateField()
+    unit_cost = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "stock_lot_archive"
+        indexes = [
+            models.Index(fields=["product", "expiry_date"], name="idx_lot_archive_product"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"Archived lot {self.lot_code} · {self.product_id}@{self.warehouse_id}"
+
+
+class StockLotSnapshot(models.Model):
+    """
+    Existencia de un lote al cierre de `snapshot_date` (movimientos hasta el fin del día).
+
+    Solo se guardan lotes con existencia distinta de cero. Producto y depósito
+    se desnormalizan para filtrar sin join; las FKs no tienen constraint para
+    que los snapshots no bloqueen la baja de lotes.
+    """
+    snapshot_date = models.DateField()
+    lot = models.ForeignKey(
+        StockLot, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    product = models.ForeignKey(
+        Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    qty_on_hand = models.DecimalField(max_digits=12, decimal_places=3)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["snapshot_date", "lot"], name="uq_stock_snapshot_date_lot"),
+        ]
+        indexes = [
+            models.Index(fields=["snapshot_date", "product"], name="idx_stock_snapshot_product"),
+            models.Index(fields=["snapshot_date", "warehouse"], name="idx_stock_snapshot_warehouse"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.snapshot_date} · lot {self.lot_id} · {self.qty_on_hand}"
@@ -0,0 +1,360 @@
+# apps/stock/receipt_service.py
+"""
+Recepción masiva de stock (camión completo) en un número fijo de queries.
+
+Flujo:
+1. Validación de todas las filas en una pasada (productos y depósitos con una
+   query cada uno).
+2. Inserción de los lotes nuevos vacíos (ignore_conflicts sobre
+   uq_lot_per_product_warehouse), lock de todos los lotes en orden de id y
+   bulk_update de las cantidades incrementadas.
+3. bulk_create de los Movement ENTRY (uno por fila) y refresco del resumen.
+"""
+
+import csv
+import io
+import json
+import logging
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from apps.catalog.models import Product
+from .idempotency_service import IdempotencyInProgress, IdempotencyService
+from .models import Movement, StockLot, Warehouse
+from .summary_service import refresh_stock_summaries
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_FIELDS = ['product_code', 'lot_code', 'expiry_date', 'qty', 'unit_cost', 'warehouse']
+
+# Límite por request/archivo (en filas)
+MAX_RECEIPT_ROWS = 20000
+
+
+class ReceiptRowError(NamedTuple):
+    """Error de validación de una fila (row es 1-based)."""
+    row: int
+    error: str
+    message: str
+
+
+class BulkReceiptResult(NamedTuple):
+    """Resultado de una recepción masiva."""
+    rows_total: int
+    rows_applied: int
+    lots_created: int
+    lots_updated: int
+    movements_created: int
+    errors: List[ReceiptRowError]
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = self._asdict()
+        data['errors'] = [error._asdict() for error in self.errors]
+        return data
+
+
+class _ValidRow(NamedTuple):
+    row: int
+    product: Product
+    warehouse: Warehouse
+    lot_code: str
+    expiry_date: date
+    qty: Decimal
+    unit_cost: Decimal
+
+
+def parse_receipt_file(content: str, fmt: str) -> List[Dict[str, Any]]:
+    """
+    Convierte el contenido JSON o CSV en una lista de filas (dicts).
+
+    JSON: lista de objetos o {"rows": [...]}. CSV: con encabezado RECEIPT_FIELDS.
+
+    Raises:
+        ValueError: Si el formato o el contenido no son válidos
+    """
+    if fmt == 'json':
+        data = json.loads(content)
+        if isinstance(data, dict):
+            data = data.get('rows')
+        if not isinstance(data, list):
+            raise ValueError("JSON debe ser una lista de filas o un objeto con 'rows'")
+        return data
+
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(content))
+        missing = set(RECEIPT_FIELDS) - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"Faltan columnas en el CSV: {', '.join(sorted(missing))}")
+        return list(reader)
+
+    raise ValueError(f"Formato no soportado: {fmt}")
+
+
+def _resolve_warehouse(value, by_name: Dict[str, Warehouse], by_id: Dict[int, Warehouse]) -> Optional[Warehouse]:
+    """El depósito puede venir por nombre o por id."""
+    if isinstance(value, int) or (isinstance(value, str) and value.strip().isdigit()):
+        return by_id.get(int(value))
+    return by_name.get(str(value).strip())
+
+
+def _validate_rows(rows: List[Dict[str, Any]]) -> Tuple[List[_ValidRow], List[ReceiptRowError]]:
+    """Valida todas las filas en una pasada (productos y depósitos en una query cada uno)."""
+    product_codes = {str(row.get('product_code', '')).strip() for row in rows if isinstance(row, dict)}
+    products = {product.code: product for product in Product.objects.filter(code__in=product_codes)}
+
+    warehouses = list(Warehouse.objects.all())
+    warehouses_by_name = {warehouse.name: warehouse for warehouse in warehouses}
+    warehouses_by_id = {warehouse.id: warehouse for warehouse in warehouses}
+
+    valid: List[_ValidRow] = []
+    errors: List[ReceiptRowError] = []
+
+    for index, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            errors.append(ReceiptRowError(index, "VALIDATION_ERROR", "La fila debe ser un objeto"))
+            continue
+
+        missing = [field for field in RECEIPT_FIELDS if row.get(field) in (None, '')]
+        if missing:
+            errors.append(ReceiptRowError(index, "VALIDATION_ERROR", f"Faltan campos: {', '.join(missing)}"))
+            continue
+
+        product = products.get(str(row['product_code']).strip())
+        if product is None:
+            errors.append(ReceiptRowError(index, "NOT_FOUND", f"Producto {row['product_code']} no existe"))
+            continue
+
+        warehouse = _resolve_warehouse(row['warehouse'], warehouses_by_name, warehouses_by_id)
+        if warehouse is None or not warehouse.is_active:
+            errors.append(ReceiptRowError(index, "NOT_FOUND", f"Depósito {row['warehouse']} no existe o está inactivo"))
+            continue
+
+        expiry_date = row['expiry_date']
+        if not isinstance(expiry_date, date):
+            try:
+                expiry_date = parse_date(str(expiry_date).strip())
+            except ValueError:
+                expiry_date = None
+        if expiry_date is None:
+            errors.append(ReceiptRowError(index, "VALIDATION_ERROR", f"expiry_date inválida: {row['expiry_date']}"))
+            continue
+
+        try:
+            qty = Decimal(str(row['qty']).strip())
+            unit_cost = Decimal(str(row['unit_cost']).strip())
+        except InvalidOperation:
+            errors.append(ReceiptRowError(index, "VALIDATION_ERROR", "qty y unit_cost deben ser numéricos"))
+            continue
+
+        if qty <= 0:
+            errors.append(ReceiptRowError(index, "VALIDATION_ERROR", "La cantidad debe ser mayor a 0"))
+            continue
+        if unit_cost <= 0:
+            errors.append(ReceiptRowError(index, "VALIDATION_ERROR", "El costo unitario debe ser mayor a 0"))
+            continue
+
+        valid.append(_ValidRow(
+            row=index,
+            product=product,
+            warehouse=warehouse,
+            lot_code=str(row['lot_code']).strip(),
+            expiry_date=expiry_date,
+            qty=qty,
+            unit_cost=unit_cost,
+        ))
+
+    return valid, errors
+
+
+@transaction.atomic
+def receive_bulk(
+    rows: List[Dict[str, Any]],
+    *,
+    user_id: int,
+    reason: str = Movement.Reason.PURCHASE,
+    allow_partial: bool = False,
+) -> BulkReceiptResult:
+    """
+    Registra una recepción masiva de stock con semántica de upsert por lote.
+
+    Args:
+        rows: Filas con product_code, lot_code, expiry_date, qty, unit_cost y
+            warehouse (nombre o id)
+        user_id: Usuario que registra los movimientos
+        reason: Motivo de los movimientos ENTRY
+        allow_partial: Si es True aplica las filas válidas aunque otras fallen;
+            si es False cualquier error rechaza la recepción completa
+
+    Returns:
+        BulkReceiptResult con contadores y errores por fila
+    """
+    if len(rows) > MAX_RECEIPT_ROWS:
+        raise ValueError(f"No se pueden procesar más de {MAX_RECEIPT_ROWS} filas por recepción")
+
+    valid, errors = _validate_rows(rows)
+    if not valid:
+        return BulkReceiptResult(len(rows), 0, 0, 0, 0, errors)
+
+    # Primera fila de cada lote: define vencimiento y costo si el lote es nuevo
+    first_rows: Dict[Tuple[int, str, int], _ValidRow] = {}
+    for row in valid:
+        first_rows.setdefault((row.product.id, row.lot_code, row.warehouse.id), row)
+
+    def _candidate_lots():
+        return StockLot.objects.filter(
+            product_id__in={key[0] for key in first_rows},
+            lot_code__in={key[1] for key in first_rows},
+            warehouse_id__in={key[2] for key in first_rows},
+        )
+
+    # Los lotes nuevos se insertan vacíos (ignore_conflicts) para poder bloquearlos
+    # junto con los existentes: dos recepciones que crean el mismo lote se serializan
+    # en el lock en vez de pisarse el qty_on_hand
+    preexisting = set(_candidate_lots().values_list('product_id', 'lot_code', 'warehouse_id'))
+    StockLot.objects.bulk_create(
+        [
+            StockLot(
+                product=row.product,
+                lot_code=row.lot_code,
+                warehouse=row.warehouse,
+                expiry_date=row.expiry_date,
+                unit_cost=row.unit_cost,
+                qty_on_hand=Decimal('0'),
+            )
+            for key, row in first_rows.items() if key not in preexisting
+        ],
+        ignore_conflicts=True,
+    )
+
+    # Todos los lotes bloqueados en orden de id (mismo criterio que allocate_many)
+    locked = {
+        (lot.product_id, lot.lot_code, lot.warehouse_id): lot
+        for lot in _candidate_lots().select_for_update().order_by('id')
+        if (lot.product_id, lot.lot_code, lot.warehouse_id) in first_rows
+    }
+
+    # Incrementos sobre los valores bloqueados; la fecha se valida contra el lote real
+    lots_by_key: Dict[Tuple[int, str, int], StockLot] = {}
+    accepted: List[_ValidRow] = []
+    for row in valid:
+        key = (row.product.id, row.lot_code, row.warehouse.id)
+        lot = locked[key]
+
+        if lot.expiry_date != row.expiry_date:
+            errors.append(ReceiptRowError(
+                row.row,
+                "INCONSISTENT_LOT",
+                f"El lote {row.lot_code} ya existe con fecha de vencimiento {lot.expiry_date}, "
+                f"pero se intenta ingresar con fecha {row.expiry_date}"
+            ))
+            continue
+
+        lot.qty_on_hand += row.qty
+        lot.is_archived = False
+        lots_by_key[key] = lot
+        accepted.append(row)
+
+    errors.sort(key=lambda error: error.row)
+
+    if (errors and not allow_partial) or not accepted:
+        # Descarta los lotes vacíos insertados para el lock
+        transaction.set_rollback(True)
+        return BulkReceiptResult(len(rows), 0, 0, 0, 0, errors)
+
+    StockLot.objects.bulk_update(list(lots_by_key.values()), ['qty_on_hand', 'is_archived'])
+
+    movements = Movement.objects.bulk_create([
+        Movement(
+            type=Movement.Type.ENTRY,
+            product=row.product,
+            lot=lots_by_key[(row.product.id, row.lot_code, row.warehouse.id)],
+            qty=row.qty,
+            unit_cost=row.unit_cost,
+            reason=reason,
+            created_by_id=user_id,
+        )
+        for row in accepted
+    ])
+
+    refresh_stock_summaries({(product_id, warehouse_id) for product_id, _, warehouse_id in lots_by_key})
+
+    lots_updated = sum(1 for key in lots_by_key if key in preexisting)
+    result = BulkReceiptResult(
+        rows_total=len(rows),
+        rows_applied=len(accepted),
+        lots_created=len(lots_by_key) - lots_updated,
+        lots_updated=lots_updated,
+        movements_created=len(movements),
+        errors=errors,
+    )
+
+    logger.info(
+        "Bulk stock receipt",
+        extra={
+            'rows_total': result.rows_total,
+            'rows_applied': result.rows_applied,
+            'lots_created': result.lots_created,
+            'lots_updated': result.lots_updated,
+            'row_errors': len(errors),
+        }
+    )
+
+    return result
+
+
+def handle_bulk_receipt_request(
+    request_user,
+    rows: List[Dict[str, Any]],
+    idempotency_key: str,
+    allow_partial: bool = False,
+    operation_type: str = "receipt"
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Maneja la recepción masiva para endpoints, con idempotencia.
+
+    Returns:
+        Tuple[int, Dict]: (status_code, response_data)
+    """
+    request_data = {"rows": rows, "allow_partial": allow_partial}
+    created_by = request_user if hasattr(request_user, 'id') else None
+
+    try:
+        existing_response = IdempotencyService.check_existing_request(
+            idempotency_key, operation_type, request_data
+        )
+    except IdempotencyInProgress as e:
+        return 409, {"error": "IDEMPOTENCY_IN_PROGRESS", "message": str(e)}
+    except ValueError as e:
+        return 400, {"error": "IDEMPOTENCY_ERROR", "message": str(e)}
+    if existing_response:
+        return existing_response
+
+    try:
+        result = receive_bulk(
+            rows,
+            user_id=getattr(created_by, 'id', None),
+            allow_partial=allow_partial,
+        )
+    except ValueError as e:
+        # Sin respuesta guardada: se libera el reclamo para que el cliente pueda reintentar
+        IdempotencyService.release_claim(idempotency_key)
+        return 400, {"error": "VALIDATION_ERROR", "message": str(e)}
+    except Exception:
+        IdempotencyService.release_claim(idempotency_key)
+        raise
+
+    if result.rows_applied == 0:
+        status_code, response_data = 400, {"status": "rejected", **result.as_dict()}
+    else:
+        status_code, response_data = 201, {"status": "completed", **result.as_dict()}
+
+    # Un reintento con la misma clave devuelve la misma respuesta (también si fue rechazada)
+    IdempotencyService.store_response(
+        idempotency_key, operation_type, request_data, status_code, response_data,
+        created_by=created_by
+    )
+    return status_code, response_data
@@ -0,0 +1,260 @@
+# apps/stock/reservation_service.py
+"""
+Reservas de lotes por orden en bloque.
+
+`reserve_lots()` reemplaza las reservas de una orden en una sola transacción:
+bloquea todos los lotes involucrados con una query ordenada por id, calcula la
+disponibilidad neta de reservas PENDING de otras órdenes con un único
+aggregate agrupado, ajusta `StockLot.qty_reserved` con un UPDATE y crea las
+reservas con `bulk_create`.
+
+Las reservas pueden vencer (`expires_at`): `expire_stale_reservations()`
+cancela en bloque las PENDING vencidas y libera su retención.
+
+Todas las operaciones que tocan reservas bloquean en el mismo orden:
+orden -> reservas -> lotes.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.utils import timezone
+
+from apps.orders.models import Order
+
+from .models import QTY_FIELD, StockLot
+from .reservations import Reservation
+from .services import StockError
+from .summary_service import refresh_lot_summaries, refresh_stock_summaries
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SWEEP_BATCH_SIZE = 1000
+
+
+class ReservationUnavailable(StockError):
+    """Alguna reserva pedida supera el disponible del lote (o el lote no existe)."""
+    def __init__(self, errors: List[str], availability_check: Dict[str, Dict[str, Any]]):
+        super().__init__("INSUFFICIENT_STOCK", "; ".join(errors))
+        self.errors = errors
+        self.availability_check = availability_check
+
+
+class BulkReservationResult(NamedTuple):
+    """Resultado de `reserve_lots`."""
+    reservations: List[Reservation]
+    lots: Dict[int, StockLot]
+    total_reserved: Decimal
+
+
+def requested_by_lot(lines: Iterable[Dict[str, Any]]) -> Dict[int, Decimal]:
+    """Suma las cantidades pedidas por lote ({lot_id, qty} por línea)."""
+    requested: Dict[int, Decimal] = defaultdict(Decimal)
+    for line in lines:
+        requested[line['lot_id']] += Decimal(str(line['qty']))
+    return dict(requested)
+
+
+def _pending_totals(reservations) -> Dict[int, Decimal]:
+    pending = reservations.filter(status=Reservation.Status.PENDING).order_by()
+    return dict(pending.values('lot_id').annotate(total=Sum('qty')).values_list('lot_id', 'total'))
+
+
+def pending_by_lot(lot_ids: Iterable[int], exclude_order: Optional[Order] = None) -> Dict[int, Decimal]:
+    """Reservas PENDING por lote (de otras órdenes si se pasa `exclude_order`) en un único aggregate agrupado."""
+    reservations = Reservation.objects.filter(lot_id__in=list(lot_ids))
+    if exclude_order is not None:
+        reservations = reservations.exclude(order=exclude_order)
+    return _pending_totals(reservations)
+
+
+def check_availability(
+    requested: Dict[int, Decimal],
+    lots: Dict[int, StockLot],
+    held: Dict[int, Decimal],
+) -> Dict[str, Any]:
+    """
+    Compara lo pedido con on_hand - reservas PENDING de otras órdenes.
+
+    Returns:
+        Dict con valid, errors y availability_check por lote
+    """
+    result = {'valid': True, 'errors': [], 'availability_check': {}}
+
+    for lot_id, requested_qty in requested.items():
+        lot = lots.get(lot_id)
+        if lot is None:
+            result['valid'] = False
+            result['errors'].append(f"Lote ID {lot_id} no existe")
+            result['availability_check'][str(lot_id)] = {
+                'available': Decimal('0'),
+                'requested': requested_qty,
+                'error': 'Lote no encontrado'
+            }
+            continue
+
+        existing_reservations = held.get(lot_id, Decimal('0'))
+        available_qty = lot.qty_on_hand - existing_reservations
+        result['availability_check'][str(lot_id)] = {
+            'available': available_qty,
+            'requested': requested_qty,
+            'on_hand': lot.qty_on_hand,
+            'existing_reservations': existing_reservations
+        }
+        if requested_qty > available_qty:
+            result['valid'] = False
+            result['errors'].append(
+                f"Lote {lot.lot_code}: solicitado {requested_qty}, disponible {available_qty}"
+            )
+
+    return result
+
+
+def shift_reserved_qty(deltas: Dict[int, Decimal]) -> int:
+    """Suma `deltas[lot_id]` a qty_reserved de cada lote con un único UPDATE."""
+    deltas = {lot_id: delta for lot_id, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    return StockLot.objects.filter(id__in=list(deltas)).update(
+        qty_reserved=F('qty_reserved') + Case(
+            *[When(id=lot_id, then=Value(delta)) for lot_id, delta in deltas.items()],
+            output_field=QTY_FIELD,
+        )
+    )
+
+
+def reservation_expiry(ttl_minutes: Optional[int] = None) -> Optional[datetime]:
+    """Vencimiento para una reserva nueva (settings.RESERVATION_TTL_MINUTES por defecto; 0 = sin vencimiento)."""
+    if ttl_minutes is None:
+        ttl_minutes = settings.RESERVATION_TTL_MINUTES
+    if not ttl_minutes:
+        return None
+    return timezone.now() + timedelta(minutes=ttl_minutes)
+
+
+@transaction.atomic
+def reserve_lots(
+    order: Order,
+    lines: Iterable[Dict[str, Any]],
+    ttl_minutes: Optional[int] = None,
+) -> BulkReservationResult:
+    """
+    Reemplaza las reservas de la orden por las líneas {lot_id, qty} pedidas.
+
+    Las reservas previas de la orden se borran (liberando las PENDING) y las
+    nuevas quedan PENDING, con vencimiento si hay TTL.
+
+    Raises:
+        ReservationUnavailable: Si algún lote no existe o no alcanza el disponible
+    """
+    requested = requested_by_lot(lines)
+
+    # Serializa reemplazos concurrentes de la misma orden. Orden de locks
+    # (compartido con el sweeper y las entregas): orden -> reservas -> lotes
+    order = Order.objects.select_for_update().get(pk=order.pk)
+
+    # Reservas propias bloqueadas: lo que se libera sale de estas filas, no de una lectura previa
+    own_pending: Dict[int, Decimal] = defaultdict(Decimal)
+    for lot_id, qty in (
+        Reservation.objects.select_for_update()
+        .filter(order=order, status=Reservation.Status.PENDING)
+        .order_by('id')
+        .values_list('lot_id', 'qty')
+    ):
+        own_pending[lot_id] += qty
+    lots = {
+        lot.id: lot
+        for lot in StockLot.objects.select_for_update().filter(
+            id__in=set(requested) | set(own_pending)
+        ).order_by('id')
+    }
+
+    availability = check_availability(requested, lots, pending_by_lot(requested, exclude_order=order))
+    if not availability['valid']:
+        raise ReservationUnavailable(availability['errors'], availability['availability_check'])
+
+    Reservation.objects.filter(order=order).delete()
+
+    expires_at = reservation_expiry(ttl_minutes)
+    reservations = Reservation.objects.bulk_create([
+        Reservation(order=order, lot_id=lot_id, qty=qty, status=Reservation.Status.PENDING, expires_at=expires_at)
+        for lot_id, qty in requested.items()
+    ])
+
+    deltas = {lot_id: -qty for lot_id, qty in own_pending.items()}
+    for lot_id, qty in requested.items():
+        deltas[lot_id] = deltas.get(lot_id, Decimal('0')) + qty
+    shift_reserved_qty(deltas)
+    refresh_stock_summaries({(lot.product_id, lot.warehouse_id) for lot in lots.values()})
+
+    return BulkReservationResult(
+        reservations=reservations,
+        lots=lots,
+        total_reserved=sum(requested.values(), Decimal('0')),
+    )
+
+
+def expire_stale_reservations(
+    now: Optional[datetime] = None,
+    batch_size: int = DEFAULT_SWEEP_BATCH_SIZE,
+) -> Dict[str, int]:
+    """
+    Cancela las reservas PENDING con expires_at vencido, por lotes de `batch_size`.
+
+    Cada lote se procesa en su propia transacción con el mismo orden de locks
+    que `reserve_lots`: primero las órdenes (saltando las que están bloqueadas,
+    que se vencen en la próxima pasada), después sus reservas y por último los
+    lotes, vía el UPDATE de qty_reserved.
+
+    Returns:
+        Dict con reservations_expired, lots_released y batches
+    """
+    now = now or timezone.now()
+    result = {'reservations_expired': 0, 'lots_released': 0, 'batches': 0}
+    stale = Reservation.objects.filter(status=Reservation.Status.PENDING, expires_at__lte=now)
+
+    last_id = 0
+    while True:
+        candidates = list(stale.filter(id__gt=last_id).order_by('id').values_list('id', 'order_id')[:batch_size])
+        if not candidates:
+            break
+        last_id = candidates[-1][0]
+
+        with transaction.atomic():
+            order_ids = list(
+                Order.objects.select_for_update(skip_locked=True)
+                .filter(id__in={order_id for _, order_id in candidates})
+                .order_by('id')
+                .values_list('id', flat=True)
+            )
+            # Se re-filtra con las filas bloqueadas: otra transacción pudo cancelarlas o aplicarlas
+            rows = list(
+                stale.select_for_update()
+                .filter(id__in=[reservation_id for reservation_id, _ in candidates], order_id__in=order_ids)
+                .order_by('id')
+                .values_list('id', 'lot_id', 'qty')
+            )
+            if rows:
+                Reservation.objects.filter(id__in=[row[0] for row in rows]).update(
+                    status=Reservation.Status.CANCELLED, updated_at=timezone.now()
+                )
+                released: Dict[int, Decimal] = defaultdict(Decimal)
+                for _, lot_id, qty in rows:
+                    released[lot_id] -= qty
+                result['lots_released'] += shift_reserved_qty(released)
+                refresh_lot_summaries(list(released))
+
+        result['reservations_expired'] += len(rows)
+        result['batches'] += 1
+        if len(candidates) < batch_size:
+            break
+
+    if result['reservations_expired']:
+        logger.info("Stale reservations expired", extra=result)
+    return result
@@ -1,8 +1,10 @@
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 
 from apps.orders.models import Order
 from apps.stock.models import StockLot
+from apps.stock.summary_service import refresh_lot_summaries
 
 
 class Reservation(models.Model):
@@ -40,6 +42,9 @@ class Reservation(models.Model):
         help_text="Estado de la reserva"
     )
     
+    # Vencimiento opcional de la retención: `reservation_service.expire_stale_reservations` cancela las PENDING vencidas
+    expires_at = models.DateTimeField(null=True, blank=True)
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -69,16 +74,17 @@ class Reservation(models.Model):
                 fields=["lot", "status"], 
                 name="idx_reservation_lot_status"
             ),
-            # Índice compuesto para queries de disponibilidad
-            models.Index(
-                fields=["lot", "status", "qty"], 
-                name="idx_reservation_availability"
-            ),
             # Índice temporal para auditoría
             models.Index(
                 fields=["created_at"], 
                 name="idx_reservation_created"
             ),
+            # Barrido de reservas PENDING vencidas
+            models.Index(
+                fields=["expires_at"],
+                name="idx_reservation_pending_exp",
+                condition=Q(status="pending", expires_at__isnull=False)
+            ),
         ]
 
     def __str__(self) -> str:  # pragma: no cover
@@ -89,12 +95,47 @@ class Reservation(models.Model):
         """Indica si la reserva está activa (pending o applied)"""
         return self.status in [self.Status.PENDING, self.Status.APPLIED]
 
+    def save(self, *args, **kwargs):
+        """Al crear una reserva PENDING suma su cantidad a StockLot.qty_reserved (y al resumen)."""
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.status == self.Status.PENDING:
+                StockLot.objects.filter(pk=self.lot_id).update(
+                    qty_reserved=F('qty_reserved') + self.qty
+                )
+                refresh_lot_summaries([self.lot_id])
+
+    def _transition(self, new_status: str) -> None:
+        """
+        Cambia el estado y libera la retención del lote si la reserva estaba PENDING.
+
+        El cambio de estado es condicional (WHERE status = pending) para que dos
+        transiciones concurrentes no descuenten dos veces el contador del lote.
+        """
+        with transaction.atomic():
+            now = timezone.now()
+            released = Reservation.objects.filter(
+                pk=self.pk, status=self.Status.PENDING
+            ).update(status=new_status, updated_at=now)
+
+            if released:
+                StockLot.objects.filter(pk=self.lot_id).update(
+                    qty_reserved=F('qty_reserved') - self.qty
+                )
+                refresh_lot_summaries([self.lot_id])
+            else:
+                Reservation.objects.filter(pk=self.pk).update(status=new_status, updated_at=now)
+
+        self.status = new_status
+        self.updated_at = now
+
     def cancel(self):
         """Cancela la reserva"""
-        self.status = self.Status.CANCELLED
-        self.save(update_fields=['status', 'updated_at'])
+        self._transition(self.Status.CANCELLED)
 
     def apply(self):
         """Marca la reserva como aplicada (entregada)"""
-        self.status = self.Status.APPLIED
-        self.save(update_fields=['status', 'updated_at'])
\ No newline at end of file
+        self._transition(self.Status.APPLIED)
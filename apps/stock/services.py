@@ -3,9 +3,11 @@ import logging
 import uuid
 from datetime import date, timedelta
 from decimal import Decimal
-from typing import Optional, List, Dict, Any, NamedTuple, Tuple
+from typing import Optional, List, Dict, Any, NamedTuple, Sequence, Tuple
 
+from django.conf import settings
 from django.db import transaction
+from django.db.models import F, Q
 from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
@@ -14,15 +16,27 @@ from django.http import Http404
 from apps.catalog.models import Product
 from .models import StockLot, Movement, Warehouse
 from apps.events.manager import EventSystemManager
-from apps.core.events import EventBus
+from apps.core.events import publish_many_sync, publish_sync
 from apps.stock.events import (
     StockEntryRequested, StockExitRequested, StockValidationRequested,
-    WarehouseValidationRequested
+    WarehouseValidationRequested, StockEntryCompleted, StockUpdated
 )
-from .idempotency_service import IdempotencyService
+from .idempotency_service import IdempotencyInProgress, IdempotencyService
+from .summary_service import refresh_stock_summaries, refresh_stock_summary, refresh_stock_summary_on_commit
+from .allocation_strategies import get_allocation_strategy, record_allocation_metrics
+from apps.core.metrics import increment_stock_exit_conflict, observe_stock_exit_attempts
 
 logger = logging.getLogger(__name__)
 
+# Modos de `create_exit` (settings.STOCK_EXIT_MODE)
+EXIT_MODE_LOCKING = 'locking'
+EXIT_MODE_OPTIMISTIC = 'optimistic'
+
+# Modos de `handle_stock_entry_request` (settings.STOCK_ENTRY_MODE)
+ENTRY_MODE_EVENTS = 'events'
+ENTRY_MODE_DIRECT = 'direct'
+ENTRY_MODES = (ENTRY_MODE_EVENTS, ENTRY_MODE_DIRECT)
+
 
 # API Service Layer - Funciones para manejar lógica de endpoints
 
@@ -78,20 +92,32 @@ def handle_stock_entry_request(
     request_user,
     payload_data: Dict[str, Any],
     idempotency_key: str,
-    operation_type: str = "entry_v2"
+    operation_type: str = "entry_v2",
+    mode: Optional[str] = None
 ) -> Tuple[int, Dict[str, Any]]:
     """
     Maneja la lógica de entrada de stock para endpoints.
     
+    En modo 'events' publica StockEntryRequested y responde 202; la entrada se
+    procesa en la cadena de eventos de StockEntryHandler. En modo 'direct'
+    valida y persiste en línea con `create_entry` (una transacción), responde
+    201 y publica StockEntryCompleted/StockUpdated después del commit, solo
+    como notificación.
+    
     Args:
         request_user: Usuario de la request
         payload_data: Datos del payload
         idempotency_key: Clave de idempotencia
         operation_type: Tipo de operación para idempotencia
+        mode: 'events' o 'direct' (default: settings.STOCK_ENTRY_MODE)
         
     Returns:
         Tuple[int, Dict]: (status_code, response_data)
     """
+    mode = mode or settings.STOCK_ENTRY_MODE
+    if mode not in ENTRY_MODES:
+        return 400, {"error": "VALIDATION_ERROR", "message": f"Modo de entrada desconocido: {mode}"}
+    
     try:
         # Prepare request data for idempotency check
         request_data = {
@@ -115,42 +141,78 @@ def handle_stock_entry_request(
         product = get_object_or_404(Product, id=payload_data["product_id"])
         warehouse = get_object_or_404(Warehouse, id=payload_data["warehouse_id"])
         
-        # Request stock entry via events
-        event_id = request_stock_entry(
-            product_id=payload_data["product_id"],
-            lot_code=payload_data["lot_code"],
-            expiry_date=payload_data["expiry_date"],
-            qty=payload_data["qty"],
-            unit_cost=payload_data["unit_cost"],
-            user_id=getattr(request_user, 'id', None) if hasattr(request_user, 'id') else None,
-            warehouse_id=payload_data["warehouse_id"],
-            correlation_id=idempotency_key
-        )
-        
-        response_data = {
-            "event_id": event_id,
-            "status": "requested",
-            "message": "Stock entry request submitted successfully",
-            "correlation_id": idempotency_key
-        }
+        if mode == ENTRY_MODE_DIRECT:
+            # Validación y persistencia en línea; los eventos solo notifican
+            movement = create_entry(
+                product=product,
+                lot_code=payload_data["lot_code"],
+                expiry_date=payload_data["expiry_date"],
+                qty=payload_data["qty"],
+                unit_cost=payload_data["unit_cost"],
+                warehouse=warehouse,
+                reason=payload_data.get("reason", Movement.Reason.PURCHASE),
+                created_by=request_user if hasattr(request_user, 'id') else None
+            )
+            transaction.on_commit(lambda: notify_stock_entry(movement, correlation_id=idempotency_key))
+            
+            status_code = 201
+            response_data = {
+                "status": "completed",
+                "movement_id": movement.id,
+                "lot_id": movement.lot.id,
+                "product_id": product.id,
+                "lot_code": movement.lot.lot_code,
+                "new_qty_on_hand": float(movement.lot.qty_on_hand),
+                "warehouse_name": warehouse.name,
+                "correlation_id": idempotency_key
+            }
+        else:
+            # Request stock entry via events
+            event_id = request_stock_entry(
+                product_id=payload_data["product_id"],
+                lot_code=payload_data["lot_code"],
+                expiry_date=payload_data["expiry_date"],
+                qty=payload_data["qty"],
+                unit_cost=payload_data["unit_cost"],
+                user_id=getattr(request_user, 'id', None) if hasattr(request_user, 'id') else None,
+                warehouse_id=payload_data["warehouse_id"],
+                correlation_id=idempotency_key
+            )
+            
+            status_code = 202
+            response_data = {
+                "event_id": event_id,
+                "status": "requested",
+                "message": "Stock entry request submitted successfully",
+                "correlation_id": idempotency_key
+            }
         
         # Store response for idempotency
         IdempotencyService.store_response(
-            idempotency_key, operation_type, request_data, 202, response_data,
+            idempotency_key, operation_type, request_data, status_code, response_data,
             created_by=request_user if hasattr(request_user, 'id') else None
         )
         
-        return 202, response_data
+        return status_code, response_data
         
+    except IdempotencyInProgress as e:
+        error_data = {"error": "IDEMPOTENCY_IN_PROGRESS", "message": str(e)}
+        return 409, error_data
     except ValueError as e:
         error_data = {"error": "IDEMPOTENCY_ERROR", "message": str(e)}
         return 400, error_data
+    except StockError as e:
+        error_data = {"error": e.code, "message": str(e)}
+        return 400, error_data
     except Http404 as e:
         error_data = {"error": "NOT_FOUND", "message": str(e)}
         return 404, error_data
     except Exception as e:
         error_data = {"error": "VALIDATION_ERROR", "message": str(e)}
         return 400, error_data
+    finally:
+        # Sin respuesta guardada (errores no cacheables) el reclamo se libera acá
+        IdempotencyService.release_claim(idempotency_key)
 
 
 def handle_stock_exit_request(
@@ -215,6 +277,9 @@ def handle_stock_exit_request(
         
         return 202, response_data
         
+    except IdempotencyInProgress as e:
+        error_data = {"error": "IDEMPOTENCY_IN_PROGRESS", "message": str(e)}
+        return 409, error_data
     except ValueError as e:
         error_data = {"error": "IDEMPOTENCY_ERROR", "message": str(e)}
         return 400, error_data
@@ -224,6 +289,9 @@ def handle_stock_exit_request(
     except Exception as e:
         error_data = {"error": "VALIDATION_ERROR", "message": str(e)}
         return 400, error_data
+    finally:
+        # Sin respuesta guardada (errores no cacheables) el reclamo se libera acá
+        IdempotencyService.release_claim(idempotency_key)
 
 
 def handle_legacy_stock_entry(
@@ -289,6 +357,9 @@ def handle_legacy_stock_entry(
         
         return 201, response_data
         
+    except IdempotencyInProgress as e:
+        error_data = {"error": "IDEMPOTENCY_IN_PROGRESS", "message": str(e)}
+        return 409, error_data
     except ValueError as e:
         # Idempotency validation error
         error_data = {"error": "IDEMPOTENCY_ERROR", "message": str(e)}
@@ -318,6 +389,9 @@ def handle_legacy_stock_entry(
     except Exception as e:
         error_data = {"error": "VALIDATION_ERROR", "message": str(e)}
         return 400, error_data
+    finally:
+        # Sin respuesta guardada (errores no cacheables) el reclamo se libera acá
+        IdempotencyService.release_claim(idempotency_key)
 
 
 def handle_legacy_stock_exit(
@@ -387,6 +461,9 @@ def handle_legacy_stock_exit(
         
         return 201, response_data
         
+    except IdempotencyInProgress as e:
+        error_data = {"error": "IDEMPOTENCY_IN_PROGRESS", "message": str(e)}
+        return 409, error_data
     except ValueError as e:
         # Idempotency validation error
         error_data = {"error": "IDEMPOTENCY_ERROR", "message": str(e)}
@@ -418,6 +495,9 @@ def handle_legacy_stock_exit(
     except Exception as e:
         error_data = {"error": "VALIDATION_ERROR", "message": str(e)}
         return 400, error_data
+    finally:
+        # Sin respuesta guardada (errores no cacheables) el reclamo se libera acá
+        IdempotencyService.release_claim(idempotency_key)
 
 
 def handle_stock_lots_query(
@@ -433,8 +513,8 @@ def handle_stock_lots_query(
         Tuple[int, Dict]: (status_code, response_data)
     """
     try:
-        # Construir queryset base
-        queryset = StockLot.objects.select_related('product', 'warehouse')
+        # Construir queryset base (disponibilidad calculada en la misma query)
+        queryset = StockLot.objects.select_related('product', 'warehouse').with_availability()
         
         # Aplicar filtros
         if product_id:
@@ -462,7 +542,7 @@ def handle_stock_lots_query(
                 "lot_code": lot.lot_code,
                 "expiry_date": lot.expiry_date,
                 "qty_on_hand": lot.qty_on_hand,
-                "qty_available": lot.qty_available,
+                "qty_available": lot.available_qty,
                 "unit_cost": lot.unit_cost,
                 "warehouse_name": lot.warehouse.name,
                 "is_quarantined": lot.is_quarantined,
@@ -488,6 +568,55 @@ def handle_stock_lots_query(
 
 # Event-driven service functions (new approach)
 
+def notify_stock_entry(movement: Movement, correlation_id: Optional[str] = None) -> int:
+    """
+    Publica StockEntryCompleted y StockUpdated de una entrada ya persistida.
+    
+    Son solo notificaciones: un fallo del bus se registra y no afecta la entrada.
+    
+    Returns:
+        int: Cantidad de eventos publicados (0 si falló la publicación)
+    """
+    lot = movement.lot
+    metadata = {'correlation_id': correlation_id} if correlation_id else {}
+    events = [
+        StockEntryCompleted(
+            aggregate_id=str(movement.id),
+            aggregate_type="StockEntry",
+            entry_id=str(movement.id),
+            product_id=str(movement.product_id),
+            warehouse_id=str(lot.warehouse_id),
+            lot_id=str(lot.id),
+            lot_code=lot.lot_code,
+            quantity=movement.qty,
+            unit_cost=movement.unit_cost,
+            total_cost=movement.qty * movement.unit_cost,
+            completed_at=movement.created_at,
+            completed_by=str(movement.created_by_id) if movement.created_by_id else None,
+            metadata=metadata
+        ),
+        StockUpdated(
+            aggregate_id=str(lot.id),
+            aggregate_type="StockLot",
+            product_id=str(movement.product_id),
+            warehouse_id=str(lot.warehouse_id),
+            old_quantity=lot.qty_on_hand - movement.qty,
+            new_quantity=lot.qty_on_hand,
+            change_type="entry",
+            reference_id=str(movement.id),
+            metadata=metadata
+        ),
+    ]
+    try:
+        return publish_many_sync(events)
+    except Exception as e:
+        logger.warning(
+            "Stock entry notification failed",
+            extra={'movement_id': movement.id, 'error': str(e)}
+        )
+        return 0
+
+
 def request_stock_entry(
     product_id: int,
     lot_code: str,
@@ -504,19 +633,23 @@ def request_stock_entry(
     Returns:
         str: ID del evento publicado
     """
+    entry_id = str(uuid.uuid4())
     event = StockEntryRequested(
-        product_id=product_id,
+        aggregate_id=entry_id,
+        aggregate_type="StockEntry",
+        entry_id=entry_id,
+        product_id=str(product_id),
         lot_code=lot_code,
         expiry_date=expiry_date,
-        qty=qty,
+        quantity=qty,
         unit_cost=unit_cost,
-        user_id=user_id,
-        warehouse_id=warehouse_id,
+        warehouse_id=str(warehouse_id) if warehouse_id is not None else None,
+        received_by=str(user_id) if user_id is not None else None,
         correlation_id=correlation_id
     )
     
     event_manager = EventSystemManager()
-    return EventBus.publish(event)
+    return publish_sync(event)
 
 
 def request_stock_exit(
@@ -543,7 +676,7 @@ def request_stock_exit(
     )
     
     event_manager = EventSystemManager()
-    return EventBus.publish(event)
+    return publish_sync(event)
 
 
 def validate_stock_availability(
@@ -566,7 +699,7 @@ def validate_stock_availability(
     )
     
     event_manager = EventSystemManager()
-    return EventBus.publish(event)
+    return publish_sync(event)
 
 
 def validate_warehouse(
@@ -585,7 +718,7 @@ def validate_warehouse(
     )
     
     event_manager = EventSystemManager()
-    return EventBus.publish(event)
+    return publish_sync(event)
 
 
 # Tipos auxiliares
@@ -606,6 +739,14 @@ class AllocationPlan(NamedTuple):
     qty_allocated: Decimal
 
 
+class AllocationLine(NamedTuple):
+    """Línea de una asignación múltiple (ver `allocate_many`)."""
+    product_id: int
+    qty: Decimal
+    warehouse_id: Optional[int] = None
+    min_shelf_life_days: int = 0
+
+
 # Legacy service functions (maintained for backward compatibility)
 # These will be gradually phased out as consumers migrate to event-driven approach
 
@@ -696,8 +837,9 @@ def create_entry(
                 f"pero se intenta ingresar con fecha {expiry_date}"
             )
     
-    # Actualizar cantidad en el lote
+    # Actualizar cantidad en el lote (un reingreso reactiva un lote retirado)
     stock_lot.qty_on_hand += qty
+    stock_lot.is_archived = False
     stock_lot.save()
     
     # Crear el movimiento
@@ -711,6 +853,8 @@ def create_entry(
         created_by=created_by
     )
     
+    refresh_stock_summary(product.id, warehouse.id)
+    
     # Log estructurado
     logger.info(
         "Stock entry created",
@@ -747,17 +891,39 @@ def pick_lots_fefo(
     Raises:
         NotEnoughStock: Si no hay suficiente stock disponible
     """
-    # Obtener lotes disponibles ordenados por FEFO
-    available_lots = StockLot.objects.select_for_update().filter(
+    # Obtener lotes disponibles ordenados por FEFO (una sola query con reservas)
+    available_lots = list(_fefo_exit_candidates(product, warehouse).select_for_update())
+    
+    return [
+        {'lot_id': lot.id, 'qty_to_take': qty_to_take}
+        for lot, qty_to_take in _plan_fefo_exit(product, qty_needed, available_lots)
+    ]
+
+
+def _fefo_exit_candidates(product: Product, warehouse: Warehouse):
+    """Lotes candidatos a una salida FEFO, con `available_qty` anotado."""
+    return StockLot.objects.with_availability().filter(
         product=product,
         warehouse=warehouse,
         qty_on_hand__gt=0,
         is_quarantined=False,
         is_reserved=False
     ).order_by('expiry_date', 'id')
+
+
+def _plan_fefo_exit(
+    product: Product,
+    qty_needed: Decimal,
+    available_lots: List[StockLot]
+) -> List[Tuple[StockLot, Decimal]]:
+    """
+    Reparte qty_needed entre los lotes (ya ordenados FEFO) según `available_qty`.
     
+    Raises:
+        NotEnoughStock: Si no hay suficiente stock disponible
+    """
     # Verificar stock total disponible
-    total_available = sum(lot.qty_available for lot in available_lots)
+    total_available = sum((lot.available_qty for lot in available_lots), Decimal('0'))
     if total_available < qty_needed:
         raise NotEnoughStock(product.id, qty_needed, total_available)
     
@@ -768,24 +934,23 @@ def pick_lots_fefo(
     for lot in available_lots:
         if remaining_qty <= 0:
             break
+        if lot.available_qty <= 0:
+            continue
             
-        qty_to_take = min(lot.qty_available, remaining_qty)
-        allocation_plan.append({
-            'lot_id': lot.id,
-            'qty_to_take': qty_to_take
-        })
+        qty_to_take = min(lot.available_qty, remaining_qty)
+        allocation_plan.append((lot, qty_to_take))
         remaining_qty -= qty_to_take
     
     return allocation_plan
 
 
-@transaction.atomic
 def create_exit(
     product: Product,
     qty_total: Decimal,
     warehouse: Warehouse,
     reason: str = Movement.Reason.SALE,
-    created_by: User = None
+    created_by: User = None,
+    mode: Optional[str] = None
 ) -> List[Movement]:
     """
     Crea una salida de stock siguiendo FEFO de forma transaccional.
@@ -797,6 +962,8 @@ def create_exit(
         warehouse: Depósito
         reason: Motivo del movimiento
         created_by: Usuario que crea el movimiento
+        mode: 'locking' (select_for_update de los lotes) u 'optimistic'
+            (ver `create_exit_optimistic`); default settings.STOCK_EXIT_MODE
     
     Returns:
         Lista de movimientos creados (uno por lote usado)
@@ -808,6 +975,25 @@ def create_exit(
     if qty_total <= 0:
         raise StockError("VALIDATION_ERROR", "La cantidad debe ser mayor a 0")
     
+    mode = mode or settings.STOCK_EXIT_MODE
+    if mode == EXIT_MODE_OPTIMISTIC:
+        # Sin transacción envolvente: cada intento es su propia transacción corta
+        return create_exit_optimistic(product, qty_total, warehouse, reason=reason, created_by=created_by)
+    if mode != EXIT_MODE_LOCKING:
+        raise StockError("VALIDATION_ERROR", f"Modo de salida desconocido: {mode}")
+    
+    return _create_exit_locking(product, qty_total, warehouse, reason, created_by)
+
+
+@transaction.atomic
+def _create_exit_locking(
+    product: Product,
+    qty_total: Decimal,
+    warehouse: Warehouse,
+    reason: str,
+    created_by: User
+) -> List[Movement]:
+    """Salida FEFO con select_for_update de cada lote (modo 'locking' de `create_exit`)."""
     # Obtener plan de asignación FEFO
     allocation_plan = pick_lots_fefo(product, qty_total, warehouse)
     
@@ -857,9 +1043,138 @@ def create_exit(
             }
         )
     
+    refresh_stock_summary(product.id, warehouse.id)
+    
+    return movements
+
+
+class _ExitConflict(Exception):
+    """Un UPDATE condicional no afectó filas: el lote cambió desde la lectura."""
+    def __init__(self, lot_id: int):
+        super().__init__(lot_id)
+        self.lot_id = lot_id
+
+
+def _apply_exit_plan_optimistic(
+    product: Product,
+    qty_total: Decimal,
+    warehouse: Warehouse,
+    reason: str,
+    created_by: User
+) -> List[Movement]:
+    """
+    Un intento de salida optimista: lectura sin lock, un UPDATE condicional por
+    lote y bulk_create de los movimientos.
+    
+    Raises:
+        _ExitConflict: Si algún lote ya no tiene la cantidad planificada
+    """
+    today = date.today()
+    plan = _plan_fefo_exit(product, qty_total, list(_fefo_exit_candidates(product, warehouse)))
+    
+    for lot, qty_to_take in plan:
+        # El lock de la fila dura solo esta sentencia; el WHERE revalida la disponibilidad
+        updated = StockLot.objects.filter(
+            id=lot.id,
+            qty_on_hand__gte=F('qty_reserved') + qty_to_take,
+            is_quarantined=False,
+            is_reserved=False,
+            expiry_date__gte=today,
+        ).update(qty_on_hand=F('qty_on_hand') - qty_to_take)
+        if updated == 0:
+            raise _ExitConflict(lot.id)
+        lot.qty_on_hand -= qty_to_take
+    
+    movements = Movement.objects.bulk_create([
+        Movement(
+            type=Movement.Type.EXIT,
+            product=product,
+            lot=lot,
+            qty=qty_to_take,
+            unit_cost=lot.unit_cost,  # Se toma del lote
+            reason=reason,
+            created_by=created_by
+        )
+        for lot, qty_to_take in plan
+    ])
+    
+    # Después del commit: el intento no retiene el lock del resumen
+    refresh_stock_summary_on_commit(product.id, warehouse.id)
     return movements
 
 
+def create_exit_optimistic(
+    product: Product,
+    qty_total: Decimal,
+    warehouse: Warehouse,
+    reason: str = Movement.Reason.SALE,
+    created_by: User = None,
+    max_retries: Optional[int] = None
+) -> List[Movement]:
+    """
+    Salida FEFO con concurrencia optimista.
+    
+    En lugar de bloquear los lotes candidatos (y volver a bloquear cada uno),
+    descuenta con `UPDATE ... SET qty_on_hand = qty_on_hand - x WHERE
+    qty_on_hand - qty_reserved >= x`. Si otro proceso consumió el lote entre la
+    lectura y el UPDATE, el intento se revierte (savepoint) y se replanifica con
+    datos frescos, hasta max_retries veces.
+    
+    El resumen por producto/depósito se recalcula después del commit (de la
+    transacción del llamador, si la hay), así la fila del resumen no queda
+    bloqueada mientras tanto.
+    
+    Raises:
+        NotEnoughStock: Si no hay suficiente stock disponible
+        StockError: CONCURRENT_MODIFICATION si se agotan los reintentos
+    """
+    if qty_total <= 0:
+        raise StockError("VALIDATION_ERROR", "La cantidad debe ser mayor a 0")
+    
+    if max_retries is None:
+        max_retries = settings.STOCK_EXIT_MAX_RETRIES
+    
+    for attempt in range(1, max_retries + 2):
+        try:
+            with transaction.atomic():
+                movements = _apply_exit_plan_optimistic(product, qty_total, warehouse, reason, created_by)
+        except _ExitConflict as conflict:
+            exhausted = attempt > max_retries
+            increment_stock_exit_conflict(mode=EXIT_MODE_OPTIMISTIC, outcome='exhausted' if exhausted else 'retried')
+            logger.warning(
+                "Stock exit conflict",
+                extra={
+                    'product_code': product.code,
+                    'lot_id': conflict.lot_id,
+                    'attempt': attempt,
+                    'max_retries': max_retries,
+                }
+            )
+            if exhausted:
+                observe_stock_exit_attempts(attempt, mode=EXIT_MODE_OPTIMISTIC)
+                raise StockError(
+                    "CONCURRENT_MODIFICATION",
+                    f"No se pudo descontar stock de {product.code} por contención "
+                    f"después de {attempt} intentos"
+                )
+            continue
+        
+        observe_stock_exit_attempts(attempt, mode=EXIT_MODE_OPTIMISTIC)
+        logger.info(
+            "Stock exit created",
+            extra={
+                'product_code': product.code,
+                'lots': len(movements),
+                'qty': float(qty_total),
+                'warehouse': warehouse.name,
+                'reason': reason,
+                'mode': EXIT_MODE_OPTIMISTIC,
+                'attempts': attempt,
+            }
+        )
+        return movements
+
+
 def get_lot_options(
     product: Product, 
     qty: Decimal, 
@@ -882,7 +1197,7 @@ def get_lot_options(
     min_expiry_date = date.today() + timedelta(days=min_shelf_life_days)
     
     # Query base para lotes disponibles
-    lots_query = StockLot.objects.select_related('warehouse').filter(
+    lots_query = StockLot.objects.select_related('warehouse').with_availability().filter(
         product=product,
         qty_on_hand__gt=0,
         expiry_date__gte=min_expiry_date,
@@ -901,7 +1216,7 @@ def get_lot_options(
             lot_id=lot.id,
             lot_code=lot.lot_code,
             expiry_date=lot.expiry_date,
-            qty_available=lot.qty_available,
+            qty_available=lot.available_qty,
             unit_cost=lot.unit_cost,
             warehouse_name=lot.warehouse.name if lot.warehouse else None
         )
@@ -914,7 +1229,9 @@ def allocate_lots_fefo(
     qty_needed: Decimal,
     chosen_lot_id: Optional[int] = None,
     min_shelf_life_days: int = 0,
-    warehouse_id: Optional[int] = None
+    warehouse_id: Optional[int] = None,
+    strategy=None,
+    customer=None
 ) -> List[AllocationPlan]:
     """
     Asigna lotes siguiendo FEFO con soporte para override.
@@ -925,6 +1242,8 @@ def allocate_lots_fefo(
         chosen_lot_id: ID del lote específico para override (opcional)
         min_shelf_life_days: Días mínimos de vida útil requeridos
         warehouse_id: ID del depósito (opcional)
+        strategy: Estrategia de asignación (nombre o instancia; ver allocation_strategies)
+        customer: Cliente cuya estrategia se usa si no se pasa `strategy`
     
     Returns:
         Lista de planes de asignación
@@ -938,8 +1257,10 @@ def allocate_lots_fefo(
     # Fecha mínima de vencimiento
     min_expiry_date = date.today() + timedelta(days=min_shelf_life_days)
     
-    # Query base para lotes disponibles (sin filtro de vida útil)
-    base_query = StockLot.objects.filter(
+    # Query base para lotes disponibles (sin filtro de vida útil).
+    # Se materializa una sola vez con la disponibilidad anotada; el resto
+    # del cálculo (vida útil, override, FEFO) se hace en memoria.
+    base_query = StockLot.objects.with_availability().filter(
         product=product,
         qty_on_hand__gt=0,
         is_quarantined=False,
@@ -949,20 +1270,23 @@ def allocate_lots_fefo(
     if warehouse_id is not None:
         base_query = base_query.filter(warehouse_id=warehouse_id)
     
+    candidate_lots = list(base_query.order_by('expiry_date', 'id'))
+    
     # Verificar si hay stock disponible sin considerar vida útil
-    total_available_any_expiry = sum(lot.qty_available for lot in base_query)
+    total_available_any_expiry = sum((lot.available_qty for lot in candidate_lots), Decimal('0'))
     if total_available_any_expiry < qty_needed:
         raise StockError(
             "INSUFFICIENT_STOCK", 
             f"Stock insuficiente. Solicitado: {qty_needed}, disponible: {total_available_any_expiry}"
         )
     
+    # Lotes que cumplen la vida útil mínima
+    shelf_life_lots = [lot for lot in candidate_lots if lot.expiry_date >= min_expiry_date]
+    
     # Aplicar filtro de vida útil mínima solo si no hay override de lote específico
     if chosen_lot_id is None:
-        base_query = base_query.filter(expiry_date__gte=min_expiry_date)
-        
         # Verificar si hay stock suficiente con vida útil adecuada
-        total_available_with_shelf_life = sum(lot.qty_available for lot in base_query)
+        total_available_with_shelf_life = sum((lot.available_qty for lot in shelf_life_lots), Decimal('0'))
         if total_available_with_shelf_life < qty_needed:
             raise StockError(
                 "INSUFFICIENT_SHELF_LIFE", 
@@ -975,46 +1299,47 @@ def allocate_lots_fefo(
     # Si hay override de lote específico
     if chosen_lot_id is not None:
         # Primero verificar que el lote elegido existe y tiene stock
-        try:
-            chosen_lot = StockLot.objects.get(
+        chosen_lot = next((lot for lot in candidate_lots if lot.id == chosen_lot_id), None)
+        if chosen_lot is None and warehouse_id is not None:
+            # El override puede apuntar a un lote de otro depósito
+            chosen_lot = StockLot.objects.with_availability().filter(
                 id=chosen_lot_id,
                 product=product,
                 qty_on_hand__gt=0,
                 is_quarantined=False,
                 is_reserved=False
-            )
-        except StockLot.DoesNotExist:
+            ).first()
+        if chosen_lot is None:
             raise StockError("INVALID_LOT", f"Lote {chosen_lot_id} no válido o sin stock disponible")
         
         # Verificar que el lote elegido cumple con la vida útil mínima solo si no hay cantidad restante
-        if chosen_lot.qty_available >= qty_needed and chosen_lot.expiry_date < min_expiry_date:
+        if chosen_lot.available_qty >= qty_needed and chosen_lot.expiry_date < min_expiry_date:
             raise StockError(
                 "INSUFFICIENT_SHELF_LIFE", 
                 f"Lote {chosen_lot.lot_code} no cumple vida útil mínima de {min_shelf_life_days} días"
             )
         
         # Asignar del lote elegido lo que se pueda
-        qty_from_chosen = min(remaining_qty, chosen_lot.qty_available)
+        qty_from_chosen = min(remaining_qty, chosen_lot.available_qty)
         allocation_plan.append(AllocationPlan(
             lot_id=chosen_lot.id,
             qty_allocated=qty_from_chosen
         ))
         remaining_qty -= qty_from_chosen
     
-    # Si aún queda cantidad por asignar, completar con FEFO
+    # Si aún queda cantidad por asignar, completar según la estrategia
+    # (excluyendo el lote ya usado en el override, con filtro de vida útil)
+    try:
+        allocation_strategy = get_allocation_strategy(strategy, customer)
+    except ValueError as e:
+        raise StockError("VALIDATION_ERROR", str(e))
     if remaining_qty > 0:
-        # Excluir el lote ya usado en el override y aplicar filtro de vida útil
-        fefo_query = base_query.order_by('expiry_date', 'id')
-        if chosen_lot_id is not None:
-            fefo_query = fefo_query.exclude(id=chosen_lot_id)
-            # Aplicar filtro de vida útil a los lotes restantes
-            fefo_query = fefo_query.filter(expiry_date__gte=min_expiry_date)
-        
-        for lot in fefo_query:
-            if remaining_qty <= 0:
-                break
-                
-            qty_from_lot = min(remaining_qty, lot.qty_available)
+        steps = allocation_strategy.plan(
+            [lot for lot in shelf_life_lots if lot.id != chosen_lot_id],
+            remaining_qty,
+            {lot.id: lot.available_qty for lot in shelf_life_lots}
+        )
+        for lot, qty_from_lot in steps:
             allocation_plan.append(AllocationPlan(
                 lot_id=lot.id,
                 qty_allocated=qty_from_lot
@@ -1023,12 +1348,12 @@ def allocate_lots_fefo(
     
     # Verificar si se pudo asignar toda la cantidad
     if remaining_qty > 0:
-        total_available = sum(lot.qty_available for lot in base_query)
         raise StockError(
             "INSUFFICIENT_STOCK", 
-            f"Stock insuficiente. Solicitado: {qty_needed}, disponible: {total_available}"
+            f"Stock insuficiente. Solicitado: {qty_needed}, disponible: {total_available_any_expiry}"
         )
     
+    record_allocation_metrics(allocation_strategy, [len(allocation_plan)])
     return allocation_plan
 
 
@@ -1073,8 +1398,9 @@ def record_entry(
         if lot.expiry_date != expiry_date:
             raise EntryError("LOT_MISMATCH", "El lote existe con otra fecha de vencimiento")
         lot.qty_on_hand = (lot.qty_on_hand or 0) + qty
+        lot.is_archived = False
         # El unit_cost no se recalcula en v1 (simple): solo registramos en Movement
-        lot.save(update_fields=["qty_on_hand"])
+        lot.save(update_fields=["qty_on_hand", "is_archived"])
     else:
         lot = StockLot.objects.create(
             product=product,
@@ -1095,6 +1421,7 @@ def record_entry(
         reason="entry",
         created_by_id=user_id,
     )
+    refresh_stock_summary(product.id, lot.warehouse_id)
     return mv
 
 
@@ -1174,4 +1501,134 @@ def record_exit_fefo(
         movements.append(mv)
         remaining -= take
 
+    refresh_stock_summaries({(product.id, mv.lot.warehouse_id) for mv in movements})
     return movements
+
+
+@transaction.atomic
+def allocate_many(
+    lines: Sequence[Tuple],
+    *,
+    user_id: int,
+    order_id: Optional[int] = None,
+    reason: str = Movement.Reason.SALE,
+    strategy=None,
+    customer=None,
+) -> List[List[Movement]]:
+    """
+    Descuenta stock por FEFO para varias líneas en un número fijo de queries.
+
+    Bloquea todos los lotes candidatos en una sola query ordenada por id (orden
+    de lock estable entre checkouts concurrentes, sin deadlocks), planifica FEFO
+    en memoria respetando disponibilidad (reservas, cuarentena, vencidos) y
+    aplica con un bulk_update de lotes y un bulk_create de movimientos.
+
+    Args:
+        lines: Secuencia de (product_id, qty, warehouse_id, min_shelf_life_days);
+            se aceptan tuplas más cortas o AllocationLine.
+        user_id: Usuario que registra los movimientos
+        order_id: Orden a linkear en los movimientos (opcional)
+        reason: Motivo de los movimientos
+        strategy: Estrategia de asignación (nombre o instancia; ver allocation_strategies)
+        customer: Cliente cuya estrategia se usa si no se pasa `strategy`
+
+    Returns:
+        Movimientos creados, una lista por línea (mismo orden que `lines`).
+
+    Raises:
+        ExitError: VALIDATION_ERROR o INSUFFICIENT_STOCK (se revierte todo).
+    """
+    lines = [AllocationLine(*line) for line in lines]
+    if not lines:
+        return []
+    try:
+        allocation_strategy = get_allocation_strategy(strategy, customer)
+    except ValueError as e:
+        raise ExitError("VALIDATION_ERROR", str(e))
+
+    for line in lines:
+        if line.qty <= 0:
+            raise ExitError("VALIDATION_ERROR", f"qty debe ser > 0 (product_id={line.product_id})")
+
+    # Una sola query de lock para todas las líneas
+    lots_filter = Q()
+    for product_id, warehouse_id in {(line.product_id, line.warehouse_id) for line in lines}:
+        key_filter = Q(product_id=product_id)
+        if warehouse_id is not None:
+            key_filter &= Q(warehouse_id=warehouse_id)
+        lots_filter |= key_filter
+
+    locked_lots = list(
+        StockLot.objects.select_for_update().with_availability()
+        .filter(lots_filter, qty_on_hand__gt=0)
+        .order_by('id')
+    )
+
+    # Planificación FEFO en memoria; `remaining` se comparte entre líneas del mismo producto
+    fefo_lots = sorted(locked_lots, key=lambda lot: (lot.expiry_date, lot.id))
+    remaining = {lot.id: lot.available_qty for lot in locked_lots}
+    taken: Dict[int, Decimal] = {}
+    plans: List[List[Tuple[StockLot, Decimal]]] = []
+    today = date.today()
+
+    for line in lines:
+        min_expiry_date = today + timedelta(days=line.min_shelf_life_days)
+        candidates = [
+            lot for lot in fefo_lots
+            if lot.product_id == line.product_id
+            and (line.warehouse_id is None or lot.warehouse_id == line.warehouse_id)
+            and lot.expiry_date >= min_expiry_date
+            and remaining[lot.id] > 0
+        ]
+
+        available = sum((remaining[lot.id] for lot in candidates), Decimal("0"))
+        if line.qty > available:
+            raise ExitError(
+                "INSUFFICIENT_STOCK",
+                f"Producto {line.product_id}: solicitado {line.qty}, disponible {available}"
+            )
+
+        plan = allocation_strategy.plan(candidates, line.qty, remaining)
+        for lot, take in plan:
+            remaining[lot.id] -= take
+            taken[lot.id] = taken.get(lot.id, Decimal("0")) + take
+        plans.append(plan)
+
+    # Aplicar: un UPDATE para los lotes y un INSERT para los movimientos
+    touched_lots = [lot for lot in locked_lots if lot.id in taken]
+    for lot in touched_lots:
+        lot.qty_on_hand -= taken[lot.id]
+    StockLot.objects.bulk_update(touched_lots, ["qty_on_hand"])
+
+    movements = Movement.objects.bulk_create([
+        Movement(
+            type=Movement.Type.EXIT,
+            product_id=lot.product_id,
+            lot=lot,
+            qty=take,
+            unit_cost=lot.unit_cost,
+            reason=reason,
+            order_id=order_id,
+            created_by_id=user_id,
+        )
+        for plan in plans
+        for lot, take in plan
+    ])
+
+    refresh_stock_summaries({(lot.product_id, lot.warehouse_id) for lot in touched_lots})
+    record_allocation_metrics(allocation_strategy, [len(plan) for plan in plans])
+
+    logger.info(
+        "Bulk FEFO allocation",
+        extra={
+            'lines': len(lines),
+            'lots_touched': len(touched_lots),
+            'movements': len(movements),
+            'order_id': order_id,
+            'strategy': allocation_strategy.name,
+        }
+    )
+
+    # Reagrupar movimientos por línea
+    movements_iter = iter(movements)
+    return [[next(movements_iter) for _ in plan] for plan in plans]
@@ -0,0 +1,233 @@
+# apps/stock/snapshot_service.py
+"""
+Stock histórico por lote: snapshots periódicos + reconstrucción "as of".
+
+`take_snapshot(day)` guarda la existencia de cada lote al cierre del día en
+StockLotSnapshot. Se calcula desde la existencia actual restando los
+movimientos posteriores, así que puede correr en cualquier momento del día
+siguiente (o después) sin perder exactitud.
+
+`as_of(day)` parte del ancla más cercana a la fecha pedida (snapshot anterior,
+snapshot posterior o la existencia actual) y aplica solo los movimientos entre
+el ancla y la fecha: el costo queda acotado por el intervalo entre snapshots y
+no por el tamaño del libro. Los deltas incluyen los movimientos archivados.
+"""
+
+import logging
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Case, F, Sum, When
+from django.utils import timezone
+
+from .models import Movement, StockLot
+from .models_archive import MovementArchive, StockLotSnapshot
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_BATCH_SIZE = 1000
+
+# lot_id -> (product_id, warehouse_id, qty)
+LotQuantities = Dict[int, Tuple[int, int, Decimal]]
+
+
+class LotStockAsOf(NamedTuple):
+    """Existencia de un lote a una fecha."""
+    lot_id: int
+    product_id: int
+    warehouse_id: int
+    qty_on_hand: Decimal
+
+
+class StockAsOf(NamedTuple):
+    """
+    Resultado de `as_of()`.
+
+    source es 'snapshot' o 'live'; source_date es la fecha del ancla usada.
+    """
+    day: date
+    source: str
+    source_date: date
+    lots: List[LotStockAsOf]
+
+
+def _day_start(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _signed_qty():
+    return Sum(Case(When(type=Movement.Type.EXIT, then=-F('qty')), default=F('qty')))
+
+
+def _net_by_lot(
+    start: datetime,
+    end: Optional[datetime],
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    lot_id: Optional[int] = None,
+) -> LotQuantities:
+    """
+    Neto (entradas - salidas) por lote de los movimientos en [start, end),
+    sumando tabla viva y archivo. end=None deja el rango abierto.
+    """
+    net: LotQuantities = {}
+
+    for model, warehouse_lookup in ((Movement, 'lot__warehouse_id'), (MovementArchive, 'warehouse_id')):
+        qs = model.objects.filter(created_at__gte=start)
+        if end is not None:
+            qs = qs.filter(created_at__lt=end)
+        if product_id is not None:
+            qs = qs.filter(product_id=product_id)
+        if warehouse_id is not None:
+            qs = qs.filter(**{warehouse_lookup: warehouse_id})
+        if lot_id is not None:
+            qs = qs.filter(lot_id=lot_id)
+
+        rows = qs.order_by().values_list('lot_id', 'product_id', warehouse_lookup).annotate(net=_signed_qty())
+        for row_lot_id, row_product_id, row_warehouse_id, row_net in rows:
+            _, _, current = net.get(row_lot_id, (None, None, Decimal('0')))
+            net[row_lot_id] = (row_product_id, row_warehouse_id, current + row_net)
+
+    return net
+
+
+def _apply(base: LotQuantities, delta: LotQuantities, sign: int) -> LotQuantities:
+    result = dict(base)
+    for lot_id, (product_id, warehouse_id, qty) in delta.items():
+        _, _, current = result.get(lot_id, (product_id, warehouse_id, Decimal('0')))
+        result[lot_id] = (product_id, warehouse_id, current + sign * qty)
+    return result
+
+
+def _live_lots(product_id=None, warehouse_id=None, lot_id=None) -> LotQuantities:
+    qs = StockLot.objects.exclude(qty_on_hand=0)
+    if product_id is not None:
+        qs = qs.filter(product_id=product_id)
+    if warehouse_id is not None:
+        qs = qs.filter(warehouse_id=warehouse_id)
+    if lot_id is not None:
+        qs = qs.filter(id=lot_id)
+    return {
+        row_lot_id: (row_product_id, row_warehouse_id, qty)
+        for row_lot_id, row_product_id, row_warehouse_id, qty
+        in qs.values_list('id', 'product_id', 'warehouse_id', 'qty_on_hand').iterator()
+    }
+
+
+def _snapshot_lots(snapshot_date: date, product_id=None, warehouse_id=None, lot_id=None) -> LotQuantities:
+    qs = StockLotSnapshot.objects.filter(snapshot_date=snapshot_date)
+    if product_id is not None:
+        qs = qs.filter(product_id=product_id)
+    if warehouse_id is not None:
+        qs = qs.filter(warehouse_id=warehouse_id)
+    if lot_id is not None:
+        qs = qs.filter(lot_id=lot_id)
+    return {
+        row_lot_id: (row_product_id, row_warehouse_id, qty)
+        for row_lot_id, row_product_id, row_warehouse_id, qty
+        in qs.values_list('lot_id', 'product_id', 'warehouse_id', 'qty_on_hand').iterator()
+    }
+
+
+@transaction.atomic
+def take_snapshot(day: date) -> int:
+    """
+    Guarda la existencia de todos los lotes al cierre de `day`.
+
+    Reemplaza un snapshot previo de la misma fecha.
+
+    Returns:
+        Cantidad de lotes guardados (solo existencias distintas de cero)
+
+    Raises:
+        ValueError: Si la fecha es futura
+    """
+    if day > timezone.localdate():
+        raise ValueError(f"No se puede tomar un snapshot de una fecha futura: {day}")
+
+    # Existencia actual menos lo movido después del cierre del día
+    since_close = _net_by_lot(_day_start(day + timedelta(days=1)), None)
+    current = {
+        row_lot_id: (row_product_id, row_warehouse_id, qty)
+        for row_lot_id, row_product_id, row_warehouse_id, qty
+        in StockLot.objects.values_list('id', 'product_id', 'warehouse_id', 'qty_on_hand').iterator()
+    }
+    closing = _apply(current, since_close, -1)
+
+    StockLotSnapshot.objects.filter(snapshot_date=day).delete()
+    created = StockLotSnapshot.objects.bulk_create(
+        [
+            StockLotSnapshot(
+                snapshot_date=day, lot_id=lot_id, product_id=product_id,
+                warehouse_id=warehouse_id, qty_on_hand=qty,
+            )
+            for lot_id, (product_id, warehouse_id, qty) in closing.items()
+            if qty != 0
+        ],
+        batch_size=SNAPSHOT_BATCH_SIZE,
+    )
+
+    logger.info("Stock snapshot taken", extra={'snapshot_date': day.isoformat(), 'lots': len(created)})
+    return len(created)
+
+
+def nearest_snapshot_dates(day: date) -> Tuple[Optional[date], Optional[date]]:
+    """Fechas de snapshot más cercanas a `day`: (anterior o igual, posterior)."""
+    dates = StockLotSnapshot.objects.order_by()
+    before = dates.filter(snapshot_date__lte=day).order_by('-snapshot_date').values_list('snapshot_date', flat=True).first()
+    after = dates.filter(snapshot_date__gt=day).order_by('snapshot_date').values_list('snapshot_date', flat=True).first()
+    return before, after
+
+
+def as_of(
+    day: date,
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    lot_id: Optional[int] = None,
+) -> StockAsOf:
+    """
+    Existencia por lote al cierre de `day`.
+
+    Elige el ancla más cercana en días (snapshot anterior, snapshot posterior o
+    la existencia actual, que cuenta como hoy) y aplica el delta de movimientos
+    hacia adelante o hacia atrás.
+
+    Raises:
+        ValueError: Si la fecha es futura
+    """
+    today = timezone.localdate()
+    if day > today:
+        raise ValueError(f"No se puede consultar stock de una fecha futura: {day}")
+
+    filters = dict(product_id=product_id, warehouse_id=warehouse_id, lot_id=lot_id)
+    day_end = _day_start(day + timedelta(days=1))
+
+    before, after = nearest_snapshot_dates(day)
+    candidates = [('live', today, (today - day).days)]
+    if after is not None:
+        candidates.append(('snapshot', after, (after - day).days))
+    if before is not None:
+        candidates.append(('snapshot', before, (day - before).days))
+    # Ante empate se prefiere el snapshot anterior (delta hacia adelante)
+    source, source_date, _ = min(candidates, key=lambda candidate: (candidate[2], candidate[1] > day))
+
+    if source == 'live':
+        quantities = _apply(_live_lots(**filters), _net_by_lot(day_end, None, **filters), -1)
+    elif source_date <= day:
+        delta = _net_by_lot(_day_start(source_date + timedelta(days=1)), day_end, **filters)
+        quantities = _apply(_snapshot_lots(source_date, **filters), delta, 1)
+    else:
+        delta = _net_by_lot(day_end, _day_start(source_date + timedelta(days=1)), **filters)
+        quantities = _apply(_snapshot_lots(source_date, **filters), delta, -1)
+
+    lots = sorted(
+        (
+            LotStockAsOf(lot, product, warehouse, qty)
+            for lot, (product, warehouse, qty) in quantities.items()
+            if qty != 0
+        ),
+        key=lambda lot: (lot.product_id, lot.warehouse_id, lot.lot_id),
+    )
+    return StockAsOf(day=day, source=source, source_date=source_date, lots=lots)
@@ -0,0 +1,183 @@
+# apps/stock/summary_service.py
+"""
+Mantenimiento del resumen de stock por (producto, depósito).
+
+Los servicios que modifican lotes llaman a `refresh_stock_summaries()` con las
+claves tocadas dentro de su propia transacción: se recalcula cada clave con una
+única query agrupada sobre sus lotes (índice idx_lot_fefo) y se hace un
+upsert sobre `uq_stock_summary_product_warehouse`. En la misma pasada se
+actualiza el índice de vencimientos (`expiry_bucket_service`).
+"""
+
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .expiry_bucket_service import refresh_expiry_buckets
+from .models import QTY_FIELD, ProductStockSummary, StockLot, available_qty_expression
+
+SummaryKey = Tuple[int, int]  # (product_id, warehouse_id)
+
+SUMMARY_FIELDS = ['on_hand', 'reserved', 'available', 'lot_count', 'nearest_expiry']
+
+
+def _aggregate_lots(lots) -> Dict[SummaryKey, Dict]:
+    """Agrega los lotes por (producto, depósito) en una sola query."""
+    zero = Value(Decimal('0'), output_field=QTY_FIELD)
+    in_stock = Q(qty_on_hand__gt=0)
+
+    rows = (
+        lots.order_by()
+        .values('product_id', 'warehouse_id')
+        .annotate(
+            on_hand=Coalesce(Sum('qty_on_hand'), zero),
+            reserved=Coalesce(Sum('qty_reserved'), zero),
+            available=Coalesce(Sum(available_qty_expression()), zero),
+            lot_count=Count('id', filter=in_stock),
+            nearest_expiry=Min('expiry_date', filter=in_stock),
+        )
+    )
+    return {
+        (row['product_id'], row['warehouse_id']): {field: row[field] for field in SUMMARY_FIELDS}
+        for row in rows
+    }
+
+
+def _empty_totals() -> Dict:
+    return {
+        'on_hand': Decimal('0'),
+        'reserved': Decimal('0'),
+        'available': Decimal('0'),
+        'lot_count': 0,
+        'nearest_expiry': None,
+    }
+
+
+def _upsert(totals_by_key: Dict[SummaryKey, Dict]) -> None:
+    ProductStockSummary.objects.bulk_create(
+        [
+            ProductStockSummary(product_id=product_id, warehouse_id=warehouse_id, **totals)
+            for (product_id, warehouse_id), totals in totals_by_key.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['product', 'warehouse'],
+        update_fields=SUMMARY_FIELDS + ['updated_at'],
+    )
+
+
+def _lock_summaries(keys: Set[SummaryKey]) -> None:
+    """Bloquea las filas del resumen de las claves en orden, creando las que falten."""
+    def locked_keys() -> Set[SummaryKey]:
+        rows = ProductStockSummary.objects.select_for_update().filter(
+            product_id__in={product_id for product_id, _ in keys},
+            warehouse_id__in={warehouse_id for _, warehouse_id in keys},
+        ).order_by('product_id', 'warehouse_id').values_list('product_id', 'warehouse_id')
+        return set(rows)
+
+    missing = keys - locked_keys()
+    if missing:
+        # Primera vez de la clave: se crea vacía y se bloquea como las demás
+        ProductStockSummary.objects.bulk_create(
+            [ProductStockSummary(product_id=product_id, warehouse_id=warehouse_id) for product_id, warehouse_id in missing],
+            ignore_conflicts=True,
+        )
+        locked_keys()
+
+
+def refresh_stock_summaries(keys: Iterable[SummaryKey]) -> None:
+    """
+    Recalcula el resumen de las claves (product_id, warehouse_id) indicadas.
+
+    Debe llamarse dentro de la transacción que modificó los lotes, después de
+    modificarlos y lo más cerca posible del commit: la fila del resumen queda
+    bloqueada hasta entonces. Claves sin lotes quedan en cero.
+    """
+    keys = {(product_id, warehouse_id) for product_id, warehouse_id in keys if warehouse_id is not None}
+    if not keys:
+        return
+
+    _lock_summaries(keys)
+
+    lots = StockLot.objects.filter(
+        product_id__in={product_id for product_id, _ in keys},
+        warehouse_id__in={warehouse_id for _, warehouse_id in keys},
+    )
+    aggregated = _aggregate_lots(lots)
+
+    _upsert({key: aggregated.get(key) or _empty_totals() for key in keys})
+    refresh_expiry_buckets(keys)
+
+
+def refresh_stock_summary(product_id: int, warehouse_id: Optional[int]) -> None:
+    """Atajo de `refresh_stock_summaries` para una sola clave."""
+    refresh_stock_summaries([(product_id, warehouse_id)])
+
+
+def refresh_stock_summary_on_commit(product_id: int, warehouse_id: Optional[int]) -> None:
+    """
+    Difiere `refresh_stock_summary` hasta después del commit de la transacción actual.
+
+    Para caminos que no deben sostener el lock del resumen mientras la
+    transacción que los envuelve sigue abierta (salida optimista). El recálculo
+    corre en su propia transacción corta; si la transacción actual se revierte,
+    no corre.
+    """
+    def refresh() -> None:
+        with transaction.atomic():
+            refresh_stock_summary(product_id, warehouse_id)
+
+    transaction.on_commit(refresh)
+
+
+def refresh_lot_summaries(lot_ids: Iterable[int]) -> None:
+    """Recalcula el resumen de las claves a las que pertenecen los lotes indicados."""
+    refresh_stock_summaries(
+        StockLot.objects.filter(id__in=set(lot_ids)).values_list('product_id', 'warehouse_id').distinct()
+    )
+
+
+def reconcile_stock_summaries(apply: bool = True, batch_size: int = 500) -> Dict[str, int]:
+    """
+    Compara el resumen con los lotes y corrige las diferencias.
+
+    También recalcula `available`, que depende de la fecha (lotes que vencen).
+    Con apply=False solo informa las diferencias.
+
+    Returns:
+        Dict con checked, drifted, fixed y removed.
+    """
+    expected = _aggregate_lots(StockLot.objects.all())
+
+    current = {
+        (row['product_id'], row['warehouse_id']): {field: row[field] for field in SUMMARY_FIELDS}
+        for row in ProductStockSummary.objects.values('product_id', 'warehouse_id', *SUMMARY_FIELDS)
+    }
+
+    drifted = [key for key, totals in expected.items() if current.get(key) != totals]
+    orphans = [key for key in current if key not in expected]
+
+    result = {
+        'checked': len(expected),
+        'drifted': len(drifted),
+        'fixed': 0,
+        'removed': 0,
+    }
+    if not apply:
+        return result
+
+    for start in range(0, len(drifted), batch_size):
+        batch = drifted[start:start + batch_size]
+        with transaction.atomic():
+            refresh_stock_summaries(batch)
+        result['fixed'] += len(batch)
+
+    for start in range(0, len(orphans), batch_size):
+        orphan_filter = Q()
+        for product_id, warehouse_id in orphans[start:start + batch_size]:
+            orphan_filter |= Q(product_id=product_id, warehouse_id=warehouse_id)
+        result['removed'] += ProductStockSummary.objects.filter(orphan_filter).delete()[0]
+
+    return result
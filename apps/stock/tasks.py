@@ -2,24 +2,37 @@
 Celery tasks for stock management with fault tolerance.
 Event-driven version - publishes events instead of direct notifications.
 """
+import itertools
 import logging
+import time
 from datetime import date, timedelta
 from decimal import Decimal
 from typing import List, Dict, Any
 from celery import shared_task
+from django.conf import settings
 from django.db import transaction, models
 from django.utils import timezone
 from apps.catalog.models import Product
-from apps.stock.models import StockLot
+from apps.stock.models import ProductStockSummary, StockLot
+from apps.stock.summary_service import reconcile_stock_summaries
+from apps.stock.archive_service import archive_movements, retention_cutoff, retire_expired_lots
+from apps.stock.snapshot_service import take_snapshot
+from apps.stock.reservation_service import expire_stale_reservations
+from apps.stock.low_stock_service import default_low_stock_threshold, detect_low_stock
+from apps.stock.watermark_service import close_scan_window, open_scan_window
+from apps.stock.expiry_bucket_service import expiry_boundaries, lots_expiring_within, near_expiry_lots, publish_near_expiry_metrics, roll_expiry_buckets as roll_buckets
 from apps.core.metrics import increment_counter, set_gauge
 from apps.events.manager import EventSystemManager
-from apps.core.events import EventBus
+from apps.core.events import publish_many_sync
 from apps.stock.events import (
     LotExpiryWarning, LowStockDetected, StockNotificationRequested
 )
 
 logger = logging.getLogger(__name__)
 
+# Lots per batched event publish in scan_near_expiry
+SCAN_CHUNK_SIZE = 2000
+
 
 @shared_task(
     bind=True,
@@ -31,98 +44,104 @@ logger = logging.getLogger(__name__)
     soft_time_limit=180,  # 3 minutes
     time_limit=300,  # 5 minutes
 )
-def scan_near_expiry(self, days_ahead: int = 7):
+def scan_near_expiry(self, days_ahead: int = 7, incremental: bool = False):
     """
     Scan for products near expiry and send alerts.
     
+    Streams the near-expiry lots with their per-product total (a window
+    aggregate partitioned by product) in a single query read with
+    `.iterator()`, and publishes the events of each chunk of SCAN_CHUNK_SIZE
+    lots with a single batched call.
+    
     Args:
         days_ahead: Number of days ahead to check for expiry
+        incremental: Only re-evaluate products with movements since the last
+            incremental scan plus lots that crossed an expiry bucket boundary
     """
     try:
         logger.info(f"Starting near expiry scan for {days_ahead} days ahead")
+        started = time.perf_counter()
+        today = date.today()
+        window = open_scan_window(f'scan_near_expiry:{days_ahead}', today) if incremental else None
+        
+        # Find lots near expiry with stock. A full scan is narrowed by the
+        # expiry-bucket index; an incremental one filters StockLot directly,
+        # since the lots that crossed a boundary overnight are exactly the ones
+        # the index may still hold in their old bucket.
+        if window is None or window.is_full:
+            expiring_lots = near_expiry_lots(days_ahead, today=today)
+        else:
+            expiring_lots = lots_expiring_within(days_ahead, today=today).filter(
+                window.lot_filter(expiry_boundaries(days_ahead))
+            )
+        
+        # Ordered by product so each product's lots arrive together
+        lot_rows = (
+            expiring_lots
+            .annotate(product_total_qty=models.Window(
+                models.Sum('qty_on_hand'), partition_by=[models.F('product_id')]
+            ))
+            .order_by('product__name', 'product_id', 'expiry_date', 'id')
+            .values_list(
+                'product_id', 'product__name', 'product_total_qty',
+                'id', 'lot_code', 'expiry_date', 'qty_on_hand', 'warehouse_id',
+            )
+            .iterator(chunk_size=SCAN_CHUNK_SIZE)
+        )
         
-        # Calculate expiry threshold
-        expiry_threshold = date.today() + timedelta(days=days_ahead)
-        
-        # Find lots near expiry with available stock
-        near_expiry_lots = StockLot.objects.select_related('product').filter(
-            expiry_date__lte=expiry_threshold,
-            expiry_date__gte=date.today(),  # Not already expired
-            qty_on_hand__gt=0
-        ).order_by('expiry_date', 'product__name')
-        
-        if not near_expiry_lots.exists():
-            logger.info("No products near expiry found")
-            set_gauge('products_near_expiry', 0)
-            increment_counter('near_expiry_scans_total', {'status': 'no_products'})
-            
-            return {
-                'status': 'success',
-                'products_found': 0,
-                'alerts_sent': 0
-            }
-        
-        # Group by product for better reporting
-        products_by_expiry = {}
+        products_found = 0
         total_lots = 0
-        
-        for lot in near_expiry_lots:
-            total_lots += 1
-            product_key = lot.product.name
-            
-            if product_key not in products_by_expiry:
-                products_by_expiry[product_key] = {
-                    'product': lot.product,
-                    'lots': [],
-                    'total_qty': Decimal('0')
-                }
-            
-            products_by_expiry[product_key]['lots'].append(lot)
-            products_by_expiry[product_key]['total_qty'] += lot.qty_on_hand
-        
-        logger.info(f"Found {len(products_by_expiry)} products with {total_lots} lots near expiry")
-        
-        # Send alerts for each product
         alerts_sent = 0
-        for product_name, product_data in products_by_expiry.items():
+        events_failed = 0
+        product_names = []
+        pending_events = []
+        pending_products = 0
+        pending_lots = 0
+        
+        def flush():
+            nonlocal alerts_sent, events_failed, pending_events, pending_products, pending_lots
             try:
-                # Prepare alert data
-                lots_info = []
-                for lot in product_data['lots']:
-                    days_to_expiry = (lot.expiry_date - date.today()).days
-                    lots_info.append({
-                        'lot_code': lot.lot_code,
-                        'quantity': float(lot.qty_on_hand),
-                        'days_to_expiry': days_to_expiry,
-                        'expiry_date': lot.expiry_date.isoformat()
-                    })
-                
-                # Publish expiry warning event for each lot
-                for lot in product_data['lots']:
-                    days_to_expiry = (lot.expiry_date - date.today()).days
-                    
-                    # Publish LotExpiryWarning event
-                    EventBus.publish(
-                        LotExpiryWarning(
-                            lot_id=str(lot.id),
-                            product_id=str(lot.product.id),
-                            product_name=lot.product.name,
-                            lot_code=lot.lot_code,
-                            expiry_date=lot.expiry_date,
-                            days_to_expiry=days_to_expiry,
-                            quantity=lot.qty_on_hand,
-                            warehouse_id=str(lot.warehouse.id) if lot.warehouse else None,
-                            priority="high" if days_to_expiry <= 3 else "medium"
-                        )
+                publish_many_sync(pending_events)
+                alerts_sent += pending_products
+            except Exception as publish_exc:
+                events_failed += len(pending_events)
+                logger.error(f"Failed to publish near expiry batch of {len(pending_events)} events: {publish_exc}")
+            pending_events, pending_products, pending_lots = [], 0, 0
+        
+        for product_id, rows in itertools.groupby(lot_rows, key=lambda row: row[0]):
+            lots = list(rows)
+            product_name, product_total_qty = lots[0][1], lots[0][2]
+            
+            lots_info = []
+            for _, _, _, lot_id, lot_code, expiry_date, qty_on_hand, warehouse_id in lots:
+                days_to_expiry = (expiry_date - today).days
+                lots_info.append({
+                    'lot_code': lot_code,
+                    'quantity': float(qty_on_hand),
+                    'days_to_expiry': days_to_expiry,
+                    'expiry_date': expiry_date.isoformat()
+                })
+                pending_events.append(
+                    LotExpiryWarning(
+                        aggregate_id=str(lot_id),
+                        aggregate_type='StockLot',
+                        lot_code=lot_code,
+                        product_id=str(product_id),
+                        product_name=product_name,
+                        expiry_date=expiry_date,
+                        days_until_expiry=days_to_expiry,
+                        quantity=qty_on_hand,
+                        warehouse_id=str(warehouse_id) if warehouse_id else "",
+                        metadata={'priority': "high" if days_to_expiry <= 3 else "medium"}
                     )
-                
-                # Publish notification request event
-                message = f"""
+                )
+            
+            message = f"""
 ALERTA DE VENCIMIENTO PRÓXIMO
 
 Producto: {product_name}
-Total en riesgo: {product_data['total_qty']} unidades
-Lotes afectados: {len(product_data['lots'])}
+Total en riesgo: {product_total_qty} unidades
+Lotes afectados: {len(lots)}
 
 Detalle de lotes:
 {chr(10).join([f"  - Lote {info['lot_code']}: {info['quantity']} unidades (vence en {info['days_to_expiry']} días - {info['expiry_date']})" for info in lots_info])}
@@ -134,44 +153,78 @@ Se recomienda:
 
 Revisar en el panel de stock.
                 """
-                
-                EventBus.publish(
-                    StockNotificationRequested(
-                        notification_id=f"expiry_warning_{product_data['product'].id}_{date.today().isoformat()}",
-                        notification_type="expiry_warning",
-                        priority="high" if any(lot.expiry_date <= date.today() + timedelta(days=3) for lot in product_data['lots']) else "medium",
-                        product_id=str(product_data['product'].id),
-                        product_name=product_name,
-                        message=message,
-                        details={
-                            'total_quantity': float(product_data['total_qty']),
-                            'lots_count': len(product_data['lots']),
-                            'lots_info': lots_info
-                        },
-                        notify_roles=['stock_manager', 'warehouse_manager'],
-                        notify_email=True,
-                        notify_dashboard=True
-                    )
+            
+            pending_events.append(
+                StockNotificationRequested(
+                    aggregate_id=str(product_id),
+                    aggregate_type='Product',
+                    notification_type="expiry_warning",
+                    product_id=str(product_id),
+                    message=message,
+                    priority="high" if any(info['days_to_expiry'] <= 3 for info in lots_info) else "medium",
+                    metadata={
+                        'notification_id': f"expiry_warning_{product_id}_{today.isoformat()}",
+                        'product_name': product_name,
+                        'total_quantity': float(product_total_qty),
+                        'lots_count': len(lots),
+                        'lots_info': lots_info,
+                        'notify_roles': ['stock_manager', 'warehouse_manager'],
+                    }
                 )
-                
-                alerts_sent += 1
-                
-            except Exception as alert_exc:
-                logger.error(f"Failed to publish events for {product_name}: {alert_exc}")
-        
-        # Update metrics
-        set_gauge('products_near_expiry', len(products_by_expiry))
-        set_gauge('lots_near_expiry', total_lots)
+            )
+            
+            products_found += 1
+            total_lots += len(lots)
+            product_names.append(product_name)
+            pending_products += 1
+            pending_lots += len(lots)
+            
+            if pending_lots >= SCAN_CHUNK_SIZE:
+                flush()
+        
+        if pending_events:
+            flush()
+        
+        elapsed = time.perf_counter() - started
+        lots_per_second = total_lots / elapsed if elapsed else 0.0
+        
+        # A failed batch keeps the window open so the next scan retries its alerts
+        if window is not None and not events_failed:
+            close_scan_window(window)
+        
+        # Update metrics (totals only make sense for a full scan)
+        if window is None or window.is_full:
+            set_gauge('products_near_expiry', products_found)
+            set_gauge('lots_near_expiry', total_lots)
+        set_gauge('near_expiry_scan_lots_per_second', lots_per_second)
+        
+        if not products_found:
+            logger.info("No products near expiry found")
+            increment_counter('near_expiry_scans_total', {'status': 'no_products'})
+            
+            return {
+                'status': 'success',
+                'products_found': 0,
+                'alerts_sent': 0,
+                'incremental': incremental
+            }
+        
         increment_counter('near_expiry_scans_total', {'status': 'success'})
         
-        logger.info(f"Near expiry scan completed: {len(products_by_expiry)} products, {alerts_sent} alerts sent")
+        logger.info(
+            f"Near expiry scan completed: {products_found} products, {total_lots} lots, "
+            f"{alerts_sent} alerts sent ({lots_per_second:.0f} lots/s)"
+        )
         
         return {
             'status': 'success',
-            'products_found': len(products_by_expiry),
+            'products_found': products_found,
             'lots_found': total_lots,
             'alerts_sent': alerts_sent,
-            'products': list(products_by_expiry.keys())
+            'events_failed': events_failed,
+            'lots_per_second': round(lots_per_second, 1),
+            'incremental': incremental,
+            'products': product_names
         }
         
     except Exception as exc:
@@ -192,105 +245,109 @@ Revisar en el panel de stock.
     soft_time_limit=120,  # 2 minutes
     time_limit=240,  # 4 minutes
 )
-def scan_low_stock(self, min_stock_threshold: float = 10.0):
+def scan_low_stock(self, min_stock_threshold: float = None, incremental: bool = False):
     """
     Scan for products with low stock and send alerts.
     
+    Detection is a single grouped query over the stock summary compared with
+    each product's low_stock_threshold; all events go out in one batch.
+    
     Args:
-        min_stock_threshold: Minimum stock threshold (default from product or global)
+        min_stock_threshold: Threshold for products without their own
+            low_stock_threshold (default: settings.LOW_STOCK_THRESHOLD_DEFAULT)
+        incremental: Only re-evaluate products with movements since the last
+            incremental scan
     """
     try:
-        logger.info(f"Starting low stock scan with threshold {min_stock_threshold}")
-        
-        # Get products with their current stock levels
-        products_with_stock = []
-        
-        for product in Product.objects.filter(is_active=True):
-            # Calculate total stock for this product
-            total_stock = StockLot.objects.filter(
-                product=product,
-                qty_on_hand__gt=0
-            ).aggregate(
-                total=models.Sum('qty_on_hand')
-            )['total'] or Decimal('0')
-            
-            # Use product-specific min_stock or global threshold
-            product_min_stock = getattr(product, 'min_stock', None) or Decimal(str(min_stock_threshold))
+        default_threshold = (
+            Decimal(str(min_stock_threshold)) if min_stock_threshold is not None
+            else default_low_stock_threshold()
+        )
+        logger.info(f"Starting low stock scan with default threshold {default_threshold}")
+        
+        events = []
+        product_names = []
+        today = date.today()
+        window = open_scan_window('scan_low_stock', today) if incremental else None
+        product_ids = None if window is None or window.is_full else window.touched_product_ids()
+        
+        for item in detect_low_stock(default_threshold, product_ids=product_ids):
+            product_names.append(item.product_name)
             
-            if total_stock <= product_min_stock:
-                products_with_stock.append({
-                    'product': product,
-                    'current_stock': float(total_stock),
-                    'min_stock': float(product_min_stock),
-                    'shortage': float(product_min_stock - total_stock)
-                })
+            events.append(
+                LowStockDetected(
+                    aggregate_id=str(item.product_id),
+                    aggregate_type='Product',
+                    product_id=str(item.product_id),
+                    product_name=item.product_name,
+                    product_sku=item.product_code,
+                    current_quantity=item.on_hand,
+                    minimum_quantity=item.threshold,
+                    metadata={'priority': "high" if item.on_hand == 0 else "medium"}
+                )
+            )
+            events.append(
+                StockNotificationRequested(
+                    aggregate_id=str(item.product_id),
+                    aggregate_type='Product',
+                    notification_type="low_stock",
+                    priority="urgent" if item.on_hand == 0 else "high",
+                    product_id=str(item.product_id),
+                    message=f"Stock bajo detectado para {item.product_name}: {item.on_hand} unidades (mínimo: {item.threshold})",
+                    metadata={
+                        'notification_id': f"low_stock_{item.product_id}_{today.isoformat()}",
+                        'product_name': item.product_name,
+                        'current_stock': float(item.on_hand),
+                        'min_stock': float(item.threshold),
+                        'shortage': float(item.shortage),
+                        'notify_roles': ['stock_manager', 'purchasing_manager'],
+                    }
+                )
+            )
         
-        if not products_with_stock:
+        if not product_names:
+            if window is not None:
+                close_scan_window(window)
+            
             logger.info("No products with low stock found")
-            set_gauge('products_low_stock', 0)
+            if product_ids is None:
+                set_gauge('products_low_stock', 0)
             increment_counter('low_stock_scans_total', {'status': 'no_products'})
             
             return {
                 'status': 'success',
                 'products_found': 0,
-                'alerts_sent': 0
+                'alerts_sent': 0,
+                'incremental': incremental
             }
         
-        logger.info(f"Found {len(products_with_stock)} products with low stock")
+        logger.info(f"Found {len(product_names)} products with low stock")
         
         # Send alerts for low stock products
         alerts_sent = 0
-        for product_data in products_with_stock:
-            try:
-                # Publish LowStockDetected event
-                EventBus.publish(
-                    LowStockDetected(
-                        product_id=str(product_data['product'].id),
-                        product_name=product_data['product'].name,
-                        current_stock=Decimal(str(product_data['current_stock'])),
-                        min_stock_threshold=Decimal(str(product_data['min_stock'])),
-                        shortage_quantity=Decimal(str(product_data['shortage'])),
-                        warehouse_id=None,  # Global stock level
-                        priority="high" if product_data['current_stock'] == 0 else "medium"
-                    )
-                )
-                
-                # Publish notification request event
-                EventBus.publish(
-                    StockNotificationRequested(
-                        notification_id=f"low_stock_{product_data['product'].id}_{date.today().isoformat()}",
-                        notification_type="low_stock",
-                        priority="urgent" if product_data['current_stock'] == 0 else "high",
-                        product_id=str(product_data['product'].id),
-                        product_name=product_data['product'].name,
-                        message=f"Stock bajo detectado para {product_data['product'].name}: {product_data['current_stock']} unidades (mínimo: {product_data['min_stock']})",
-                        details={
-                            'current_stock': product_data['current_stock'],
-                            'min_stock': product_data['min_stock'],
-                            'shortage': product_data['shortage']
-                        },
-                        notify_roles=['stock_manager', 'purchasing_manager'],
-                        notify_email=True,
-                        notify_dashboard=True
-                    )
-                )
-                
-                alerts_sent += 1
-                
-            except Exception as alert_exc:
-                logger.error(f"Failed to publish events for {product_data['product'].name}: {alert_exc}")
-        
-        # Update metrics
-        set_gauge('products_low_stock', len(products_with_stock))
+        try:
+            publish_many_sync(events)
+            alerts_sent = len(product_names)
+        except Exception as alert_exc:
+            logger.error(f"Failed to publish low stock events: {alert_exc}")
+        
+        # Only advance the watermark once the alerts went out
+        if window is not None and alerts_sent:
+            close_scan_window(window)
+        
+        # Update metrics (totals only make sense for a full scan)
+        if product_ids is None:
+            set_gauge('products_low_stock', len(product_names))
         increment_counter('low_stock_scans_total', {'status': 'success'})
         
-        logger.info(f"Low stock scan completed: {len(products_with_stock)} products, {alerts_sent} alerts sent")
+        logger.info(f"Low stock scan completed: {len(product_names)} products, {alerts_sent} alerts sent")
         
         return {
             'status': 'success',
-            'products_found': len(products_with_stock),
+            'products_found': len(product_names),
             'alerts_sent': alerts_sent,
-            'products': [p['product'].name for p in products_with_stock]
+            'incremental': incremental,
+            'products': product_names
         }
         
     except Exception as exc:
@@ -311,48 +368,39 @@ def scan_low_stock(self, min_stock_threshold: float = 10.0):
     soft_time_limit=60,  # 1 minute
     time_limit=120,  # 2 minutes
 )
-def cleanup_expired_lots(self):
+def cleanup_expired_lots(self, batch_size=1000):
     """
-    Clean up expired lots with zero stock.
-    This task helps maintain database performance.
+    Retire expired lots with zero stock in bounded id-range batches.
+
+    Lots still referenced by movements, reservations or sales are only flagged
+    as archived; unreferenced ones are moved to the lot archive table.
     """
     try:
         logger.info("Starting cleanup of expired lots")
-        
-        # Find expired lots with zero stock
-        expired_lots = StockLot.objects.filter(
-            expiry_date__lt=date.today(),
-            qty_on_hand=0
-        )
-        
-        expired_count = expired_lots.count()
-        
-        if expired_count == 0:
+
+        result = retire_expired_lots(batch_size=batch_size)
+
+        if result['batches'] == 0:
             logger.info("No expired lots to clean up")
             increment_counter('lot_cleanup_total', {'status': 'no_lots'})
-            
-            return {
-                'status': 'success',
-                'lots_cleaned': 0
-            }
-        
-        # Delete expired lots in batches
-        with transaction.atomic():
-            deleted_count = expired_lots.delete()[0]
-        
-        logger.info(f"Cleaned up {deleted_count} expired lots")
-        increment_counter('lot_cleanup_total', {'status': 'success'})
-        set_gauge('expired_lots_cleaned', deleted_count)
-        
+        else:
+            logger.info(
+                f"Retired expired lots: {result['lots_flagged']} flagged, "
+                f"{result['lots_moved']} moved to archive in {result['batches']} batches"
+            )
+            increment_counter('lot_cleanup_total', {'status': 'success'})
+        set_gauge('expired_lots_cleaned', result['lots_moved'])
+
         return {
             'status': 'success',
-            'lots_cleaned': deleted_count
+            'lots_cleaned': result['lots_moved'],
+            **result
         }
-        
+
     except Exception as exc:
         logger.error(f"Lot cleanup failed: {exc}")
         increment_counter('lot_cleanup_total', {'status': 'failed'})
-        
+
         # Let autoretry handle the retry
         raise exc
 
@@ -373,13 +421,15 @@ def update_stock_metrics(self):
         total_products = Product.objects.filter(is_active=True).count()
         set_gauge('total_active_products', total_products)
         
-        # Total stock lots
-        total_lots = StockLot.objects.filter(qty_on_hand__gt=0).count()
+        # Total stock lots (read from the stock summary table)
+        total_lots = ProductStockSummary.objects.aggregate(
+            total=models.Sum('lot_count')
+        )['total'] or 0
         set_gauge('total_stock_lots', total_lots)
         
         # Products with stock
-        products_with_stock = StockLot.objects.filter(
-            qty_on_hand__gt=0
+        products_with_stock = ProductStockSummary.objects.filter(
+            on_hand__gt=0
         ).values('product').distinct().count()
         set_gauge('products_with_stock', products_with_stock)
         
@@ -407,4 +457,221 @@ def update_stock_metrics(self):
         return {
             'status': 'failed',
             'error': str(exc)
-        }
\ No newline at end of file
+        }
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_backoff_max=300,  # Max 5 minutes
+    retry_jitter=True,
+    max_retries=2,
+    soft_time_limit=300,  # 5 minutes
+    time_limit=600,  # 10 minutes
+)
+def reconcile_stock_summary(self):
+    """
+    Reconcile ProductStockSummary against the stock lots.
+    
+    Fixes drift and refreshes the date-dependent `available` column
+    (lots that expired since the last write).
+    """
+    try:
+        logger.info("Starting stock summary reconciliation")
+        
+        result = reconcile_stock_summaries()
+        
+        set_gauge('stock_summary_drifted', result['drifted'])
+        increment_counter('stock_summary_reconcile_total', {'status': 'success'})
+        
+        logger.info(
+            f"Stock summary reconciled: {result['checked']} keys checked, "
+            f"{result['fixed']} fixed, {result['removed']} removed"
+        )
+        
+        return {
+            'status': 'success',
+            **result
+        }
+        
+    except Exception as exc:
+        logger.error(f"Stock summary reconciliation failed: {exc}")
+        increment_counter('stock_summary_reconcile_total', {'status': 'failed'})
+        
+        # Let autoretry handle the retry
+        raise exc
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_backoff_max=300,  # Max 5 minutes
+    retry_jitter=True,
+    max_retries=2,
+    soft_time_limit=1800,  # 30 minutes
+    time_limit=3600,  # 1 hour
+)
+def archive_old_movements(self, batch_size: int = 5000):
+    """
+    Move movements older than MOVEMENT_RETENTION_DAYS out of the live ledger.
+    
+    Each batch is rolled up into MovementDailyAggregate, copied to the
+    archive table and deleted in one transaction, so a retry resumes
+    where the previous run stopped.
+    """
+    try:
+        before = retention_cutoff()
+        logger.info(f"Starting movement archiving before {before}")
+        
+        result = archive_movements(before, batch_size=batch_size)
+        
+        increment_counter('stock_movements_archived_total', {'status': 'success'})
+        set_gauge('stock_movements_archived_last_run', result['movements_archived'])
+        
+        logger.info(
+            f"Movement archiving completed: {result['movements_archived']} movements "
+            f"in {result['batches']} batches"
+        )
+        
+        return {
+            'status': 'success',
+            'before': before.isoformat(),
+            **result
+        }
+        
+    except Exception as exc:
+        logger.error(f"Movement archiving failed: {exc}")
+        increment_counter('stock_movements_archived_total', {'status': 'failed'})
+        
+        # Let autoretry handle the retry
+        raise exc
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_backoff_max=300,  # Max 5 minutes
+    retry_jitter=True,
+    max_retries=2,
+    soft_time_limit=900,  # 15 minutes
+    time_limit=1800,  # 30 minutes
+)
+def take_stock_snapshot(self, day: str = None):
+    """
+    Checkpoint every lot's qty_on_hand at the close of a day.
+    
+    Defaults to yesterday. With STOCK_SNAPSHOT_INTERVAL=weekly only
+    Sundays are snapshotted; other days are skipped.
+    
+    Args:
+        day: ISO date to snapshot (forces the snapshot regardless of interval)
+    """
+    try:
+        if day:
+            snapshot_day = date.fromisoformat(day)
+        else:
+            snapshot_day = timezone.localdate() - timedelta(days=1)
+            if settings.STOCK_SNAPSHOT_INTERVAL == 'weekly' and snapshot_day.weekday() != 6:
+                return {'status': 'skipped', 'snapshot_date': snapshot_day.isoformat()}
+        
+        lots = take_snapshot(snapshot_day)
+        
+        increment_counter('stock_snapshot_total', {'status': 'success'})
+        set_gauge('stock_snapshot_lots', lots)
+        
+        logger.info(f"Stock snapshot for {snapshot_day}: {lots} lots")
+        
+        return {
+            'status': 'success',
+            'snapshot_date': snapshot_day.isoformat(),
+            'lots': lots
+        }
+        
+    except Exception as exc:
+        logger.error(f"Stock snapshot failed: {exc}")
+        increment_counter('stock_snapshot_total', {'status': 'failed'})
+        
+        # Let autoretry handle the retry
+        raise exc
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_backoff_max=300,  # Max 5 minutes
+    retry_jitter=True,
+    max_retries=2,
+    soft_time_limit=600,  # 10 minutes
+    time_limit=900,  # 15 minutes
+)
+def roll_expiry_buckets(self):
+    """
+    Rebuild the expiry-bucket index for today and refresh the near-expiry gauge.
+    
+    Entries and exits keep the index current for the keys they touch; this
+    nightly roll moves untouched lots into their new bucket as days pass.
+    """
+    try:
+        result = roll_buckets()
+        publish_near_expiry_metrics()
+        
+        increment_counter('expiry_bucket_roll_total', {'status': 'success'})
+        set_gauge('expiry_buckets', result['buckets'])
+        
+        logger.info(f"Expiry buckets rolled: {result['buckets']} buckets, {result['removed']} removed")
+        
+        return {
+            'status': 'success',
+            **result
+        }
+        
+    except Exception as exc:
+        logger.error(f"Expiry bucket roll failed: {exc}")
+        increment_counter('expiry_bucket_roll_total', {'status': 'failed'})
+        
+        # Let autoretry handle the retry
+        raise exc
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_backoff_max=60,  # Max 1 minute
+    retry_jitter=True,
+    max_retries=2,
+    soft_time_limit=120,  # 2 minutes
+    time_limit=180,  # 3 minutes
+)
+def expire_reservations(self, batch_size=1000):
+    """
+    Cancel PENDING reservations past their expires_at and release their holds.
+    
+    Stale holds otherwise keep qty_reserved up and starve availability.
+    """
+    try:
+        result = expire_stale_reservations(batch_size=batch_size)
+        
+        increment_counter('reservation_expiry_total', {'status': 'success'})
+        set_gauge('reservations_expired', result['reservations_expired'])
+        
+        if result['reservations_expired']:
+            logger.info(
+                f"Expired {result['reservations_expired']} reservations "
+                f"on {result['lots_released']} lots"
+            )
+        
+        return {
+            'status': 'success',
+            **result
+        }
+        
+    except Exception as exc:
+        logger.error(f"Reservation expiry failed: {exc}")
+        increment_counter('reservation_expiry_total', {'status': 'failed'})
+        
+        # Let autoretry handle the retry
+        raise exc
@@ -0,0 +1,143 @@
+"""
+Tests de la venta POS de punta a punta por el event bus real.
+
+`POSStockRequestHandler` responde las solicitudes de `process_pos_sale` desde el
+loop de fondo, con su propia conexión a la base (por eso TransactionTestCase).
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase, override_settings
+
+from apps.catalog.models import Product
+from apps.pos.models import LotOverrideAudit, SaleItemLot
+from apps.pos.events import SaleItemData
+from apps.pos.services import process_pos_sale, request_sale_consumption
+from apps.stock.models import Movement, StockLot, Warehouse
+from apps.stock.services import record_entry
+
+
+class POSStockRequestHandlerTests(TransactionTestCase):
+    """Validación FEFO, override y consumo de lotes respondidos por el handler de stock."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='seller', password='testpass123')
+        self.warehouse = Warehouse.objects.create(name='Almacén Principal')
+        self.product = Product.objects.create(code='PROD-1', name='Producto 1', price=Decimal('10.00'))
+
+        today = date.today()
+        self.lot1 = record_entry(
+            product_id=self.product.id, lot_code='LOT-1', expiry_date=today + timedelta(days=10),
+            qty=Decimal('5.000'), unit_cost=Decimal('8.00'), user_id=self.user.id, warehouse_id=self.warehouse.id,
+        ).lot
+        self.lot2 = record_entry(
+            product_id=self.product.id, lot_code='LOT-2', expiry_date=today + timedelta(days=30),
+            qty=Decimal('10.000'), unit_cost=Decimal('8.50'), user_id=self.user.id, warehouse_id=self.warehouse.id,
+        ).lot
+
+    def _sell(self, sale_id, items):
+        return process_pos_sale(sale_id=sale_id, user=self.user, customer=None, items=items)
+
+    def test_fefo_sale_consumes_lots_through_the_stock_handler(self):
+        result = self._sell('sale-fefo', [
+            {'product_id': self.product.id, 'qty': Decimal('7'), 'unit_price': Decimal('10.00'), 'sequence': 1},
+        ])
+
+        self.assertTrue(result['success'], result)
+        self.assertEqual(
+            [(m['lot_id'], m['lot_code'], m['qty'], m['unit_cost']) for m in result['movements']],
+            [(self.lot1.id, 'LOT-1', Decimal('5'), Decimal('8.00')),
+             (self.lot2.id, 'LOT-2', Decimal('2'), Decimal('8.50'))]
+        )
+
+        movements = Movement.objects.filter(id__in=[m['movement_id'] for m in result['movements']])
+        self.assertEqual({m.type for m in movements}, {Movement.Type.EXIT})
+        self.assertEqual({m.reason for m in movements}, {Movement.Reason.SALE})
+        self.assertEqual(
+            list(SaleItemLot.objects.filter(sale_id='sale-fefo').order_by('lot_id').values_list('lot_id', 'qty_consumed')),
+            [(self.lot1.id, Decimal('5')), (self.lot2.id, Decimal('2'))]
+        )
+        self.assertEqual(StockLot.objects.get(id=self.lot1.id).qty_on_hand, Decimal('0'))
+        self.assertEqual(StockLot.objects.get(id=self.lot2.id).qty_on_hand, Decimal('8'))
+
+    @override_settings(FEATURE_LOT_OVERRIDE=True)
+    def test_lot_override_is_consumed_and_audited(self):
+        result = self._sell('sale-override', [
+            {'product_id': self.product.id, 'qty': Decimal('3'), 'unit_price': Decimal('10.00'), 'sequence': 1,
+             'lot_id': self.lot2.id, 'lot_override_reason': 'Cliente pide el lote más nuevo'},
+        ])
+
+        self.assertTrue(result['success'], result)
+        self.assertEqual(result['movements'][0]['lot_code'], 'LOT-2')
+        self.assertEqual(StockLot.objects.get(id=self.lot2.id).qty_on_hand, Decimal('7'))
+        self.assertEqual(StockLot.objects.get(id=self.lot1.id).qty_on_hand, Decimal('5'))
+        audit = LotOverrideAudit.objects.get(sale_id='sale-override')
+        self.assertEqual((audit.lot_chosen_id, audit.qty, audit.actor_id), (self.lot2.id, Decimal('3'), self.user.id))
+
+    def test_insufficient_stock_is_replied_as_an_error(self):
+        result = self._sell('sale-short', [
+            {'product_id': self.product.id, 'qty': Decimal('20'), 'unit_price': Decimal('10.00'), 'sequence': 1},
+        ])
+
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error_code'], 'INSUFFICIENT_STOCK')
+        self.assertFalse(Movement.objects.filter(type=Movement.Type.EXIT).exists())
+
+    def test_lines_of_the_same_product_are_planned_on_the_remaining_stock(self):
+        result = self._sell('sale-two-lines', [
+            {'product_id': self.product.id, 'qty': Decimal('4'), 'unit_price': Decimal('10.00'), 'sequence': 1},
+            {'product_id': self.product.id, 'qty': Decimal('4'), 'unit_price': Decimal('10.00'), 'sequence': 2},
+        ])
+
+        self.assertTrue(result['success'], result)
+        self.assertEqual(
+            [(m['sequence'], m['lot_id'], m['qty']) for m in result['movements']],
+            [(1, self.lot1.id, Decimal('4')),
+             (2, self.lot1.id, Decimal('1')),
+             (2, self.lot2.id, Decimal('3'))]
+        )
+        self.assertEqual(StockLot.objects.get(id=self.lot1.id).qty_on_hand, Decimal('0'))
+        self.assertEqual(StockLot.objects.get(id=self.lot2.id).qty_on_hand, Decimal('7'))
+
+    def test_sale_failing_part_way_leaves_no_writes(self):
+        result = self._sell('sale-partial', [
+            {'product_id': self.product.id, 'qty': Decimal('4'), 'unit_price': Decimal('10.00'), 'sequence': 1},
+            {'product_id': self.product.id, 'qty': Decimal('12'), 'unit_price': Decimal('10.00'), 'sequence': 2},
+        ])
+
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error_code'], 'INSUFFICIENT_STOCK')
+        self.assertEqual(StockLot.objects.get(id=self.lot1.id).qty_on_hand, Decimal('5'))
+        self.assertEqual(StockLot.objects.get(id=self.lot2.id).qty_on_hand, Decimal('10'))
+        self.assertFalse(Movement.objects.filter(type=Movement.Type.EXIT).exists())
+        self.assertFalse(SaleItemLot.objects.filter(sale_id='sale-partial').exists())
+
+    @override_settings(EVENT_REQUEST_TIMEOUT_SECONDS=0)
+    def test_request_expired_before_commit_is_rolled_back(self):
+        result = self._sell('sale-expired', [
+            {'product_id': self.product.id, 'qty': Decimal('2'), 'unit_price': Decimal('10.00'), 'sequence': 1},
+        ])
+
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error_code'], 'REQUEST_EXPIRED')
+        self.assertEqual(StockLot.objects.get(id=self.lot1.id).qty_on_hand, Decimal('5'))
+        self.assertFalse(SaleItemLot.objects.filter(sale_id='sale-expired').exists())
+
+    def test_timed_out_reply_uses_the_committed_lines(self):
+        reply_after_commit = self._sell('sale-committed', [
+            {'product_id': self.product.id, 'qty': Decimal('2'), 'unit_price': Decimal('10.00'), 'sequence': 1},
+        ])
+
+        with patch('apps.pos.services.request_sync', side_effect=TimeoutError):
+            result = request_sale_consumption('sale-committed', self.user, None, [
+                SaleItemData(product_id=self.product.id, product_name='Producto 1', product_code='PROD-1',
+                             sequence=1, qty=Decimal('2'), unit_price=Decimal('10.00')),
+            ])
+
+        self.assertFalse(result['error'])
+        self.assertEqual(
+            [m['movement_id'] for m in result['lines'][0]['movements']],
+            [m['movement_id'] for m in reply_after_commit['movements']]
+        )
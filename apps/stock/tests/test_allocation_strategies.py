@@ -0,0 +1,140 @@
+"""Tests para las estrategias de asignación de lotes."""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from prometheus_client import REGISTRY
+
+from apps.catalog.models import Product
+from apps.customers.models import Customer
+from apps.stock.allocation_strategies import (
+    AllocationStrategy, MinSplitFEFOStrategy, StrictFEFOStrategy, get_allocation_strategy
+)
+from apps.stock.fefo_service import FEFOService
+from apps.stock.models import StockLot, Warehouse
+from apps.stock.services import ExitError, StockError, allocate_lots_fefo, allocate_many
+
+User = get_user_model()
+
+
+def _lot(lot_id, days, warehouse_id=1):
+    return SimpleNamespace(id=lot_id, expiry_date=date(2030, 1, 1) + timedelta(days=days), warehouse_id=warehouse_id)
+
+
+class MinSplitStrategyTests(SimpleTestCase):
+    """La tolerancia de vencimiento permite elegir menos lotes y depósitos."""
+
+    def _plan(self, strategy, lots, available, qty):
+        return [(lot.id, take) for lot, take in strategy.plan(lots, Decimal(qty), available)]
+
+    def test_prefers_a_single_lot_within_tolerance(self):
+        lots = [_lot(1, 0), _lot(2, 1), _lot(3, 2), _lot(4, 3)]
+        available = {1: Decimal('2'), 2: Decimal('3'), 3: Decimal('20'), 4: Decimal('50')}
+
+        self.assertEqual(
+            self._plan(StrictFEFOStrategy(), lots, available, '10'),
+            [(1, Decimal('2')), (2, Decimal('3')), (3, Decimal('5'))]
+        )
+        # El lote 3 es el de vencimiento más próximo que cubre todo
+        self.assertEqual(self._plan(MinSplitFEFOStrategy(7), lots, available, '10'), [(3, Decimal('10'))])
+
+    def test_keeps_fefo_outside_the_tolerance_window(self):
+        lots = [_lot(1, 0), _lot(2, 30)]
+        available = {1: Decimal('4'), 2: Decimal('100')}
+        self.assertEqual(
+            self._plan(MinSplitFEFOStrategy(7), lots, available, '10'),
+            [(1, Decimal('4')), (2, Decimal('6'))]
+        )
+
+    def test_prefers_a_single_warehouse(self):
+        lots = [_lot(1, 0, warehouse_id=1), _lot(2, 1, warehouse_id=2), _lot(3, 2, warehouse_id=1)]
+        available = {1: Decimal('6'), 2: Decimal('8'), 3: Decimal('6')}
+        plan = MinSplitFEFOStrategy(7).plan(lots, Decimal('12'), available)
+        self.assertEqual([(lot.id, take) for lot, take in plan], [(1, Decimal('6')), (3, Decimal('6'))])
+
+    def test_partial_when_lots_do_not_cover(self):
+        lots = [_lot(1, 0), _lot(2, 1)]
+        available = {1: Decimal('1'), 2: Decimal('2')}
+        self.assertEqual(
+            self._plan(MinSplitFEFOStrategy(7), lots, available, '5'),
+            [(1, Decimal('1')), (2, Decimal('2'))]
+        )
+
+    def test_resolution_order(self):
+        customer = SimpleNamespace(allocation_strategy='min_splits')
+        self.assertIsInstance(get_allocation_strategy(), StrictFEFOStrategy)
+        self.assertIsInstance(get_allocation_strategy(customer=customer), MinSplitFEFOStrategy)
+        self.assertIsInstance(get_allocation_strategy('fefo', customer=customer), StrictFEFOStrategy)
+        with self.assertRaises(ValueError):
+            get_allocation_strategy('unknown')
+
+
+@override_settings(STOCK_ALLOCATION_EXPIRY_TOLERANCE_DAYS=7)
+class AllocationStrategyInterfaceTests(SimpleTestCase):
+    """Una estrategia sin `plan()` falla al instanciarse, no en medio de una asignación."""
+
+    def test_strategy_without_plan_cannot_be_instantiated(self):
+        class Incomplete(AllocationStrategy):
+            name = 'incomplete'
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+        with self.assertRaises(TypeError):
+            AllocationStrategy()
+        self.assertIsInstance(StrictFEFOStrategy(), AllocationStrategy)
+
+
+class AllocationStrategySelectionTests(TestCase):
+    """Las asignaciones aceptan la estrategia por llamada o por cliente."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='strategy', password='test123')
+        self.product = Product.objects.create(code='STR-001', name='Producto Estrategia', price=Decimal('1.00'))
+        self.near = Warehouse.objects.create(name='Norte')
+        self.far = Warehouse.objects.create(name='Sur')
+        today = date.today()
+        self.lots = [
+            StockLot.objects.create(
+                product=self.product, lot_code=code, expiry_date=today + timedelta(days=days),
+                qty_on_hand=Decimal(qty), unit_cost=Decimal('1.00'), warehouse=warehouse
+            )
+            for code, days, qty, warehouse in [
+                ('STR-A', 10, '3', self.near), ('STR-B', 11, '4', self.far), ('STR-C', 12, '30', self.far),
+            ]
+        ]
+
+    def _movements_observed(self, strategy):
+        return REGISTRY.get_sample_value(
+            'stock_allocation_movements_per_line_count', {'strategy': strategy}
+        ) or 0
+
+    def test_allocate_lots_fefo_per_call(self):
+        strict = allocate_lots_fefo(self.product, Decimal('10'))
+        self.assertEqual(len(strict), 3)
+
+        plan = allocate_lots_fefo(self.product, Decimal('10'), strategy='min_splits')
+        self.assertEqual([(p.lot_id, p.qty_allocated) for p in plan], [(self.lots[2].id, Decimal('10'))])
+
+        with self.assertRaises(StockError):
+            allocate_lots_fefo(self.product, Decimal('1'), strategy='unknown')
+
+    def test_allocate_many_uses_the_customer_strategy_and_reports_metrics(self):
+        customer = Customer.objects.create(name='Cliente Lotes', segment='retail', allocation_strategy='min_splits')
+        observed = self._movements_observed('min_splits')
+
+        movements = allocate_many([(self.product.id, Decimal('10'))], user_id=self.user.id, customer=customer)
+
+        self.assertEqual([(m.lot_id, m.qty) for m in movements[0]], [(self.lots[2].id, Decimal('10'))])
+        self.assertEqual(self._movements_observed('min_splits'), observed + 1)
+        with self.assertRaises(ExitError):
+            allocate_many([(self.product.id, Decimal('1'))], user_id=self.user.id, strategy='unknown')
+
+    def test_fefo_service_accepts_strategy(self):
+        allocations = FEFOService.allocate_stock_fefo(
+            product_id=self.product.id, qty_needed=Decimal('5'), user_id=self.user.id, strategy='min_splits'
+        )
+        self.assertEqual([(a.lot_id, a.qty_allocated) for a in allocations], [(self.lots[2].id, Decimal('5'))])
+        self.assertEqual(StockLot.objects.get(id=self.lots[0].id).qty_on_hand, Decimal('3'))
@@ -0,0 +1,191 @@
+"""Tests para StockLot.objects.with_availability() y su uso en FEFO."""
+
+from datetime import date, timedelta
+from io import StringIO
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from apps.catalog.models import Product
+from apps.customers.models import Customer
+from apps.orders.models import Order
+from apps.stock.models import StockLot, Warehouse
+from apps.stock.reservations import Reservation
+from apps.stock.services import (
+    allocate_lots_fefo, get_lot_options, pick_lots_fefo, handle_stock_lots_query
+)
+
+User = get_user_model()
+
+
+class WithAvailabilityTests(TestCase):
+    """Disponibilidad anotada en SQL, neta de reservas y vencimiento."""
+
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name='Almacén Principal')
+        self.product = Product.objects.create(
+            code='AVAIL-001',
+            name='Producto Disponibilidad',
+            price=Decimal('10.00')
+        )
+        customer = Customer.objects.create(name='Cliente Test')
+        self.order = Order.objects.create(customer=customer, delivery_method='pickup')
+
+        today = date.today()
+        self.lot = StockLot.objects.create(
+            product=self.product,
+            lot_code='LOT-A',
+            expiry_date=today + timedelta(days=10),
+            qty_on_hand=Decimal('10.000'),
+            unit_cost=Decimal('5.00'),
+            warehouse=self.warehouse
+        )
+        self.expired_lot = StockLot.objects.create(
+            product=self.product,
+            lot_code='LOT-EXP',
+            expiry_date=today - timedelta(days=1),
+            qty_on_hand=Decimal('7.000'),
+            unit_cost=Decimal('5.00'),
+            warehouse=self.warehouse
+        )
+
+    def _annotated(self, lot):
+        return StockLot.objects.with_availability().get(id=lot.id)
+
+    def test_available_discounts_active_reservations(self):
+        Reservation.objects.create(order=self.order, lot=self.lot, qty=Decimal('3.000'))
+
+        lot = self._annotated(self.lot)
+        self.assertEqual(lot.qty_reserved, Decimal('3.000'))
+        self.assertEqual(lot.available_qty, Decimal('7.000'))
+        self.assertEqual(lot.qty_available, Decimal('7.000'))
+
+    def test_cancelled_reservations_are_ignored(self):
+        reservation = Reservation.objects.create(order=self.order, lot=self.lot, qty=Decimal('3.000'))
+        reservation.cancel()
+
+        self.assertEqual(self._annotated(self.lot).available_qty, Decimal('10.000'))
+
+    def test_expired_and_quarantined_lots_have_no_availability(self):
+        self.assertEqual(self._annotated(self.expired_lot).available_qty, Decimal('0'))
+
+        StockLot.objects.filter(id=self.lot.id).update(is_quarantined=True)
+        self.assertEqual(self._annotated(self.lot).available_qty, Decimal('0'))
+
+    def test_matches_qty_available_property(self):
+        Reservation.objects.create(order=self.order, lot=self.lot, qty=Decimal('4.000'))
+
+        for lot in StockLot.objects.with_availability():
+            fresh = StockLot.objects.get(id=lot.id)
+            self.assertEqual(lot.available_qty, fresh.qty_available)
+
+
+class FEFOQueryCountTests(TestCase):
+    """Los servicios FEFO no deben hacer una query por lote."""
+
+    LOTS = 40
+
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name='Almacén Principal')
+        self.product = Product.objects.create(
+            code='AVAIL-002',
+            name='Producto Muchos Lotes',
+            price=Decimal('10.00')
+        )
+        today = date.today()
+        StockLot.objects.bulk_create([
+            StockLot(
+                product=self.product,
+                lot_code=f'LOT-{i:03d}',
+                expiry_date=today + timedelta(days=5 + i),
+                qty_on_hand=Decimal('1.000'),
+                unit_cost=Decimal('5.00'),
+                warehouse=self.warehouse
+            )
+            for i in range(self.LOTS)
+        ])
+
+    def test_allocate_lots_fefo_single_query(self):
+        with self.assertNumQueries(1):
+            plan = allocate_lots_fefo(self.product, Decimal('35.000'))
+        self.assertEqual(len(plan), 35)
+
+    def test_allocate_lots_fefo_with_override_single_query(self):
+        last_lot = StockLot.objects.filter(product=self.product).order_by('-expiry_date').first()
+        with self.assertNumQueries(1):
+            plan = allocate_lots_fefo(self.product, Decimal('3.000'), chosen_lot_id=last_lot.id)
+        self.assertEqual(plan[0].lot_id, last_lot.id)
+        self.assertEqual(len(plan), 3)
+
+    def test_pick_lots_fefo_single_query(self):
+        with self.assertNumQueries(1):
+            plan = pick_lots_fefo(self.product, Decimal('12.000'), self.warehouse)
+        self.assertEqual(len(plan), 12)
+
+    def test_get_lot_options_single_query(self):
+        with self.assertNumQueries(1):
+            options = get_lot_options(self.product, Decimal('1.000'))
+        self.assertEqual(len(options), self.LOTS)
+
+    def test_handle_stock_lots_query_constant_queries(self):
+        # producto + lotes (con disponibilidad anotada)
+        with self.assertNumQueries(2):
+            status, data = handle_stock_lots_query(product_id=self.product.id, limit=self.LOTS)
+        self.assertEqual(status, 200)
+        self.assertEqual(data['total_count'], self.LOTS)
+
+
+class QtyReservedCounterTests(TestCase):
+    """El contador qty_reserved sigue el ciclo de vida de las reservas."""
+
+    def setUp(self):
+        warehouse = Warehouse.objects.create(name='Almacén Principal')
+        product = Product.objects.create(code='AVAIL-003', name='Producto Contador', price=Decimal('10.00'))
+        customer = Customer.objects.create(name='Cliente Test')
+        self.order = Order.objects.create(customer=customer, delivery_method='pickup')
+        self.lot = StockLot.objects.create(
+            product=product,
+            lot_code='LOT-CNT',
+            expiry_date=date.today() + timedelta(days=30),
+            qty_on_hand=Decimal('10.000'),
+            unit_cost=Decimal('5.00'),
+            warehouse=warehouse
+        )
+
+    def _qty_reserved(self):
+        self.lot.refresh_from_db(fields=['qty_reserved'])
+        return self.lot.qty_reserved
+
+    def test_create_cancel_apply(self):
+        reservation = Reservation.objects.create(order=self.order, lot=self.lot, qty=Decimal('4.000'))
+        self.assertEqual(self._qty_reserved(), Decimal('4.000'))
+
+        reservation.apply()
+        self.assertEqual(self._qty_reserved(), Decimal('0.000'))
+
+        # Cancelar una reserva ya aplicada no vuelve a descontar
+        reservation.cancel()
+        self.assertEqual(self._qty_reserved(), Decimal('0.000'))
+        self.assertEqual(reservation.status, Reservation.Status.CANCELLED)
+
+    def test_cancel_twice_releases_once(self):
+        reservation = Reservation.objects.create(order=self.order, lot=self.lot, qty=Decimal('4.000'))
+        stale_copy = Reservation.objects.get(id=reservation.id)
+
+        reservation.cancel()
+        stale_copy.cancel()
+        self.assertEqual(self._qty_reserved(), Decimal('0.000'))
+
+    def test_rebuild_command_fixes_drift(self):
+        Reservation.objects.create(order=self.order, lot=self.lot, qty=Decimal('4.000'))
+        StockLot.objects.filter(id=self.lot.id).update(qty_reserved=Decimal('9.000'))
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_reserved_qty', '--verify', stdout=StringIO())
+
+        call_command('rebuild_reserved_qty', stdout=StringIO())
+        self.assertEqual(self._qty_reserved(), Decimal('4.000'))
+        call_command('rebuild_reserved_qty', '--verify', stdout=StringIO())
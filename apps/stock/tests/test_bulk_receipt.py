@@ -0,0 +1,139 @@
+"""Tests para la recepción masiva de stock (receipt_service)."""
+
+import json
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from apps.catalog.models import Product
+from apps.stock.models import Movement, ProductStockSummary, StockLot, Warehouse
+from apps.stock.receipt_service import handle_bulk_receipt_request, parse_receipt_file, receive_bulk
+
+User = get_user_model()
+
+
+class BulkReceiptTests(TestCase):
+    """Upsert de lotes, errores por fila e idempotencia."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='receiver', password='test123')
+        self.warehouse = Warehouse.objects.create(name='Central')
+        self.products = [
+            Product.objects.create(code=f'REC-{i:03d}', name=f'Producto {i}', price=Decimal('10.00'))
+            for i in range(3)
+        ]
+        self.expiry = (date.today() + timedelta(days=90)).isoformat()
+        self.existing_lot = StockLot.objects.create(
+            product=self.products[0],
+            lot_code='L-EXIST',
+            expiry_date=date.today() + timedelta(days=90),
+            qty_on_hand=Decimal('5'),
+            unit_cost=Decimal('2.00'),
+            warehouse=self.warehouse
+        )
+
+    def _row(self, code, lot_code, qty='10', **overrides):
+        row = {
+            'product_code': code,
+            'lot_code': lot_code,
+            'expiry_date': self.expiry,
+            'qty': qty,
+            'unit_cost': '2.50',
+            'warehouse': 'Central',
+        }
+        row.update(overrides)
+        return row
+
+    def test_upserts_lots_and_creates_movements(self):
+        rows = [
+            self._row('REC-000', 'L-EXIST', '7'),
+            self._row('REC-001', 'L-NEW'),
+            self._row('REC-001', 'L-NEW', '3'),  # misma línea de lote repetida en el archivo
+            self._row('REC-002', 'L-NEW', '4', warehouse=str(self.warehouse.id)),
+        ]
+
+        # lotes previos + insert de los nuevos + lock + update,
+        # + índice de vencimientos (agregado + upsert)
+        # + lock del resumen (claves nuevas: lock, alta y lock)
+        with self.assertNumQueries(16):
+            result = receive_bulk(rows, user_id=self.user.id)
+
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.rows_applied, 4)
+        self.assertEqual(result.lots_created, 2)
+        self.assertEqual(result.lots_updated, 1)
+        self.assertEqual(result.movements_created, 4)
+
+        self.existing_lot.refresh_from_db()
+        self.assertEqual(self.existing_lot.qty_on_hand, Decimal('12'))
+        self.assertEqual(StockLot.objects.get(product=self.products[1], lot_code='L-NEW').qty_on_hand, Decimal('13'))
+        self.assertEqual(Movement.objects.filter(type=Movement.Type.ENTRY).count(), 4)
+        self.assertEqual(
+            ProductStockSummary.objects.get(product=self.products[1], warehouse=self.warehouse).on_hand,
+            Decimal('13')
+        )
+
+    def test_row_errors_reject_whole_receipt(self):
+        rows = [
+            self._row('REC-001', 'L-OK'),
+            self._row('NOPE', 'L-X'),
+            self._row('REC-002', 'L-Y', qty='0'),
+            self._row('REC-000', 'L-EXIST', expiry_date=date.today().isoformat()),
+        ]
+
+        result = receive_bulk(rows, user_id=self.user.id)
+
+        self.assertEqual(result.rows_applied, 0)
+        self.assertEqual([(e.row, e.error) for e in result.errors], [
+            (2, 'NOT_FOUND'), (3, 'VALIDATION_ERROR'), (4, 'INCONSISTENT_LOT'),
+        ])
+        self.assertFalse(StockLot.objects.filter(lot_code='L-OK').exists())
+
+        partial = receive_bulk(rows, user_id=self.user.id, allow_partial=True)
+        self.assertEqual(partial.rows_applied, 1)
+        self.assertEqual(len(partial.errors), 3)
+        self.assertTrue(StockLot.objects.filter(lot_code='L-OK').exists())
+
+    def test_parse_csv(self):
+        content = (
+            'product_code,lot_code,expiry_date,qty,unit_cost,warehouse\n'
+            f'REC-001,L-CSV,{self.expiry},2.5,1.10,Central\n'
+        )
+        rows = parse_receipt_file(content, 'csv')
+        result = receive_bulk(rows, user_id=self.user.id)
+
+        self.assertEqual(result.rows_applied, 1)
+        self.assertEqual(StockLot.objects.get(lot_code='L-CSV').qty_on_hand, Decimal('2.5'))
+
+        with self.assertRaises(ValueError):
+            parse_receipt_file('product_code,qty\nREC-001,1\n', 'csv')
+
+    def test_idempotent_retry_does_not_duplicate_stock(self):
+        rows = [self._row('REC-001', 'L-IDEM')]
+
+        status, first = handle_bulk_receipt_request(self.user, rows, 'receipt-key-1')
+        status_retry, retry = handle_bulk_receipt_request(self.user, rows, 'receipt-key-1')
+
+        self.assertEqual((status, status_retry), (201, 201))
+        self.assertEqual(first, retry)
+        self.assertEqual(StockLot.objects.get(lot_code='L-IDEM').qty_on_hand, Decimal('10'))
+
+        status_conflict, error = handle_bulk_receipt_request(self.user, [self._row('REC-002', 'L-OTHER')], 'receipt-key-1')
+        self.assertEqual(status_conflict, 400)
+        self.assertEqual(error['error'], 'IDEMPOTENCY_ERROR')
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as handle:
+            json.dump({'rows': [self._row('REC-002', 'L-CMD', '6')]}, handle)
+
+        call_command('import_stock_receipt', handle.name, '--user', 'receiver',
+                     '--idempotency-key', 'cmd-1', stdout=StringIO())
+        call_command('import_stock_receipt', handle.name, '--user', 'receiver',
+                     '--idempotency-key', 'cmd-1', stdout=StringIO())
+
+        self.assertEqual(StockLot.objects.get(lot_code='L-CMD').qty_on_hand, Decimal('6'))
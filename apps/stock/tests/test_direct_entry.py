@@ -0,0 +1,144 @@
+"""Tests para el modo directo de las entradas v2 y su benchmark."""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from apps.catalog.models import Product
+from apps.stock.benchmarks import EntryBenchmarkResult, run_entry_benchmark
+from apps.stock.events import StockEntryCompleted, StockEntryRequested, StockUpdated
+from apps.stock.models import Movement, StockLot, Warehouse
+from apps.stock.services import handle_stock_entry_request, request_stock_entry
+
+User = get_user_model()
+
+
+@patch('apps.stock.services.publish_many_sync', return_value=2)
+class DirectStockEntryTests(TestCase):
+    """El modo directo persiste en línea y publica los eventos después del commit."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='direct', password='test123')
+        self.warehouse = Warehouse.objects.create(name='Central')
+        self.product = Product.objects.create(code='DIR-001', name='Producto Directo', price=Decimal('1.00'))
+        self.payload = {
+            'product_id': self.product.id,
+            'lot_code': 'DIR-L1',
+            'expiry_date': date.today() + timedelta(days=60),
+            'qty': Decimal('5'),
+            'unit_cost': Decimal('2.00'),
+            'warehouse_id': self.warehouse.id,
+        }
+
+    def _entry(self, key, **kwargs):
+        return handle_stock_entry_request(request_user=self.user, payload_data=self.payload, idempotency_key=key, **kwargs)
+
+    def test_direct_mode_per_call(self, publish):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            status_code, data = self._entry('direct-1', mode='direct')
+
+        self.assertEqual(status_code, 201)
+        self.assertEqual(data['status'], 'completed')
+        lot = StockLot.objects.get(id=data['lot_id'])
+        self.assertEqual(lot.qty_on_hand, Decimal('5'))
+        self.assertTrue(Movement.objects.filter(id=data['movement_id'], type=Movement.Type.ENTRY).exists())
+
+        self.assertEqual(len(callbacks), 1)
+        completed, updated = publish.call_args.args[0]
+        self.assertIsInstance(completed, StockEntryCompleted)
+        self.assertEqual(completed.total_cost, Decimal('10.00'))
+        self.assertIsInstance(updated, StockUpdated)
+        self.assertEqual((updated.old_quantity, updated.new_quantity), (Decimal('0'), Decimal('5')))
+
+        # La repetición se sirve por idempotencia sin otra entrada
+        self.assertEqual(self._entry('direct-1', mode='direct'), (201, data))
+        self.assertEqual(StockLot.objects.get(id=lot.id).qty_on_hand, Decimal('5'))
+
+    @override_settings(STOCK_ENTRY_MODE='direct')
+    def test_mode_from_settings_and_business_errors(self, publish):
+        status_code, _ = self._entry('direct-2')
+        self.assertEqual(status_code, 201)
+
+        self.payload['expiry_date'] = date.today() + timedelta(days=61)
+        status_code, data = self._entry('direct-3')
+        self.assertEqual((status_code, data['error']), (400, 'INCONSISTENT_LOT'))
+
+        status_code, data = self._entry('direct-4', mode='unknown')
+        self.assertEqual((status_code, data['error']), (400, 'VALIDATION_ERROR'))
+
+    def test_notification_failure_does_not_undo_the_entry(self, publish):
+        publish.side_effect = RuntimeError('bus down')
+        with self.captureOnCommitCallbacks(execute=True):
+            status_code, data = self._entry('direct-5', mode='direct')
+
+        self.assertEqual(status_code, 201)
+        self.assertTrue(StockLot.objects.filter(id=data['lot_id']).exists())
+
+
+@patch('apps.stock.services.publish_many_sync', return_value=2)
+class EntryBenchmarkTests(TestCase):
+    """El benchmark reporta percentiles y limpia sus datos temporales."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_direct_benchmark(self, publish):
+        result = run_entry_benchmark('direct', iterations=5)
+
+        self.assertEqual((result.succeeded, result.errors, result.lots_written), (5, 0, 5))
+        self.assertLessEqual(result.p50_ms, result.p99_ms)
+        self.assertFalse(Product.objects.filter(code__startswith='BENCH-E-').exists())
+
+    def test_benchmark_command(self, publish):
+        out = StringIO()
+        call_command('benchmark_stock_entry', iterations=2, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('events', output)
+        self.assertIn('direct', output)
+        self.assertEqual(output.count(' p99='), 2)
+        # Sin bus de eventos en los tests la cadena no persiste lotes: no se comparan latencias
+        self.assertIn('Sin comparación', output)
+        self.assertNotIn(' p50 x', output)
+
+    def test_benchmark_command_compares_when_lots_match(self, publish):
+        def result(mode, p50):
+            return EntryBenchmarkResult(mode, 2, 2, 0, 2, p50, p50 * 2, 0.1)
+
+        out = StringIO()
+        with patch(
+            'apps.stock.management.commands.benchmark_stock_entry.run_entry_benchmark',
+            side_effect=lambda mode, iterations: result(mode, 4.0 if mode == 'events' else 1.0)
+        ):
+            call_command('benchmark_stock_entry', iterations=2, stdout=out)
+
+        self.assertIn('events/direct p50 x4.00 p99 x4.00', out.getvalue())
+
+
+class RequestStockEntryTests(TestCase):
+    """request_stock_entry arma StockEntryRequested con los campos del evento."""
+
+    @patch('apps.stock.services.publish_sync', side_effect=lambda event: str(event.event_id))
+    def test_event_fields(self, publish):
+        expiry_date = date.today() + timedelta(days=30)
+        event_id = request_stock_entry(
+            product_id=7, lot_code='REQ-L1', expiry_date=expiry_date, qty=Decimal('3'),
+            unit_cost=Decimal('2.50'), user_id=9, warehouse_id=4, correlation_id='entry-key'
+        )
+
+        event = publish.call_args.args[0]
+        self.assertIsInstance(event, StockEntryRequested)
+        self.assertEqual(event_id, str(event.event_id))
+        self.assertEqual(event.aggregate_id, event.entry_id)
+        self.assertEqual(
+            (event.product_id, event.lot_code, event.expiry_date, event.quantity, event.unit_cost),
+            ('7', 'REQ-L1', expiry_date, Decimal('3'), Decimal('2.50'))
+        )
+        self.assertEqual((event.warehouse_id, event.received_by, event.correlation_id), ('4', '9', 'entry-key'))
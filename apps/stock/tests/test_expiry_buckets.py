@@ -0,0 +1,193 @@
+"""Tests para el índice de vencimientos por (producto, depósito, rango)."""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from apps.catalog.models import Product
+from apps.stock.expiry_bucket_service import (
+    buckets_within,
+    near_expiry_buckets,
+    near_expiry_lot_counts,
+    near_expiry_lots,
+    roll_expiry_buckets,
+)
+from apps.stock.models import ExpiryBucket, StockLot, Warehouse
+from apps.stock.services import create_entry, create_exit
+
+User = get_user_model()
+
+
+class ExpiryBucketTests(TestCase):
+    """El índice se mantiene en entradas/salidas y se corre con el job nocturno."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='expiry', password='test123')
+        self.warehouse = Warehouse.objects.create(name='Central')
+        self.product = Product.objects.create(
+            code='EXP-001', name='Producto Vencimiento', price=Decimal('10.00'), category='lacteos'
+        )
+        self.today = date.today()
+
+    def _entry(self, lot_code, qty, days):
+        return create_entry(
+            product=self.product,
+            lot_code=lot_code,
+            expiry_date=self.today + timedelta(days=days),
+            qty=Decimal(qty),
+            unit_cost=Decimal('5.00'),
+            warehouse=self.warehouse,
+            created_by=self.user
+        )
+
+    def _buckets(self):
+        return {
+            bucket.bucket: (bucket.qty, bucket.lot_count, bucket.nearest_expiry)
+            for bucket in ExpiryBucket.objects.filter(product=self.product, warehouse=self.warehouse)
+        }
+
+    def test_entries_and_exits_update_buckets(self):
+        self._entry('LOT-A', '10', 3)
+        self._entry('LOT-B', '5', 7)
+        self._entry('LOT-C', '8', 20)
+        self._entry('LOT-D', '4', 200)  # fuera del índice
+
+        buckets = self._buckets()
+        self.assertEqual(buckets['0-7'], (Decimal('15'), 2, self.today + timedelta(days=3)))
+        self.assertEqual(buckets['8-30'], (Decimal('8'), 1, self.today + timedelta(days=20)))
+        self.assertEqual(buckets['31-90'], (Decimal('0'), 0, None))
+
+        # FEFO consume LOT-A completo y 2 de LOT-B
+        create_exit(product=self.product, qty_total=Decimal('12'), warehouse=self.warehouse, created_by=self.user)
+
+        buckets = self._buckets()
+        self.assertEqual(buckets['0-7'], (Decimal('3'), 1, self.today + timedelta(days=7)))
+        self.assertEqual(buckets['8-30'], (Decimal('8'), 1, self.today + timedelta(days=20)))
+
+    def test_roll_moves_lots_to_their_new_bucket(self):
+        self._entry('LOT-A', '10', 9)
+        self._entry('LOT-B', '5', 2)
+        self.assertEqual(self._buckets()['8-30'][1], 1)
+
+        # Dos días después LOT-A pasa a 0-7 y LOT-B sigue vigente
+        result = roll_expiry_buckets(self.today + timedelta(days=2))
+
+        buckets = self._buckets()
+        self.assertEqual(buckets['0-7'], (Decimal('15'), 2, self.today + timedelta(days=2)))
+        self.assertNotIn('8-30', buckets)
+        self.assertEqual(result['buckets'], 1)
+
+        # Vencidos todos, el índice queda vacío
+        roll_expiry_buckets(self.today + timedelta(days=10))
+        self.assertEqual(self._buckets(), {})
+
+    def test_roll_in_product_batches(self):
+        self._entry('LOT-A', '10', 9)
+        other = Product.objects.create(code='EXP-003', name='Otro', price=Decimal('1.00'))
+        StockLot.objects.create(
+            product=other, lot_code='RAW', expiry_date=self.today + timedelta(days=3),
+            qty_on_hand=Decimal('2'), unit_cost=Decimal('1.00'), warehouse=self.warehouse
+        )
+
+        # productos (2) + 2 tandas (savepoint, agregado, upsert, borrado, release)
+        with self.assertNumQueries(2 + 2 * 5):
+            result = roll_expiry_buckets(self.today + timedelta(days=2), batch_size=1)
+
+        self.assertEqual(result['buckets'], 2)
+        self.assertEqual(self._buckets()['0-7'][1], 1)
+        self.assertTrue(ExpiryBucket.objects.filter(product=other, bucket='0-7', lot_count=1).exists())
+
+    def test_near_expiry_lots_only_scans_indexed_keys(self):
+        self._entry('LOT-A', '10', 5)
+        self._entry('LOT-B', '5', 25)
+        # Lote cargado por fuera de los servicios: no está en el índice
+        other = Product.objects.create(code='EXP-002', name='Otro', price=Decimal('1.00'))
+        StockLot.objects.create(
+            product=other, lot_code='RAW', expiry_date=self.today + timedelta(days=2),
+            qty_on_hand=Decimal('1'), unit_cost=Decimal('1.00'), warehouse=self.warehouse
+        )
+
+        self.assertEqual(buckets_within(7), ['0-7'])
+        self.assertEqual(list(near_expiry_lots(7).values_list('lot_code', flat=True)), ['LOT-A'])
+        self.assertEqual(
+            sorted(near_expiry_lots(30).values_list('lot_code', flat=True)), ['LOT-A', 'LOT-B']
+        )
+        self.assertEqual(near_expiry_buckets(30).count(), 2)
+        self.assertEqual(near_expiry_lot_counts(30), {('lacteos', '0-7'): 1, ('lacteos', '8-30'): 1})
+
+    def test_near_expiry_lots_with_stale_index_falls_back_to_dates(self):
+        # Índice calculado ayer: el lote estaba a 8 días, en 8-30
+        with patch('apps.stock.expiry_bucket_service.timezone.localdate',
+                   return_value=self.today - timedelta(days=1)):
+            self._entry('LOT-A', '10', 7)
+        self.assertEqual(self._buckets()['8-30'][1], 1)
+        self.assertEqual(self._buckets()['0-7'][1], 0)
+
+        # Hoy vence en 7 días aunque el roll todavía no corrió
+        self.assertEqual(list(near_expiry_lots(7).values_list('lot_code', flat=True)), ['LOT-A'])
+
+        roll_expiry_buckets(self.today)
+        self.assertEqual(self._buckets()['0-7'][1], 1)
+        self.assertEqual(list(near_expiry_lots(7).values_list('lot_code', flat=True)), ['LOT-A'])
+
+    def test_update_metrics_reads_counts_from_index(self):
+        self._entry('LOT-A', '10', 5)
+
+        out = StringIO()
+        call_command('update_metrics', stdout=out)
+
+        self.assertIn('lacteos (0-7 días): 1 lotes', out.getvalue())
+
+
+class ScanNearExpiryTests(TestCase):
+    """El scan recorre los lotes en streaming y publica un lote de eventos por chunk."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='scanner', password='test123')
+        self.warehouse = Warehouse.objects.create(name='Central')
+        self.today = date.today()
+        for code, days_list in (('SCN-A', (1, 4)), ('SCN-B', (2,)), ('SCN-C', (6, 30))):
+            product = Product.objects.create(code=code, name=f'Producto {code}', price=Decimal('1.00'))
+            for index, days in enumerate(days_list):
+                create_entry(
+                    product=product, lot_code=f'{code}-{index}', expiry_date=self.today + timedelta(days=days),
+                    qty=Decimal('5'), unit_cost=Decimal('1.00'), warehouse=self.warehouse, created_by=self.user
+                )
+
+    def test_streams_lots_and_publishes_one_batch_per_chunk(self):
+        from apps.stock import tasks
+
+        with patch.object(tasks, 'SCAN_CHUNK_SIZE', 2), \
+                patch.object(tasks, 'publish_many_sync') as publish, \
+                self.assertNumQueries(1):
+            result = tasks.scan_near_expiry(days_ahead=7)
+
+        self.assertEqual(result['products_found'], 3)
+        self.assertEqual(result['lots_found'], 4)
+        self.assertEqual(result['alerts_sent'], 3)
+        self.assertEqual(result['products'], ['Producto SCN-A', 'Producto SCN-B', 'Producto SCN-C'])
+
+        # SCN-A (2 lotes) llena el primer chunk; SCN-B y SCN-C van en el segundo
+        batches = [call.args[0] for call in publish.call_args_list]
+        self.assertEqual([len(batch) for batch in batches], [3, 4])
+        warning, notification = batches[0][0], batches[0][2]
+        self.assertEqual(warning.lot_code, 'SCN-A-0')
+        self.assertEqual(warning.days_until_expiry, 1)
+        self.assertEqual(notification.notification_type, 'expiry_warning')
+        self.assertEqual(notification.metadata['total_quantity'], 10.0)
+        self.assertEqual(notification.priority, 'high')
+
+    def test_failed_batches_are_counted_and_scan_continues(self):
+        from apps.stock import tasks
+
+        with patch.object(tasks, 'publish_many_sync', side_effect=RuntimeError('bus down')):
+            result = tasks.scan_near_expiry(days_ahead=7)
+
+        self.assertEqual(result['products_found'], 3)
+        self.assertEqual(result['alerts_sent'], 0)
+        self.assertEqual(result['events_failed'], 7)
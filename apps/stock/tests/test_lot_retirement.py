@@ -0,0 +1,95 @@
+"""Tests para el retiro por lotes de lotes vencidos y agotados."""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from apps.catalog.models import Product
+from apps.stock.archive_service import retire_expired_lots
+from apps.stock.models import Movement, StockLot, StockLotArchive, Warehouse
+from apps.stock.services import create_entry
+
+User = get_user_model()
+
+
+class LotRetirementTests(TestCase):
+    """Se marcan los lotes referenciados y se mueven al archivo los que no."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='retirer', password='test123')
+        self.warehouse = Warehouse.objects.create(name='Central')
+        self.product = Product.objects.create(code='RET-001', name='Producto Retiro', price=Decimal('10.00'))
+        self.today = date.today()
+
+    def _lot(self, lot_code, days, qty='0', reserved='0'):
+        return StockLot.objects.create(
+            product=self.product, lot_code=lot_code, expiry_date=self.today + timedelta(days=days),
+            qty_on_hand=Decimal(qty), qty_reserved=Decimal(reserved), unit_cost=Decimal('2.00'),
+            warehouse=self.warehouse
+        )
+
+    def test_flags_referenced_lots_and_moves_unreferenced_ones(self):
+        empty = self._lot('L-EMPTY', -10)
+        referenced = self._lot('L-REF', -5)
+        Movement.objects.create(
+            type=Movement.Type.EXIT, product=self.product, lot=referenced, qty=Decimal('1'),
+            unit_cost=Decimal('2.00'), reason='sale', created_by=self.user
+        )
+        with_stock = self._lot('L-STOCK', -3, qty='4')
+        current = self._lot('L-CURRENT', 30)
+
+        result = retire_expired_lots(self.today, batch_size=1)
+
+        self.assertEqual(result['lots_flagged'], 2)
+        self.assertEqual(result['lots_moved'], 1)
+        self.assertEqual(result['batches'], 2)
+        self.assertEqual(
+            set(StockLot.objects.values_list('id', flat=True)), {referenced.id, with_stock.id, current.id}
+        )
+        self.assertTrue(StockLot.objects.get(id=referenced.id).is_archived)
+        self.assertFalse(StockLot.objects.filter(is_archived=True).exclude(id=referenced.id).exists())
+
+        archived = StockLotArchive.objects.get(id=empty.id)
+        self.assertEqual(archived.lot_code, 'L-EMPTY')
+        self.assertEqual(archived.expiry_date, empty.expiry_date)
+        self.assertEqual(archived.unit_cost, Decimal('2.00'))
+
+        # Liberadas las referencias, la próxima corrida mueve el lote ya marcado
+        Movement.objects.filter(lot=referenced).delete()
+        result = retire_expired_lots(self.today)
+        self.assertEqual((result['lots_flagged'], result['lots_moved']), (0, 1))
+        self.assertTrue(StockLotArchive.objects.filter(id=referenced.id).exists())
+
+        # Sin candidatos no se recorre nada
+        self.assertEqual(retire_expired_lots(self.today)['batches'], 0)
+
+    def test_reentry_revives_an_archived_lot(self):
+        create_entry(
+            product=self.product, lot_code='L-BACK', expiry_date=self.today - timedelta(days=2),
+            qty=Decimal('3'), unit_cost=Decimal('2.00'), warehouse=self.warehouse, created_by=self.user
+        )
+        StockLot.objects.filter(lot_code='L-BACK').update(qty_on_hand=0)
+        retire_expired_lots(self.today)
+        self.assertTrue(StockLot.objects.get(lot_code='L-BACK').is_archived)
+
+        create_entry(
+            product=self.product, lot_code='L-BACK', expiry_date=self.today - timedelta(days=2),
+            qty=Decimal('1'), unit_cost=Decimal('2.00'), warehouse=self.warehouse, created_by=self.user
+        )
+
+        lot = StockLot.objects.get(lot_code='L-BACK')
+        self.assertFalse(lot.is_archived)
+        self.assertEqual(lot.qty_on_hand, Decimal('1'))
+
+    def test_cleanup_task_reports_retired_lots(self):
+        from apps.stock.tasks import cleanup_expired_lots
+
+        self._lot('L-OLD', -1)
+
+        result = cleanup_expired_lots()
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['lots_cleaned'], 1)
+        self.assertFalse(StockLot.objects.exists())
@@ -0,0 +1,94 @@
+"""Tests para la detección de stock bajo por producto."""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from apps.catalog.models import Product
+from apps.notifications.models import Notification
+from apps.notifications.services import generate_low_stock_alerts
+from apps.stock.low_stock_service import detect_low_stock
+from apps.stock.models import Warehouse
+from apps.stock.services import create_entry
+
+User = get_user_model()
+
+
+@override_settings(LOW_STOCK_THRESHOLD_DEFAULT=10)
+class LowStockDetectionTests(TestCase):
+    """Una query agrupada compara el total de cada producto con su propio umbral."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='lowstock', password='test123')
+        self.central = Warehouse.objects.create(name='Central')
+        self.norte = Warehouse.objects.create(name='Norte')
+        # Umbral propio 50: 30 + 15 en dos depósitos => bajo
+        self.milk = self._product('LOW-MILK', 'Leche', threshold='50')
+        self._entry(self.milk, self.central, '30')
+        self._entry(self.milk, self.norte, '15')
+        # Umbral propio 5: 8 => ok aunque esté bajo el umbral por defecto
+        self.salt = self._product('LOW-SALT', 'Sal', threshold='5')
+        self._entry(self.salt, self.central, '8')
+        # Sin umbral propio (10): 4 en dos lotes => bajo por lote y por total
+        self.rice = self._product('LOW-RICE', 'Arroz')
+        self._entry(self.rice, self.central, '2')
+        self._entry(self.rice, self.central, '2')
+        # Sin umbral propio: 12 => ok
+        self.beans = self._product('LOW-BEAN', 'Porotos')
+        self._entry(self.beans, self.norte, '12')
+        # Sin stock
+        self.oil = self._product('LOW-OIL', 'Aceite')
+        # Inactivo
+        self._product('LOW-OFF', 'Inactivo', is_active=False)
+
+    def _product(self, code, name, threshold=None, is_active=True):
+        return Product.objects.create(
+            code=code, name=name, price=Decimal('1.00'), is_active=is_active,
+            low_stock_threshold=Decimal(threshold) if threshold else None
+        )
+
+    def _entry(self, product, warehouse, qty):
+        create_entry(
+            product=product, lot_code=f'{product.code}-{warehouse.id}-{qty}',
+            expiry_date=date.today() + timedelta(days=60), qty=Decimal(qty),
+            unit_cost=Decimal('1.00'), warehouse=warehouse, created_by=self.user
+        )
+
+    def test_detects_by_product_total_and_threshold_in_one_query(self):
+        with self.assertNumQueries(1):
+            items = list(detect_low_stock())
+
+        self.assertEqual(
+            [(item.product_code, item.on_hand, item.threshold) for item in items],
+            [
+                ('LOW-OIL', Decimal('0'), Decimal('10')),
+                ('LOW-RICE', Decimal('4'), Decimal('10')),
+                ('LOW-MILK', Decimal('45'), Decimal('50')),
+            ]
+        )
+        self.assertEqual(items[2].shortage, Decimal('5'))
+
+        codes = [item.product_code for item in detect_low_stock(Decimal('3'), include_out_of_stock=False)]
+        self.assertEqual(codes, ['LOW-MILK'])
+
+    def test_task_and_notifications_share_the_detector(self):
+        from apps.stock.tasks import scan_low_stock
+
+        with patch('apps.stock.tasks.publish_many_sync') as publish:
+            result = scan_low_stock()
+
+        self.assertEqual(result['products'], ['Aceite', 'Arroz', 'Leche'])
+        self.assertEqual(publish.call_count, 1)
+        self.assertEqual(len(publish.call_args.args[0]), 6)
+
+        generated = generate_low_stock_alerts()
+
+        # Un aviso por producto (no por lote); sin stock no se avisa
+        self.assertEqual(generated.created, 2)
+        payloads = {n.payload['product_id']: n.payload for n in Notification.objects.filter(event='low_stock')}
+        self.assertEqual(set(payloads), {self.rice.id, self.milk.id})
+        self.assertEqual(payloads[self.milk.id]['threshold'], 50.0)
+        self.assertEqual(payloads[self.milk.id]['current_stock'], 45.0)
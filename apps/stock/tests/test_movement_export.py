@@ -0,0 +1,80 @@
+"""Tests para la exportación en streaming de movimientos."""
+
+import csv
+import io
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from apps.catalog.models import Product
+from apps.stock.export_service import EXPORT_COLUMNS, stream_movements
+from apps.stock.models import Movement, StockLot, Warehouse
+
+User = get_user_model()
+
+
+class MovementExportTests(TestCase):
+    """CSV/NDJSON con filtros, sin cargar el queryset completo."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='exporter', password='test123')
+        self.central = Warehouse.objects.create(name='Central')
+        self.north = Warehouse.objects.create(name='Norte')
+        self.product = Product.objects.create(code='EXP-001', name='Producto Export', price=Decimal('10.00'))
+        other = Product.objects.create(code='EXP-002', name='Otro', price=Decimal('10.00'))
+
+        def lot(product, warehouse, code):
+            return StockLot.objects.create(
+                product=product, lot_code=code, expiry_date=date.today() + timedelta(days=30),
+                qty_on_hand=Decimal('10'), unit_cost=Decimal('2.00'), warehouse=warehouse
+            )
+
+        central_lot = lot(self.product, self.central, 'L-C')
+        north_lot = lot(self.product, self.north, 'L-N')
+        other_lot = lot(other, self.central, 'L-O')
+
+        for stock_lot, reason in [(central_lot, 'purchase'), (north_lot, 'purchase'), (other_lot, 'adjustment')]:
+            Movement.objects.create(
+                type=Movement.Type.ENTRY, product=stock_lot.product, lot=stock_lot, qty=Decimal('10'),
+                unit_cost=Decimal('2.00'), reason=reason, created_by=user
+            )
+
+    def test_csv_includes_header_and_joined_columns(self):
+        content = ''.join(stream_movements('csv'))
+        rows = list(csv.DictReader(io.StringIO(content)))
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(list(rows[0].keys()), [name for name, _, _ in EXPORT_COLUMNS])
+        self.assertEqual(rows[0]['product_code'], 'EXP-001')
+        self.assertEqual(rows[0]['warehouse_name'], 'Central')
+        self.assertEqual(rows[0]['created_by'], 'exporter')
+
+    def test_ndjson_filters(self):
+        lines = list(stream_movements('ndjson', product_id=self.product.id, warehouse_id=self.north.id))
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['lot_code'], 'L-N')
+
+        self.assertEqual(len(list(stream_movements('ndjson', reason='adjustment'))), 1)
+        self.assertEqual(len(list(stream_movements('ndjson', date_to=date.today() - timedelta(days=1)))), 0)
+        self.assertEqual(len(list(stream_movements('ndjson', date_from=date.today(), date_to=date.today()))), 3)
+
+    def test_rows_come_from_a_single_iterator_query(self):
+        # Con chunk_size pequeño igual es una sola query (SQLite no tiene cursores del servidor)
+        with self.assertNumQueries(1):
+            lines = list(stream_movements('ndjson', chunk_size=1))
+        self.assertEqual(len(lines), 3)
+
+    def test_invalid_format(self):
+        with self.assertRaises(ValueError):
+            stream_movements('xml')
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_movements', '--format', 'csv', '--reason', 'purchase', stdout=out)
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual(len(rows), 2)
@@ -0,0 +1,153 @@
+"""Tests para las reservas en bloque y el vencimiento de reservas."""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from ninja.testing import TestClient
+
+from apps.catalog.models import Product
+from apps.customers.models import Customer
+from apps.orders.models import Order
+from apps.orders.picking_api import picking_router
+from apps.stock.models import ProductStockSummary, StockLot, Warehouse
+from apps.stock.reservation_service import ReservationUnavailable, expire_stale_reservations, reserve_lots
+from apps.stock.reservations import Reservation
+
+
+class BulkReservationTests(TestCase):
+    """Una orden reemplaza sus reservas con bloqueo, validación y alta en bloque."""
+
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name='Central')
+        self.product = Product.objects.create(code='RSV-001', name='Producto Reserva', price=Decimal('10.00'))
+        customer = Customer.objects.create(name='Cliente Reserva')
+        self.order = Order.objects.create(customer=customer, delivery_method='pickup')
+        self.other_order = Order.objects.create(customer=customer, delivery_method='pickup')
+        self.lots = [
+            StockLot.objects.create(
+                product=self.product, lot_code=f'RSV-{index}', expiry_date=date.today() + timedelta(days=30 + index),
+                qty_on_hand=Decimal('10'), unit_cost=Decimal('5.00'), warehouse=self.warehouse
+            )
+            for index in range(3)
+        ]
+
+    def _reserved(self):
+        return [StockLot.objects.get(id=lot.id).qty_reserved for lot in self.lots]
+
+    def test_replaces_reservations_with_bounded_queries(self):
+        Reservation.objects.create(order=self.other_order, lot=self.lots[0], qty=Decimal('4'))
+        Reservation.objects.create(order=self.order, lot=self.lots[2], qty=Decimal('2'))
+
+        lines = [
+            {'lot_id': self.lots[0].id, 'qty': Decimal('6')},
+            {'lot_id': self.lots[1].id, 'qty': Decimal('3')},
+            {'lot_id': self.lots[1].id, 'qty': Decimal('2')},
+        ]
+        # Orden, reservas propias, lotes, reservas ajenas, borrado, alta y qty_reserved (7),
+        # lock del resumen, resumen + índice de vencimientos (5) y savepoint (2)
+        with self.assertNumQueries(14):
+            result = reserve_lots(self.order, lines, ttl_minutes=15)
+
+        self.assertEqual(result.total_reserved, Decimal('11'))
+        self.assertEqual(
+            sorted((r.lot_id, r.qty) for r in Reservation.objects.filter(order=self.order)),
+            [(self.lots[0].id, Decimal('6')), (self.lots[1].id, Decimal('5'))]
+        )
+        self.assertTrue(all(r.expires_at for r in result.reservations))
+        # El lote 2 libera la reserva reemplazada
+        self.assertEqual(self._reserved(), [Decimal('10'), Decimal('5'), Decimal('0')])
+        summary = ProductStockSummary.objects.get(product=self.product, warehouse=self.warehouse)
+        self.assertEqual(summary.reserved, Decimal('15'))
+
+    def test_rejects_requests_over_availability_without_changes(self):
+        Reservation.objects.create(order=self.other_order, lot=self.lots[0], qty=Decimal('8'))
+        Reservation.objects.create(order=self.order, lot=self.lots[1], qty=Decimal('1'))
+
+        with self.assertRaises(ReservationUnavailable) as ctx:
+            reserve_lots(self.order, [{'lot_id': self.lots[0].id, 'qty': Decimal('3')}, {'lot_id': 999999, 'qty': 1}])
+
+        self.assertEqual(ctx.exception.code, 'INSUFFICIENT_STOCK')
+        self.assertEqual(ctx.exception.availability_check[str(self.lots[0].id)]['available'], Decimal('2'))
+        self.assertIn('Lote ID 999999 no existe', ctx.exception.errors)
+        self.assertEqual(Reservation.objects.filter(order=self.order).count(), 1)
+        self.assertEqual(self._reserved(), [Decimal('8'), Decimal('1'), Decimal('0')])
+
+    @override_settings(RESERVATION_TTL_MINUTES=30)
+    def test_endpoint_uses_bulk_service_and_default_ttl(self):
+        client = TestClient(picking_router)
+
+        response = client.post(
+            f"/{self.order.id}/reserve",
+            json={'reservations': [{'lot_id': self.lots[0].id, 'qty': '4'}]}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['reservations'][0]['lot_code'], 'RSV-0')
+        self.assertIsNotNone(data['reservations'][0]['expires_at'])
+
+        response = client.post(
+            f"/{self.order.id}/reserve",
+            json={'reservations': [{'lot_id': self.lots[0].id, 'qty': '11'}]}
+        )
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()['error'], 'INSUFFICIENT_STOCK')
+
+
+class ReservationExpiryTests(TestCase):
+    """El barrido cancela en bloque las reservas PENDING vencidas."""
+
+    def setUp(self):
+        warehouse = Warehouse.objects.create(name='Central')
+        product = Product.objects.create(code='EXPR-001', name='Producto Vencimiento', price=Decimal('10.00'))
+        customer = Customer.objects.create(name='Cliente Vencimiento')
+        self.orders = [Order.objects.create(customer=customer, delivery_method='pickup') for _ in range(3)]
+        self.lot = StockLot.objects.create(
+            product=product, lot_code='EXPR-A', expiry_date=date.today() + timedelta(days=30),
+            qty_on_hand=Decimal('20'), unit_cost=Decimal('5.00'), warehouse=warehouse
+        )
+
+    def test_sweeper_cancels_stale_pending_reservations(self):
+        now = timezone.now()
+        stale = [
+            Reservation.objects.create(
+                order=order, lot=self.lot, qty=Decimal('3'), expires_at=now - timedelta(minutes=1)
+            )
+            for order in self.orders[:2]
+        ]
+        fresh = Reservation.objects.create(
+            order=self.orders[2], lot=self.lot, qty=Decimal('4'), expires_at=now + timedelta(minutes=10)
+        )
+        self.lot.refresh_from_db()
+        self.assertEqual(self.lot.qty_reserved, Decimal('10'))
+
+        result = expire_stale_reservations(now=now, batch_size=1)
+
+        self.assertEqual(result['reservations_expired'], 2)
+        self.assertEqual(result['batches'], 2)
+        self.assertEqual(
+            set(Reservation.objects.filter(status=Reservation.Status.CANCELLED).values_list('id', flat=True)),
+            {reservation.id for reservation in stale}
+        )
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.status, Reservation.Status.PENDING)
+        self.lot.refresh_from_db()
+        self.assertEqual(self.lot.qty_reserved, Decimal('4'))
+
+        # Nada más para vencer
+        self.assertEqual(expire_stale_reservations(now=now)['reservations_expired'], 0)
+
+    def test_task_reports_expired_reservations(self):
+        from apps.stock.tasks import expire_reservations
+
+        Reservation.objects.create(
+            order=self.orders[0], lot=self.lot, qty=Decimal('2'),
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        result = expire_reservations()
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['reservations_expired'], 1)
@@ -0,0 +1,135 @@
+"""Tests para los scans incrementales con marca de agua."""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.catalog.models import Product
+from apps.stock import tasks
+from apps.stock.models import Movement, StockLot, StockScanWatermark, Warehouse
+from apps.stock.services import create_entry, create_exit
+from apps.stock.watermark_service import close_scan_window, open_scan_window
+
+User = get_user_model()
+
+
+@override_settings(LOW_STOCK_THRESHOLD_DEFAULT=10, SCAN_WATERMARK_OVERLAP_MINUTES=0)
+@patch('apps.stock.tasks.publish_many_sync')
+class IncrementalScanTests(TestCase):
+    """Después del primer scan solo se re-evalúa lo que tuvo movimientos."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='watermark', password='test123')
+        self.warehouse = Warehouse.objects.create(name='Central')
+        self.today = date.today()
+        self.products = [
+            Product.objects.create(code=f'WM-{index}', name=f'Producto {index}', price=Decimal('1.00'))
+            for index in range(3)
+        ]
+        for product in self.products:
+            self._entry(product, '4', days=5)
+
+    def _entry(self, product, qty, days):
+        create_entry(
+            product=product, lot_code=f'{product.code}-{days}-{qty}', expiry_date=self.today + timedelta(days=days),
+            qty=Decimal(qty), unit_cost=Decimal('1.00'), warehouse=self.warehouse, created_by=self.user
+        )
+
+    def test_low_stock_rescans_only_touched_products(self, publish):
+        first = tasks.scan_low_stock(incremental=True)
+        self.assertEqual(first['products_found'], 3)
+
+        # Sin movimientos: marca + query vacía + cierre
+        with self.assertNumQueries(4):
+            idle = tasks.scan_low_stock(incremental=True)
+        self.assertEqual(idle['products_found'], 0)
+
+        create_exit(product=self.products[1], qty_total=Decimal('1'), warehouse=self.warehouse, created_by=self.user)
+        touched = tasks.scan_low_stock(incremental=True)
+        self.assertEqual(touched['products'], ['Producto 1'])
+
+        # El modo completo sigue viendo todo el catálogo
+        self.assertEqual(tasks.scan_low_stock()['products_found'], 3)
+
+    def test_near_expiry_rescans_touched_products_and_boundary_crossings(self, publish):
+        self.assertEqual(tasks.scan_near_expiry(days_ahead=7, incremental=True)['products_found'], 3)
+        self.assertEqual(tasks.scan_near_expiry(days_ahead=7, incremental=True)['products_found'], 0)
+
+        self._entry(self.products[2], '1', days=6)
+        result = tasks.scan_near_expiry(days_ahead=7, incremental=True)
+        self.assertEqual(result['products'], ['Producto 2'])
+        self.assertEqual(result['lots_found'], 2)
+
+        # Lote cargado por fuera de los servicios (sin movimiento) que hoy entra a la ventana de 7 días
+        other = Product.objects.create(code='WM-X', name='Producto X', price=Decimal('1.00'))
+        StockLot.objects.create(
+            product=other, lot_code='WM-X-7', expiry_date=self.today + timedelta(days=7),
+            qty_on_hand=Decimal('2'), unit_cost=Decimal('1.00'), warehouse=self.warehouse
+        )
+        from apps.stock.expiry_bucket_service import roll_expiry_buckets
+        roll_expiry_buckets()
+        StockScanWatermark.objects.filter(name='scan_near_expiry:7').update(
+            last_scan_date=self.today - timedelta(days=1)
+        )
+
+        result = tasks.scan_near_expiry(days_ahead=7, incremental=True)
+        self.assertEqual(result['products'], ['Producto X'])
+
+        # Ya evaluado hoy: no se repite
+        self.assertEqual(tasks.scan_near_expiry(days_ahead=7, incremental=True)['products_found'], 0)
+
+    def test_boundary_crossings_do_not_depend_on_the_expiry_index(self, publish):
+        self.assertEqual(tasks.scan_near_expiry(days_ahead=7, incremental=True)['products_found'], 3)
+
+        # Lote sin filas en el índice (el roll todavía no lo ubicó) que hoy entra a la ventana
+        other = Product.objects.create(code='WM-Y', name='Producto Y', price=Decimal('1.00'))
+        StockLot.objects.create(
+            product=other, lot_code='WM-Y-7', expiry_date=self.today + timedelta(days=7),
+            qty_on_hand=Decimal('2'), unit_cost=Decimal('1.00'), warehouse=self.warehouse
+        )
+        StockScanWatermark.objects.filter(name='scan_near_expiry:7').update(
+            last_scan_date=self.today - timedelta(days=1)
+        )
+
+        self.assertEqual(tasks.scan_near_expiry(days_ahead=7, incremental=True)['products'], ['Producto Y'])
+
+    def test_failed_publish_keeps_the_window_open(self, publish):
+        publish.side_effect = RuntimeError('bus down')
+        self.assertEqual(tasks.scan_near_expiry(days_ahead=7, incremental=True)['events_failed'], 6)
+        self.assertEqual(tasks.scan_low_stock(incremental=True)['alerts_sent'], 0)
+        self.assertFalse(StockScanWatermark.objects.filter(last_movement_id__isnull=False).exists())
+
+        # Con el bus de vuelta, la misma ventana se re-evalúa completa
+        publish.side_effect = None
+        self.assertEqual(tasks.scan_near_expiry(days_ahead=7, incremental=True)['products_found'], 3)
+        self.assertEqual(tasks.scan_low_stock(incremental=True)['products_found'], 3)
+        self.assertEqual(tasks.scan_low_stock(incremental=True)['products_found'], 0)
+
+    def test_window_is_not_advanced_over_a_concurrent_scan(self, publish):
+        window = open_scan_window('scan_low_stock')
+        self.assertTrue(window.is_full)
+        self.assertEqual(window.until_movement_id, Movement.objects.latest('id').id)
+
+        concurrent = open_scan_window('scan_low_stock')
+        self.assertTrue(close_scan_window(concurrent))
+        self.assertFalse(close_scan_window(window))
+
+    @override_settings(SCAN_WATERMARK_OVERLAP_MINUTES=15)
+    def test_overlap_rescans_movements_committed_below_the_watermark(self, publish):
+        self.assertEqual(tasks.scan_low_stock(incremental=True)['products_found'], 3)
+
+        # Commit tardío: el movimiento quedó con un id menor a la marca ya cerrada
+        create_exit(product=self.products[0], qty_total=Decimal('1'), warehouse=self.warehouse, created_by=self.user)
+        late = Movement.objects.latest('id')
+        StockScanWatermark.objects.filter(name='scan_low_stock').update(last_movement_id=late.id)
+        Movement.objects.exclude(pk=late.pk).update(created_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(tasks.scan_low_stock(incremental=True)['products'], ['Producto 0'])
+
+        # Fuera del solapamiento ya no se re-evalúa
+        Movement.objects.filter(pk=late.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(tasks.scan_low_stock(incremental=True)['products_found'], 0)
@@ -0,0 +1,105 @@
+"""Tests para la estrategia de advisory lock y el benchmark de asignación."""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from apps.catalog.models import Product
+from apps.stock.benchmarks import run_allocation_benchmark
+from apps.stock.fefo_service import FEFOService
+from apps.stock.locking import acquire_stock_lock, stock_lock_key
+from apps.stock.models import Movement, StockLot, Warehouse
+
+User = get_user_model()
+
+
+class StockLockTests(TestCase):
+    """Claves estables por (producto, depósito) y no-op fuera de PostgreSQL."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='locker', password='test123')
+        self.warehouse = Warehouse.objects.create(name='Central')
+        self.product = Product.objects.create(code='LCK-001', name='Producto Lock', price=Decimal('10.00'))
+        StockLot.objects.create(
+            product=self.product, lot_code='L1', expiry_date=date.today() + timedelta(days=30),
+            qty_on_hand=Decimal('5'), unit_cost=Decimal('2.00'), warehouse=self.warehouse
+        )
+
+    def test_lock_key_is_stable_and_per_pair(self):
+        key = stock_lock_key(1, 2)
+
+        self.assertEqual(key, stock_lock_key(1, 2))
+        self.assertNotEqual(key, stock_lock_key(2, 1))
+        self.assertNotEqual(stock_lock_key(1, None), stock_lock_key(1, 0))
+        self.assertTrue(-2 ** 63 <= key < 2 ** 63)
+
+    def test_noop_outside_postgres(self):
+        with transaction.atomic():
+            self.assertFalse(acquire_stock_lock(self.product.id, self.warehouse.id))
+
+    def test_postgres_takes_transaction_advisory_lock(self):
+        fake = MagicMock(vendor='postgresql', in_atomic_block=True)
+        cursor = fake.cursor.return_value.__enter__.return_value
+
+        with patch('apps.stock.locking.connections', {'default': fake}):
+            self.assertTrue(acquire_stock_lock(self.product.id, self.warehouse.id))
+
+        cursor.execute.assert_called_once_with(
+            "SELECT pg_advisory_xact_lock(%s)", [stock_lock_key(self.product.id, self.warehouse.id)]
+        )
+
+    def test_postgres_requires_transaction(self):
+        fake = MagicMock(vendor='postgresql', in_atomic_block=False)
+
+        with patch('apps.stock.locking.connections', {'default': fake}):
+            with self.assertRaises(transaction.TransactionManagementError):
+                acquire_stock_lock(self.product.id, self.warehouse.id)
+
+    def test_allocate_with_advisory_strategy(self):
+        with patch('apps.stock.fefo_service.acquire_stock_lock') as lock:
+            allocations = FEFOService.allocate_stock_fefo(
+                product_id=self.product.id, qty_needed=Decimal('3'), user_id=self.user.id,
+                warehouse_id=self.warehouse.id, lock_strategy='advisory'
+            )
+
+        lock.assert_called_once_with(self.product.id, self.warehouse.id)
+        self.assertEqual(allocations[0].qty_allocated, Decimal('3'))
+        self.assertEqual(StockLot.objects.get().qty_on_hand, Decimal('2'))
+
+    def test_unknown_strategy_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            FEFOService.allocate_stock_fefo(
+                product_id=self.product.id, qty_needed=Decimal('1'), user_id=self.user.id,
+                lock_strategy='optimistic'
+            )
+
+
+class AllocationBenchmarkTests(TransactionTestCase):
+    """El harness cuenta cada intento y limpia sus datos temporales."""
+
+    def test_benchmark_accounts_for_every_attempt(self):
+        result = run_allocation_benchmark('advisory', threads=2, allocations=6, qty=Decimal('1'), lots=2)
+
+        self.assertEqual(result.attempts, 6)
+        self.assertEqual(
+            result.succeeded + result.false_out_of_stock + result.conflicts + result.errors, 6
+        )
+        self.assertEqual(result.remaining_qty, Decimal('6') - result.succeeded)
+        self.assertFalse(Product.objects.filter(code__startswith='BENCH-').exists())
+        self.assertFalse(Movement.objects.exists())
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_fefo_allocation', threads=1, allocations=3, lots=1, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('skip_locked', output)
+        self.assertIn('advisory', output)
+        self.assertEqual(output.count('/3 throughput='), 2)
@@ -5,17 +5,19 @@ from datetime import date, timedelta
 from decimal import Decimal
 from django.test import TransactionTestCase
 from django.db import transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 from unittest.mock import patch, MagicMock
 
 from apps.catalog.models import Product
-from apps.stock.models import Warehouse, StockLot, Movement
+from apps.stock.models import Warehouse, StockLot, Movement, ProductStockSummary
 from apps.stock.services import (
     # Legacy services
     create_entry, create_exit, pick_lots_fefo,
     StockError, NotEnoughStock, NoLotsAvailable,
+    allocate_many, ExitError, create_exit_optimistic,
     # Event-driven services
     request_stock_entry, request_stock_exit,
     validate_stock_availability, validate_warehouse
@@ -734,4 +736,216 @@ class TestEventDrivenCompatibility:
         
         # Verificar stock final
         stock_lot = StockLot.objects.get(lot_code='LEGACY-TEST')
-        assert stock_lot.qty_on_hand == Decimal('20')  # 30 - 10
\ No newline at end of file
+        assert stock_lot.qty_on_hand == Decimal('20')  # 30 - 10
+
+@pytest.mark.django_db
+class TestAllocateMany:
+    """Tests para la asignación FEFO multi-producto en lote."""
+    
+    def setup_method(self):
+        """Setup test data."""
+        self.user = User.objects.create_user(username='bulkuser')
+        self.warehouse = Warehouse.objects.create(name='Bulk Warehouse', is_active=True)
+        self.products = [
+            Product.objects.create(
+                code=f'BULK-{i:03d}',
+                name=f'Bulk Product {i}',
+                price=Decimal('10.00'),
+                tax_rate=Decimal('21.00')
+            )
+            for i in range(60)
+        ]
+        today = date.today()
+        lots = []
+        for product in self.products:
+            lots.append(StockLot(product=product, lot_code='LATE', expiry_date=today + timedelta(days=60),
+                                 qty_on_hand=Decimal('10'), unit_cost=Decimal('5.00'), warehouse=self.warehouse))
+            lots.append(StockLot(product=product, lot_code='EARLY', expiry_date=today + timedelta(days=5),
+                                 qty_on_hand=Decimal('3'), unit_cost=Decimal('4.00'), warehouse=self.warehouse))
+        StockLot.objects.bulk_create(lots)
+    
+    def test_sixty_lines_constant_queries(self, django_assert_max_num_queries):
+        """60 líneas: lock + bulk_update + bulk_create + resumen, sin queries por línea."""
+        lines = [(product.id, Decimal('5'), self.warehouse.id) for product in self.products]
+        
+        # savepoint + lock + update + insert (SQLite lo parte en 2 lotes) + resumen (2)
+        # + índice de vencimientos (agregado + upsert en 2 lotes) + release
+        # + lock del resumen (primera vez de las claves: lock, alta y lock)
+        with django_assert_max_num_queries(14):
+            result = allocate_many(lines, user_id=self.user.id)
+        
+        assert len(result) == 60
+        # FEFO: 3 del lote EARLY + 2 del lote LATE
+        assert [(mv.lot.lot_code, mv.qty) for mv in result[0]] == [('EARLY', Decimal('3')), ('LATE', Decimal('2'))]
+        assert Movement.objects.filter(type=Movement.Type.EXIT).count() == 120
+        assert StockLot.objects.get(product=self.products[0], lot_code='LATE').qty_on_hand == Decimal('8')
+        assert StockLot.objects.get(product=self.products[0], lot_code='EARLY').qty_on_hand == Decimal('0')
+    
+    def test_repeated_product_shares_availability(self):
+        """Dos líneas del mismo producto no pueden tomar el mismo stock dos veces."""
+        product = self.products[0]
+        
+        result = allocate_many([(product.id, Decimal('3')), (product.id, Decimal('4'))], user_id=self.user.id)
+        
+        assert [(mv.lot.lot_code, mv.qty) for mv in result[1]] == [('LATE', Decimal('4'))]
+        
+        with pytest.raises(ExitError) as exc_info:
+            allocate_many([(product.id, Decimal('5')), (product.id, Decimal('2'))], user_id=self.user.id)
+        assert exc_info.value.code == "INSUFFICIENT_STOCK"
+    
+    def test_min_shelf_life_and_rollback(self):
+        """Respeta vida útil mínima y revierte todo si una línea falla."""
+        first, second = self.products[:2]
+        
+        result = allocate_many([(first.id, Decimal('2'), None, 30)], user_id=self.user.id)
+        assert [mv.lot.lot_code for mv in result[0]] == ['LATE']
+        
+        with pytest.raises(ExitError):
+            allocate_many(
+                [(first.id, Decimal('1')), (second.id, Decimal('20'))],
+                user_id=self.user.id
+            )
+        assert StockLot.objects.get(product=first, lot_code='EARLY').qty_on_hand == Decimal('3')
+
+
+@pytest.mark.django_db
+class TestCreateExitOptimistic:
+    """Tests para el modo de salida optimista (UPDATE condicional + reintentos)."""
+    
+    def setup_method(self):
+        """Setup test data."""
+        self.user = User.objects.create_user(username='optimistic')
+        self.warehouse = Warehouse.objects.create(name='Optimistic Warehouse', is_active=True)
+        self.product = Product.objects.create(
+            code='OPT-001',
+            name='Optimistic Product',
+            price=Decimal('10.00'),
+            tax_rate=Decimal('21.00')
+        )
+        today = date.today()
+        self.early = StockLot.objects.create(
+            product=self.product, lot_code='EARLY', expiry_date=today + timedelta(days=5),
+            qty_on_hand=Decimal('3'), unit_cost=Decimal('4.00'), warehouse=self.warehouse
+        )
+        self.late = StockLot.objects.create(
+            product=self.product, lot_code='LATE', expiry_date=today + timedelta(days=60),
+            qty_on_hand=Decimal('10'), unit_cost=Decimal('5.00'), warehouse=self.warehouse
+        )
+    
+    def _stale_first_read(self, qty):
+        """Simula otra venta de `qty` del lote EARLY entre la primera lectura y el UPDATE."""
+        from apps.stock import services
+        real_plan = services._plan_fefo_exit
+        calls = []
+        
+        StockLot.objects.filter(id=self.early.id).update(qty_on_hand=F('qty_on_hand') - qty)
+        
+        def plan(product, qty_needed, available_lots):
+            if not calls:
+                # La primera lectura todavía no ve la otra venta
+                for lot in available_lots:
+                    if lot.id == self.early.id:
+                        lot.available_qty += qty
+            calls.append(qty_needed)
+            return real_plan(product, qty_needed, available_lots)
+        
+        return patch('apps.stock.services._plan_fefo_exit', side_effect=plan), calls
+    
+    def test_optimistic_exit_follows_fefo(self):
+        """Mismo resultado FEFO que el modo con locks."""
+        movements = create_exit(
+            product=self.product,
+            qty_total=Decimal('5'),
+            warehouse=self.warehouse,
+            created_by=self.user,
+            mode='optimistic'
+        )
+        
+        assert [(mv.lot.lot_code, mv.qty) for mv in movements] == [('EARLY', Decimal('3')), ('LATE', Decimal('2'))]
+        assert all(mv.pk for mv in movements)
+        self.early.refresh_from_db()
+        self.late.refresh_from_db()
+        assert self.early.qty_on_hand == Decimal('0')
+        assert self.late.qty_on_hand == Decimal('8')
+    
+    def test_optimistic_exit_refreshes_summary_after_commit(self, django_capture_on_commit_callbacks):
+        """El resumen se recalcula después del commit, no dentro del intento."""
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            create_exit_optimistic(
+                product=self.product,
+                qty_total=Decimal('5'),
+                warehouse=self.warehouse,
+                created_by=self.user
+            )
+            assert not ProductStockSummary.objects.filter(product=self.product).exists()
+        
+        assert len(callbacks) == 1
+        summary = ProductStockSummary.objects.get(product=self.product, warehouse=self.warehouse)
+        assert summary.on_hand == Decimal('8')
+    
+    def test_optimistic_exit_respects_reservations(self):
+        """El UPDATE condicional no consume stock reservado."""
+        StockLot.objects.filter(id=self.late.id).update(qty_reserved=Decimal('9'))
+        
+        with pytest.raises(NotEnoughStock):
+            create_exit(
+                product=self.product,
+                qty_total=Decimal('5'),
+                warehouse=self.warehouse,
+                created_by=self.user,
+                mode='optimistic'
+            )
+    
+    def test_conflict_is_retried_with_fresh_plan(self):
+        """Un conflicto revierte el intento y replanifica con datos frescos."""
+        steal, calls = self._stale_first_read(Decimal('2'))
+        
+        with steal, patch('apps.stock.services.increment_stock_exit_conflict') as conflict_metric, \
+                patch('apps.stock.services.observe_stock_exit_attempts') as attempts_metric:
+            movements = create_exit_optimistic(
+                product=self.product,
+                qty_total=Decimal('4'),
+                warehouse=self.warehouse,
+                created_by=self.user
+            )
+        
+        assert len(calls) == 2
+        conflict_metric.assert_called_once_with(mode='optimistic', outcome='retried')
+        attempts_metric.assert_called_once_with(2, mode='optimistic')
+        # Segundo plan: queda 1 en EARLY, el resto sale de LATE
+        assert [(mv.lot.lot_code, mv.qty) for mv in movements] == [('EARLY', Decimal('1')), ('LATE', Decimal('3'))]
+        self.late.refresh_from_db()
+        assert self.late.qty_on_hand == Decimal('7')
+        assert Movement.objects.filter(type=Movement.Type.EXIT).count() == 2
+    
+    def test_retries_exhausted_rolls_back(self):
+        """Sin reintentos disponibles falla con CONCURRENT_MODIFICATION y no descuenta nada."""
+        steal, _ = self._stale_first_read(Decimal('2'))
+        
+        with steal, pytest.raises(StockError) as exc_info:
+            create_exit_optimistic(
+                product=self.product,
+                qty_total=Decimal('4'),
+                warehouse=self.warehouse,
+                created_by=self.user,
+                max_retries=0
+            )
+        
+        assert exc_info.value.code == "CONCURRENT_MODIFICATION"
+        self.late.refresh_from_db()
+        assert self.late.qty_on_hand == Decimal('10')
+        assert not Movement.objects.exists()
+    
+    def test_mode_from_settings(self, settings):
+        """STOCK_EXIT_MODE=optimistic cambia el modo por defecto de create_exit."""
+        settings.STOCK_EXIT_MODE = 'optimistic'
+        
+        with patch('apps.stock.services.create_exit_optimistic', return_value=[]) as optimistic:
+            create_exit(
+                product=self.product,
+                qty_total=Decimal('1'),
+                warehouse=self.warehouse,
+                created_by=self.user
+            )
+        
+        optimistic.assert_called_once()
@@ -0,0 +1,118 @@
+"""Tests para snapshots de stock y reconstrucción as-of."""
+
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from ninja.testing import TestClient
+
+from apps.catalog.models import Product
+from apps.stock.api_stock import router
+from apps.stock.archive_service import archive_movements
+from apps.stock.models import Movement, StockLot, StockLotSnapshot, Warehouse
+from apps.stock.snapshot_service import as_of, take_snapshot
+
+User = get_user_model()
+
+
+class StockSnapshotTests(TestCase):
+    """El as-of parte del ancla más cercana y aplica solo el delta."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auditor', password='test123')
+        self.warehouse = Warehouse.objects.create(name='Central')
+        self.product = Product.objects.create(code='SNP-001', name='Producto Snapshot', price=Decimal('10.00'))
+        self.today = timezone.localdate()
+        # Historia: +10 (hace 10 días), +5 (hace 5), -3 (hace 2) => 12 en mano
+        self.lot = StockLot.objects.create(
+            product=self.product, lot_code='L-SNP', expiry_date=self.today + timedelta(days=90),
+            qty_on_hand=Decimal('12'), unit_cost=Decimal('2.00'), warehouse=self.warehouse
+        )
+        self._movement(Movement.Type.ENTRY, '10', 10)
+        self._movement(Movement.Type.ENTRY, '5', 5)
+        self._movement(Movement.Type.EXIT, '3', 2)
+
+    def _movement(self, movement_type, qty, days_ago):
+        movement = Movement.objects.create(
+            type=movement_type, product=self.product, lot=self.lot, qty=Decimal(qty),
+            unit_cost=Decimal('2.00'), reason='adjustment', created_by=self.user
+        )
+        day = self.today - timedelta(days=days_ago)
+        Movement.objects.filter(id=movement.id).update(
+            created_at=timezone.make_aware(datetime.combine(day, time(12, 0)))
+        )
+
+    def _qty(self, result):
+        return sum((lot.qty_on_hand for lot in result.lots), Decimal('0'))
+
+    def test_as_of_without_snapshots_replays_back_from_live_stock(self):
+        self.assertEqual(self._qty(as_of(self.today - timedelta(days=11))), Decimal('0'))
+        self.assertEqual(self._qty(as_of(self.today - timedelta(days=6))), Decimal('10'))
+        self.assertEqual(self._qty(as_of(self.today - timedelta(days=3))), Decimal('15'))
+
+        result = as_of(self.today - timedelta(days=1))
+        self.assertEqual(result.source, 'live')
+        self.assertEqual(result.lots[0].lot_id, self.lot.id)
+        self.assertEqual(result.lots[0].qty_on_hand, Decimal('12'))
+
+    def test_take_snapshot_stores_closing_quantity(self):
+        lots = take_snapshot(self.today - timedelta(days=5))
+
+        self.assertEqual(lots, 1)
+        snapshot = StockLotSnapshot.objects.get()
+        self.assertEqual(snapshot.qty_on_hand, Decimal('15'))
+        self.assertEqual(snapshot.warehouse_id, self.warehouse.id)
+
+        # Re-tomar la misma fecha reemplaza el snapshot
+        take_snapshot(self.today - timedelta(days=5))
+        self.assertEqual(StockLotSnapshot.objects.count(), 1)
+
+    def test_as_of_uses_nearest_snapshot_in_both_directions(self):
+        take_snapshot(self.today - timedelta(days=5))
+
+        forward = as_of(self.today - timedelta(days=4))
+        self.assertEqual((forward.source, forward.source_date), ('snapshot', self.today - timedelta(days=5)))
+        self.assertEqual(self._qty(forward), Decimal('15'))
+
+        backward = as_of(self.today - timedelta(days=6))
+        self.assertEqual((backward.source, backward.source_date), ('snapshot', self.today - timedelta(days=5)))
+        self.assertEqual(self._qty(backward), Decimal('10'))
+
+    def test_as_of_includes_archived_movements(self):
+        take_snapshot(self.today - timedelta(days=5))
+        archive_movements(self.today - timedelta(days=7))
+        self.assertEqual(Movement.objects.count(), 2)
+
+        self.assertEqual(self._qty(as_of(self.today - timedelta(days=8))), Decimal('10'))
+        self.assertEqual(self._qty(as_of(self.today - timedelta(days=11))), Decimal('0'))
+
+    def test_future_date_is_rejected(self):
+        with self.assertRaises(ValueError):
+            as_of(self.today + timedelta(days=1))
+
+    def test_snapshot_command_backfills_days(self):
+        out = StringIO()
+        call_command('take_stock_snapshot', date=(self.today - timedelta(days=1)).isoformat(), days=3, stdout=out)
+
+        self.assertEqual(
+            sorted(StockLotSnapshot.objects.values_list('snapshot_date', 'qty_on_hand')),
+            [(self.today - timedelta(days=3), Decimal('15')),
+             (self.today - timedelta(days=2), Decimal('12')),
+             (self.today - timedelta(days=1), Decimal('12'))]
+        )
+
+    def test_as_of_endpoint(self):
+        client = TestClient(router)
+
+        response = client.get(
+            f"/stock/as-of?as_of_date={(self.today - timedelta(days=3)).isoformat()}&product_id={self.product.id}"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['source'], 'live')
+        self.assertEqual(Decimal(data['lots'][0]['qty_on_hand']), Decimal('15'))
@@ -0,0 +1,131 @@
+"""Tests para ProductStockSummary y su mantenimiento incremental."""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from apps.catalog.models import Product
+from apps.customers.models import Customer
+from apps.orders.models import Order
+from apps.stock.fefo_service import FEFOService
+from apps.stock.models import ProductStockSummary, StockLot, Warehouse
+from apps.stock.reservations import Reservation
+from apps.stock.services import create_entry, create_exit, record_entry, record_exit_fefo
+
+User = get_user_model()
+
+
+class ProductStockSummaryTests(TestCase):
+    """El resumen se mantiene en la misma transacción que los lotes."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='summary', password='test123')
+        self.warehouse = Warehouse.objects.create(name='Almacén Principal')
+        self.product = Product.objects.create(code='SUM-001', name='Producto Resumen', price=Decimal('10.00'))
+        self.today = date.today()
+
+    def _summary(self):
+        return ProductStockSummary.objects.get(product=self.product, warehouse=self.warehouse)
+
+    def _entry(self, lot_code, qty, days):
+        return create_entry(
+            product=self.product,
+            lot_code=lot_code,
+            expiry_date=self.today + timedelta(days=days),
+            qty=Decimal(qty),
+            unit_cost=Decimal('5.00'),
+            warehouse=self.warehouse,
+            created_by=self.user
+        )
+
+    def test_entries_and_exits_update_summary(self):
+        self._entry('LOT-A', '10', 20)
+        self._entry('LOT-B', '5', 10)
+
+        summary = self._summary()
+        self.assertEqual(summary.on_hand, Decimal('15'))
+        self.assertEqual(summary.available, Decimal('15'))
+        self.assertEqual(summary.lot_count, 2)
+        self.assertEqual(summary.nearest_expiry, self.today + timedelta(days=10))
+
+        # FEFO consume primero LOT-B completo
+        create_exit(product=self.product, qty_total=Decimal('7'), warehouse=self.warehouse, created_by=self.user)
+
+        summary = self._summary()
+        self.assertEqual(summary.on_hand, Decimal('8'))
+        self.assertEqual(summary.lot_count, 1)
+        self.assertEqual(summary.nearest_expiry, self.today + timedelta(days=20))
+
+    def test_legacy_services_update_summary(self):
+        record_entry(
+            product_id=self.product.id,
+            lot_code='LOT-L',
+            expiry_date=self.today + timedelta(days=15),
+            qty=Decimal('12'),
+            unit_cost=Decimal('5.00'),
+            user_id=self.user.id,
+            warehouse_id=self.warehouse.id
+        )
+        self.assertEqual(self._summary().on_hand, Decimal('12'))
+
+        record_exit_fefo(product_id=self.product.id, qty=Decimal('4'), user_id=self.user.id)
+        self.assertEqual(self._summary().on_hand, Decimal('8'))
+
+        FEFOService.allocate_stock_fefo(product_id=self.product.id, qty_needed=Decimal('3'), user_id=self.user.id)
+        self.assertEqual(self._summary().on_hand, Decimal('5'))
+
+    def test_reservations_update_reserved_and_available(self):
+        movement = self._entry('LOT-R', '10', 20)
+        customer = Customer.objects.create(name='Cliente Test')
+        order = Order.objects.create(customer=customer, delivery_method='pickup')
+
+        reservation = Reservation.objects.create(order=order, lot=movement.lot, qty=Decimal('4'))
+        summary = self._summary()
+        self.assertEqual(summary.reserved, Decimal('4'))
+        self.assertEqual(summary.available, Decimal('6'))
+
+        reservation.cancel()
+        summary = self._summary()
+        self.assertEqual(summary.reserved, Decimal('0'))
+        self.assertEqual(summary.available, Decimal('10'))
+
+    def test_reconcile_command_fixes_drift(self):
+        self._entry('LOT-C', '10', 20)
+        # Lote creado por fuera de los servicios: el resumen no lo ve
+        StockLot.objects.create(
+            product=self.product,
+            lot_code='LOT-RAW',
+            expiry_date=self.today + timedelta(days=5),
+            qty_on_hand=Decimal('3'),
+            unit_cost=Decimal('5.00'),
+            warehouse=self.warehouse
+        )
+
+        with self.assertRaises(CommandError):
+            call_command('reconcile_stock_summary', '--verify', stdout=StringIO())
+
+        call_command('reconcile_stock_summary', stdout=StringIO())
+        summary = self._summary()
+        self.assertEqual(summary.on_hand, Decimal('13'))
+        self.assertEqual(summary.lot_count, 2)
+        self.assertEqual(summary.nearest_expiry, self.today + timedelta(days=5))
+
+        call_command('reconcile_stock_summary', '--verify', stdout=StringIO())
+
+    def test_scan_low_stock_reads_summary_in_constant_queries(self):
+        from apps.stock.tasks import scan_low_stock
+
+        self._entry('LOT-S', '3', 20)
+        for i in range(5):
+            Product.objects.create(code=f'SUM-X{i}', name=f'Extra {i}', price=Decimal('1.00'))
+
+        with patch('apps.stock.tasks.publish_many_sync'), self.assertNumQueries(1):
+            result = scan_low_stock(min_stock_threshold=5.0)
+
+        self.assertEqual(result['products_found'], 6)
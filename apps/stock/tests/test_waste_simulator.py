@@ -0,0 +1,110 @@
+"""Tests para el simulador de merma por vencimiento (FEFO vectorizado)."""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from apps.catalog.models import Product
+from apps.stock.models import Movement, StockLot, Warehouse
+from apps.stock.waste_simulator import simulate_expiry_waste, simulate_fefo_depletion
+
+User = get_user_model()
+
+
+class FEFODepletionTests(TestCase):
+    """Núcleo vectorizado, sin base de datos."""
+
+    def test_fefo_order_waste_and_stockouts_per_key(self):
+        # Clave 0: lote que vence el día 1 (5u) y lote que vence el día 10 (4u), demanda 2/día
+        # Clave 1: un lote que vence hoy (3u), sin demanda
+        result = simulate_fefo_depletion(
+            lot_key=np.array([0, 0, 1]),
+            lot_expiry_day=np.array([1, 10, 0]),
+            lot_qty=np.array([5.0, 4.0, 3.0]),
+            daily_demand=np.array([2.0, 0.0]),
+            horizon_days=6,
+        )
+
+        # Días 0-1 consumen 4 del primer lote: sobra 1 al vencer
+        np.testing.assert_allclose(result.waste_by_lot, [1.0, 0.0, 3.0])
+        # Días 2-3 consumen el segundo lote; días 4-5 sin stock
+        np.testing.assert_allclose(result.sold_by_key, [8.0, 0.0])
+        self.assertEqual(result.stockout_days.tolist(), [2, 0])
+        self.assertEqual(result.first_stockout_day.tolist(), [4, -1])
+
+    def test_demand_spans_lots_within_a_day(self):
+        result = simulate_fefo_depletion(
+            lot_key=np.array([0, 0]),
+            lot_expiry_day=np.array([30, 30]),
+            lot_qty=np.array([1.0, 10.0]),
+            daily_demand=np.array([3.0]),
+            horizon_days=1,
+        )
+
+        np.testing.assert_allclose(result.sold_by_key, [3.0])
+        self.assertEqual(result.stockout_days.tolist(), [0])
+
+
+class ExpiryWasteSimulationTests(TestCase):
+    """Carga desde la base, comando y reporte."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='purchasing', password='test123')
+        self.warehouse = Warehouse.objects.create(name='Central')
+        self.product = Product.objects.create(code='WST-001', name='Yogur', price=Decimal('10.00'))
+        today = date.today()
+
+        self.soon = StockLot.objects.create(
+            product=self.product, lot_code='SOON', expiry_date=today + timedelta(days=4),
+            qty_on_hand=Decimal('20'), unit_cost=Decimal('2.50'), warehouse=self.warehouse
+        )
+        StockLot.objects.create(
+            product=self.product, lot_code='LATER', expiry_date=today + timedelta(days=60),
+            qty_on_hand=Decimal('10'), unit_cost=Decimal('2.50'), warehouse=self.warehouse
+        )
+        # Lote en cuarentena: no se vende ni entra en la simulación
+        StockLot.objects.create(
+            product=self.product, lot_code='QUAR', expiry_date=today + timedelta(days=4),
+            qty_on_hand=Decimal('50'), unit_cost=Decimal('2.50'), warehouse=self.warehouse,
+            is_quarantined=True
+        )
+
+        # 56 unidades vendidas en los últimos 28 días => 2 por día
+        Movement.objects.create(
+            type=Movement.Type.EXIT, product=self.product, lot=self.soon, qty=Decimal('56'),
+            unit_cost=Decimal('2.50'), reason=Movement.Reason.SALE, created_by=user
+        )
+
+    def test_projects_waste_stockouts_and_value_at_risk(self):
+        result = simulate_expiry_waste(horizon_days=30, history_days=28)
+
+        self.assertEqual(result.lots, 2)
+        row = result.rows[0]
+        self.assertEqual(row.daily_demand, 2.0)
+        self.assertEqual(row.available_qty, 30.0)
+        # Días 0-4 venden 10 del lote SOON; vencen 10 => merma 10 (valor 25)
+        self.assertEqual(row.projected_waste, 10.0)
+        self.assertEqual(row.waste_value, 25.0)
+        # LATER cubre días 5-9; del día 10 al 29 hay quiebre
+        self.assertEqual(row.projected_sold, 20.0)
+        self.assertEqual(row.stockout_days, 20)
+        self.assertEqual(row.first_stockout_day, 10)
+        self.assertEqual(result.value_at_risk, 25.0)
+        self.assertEqual(result.stockout_keys, 1)
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            simulate_expiry_waste(horizon_days=0)
+
+    def test_command_outputs_csv(self):
+        out = StringIO()
+        call_command('simulate_expiry_waste', horizon=30, format='csv', stdout=out)
+
+        lines = out.getvalue().strip().splitlines()
+        self.assertTrue(lines[0].startswith('product_id,product_code'))
+        self.assertIn('WST-001', lines[1])
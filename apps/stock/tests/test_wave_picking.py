@@ -0,0 +1,108 @@
+"""Tests para el picking por olas (FEFO consolidado sobre muchas órdenes)."""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from ninja.testing import TestClient
+
+from apps.catalog.models import Product
+from apps.customers.models import Customer
+from apps.orders.models import Order, OrderItem
+from apps.orders.picking_api import picking_router
+from apps.stock.models import StockLot, Warehouse
+from apps.stock.reservations import Reservation
+from apps.stock.wave_picking_service import build_wave_pick_list
+
+
+class WavePickingTests(TestCase):
+    """La ola se asigna FEFO en memoria con una cantidad fija de queries."""
+
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name='Central')
+        self.customer = Customer.objects.create(name='Cliente Ola')
+        self.product = Product.objects.create(code='WAVE-001', name='Producto Ola', price=Decimal('10.00'))
+        self.other = Product.objects.create(code='WAVE-002', name='Otro Producto', price=Decimal('10.00'))
+        self.lots = [
+            self._lot(self.product, f'WAVE-{index}', days=10 + index, qty='5')
+            for index in range(3)
+        ]
+        self.other_lot = self._lot(self.other, 'WAVE-O', days=20, qty='100')
+
+    def _lot(self, product, code, days, qty):
+        return StockLot.objects.create(
+            product=product, lot_code=code, expiry_date=date.today() + timedelta(days=days),
+            qty_on_hand=Decimal(qty), unit_cost=Decimal('5.00'), warehouse=self.warehouse
+        )
+
+    def _order(self, **items):
+        order = Order.objects.create(customer=self.customer, delivery_method='pickup')
+        for product, qty in items.items():
+            OrderItem.objects.create(
+                order=order, product=getattr(self, product), qty=Decimal(qty), unit_price=Decimal('10.00')
+            )
+        return order
+
+    def test_allocates_fefo_across_the_wave_in_priority_order(self):
+        first = self._order(product='4')
+        second = self._order(product='8', other='3')
+        third = self._order(product='6')
+        # Reserva de una orden fuera de la ola: retiene stock del lote 2
+        outsider = self._order(product='1')
+        Reservation.objects.create(order=outsider, lot=self.lots[2], qty=Decimal('2'))
+        # Reserva previa de una orden de la ola: se reemplaza por la asignación
+        Reservation.objects.create(order=first, lot=self.lots[0], qty=Decimal('4'))
+
+        wave = build_wave_pick_list([third.id, first.id, second.id])
+
+        picks = {lot.lot_code: [(line.order_id, line.qty) for line in lot.orders] for lot in wave.lots}
+        self.assertEqual(picks, {
+            'WAVE-0': [(third.id, Decimal('5'))],
+            'WAVE-1': [(third.id, Decimal('1')), (first.id, Decimal('4'))],
+            'WAVE-2': [(second.id, Decimal('3'))],
+            'WAVE-O': [(second.id, Decimal('3'))],
+        })
+        self.assertEqual(wave.total_qty, Decimal('16'))
+        self.assertEqual(
+            [(s.order_id, s.qty_missing) for s in wave.shortages],
+            [(second.id, Decimal('5'))]
+        )
+
+    def test_query_count_does_not_grow_with_the_wave(self):
+        small = [self._order(product='1').id]
+        with self.assertNumQueries(3):
+            build_wave_pick_list(small)
+
+        large = [self._order(product='1', other='2').id for _ in range(12)]
+        with self.assertNumQueries(3):
+            wave = build_wave_pick_list(large)
+        self.assertEqual(wave.shortages, [])
+
+    def test_skips_quarantined_and_expired_lots(self):
+        self.lots[0].is_quarantined = True
+        self.lots[0].save()
+        self.lots[1].expiry_date = date.today() - timedelta(days=1)
+        self.lots[1].save()
+        order = self._order(product='3')
+
+        wave = build_wave_pick_list([order.id])
+        self.assertEqual([lot.lot_code for lot in wave.lots], ['WAVE-2'])
+
+    def test_endpoint_returns_consolidated_pick_list(self):
+        order = self._order(product='7')
+        client = TestClient(picking_router)
+
+        response = client.post('/picking/wave', json={'order_ids': [order.id, order.id]})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['order_ids'], [order.id])
+        self.assertEqual(data['total_lots'], 2)
+        self.assertEqual(Decimal(data['total_qty']), Decimal('7'))
+        self.assertEqual(data['pick_list'][0]['orders'], [{'order_id': order.id, 'qty': '5.000'}])
+
+        response = client.post('/picking/wave', json={'order_ids': [order.id, 999999]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['error'], 'ORDER_NOT_FOUND')
+
+        response = client.post('/picking/wave', json={'order_ids': []})
+        self.assertEqual(response.status_code, 422)
@@ -4,13 +4,14 @@ import json
 import uuid
 from datetime import date, timedelta
 from decimal import Decimal
-from django.test import TestCase, Client
+from django.core.cache import cache
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 
 from apps.catalog.models import Product
 from apps.stock.models import Warehouse, StockLot, Movement
 from apps.stock.models_idempotency import StockIdempotencyKey
-from apps.stock.idempotency_service import IdempotencyService
+from apps.stock.idempotency_service import IdempotencyInProgress, IdempotencyService
 
 User = get_user_model()
 
@@ -20,6 +21,8 @@ class StockIdempotencyTestCase(TestCase):
     
     def setUp(self):
         """Set up test data."""
+        # Replays are cached: start each test without responses from previous ones
+        cache.clear()
         self.client = Client()
         
         # Create user
@@ -343,4 +346,89 @@ class StockIdempotencyTestCase(TestCase):
         # Verify only valid key remains
         self.assertEqual(StockIdempotencyKey.objects.count(), 1)
         self.assertTrue(StockIdempotencyKey.objects.filter(key='valid-key').exists())
-        self.assertFalse(StockIdempotencyKey.objects.filter(key='expired-key').exists())
\ No newline at end of file
+        self.assertFalse(StockIdempotencyKey.objects.filter(key='expired-key').exists())
+
+
+@override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+class CachedIdempotencyTestCase(TestCase):
+    """Test cases for the cache-first idempotency layer."""
+
+    def setUp(self):
+        cache.clear()
+        self.request_data = {"product_id": 1, "qty_total": "5.000"}
+
+    def tearDown(self):
+        IdempotencyService.release_claim('cache-key')
+
+    def test_replay_is_served_from_cache_without_queries(self):
+        """A stored response is replayed from the cache, even after the row is gone."""
+        self.assertIsNone(IdempotencyService.check_existing_request('cache-key', 'exit', self.request_data))
+        IdempotencyService.store_response('cache-key', 'exit', self.request_data, 201, {'ok': True})
+
+        with self.assertNumQueries(0):
+            replay = IdempotencyService.check_existing_request('cache-key', 'exit', self.request_data)
+        self.assertEqual(replay, (201, {'ok': True}))
+
+        with self.assertRaises(ValueError):
+            IdempotencyService.check_existing_request('cache-key', 'exit', {"product_id": 2})
+
+    def test_database_fallback_when_cache_is_lost(self):
+        """With the cache flushed the durable record still replays and refills the cache."""
+        IdempotencyService.check_existing_request('cache-key', 'exit', self.request_data)
+        IdempotencyService.store_response('cache-key', 'exit', self.request_data, 201, {'ok': True})
+        cache.clear()
+
+        with self.assertNumQueries(1):
+            replay = IdempotencyService.check_existing_request('cache-key', 'exit', self.request_data)
+        self.assertEqual(replay, (201, {'ok': True}))
+        with self.assertNumQueries(0):
+            IdempotencyService.check_existing_request('cache-key', 'exit', self.request_data)
+
+    def test_concurrent_duplicate_gets_in_progress(self):
+        """While the original request holds the claim a duplicate gets 409."""
+        self.assertIsNone(IdempotencyService.check_existing_request('cache-key', 'exit', self.request_data))
+
+        # The duplicate comes from another worker: it does not share this thread's claims
+        held = IdempotencyService._claims.tokens
+        IdempotencyService._claims.tokens = {}
+        try:
+            with self.assertRaises(IdempotencyInProgress):
+                IdempotencyService.check_existing_request('cache-key', 'exit', self.request_data)
+        finally:
+            IdempotencyService._claims.tokens = held
+
+        # Once the original stores its response, duplicates replay it
+        IdempotencyService.store_response('cache-key', 'exit', self.request_data, 201, {'ok': True})
+        self.assertEqual(
+            IdempotencyService.check_existing_request('cache-key', 'exit', self.request_data), (201, {'ok': True})
+        )
+
+    def test_in_flight_duplicate_returns_409_without_moving_stock(self):
+        """The stock exit handler maps an in-flight duplicate to 409."""
+        from apps.stock.services import handle_legacy_stock_exit
+
+        user = User.objects.create_user(username='inflight', password='testpass123')
+        product = Product.objects.create(code='FLY-001', name='In Flight', price=Decimal('10.00'))
+        warehouse = Warehouse.objects.create(name='Flight Warehouse')
+        StockLot.objects.create(
+            product=product, warehouse=warehouse, lot_code='LOT-FLY',
+            expiry_date=date.today() + timedelta(days=30),
+            qty_on_hand=Decimal('20.000'), unit_cost=Decimal('5.00')
+        )
+        cache.add('idempotency:claim:flight-key', 'other-worker', 30)
+        payload = {"product_id": product.id, "qty_total": Decimal('5'), "warehouse_id": warehouse.id, "reason": "sale"}
+
+        status_code, response_data = handle_legacy_stock_exit(user, payload, 'flight-key')
+
+        self.assertEqual(status_code, 409)
+        self.assertEqual(response_data['error'], 'IDEMPOTENCY_IN_PROGRESS')
+        self.assertFalse(Movement.objects.filter(product=product).exists())
+        # The other worker's claim is left untouched
+        self.assertEqual(cache.get('idempotency:claim:flight-key'), 'other-worker')
+
+        # Once released, the request runs and its replay is served from the cache
+        cache.delete('idempotency:claim:flight-key')
+        first = handle_legacy_stock_exit(user, payload, 'flight-key')
+        self.assertEqual(first[0], 201)
+        self.assertEqual(handle_legacy_stock_exit(user, payload, 'flight-key'), first)
+        self.assertEqual(Movement.objects.filter(product=product).count(), 1)
@@ -0,0 +1,255 @@
+# apps/stock/waste_simulator.py
+"""
+Simulador offline de merma por vencimiento bajo la política FEFO.
+
+Carga los lotes vendibles y el consumo diario histórico por (producto,
+depósito) en arrays de NumPy y simula el agotamiento FEFO de todo el catálogo
+a la vez, día por día: cada día se reparte la demanda de cada clave entre sus
+lotes en orden de vencimiento (sumas acumuladas por segmento) y lo que queda en
+un lote al terminar su día de vencimiento se cuenta como merma.
+
+El costo es O(horizonte × lotes) en operaciones vectorizadas, sin queries por
+día ni por producto.
+"""
+
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Movement, StockLot
+
+DEFAULT_HORIZON_DAYS = 90
+DEFAULT_HISTORY_DAYS = 28
+
+# Salidas que cuentan como consumo (ventas POS / manuales y checkout de pedidos)
+CONSUMPTION_REASONS = (Movement.Reason.SALE, 'checkout')
+
+# Tolerancia para comparar cantidades en float
+EPSILON = 1e-9
+
+
+class FEFODepletion(NamedTuple):
+    """Resultado crudo de `simulate_fefo_depletion` (arrays por lote y por clave)."""
+    waste_by_lot: np.ndarray
+    sold_by_key: np.ndarray
+    stockout_days: np.ndarray
+    first_stockout_day: np.ndarray  # -1 si no hay quiebre en el horizonte
+
+
+class WasteProjection(NamedTuple):
+    """Proyección para una clave (producto, depósito)."""
+    product_id: int
+    product_code: str
+    product_name: str
+    warehouse_id: int
+    warehouse_name: str
+    available_qty: float
+    daily_demand: float
+    projected_sold: float
+    projected_waste: float
+    waste_value: float
+    stockout_days: int
+    first_stockout_day: Optional[int]
+
+
+class WasteSimulationResult(NamedTuple):
+    """Resultado de `simulate_expiry_waste`."""
+    as_of: date
+    horizon_days: int
+    history_days: int
+    lots: int
+    rows: List[WasteProjection]
+    total_waste_qty: float
+    value_at_risk: float
+    elapsed_seconds: float
+
+    @property
+    def stockout_keys(self) -> int:
+        return sum(1 for row in self.rows if row.stockout_days)
+
+
+def simulate_fefo_depletion(
+    lot_key: np.ndarray,
+    lot_expiry_day: np.ndarray,
+    lot_qty: np.ndarray,
+    daily_demand: np.ndarray,
+    horizon_days: int,
+) -> FEFODepletion:
+    """
+    Simula el agotamiento FEFO de todas las claves en paralelo.
+
+    Args:
+        lot_key: Índice de clave de cada lote (0..K-1). Los lotes deben venir
+            ordenados por (clave, vencimiento, id).
+        lot_expiry_day: Último día (offset desde hoy, 0 = hoy) en que el lote es vendible
+        lot_qty: Cantidad vendible de cada lote
+        daily_demand: Demanda diaria por clave (largo K)
+        horizon_days: Días a simular
+
+    Returns:
+        FEFODepletion con merma por lote y ventas / quiebres por clave
+    """
+    keys = len(daily_demand)
+    remaining = lot_qty.astype(np.float64).copy()
+    waste = np.zeros_like(remaining)
+    sold = np.zeros(keys, dtype=np.float64)
+    stockout_days = np.zeros(keys, dtype=np.int64)
+    first_stockout = np.full(keys, -1, dtype=np.int64)
+
+    # Posición de inicio de cada segmento (clave) para la suma acumulada por segmento
+    is_start = np.ones(len(lot_key), dtype=bool)
+    is_start[1:] = lot_key[1:] != lot_key[:-1]
+    segment_start = np.maximum.accumulate(np.where(is_start, np.arange(len(lot_key)), 0))
+    demand_by_lot = daily_demand[lot_key]
+
+    for day in range(horizon_days):
+        sellable = np.where(lot_expiry_day >= day, remaining, 0.0)
+
+        # Stock de los lotes anteriores (FEFO) de la misma clave
+        cumulative = np.cumsum(sellable)
+        before_segment = cumulative[segment_start] - sellable[segment_start]
+        taken_before = cumulative - sellable - before_segment
+
+        take = np.clip(demand_by_lot - taken_before, 0.0, sellable)
+        remaining -= take
+
+        served = np.bincount(lot_key, weights=take, minlength=keys)
+        sold += served
+
+        short = served < daily_demand - EPSILON
+        stockout_days += short
+        first_stockout[short & (first_stockout < 0)] = day
+
+        # Lo que sobra al cierre del día de vencimiento es merma
+        expiring = lot_expiry_day == day
+        waste[expiring] += remaining[expiring]
+        remaining[expiring] = 0.0
+
+    return FEFODepletion(waste, sold, stockout_days, first_stockout)
+
+
+def _load_inputs(today: date, history_days: int, product_id: Optional[int], warehouse_id: Optional[int]):
+    """Lotes vendibles (orden FEFO) y consumo diario histórico por clave."""
+    lots = StockLot.objects.with_availability().filter(
+        expiry_date__gte=today,
+        qty_on_hand__gt=0,
+        is_quarantined=False,
+        is_reserved=False,
+    )
+    consumption = Movement.objects.filter(
+        type=Movement.Type.EXIT,
+        reason__in=CONSUMPTION_REASONS,
+        created_at__gte=timezone.now() - timedelta(days=history_days),
+    )
+    if product_id is not None:
+        lots = lots.filter(product_id=product_id)
+        consumption = consumption.filter(product_id=product_id)
+    if warehouse_id is not None:
+        lots = lots.filter(warehouse_id=warehouse_id)
+        consumption = consumption.filter(lot__warehouse_id=warehouse_id)
+
+    lot_rows = list(
+        lots.order_by('product_id', 'warehouse_id', 'expiry_date', 'id').values_list(
+            'product_id', 'warehouse_id', 'expiry_date', 'available_qty', 'unit_cost',
+            'product__code', 'product__name', 'warehouse__name',
+        )
+    )
+    consumed = {
+        (row_product_id, row_warehouse_id): total
+        for row_product_id, row_warehouse_id, total in consumption.order_by()
+        .values_list('product_id', 'lot__warehouse_id').annotate(total=Sum('qty'))
+    }
+    return lot_rows, consumed
+
+
+def simulate_expiry_waste(
+    horizon_days: int = DEFAULT_HORIZON_DAYS,
+    history_days: int = DEFAULT_HISTORY_DAYS,
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    today: Optional[date] = None,
+) -> WasteSimulationResult:
+    """
+    Proyecta merma, días de quiebre y valor en riesgo del stock actual.
+
+    La demanda diaria de cada (producto, depósito) es el consumo de los últimos
+    `history_days` días dividido por `history_days`. Solo se simulan las claves
+    con stock vendible.
+
+    Raises:
+        ValueError: Si horizon_days o history_days no son positivos
+    """
+    if horizon_days <= 0 or history_days <= 0:
+        raise ValueError("horizon_days y history_days deben ser mayores a 0")
+
+    started = time.perf_counter()
+    today = today or timezone.localdate()
+    lot_rows, consumed = _load_inputs(today, history_days, product_id, warehouse_id)
+
+    # Claves en el orden de los lotes (ya ordenados por producto, depósito)
+    key_index = {}
+    key_info: List[Tuple] = []
+    lot_key = np.empty(len(lot_rows), dtype=np.int64)
+    lot_expiry_day = np.empty(len(lot_rows), dtype=np.int64)
+    lot_qty = np.empty(len(lot_rows), dtype=np.float64)
+    lot_cost = np.empty(len(lot_rows), dtype=np.float64)
+
+    for position, (row_product_id, row_warehouse_id, expiry_date, qty, unit_cost,
+                   product_code, product_name, warehouse_name) in enumerate(lot_rows):
+        key = (row_product_id, row_warehouse_id)
+        if key not in key_index:
+            key_index[key] = len(key_info)
+            key_info.append((row_product_id, product_code, product_name, row_warehouse_id, warehouse_name))
+        lot_key[position] = key_index[key]
+        lot_expiry_day[position] = (expiry_date - today).days
+        lot_qty[position] = qty
+        lot_cost[position] = unit_cost
+
+    daily_demand = np.array(
+        [float(consumed.get(key, Decimal('0'))) / history_days for key in key_index],
+        dtype=np.float64,
+    )
+
+    depletion = simulate_fefo_depletion(lot_key, lot_expiry_day, lot_qty, daily_demand, horizon_days)
+
+    keys = len(key_info)
+    available_by_key = np.bincount(lot_key, weights=lot_qty, minlength=keys)
+    waste_by_key = np.bincount(lot_key, weights=depletion.waste_by_lot, minlength=keys)
+    waste_value_by_key = np.bincount(lot_key, weights=depletion.waste_by_lot * lot_cost, minlength=keys)
+
+    rows = [
+        WasteProjection(
+            product_id=info[0],
+            product_code=info[1],
+            product_name=info[2],
+            warehouse_id=info[3],
+            warehouse_name=info[4],
+            available_qty=round(float(available_by_key[index]), 3),
+            daily_demand=round(float(daily_demand[index]), 3),
+            projected_sold=round(float(depletion.sold_by_key[index]), 3),
+            projected_waste=round(float(waste_by_key[index]), 3),
+            waste_value=round(float(waste_value_by_key[index]), 2),
+            stockout_days=int(depletion.stockout_days[index]),
+            first_stockout_day=(
+                int(depletion.first_stockout_day[index]) if depletion.first_stockout_day[index] >= 0 else None
+            ),
+        )
+        for index, info in enumerate(key_info)
+    ]
+    rows.sort(key=lambda row: (-row.waste_value, -row.projected_waste, row.product_id, row.warehouse_id))
+
+    return WasteSimulationResult(
+        as_of=today,
+        horizon_days=horizon_days,
+        history_days=history_days,
+        lots=len(lot_rows),
+        rows=rows,
+        total_waste_qty=round(float(waste_by_key.sum()), 3),
+        value_at_risk=round(float(waste_value_by_key.sum()), 2),
+        elapsed_seconds=time.perf_counter() - started,
+    )
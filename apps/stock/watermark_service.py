@@ -0,0 +1,112 @@
+# apps/stock/watermark_service.py
+"""
+Ventanas incrementales para los scans de stock.
+
+Cada scan (`scan_near_expiry`, `scan_low_stock`) guarda en StockScanWatermark
+el último Movement.id procesado. `open_scan_window()` devuelve la ventana
+(último procesado, último existente]; el scan re-evalúa solo los productos con
+movimientos en la ventana y, para vencimientos, los lotes que cruzaron un
+límite de rango desde el último día evaluado. `close_scan_window()` avanza la
+marca solo si nadie la movió mientras tanto; los scans la cierran únicamente
+si publicaron sus alertas, para que una ventana fallida se re-evalúe.
+
+Los cruces de rango se filtran sobre StockLot por fecha, sin pasar por el
+índice de vencimientos: hasta que corre el roll nocturno, el índice todavía
+tiene esos lotes en su rango anterior.
+
+Los ids se asignan al insertar pero se hacen visibles al commitear: un
+movimiento con id menor a la marca puede aparecer después de cerrada la
+ventana. Por eso cada ventana re-evalúa además los movimientos creados en los
+últimos settings.SCAN_WATERMARK_OVERLAP_MINUTES minutos, sin importar su id.
+
+El primer scan (sin marca) es completo. Un ajuste de `low_stock_threshold` sin
+movimientos no se detecta hasta el próximo movimiento del producto o el
+próximo scan completo (beat corre uno por hora).
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Iterable, NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import Movement, StockScanWatermark
+
+
+class ScanWindow(NamedTuple):
+    """Ventana de movimientos (since, until] a procesar por un scan."""
+    name: str
+    since_movement_id: Optional[int]  # None: scan completo
+    until_movement_id: int
+    since_date: Optional[date]
+    today: date
+    overlap_since: Optional[datetime] = None  # Re-evalúa lo creado desde acá (commits tardíos)
+
+    @property
+    def is_full(self) -> bool:
+        return self.since_movement_id is None
+
+    def touched_product_ids(self):
+        """Subquery con los productos que tuvieron movimientos en la ventana o en el solapamiento."""
+        in_window = Q(id__gt=self.since_movement_id)
+        if self.overlap_since is not None:
+            in_window |= Q(created_at__gte=self.overlap_since)
+        return Movement.objects.filter(in_window, id__lte=self.until_movement_id).values('product_id')
+
+    def crossed_expiry_filter(self, boundaries: Iterable[int]) -> Q:
+        """
+        Lotes que quedaron a exactamente `boundary` días de vencer en algún día
+        de (since_date, today], es decir, que entraron a un rango nuevo.
+        """
+        first_day = (self.since_date or self.today - timedelta(days=1)) + timedelta(days=1)
+        if first_day > self.today:
+            return Q(pk__in=[])
+
+        crossed = Q(pk__in=[])
+        for boundary in boundaries:
+            crossed |= Q(
+                expiry_date__gte=first_day + timedelta(days=boundary),
+                expiry_date__lte=self.today + timedelta(days=boundary),
+            )
+        return crossed
+
+    def lot_filter(self, boundaries: Iterable[int] = ()) -> Q:
+        """Filtro de StockLot para la ventana (vacío en un scan completo)."""
+        if self.is_full:
+            return Q()
+        return Q(product_id__in=self.touched_product_ids()) | self.crossed_expiry_filter(boundaries)
+
+
+def open_scan_window(name: str, today: Optional[date] = None) -> ScanWindow:
+    """Ventana desde la marca de `name` hasta el último movimiento existente."""
+    watermark, _ = StockScanWatermark.objects.get_or_create(name=name)
+    until = Movement.objects.aggregate(last=Max('id'))['last'] or 0
+    overlap_minutes = settings.SCAN_WATERMARK_OVERLAP_MINUTES
+    return ScanWindow(
+        name=name,
+        since_movement_id=watermark.last_movement_id,
+        until_movement_id=until,
+        since_date=watermark.last_scan_date,
+        today=today or timezone.localdate(),
+        overlap_since=timezone.now() - timedelta(minutes=overlap_minutes) if overlap_minutes else None,
+    )
+
+
+def close_scan_window(window: ScanWindow) -> bool:
+    """
+    Avanza la marca hasta el final de la ventana.
+
+    Returns:
+        False si otro scan avanzó la marca mientras tanto (no se pisa)
+    """
+    if window.since_movement_id is None:
+        unchanged = Q(last_movement_id__isnull=True)
+    else:
+        unchanged = Q(last_movement_id=window.since_movement_id)
+
+    return StockScanWatermark.objects.filter(unchanged, name=window.name).update(
+        last_movement_id=window.until_movement_id,
+        last_scan_date=window.today,
+        updated_at=timezone.now(),
+    ) == 1
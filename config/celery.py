@@ -3,6 +3,7 @@ Celery configuration for O11CE Stock B2B project.
 """
 import os
 from celery import Celery
+from celery.schedules import crontab
 from django.conf import settings
 
 # Set the default Django settings module for the 'celery' program.
@@ -66,8 +67,9 @@ app.conf.timezone = 'UTC'
 app.conf.beat_schedule = {
     'scan-near-expiry': {
         'task': 'apps.stock.tasks.scan_near_expiry',
-        'schedule': 3600.0,  # Every hour
+        'schedule': 300.0,  # Every 5 minutes (incremental: only what changed since the last run)
         'args': (7,),  # 7 days ahead warning
+        'kwargs': {'incremental': True},
         'options': {
             'queue': 'stock_queue',
             'routing_key': 'stock.scan_expiry',
@@ -75,8 +77,25 @@ app.conf.beat_schedule = {
     },
     'scan-low-stock': {
         'task': 'apps.stock.tasks.scan_low_stock',
-        'schedule': 1800.0,  # Every 30 minutes
-        'args': (10.0,),  # Alert when stock below 10 units
+        'schedule': 300.0,  # Every 5 minutes (incremental; per-product thresholds, LOW_STOCK_THRESHOLD_DEFAULT otherwise)
+        'kwargs': {'incremental': True},
+        'options': {
+            'queue': 'stock_queue',
+            'routing_key': 'stock.scan_low',
+        }
+    },
+    'scan-near-expiry-full': {
+        'task': 'apps.stock.tasks.scan_near_expiry',
+        'schedule': 3600.0,  # Every hour (full scan: refreshes the near-expiry gauges)
+        'args': (7,),
+        'options': {
+            'queue': 'stock_queue',
+            'routing_key': 'stock.scan_expiry',
+        }
+    },
+    'scan-low-stock-full': {
+        'task': 'apps.stock.tasks.scan_low_stock',
+        'schedule': 3600.0,  # Every hour (full scan: refreshes the low-stock gauge and threshold changes)
         'options': {
             'queue': 'stock_queue',
             'routing_key': 'stock.scan_low',
@@ -98,6 +117,46 @@ app.conf.beat_schedule = {
             'routing_key': 'metrics.stock',
         }
     },
+    'reconcile-stock-summary': {
+        'task': 'apps.stock.tasks.reconcile_stock_summary',
+        'schedule': 86400.0,  # Daily (refreshes available for lots that expired)
+        'options': {
+            'queue': 'maintenance_queue',
+            'routing_key': 'maintenance.stock_summary',
+        }
+    },
+    'archive-old-movements': {
+        'task': 'apps.stock.tasks.archive_old_movements',
+        'schedule': 86400.0,  # Daily (moves movements past MOVEMENT_RETENTION_DAYS to the archive)
+        'options': {
+            'queue': 'maintenance_queue',
+            'routing_key': 'maintenance.movement_archive',
+        }
+    },
+    'take-stock-snapshot': {
+        'task': 'apps.stock.tasks.take_stock_snapshot',
+        'schedule': 86400.0,  # Daily (closes yesterday; weekly interval skips non-Sundays)
+        'options': {
+            'queue': 'maintenance_queue',
+            'routing_key': 'maintenance.stock_snapshot',
+        }
+    },
+    'roll-expiry-buckets': {
+        'task': 'apps.stock.tasks.roll_expiry_buckets',
+        'schedule': crontab(hour=0, minute=5),  # Daily after midnight (moves lots to their new expiry bucket)
+        'options': {
+            'queue': 'maintenance_queue',
+            'routing_key': 'maintenance.expiry_buckets',
+        }
+    },
+    'expire-reservations': {
+        'task': 'apps.stock.tasks.expire_reservations',
+        'schedule': 60.0,  # Every minute (cancels PENDING reservations past expires_at)
+        'options': {
+            'queue': 'stock_queue',
+            'routing_key': 'stock.expire_reservations',
+        }
+    },
 }
 
 # Debug task for testing
@@ -322,6 +322,39 @@ LOW_STOCK_THRESHOLD_DEFAULT = int(
 )
 NEAR_EXPIRY_DAYS = int(os.getenv("NEAR_EXPIRY_DAYS", "7"))
 
+# Scans incrementales: minutos de movimientos que se re-evalúan aunque su id quede bajo la marca
+SCAN_WATERMARK_OVERLAP_MINUTES = int(os.getenv("SCAN_WATERMARK_OVERLAP_MINUTES", "15"))
+
+# Días que los movimientos quedan en stock_movement antes de pasar al archivo
+MOVEMENT_RETENTION_DAYS = int(os.getenv("MOVEMENT_RETENTION_DAYS", "365"))
+
+# Salidas de stock: "locking" (select_for_update) u "optimistic" (UPDATE condicional + reintentos)
+STOCK_EXIT_MODE = os.getenv("STOCK_EXIT_MODE", "locking")
+STOCK_EXIT_MAX_RETRIES = int(os.getenv("STOCK_EXIT_MAX_RETRIES", "3"))
+
+# Idempotencia de escrituras de stock: reclamo en cache (SET NX) mientras la request está en curso
+IDEMPOTENCY_IN_FLIGHT_TTL = int(os.getenv("IDEMPOTENCY_IN_FLIGHT_TTL", "30"))
+# Segundos que un duplicado concurrente espera la respuesta original antes de recibir 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "0.5"))
+
+# Minutos que dura una reserva PENDING antes de que el barrido la cancele (0 = sin vencimiento)
+RESERVATION_TTL_MINUTES = int(os.getenv("RESERVATION_TTL_MINUTES", "0"))
+
+# Entradas v2: "events" (cadena de eventos de StockEntryHandler) o "direct"
+# (validación y alta en línea; los eventos se publican después como notificación)
+STOCK_ENTRY_MODE = os.getenv("STOCK_ENTRY_MODE", "events")
+
+# Concurrencia de FEFOService.allocate_stock_fefo: "skip_locked" o "advisory" (PostgreSQL)
+FEFO_LOCK_STRATEGY = os.getenv("FEFO_LOCK_STRATEGY", "skip_locked")
+
+# Estrategia de asignación de lotes por defecto: "fefo" (estricto) o "min_splits"
+# (FEFO dentro de la tolerancia de vencimiento, minimizando lotes y depósitos)
+STOCK_ALLOCATION_STRATEGY = os.getenv("STOCK_ALLOCATION_STRATEGY", "fefo")
+STOCK_ALLOCATION_EXPIRY_TOLERANCE_DAYS = int(os.getenv("STOCK_ALLOCATION_EXPIRY_TOLERANCE_DAYS", "7"))
+
+# Frecuencia de snapshots de stock por lote: "daily" o "weekly" (cierre del domingo)
+STOCK_SNAPSHOT_INTERVAL = os.getenv("STOCK_SNAPSHOT_INTERVAL", "daily")
+
 WHATSAPP_PROVIDER_URL = os.getenv("WHATSAPP_PROVIDER_URL", "http://localhost")
 
 # FEATURE FLAGS
@@ -504,6 +537,14 @@ EVENT_BUS_CONFIG = {
     'metrics_enabled': os.environ.get('EVENT_BUS_METRICS_ENABLED', '1') == '1',
 }
 
+# Espera máxima de publish_sync/publish_many_sync sobre el event loop de fondo
+EVENT_PUBLISH_TIMEOUT_SECONDS = float(os.environ.get('EVENT_PUBLISH_TIMEOUT_SECONDS', '5'))
+# Espera máxima de EventBus.request/request_sync por la respuesta a una solicitud
+EVENT_REQUEST_TIMEOUT_SECONDS = float(os.environ.get('EVENT_REQUEST_TIMEOUT_SECONDS', '5'))
+# Margen extra que espera una venta POS después del vencimiento de su solicitud de stock:
+# el handler descarta la transacción si termina después de expires_at, pero el commit tarda
+POS_SALE_COMMIT_GRACE_SECONDS = float(os.environ.get('POS_SALE_COMMIT_GRACE_SECONDS', '2'))
+
 # SENTRY CONFIGURATION
 # ------------------------------------------------------------------------------
 if not DEBUG: